@@ -0,0 +1,92 @@
+"""
+Benchmarks the streaming merge-join annotation of a VCF (annotate_vcf.py) against the equivalent Hail join
+
+Generates N synthetic decisions (as in bench_decisions_index.py), and a sorted sites-only VCF of M records, half of
+which match a decision, 1 in 10 multi-allelic. Then reports variants per second for:
+- annotate_vcf, streaming the gzipped VCF & decisions TSV
+- Hail: import the VCF, join on the decisions Hail Table, and export the annotated VCF (skipped if Hail can't start)
+
+python benchmarks/bench_annotate_vcf.py --rows 3000000 --records 1000000
+"""
+
+import random
+import tempfile
+import time
+from argparse import ArgumentParser
+from os.path import join
+
+from bench_decisions_index import synthetic_decisions
+
+from clinvarbitration.scripts.annotate_vcf import main as annotate_vcf
+from clinvarbitration.scripts.bgzf import BgzfWriter
+from clinvarbitration.scripts.resummarise_clinvar import GRCH38, ORDERED_CONTIGS, write_decisions_tsv
+
+
+def write_synthetic_vcf(vcf_path: str, decisions: list[dict], records: int, seed: int = 42):
+    rng = random.Random(seed)  # noqa: S311
+    sites = []
+    for _ in range(records):
+        decision = rng.choice(decisions)
+        ref, alt = decision['alleles']
+        if rng.random() < 0.5:  # noqa: PLR2004
+            alts = f'{alt},{"T" if alt != "T" else "C"}' if rng.random() < 0.2 else alt  # noqa: PLR2004
+            sites.append((decision['contig'], decision['position'], ref, alts))
+        else:
+            sites.append((decision['contig'], decision['position'] + 1, 'A', 'G'))
+
+    contigs = ORDERED_CONTIGS[GRCH38]
+    sites.sort(key=lambda site: (contigs.index(site[0]), site[1]))
+    # BGZF rather than plain gzip, so Hail can import it in parallel blocks
+    with BgzfWriter(vcf_path) as handle:
+        handle.write(b'##fileformat=VCFv4.2\n')
+        handle.write(''.join(f'##contig=<ID={contig}>\n' for contig in contigs).encode())
+        handle.write(b'#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n')
+        for contig, position, ref, alts in sites:
+            handle.write(f'{contig}\t{position}\t.\t{ref}\t{alts}\t.\tPASS\t.\n'.encode())
+
+
+def hail_join(vcf_path: str, decisions_tsv: str, temp_dir: str):
+    """The Hail route, annotating each split bi-allelic row from the decisions Hail Table."""
+    import hail as hl  # noqa: PLC0415
+
+    from clinvarbitration.scripts.resummarise_clinvar import parse_into_table  # noqa: PLC0415
+
+    hl.context.init_spark(master='local[*]', quiet=True)
+    hl.default_reference(GRCH38)
+    decisions = parse_into_table(tsv_path=decisions_tsv, out_path=join(temp_dir, 'clinvar_decisions.ht'))
+
+    start = time.perf_counter()
+    mt = hl.split_multi(hl.import_vcf(vcf_path, force_bgz=True, reference_genome=GRCH38))
+    mt = mt.annotate_rows(info=mt.info.annotate(**decisions[mt.row_key]))
+    hl.export_vcf(mt.rows(), join(temp_dir, 'hail.vcf.bgz'))
+    return time.perf_counter() - start
+
+
+def main(rows: int, records: int):
+    # synthetic positions run to 200Mb, so are scaled within the shortest contig (chr21), as Hail checks every locus
+    decisions = [decision | {'position': (decision['position'] - 1) // 5 + 1} for decision in synthetic_decisions(rows)]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        decisions_tsv = join(temp_dir, 'clinvar_decisions.tsv.bgz')
+        vcf_path = join(temp_dir, 'cohort.vcf.bgz')
+        write_decisions_tsv(decisions, output_path=decisions_tsv)
+        write_synthetic_vcf(vcf_path, decisions, records=records)
+
+        start = time.perf_counter()
+        annotate_vcf(vcf=vcf_path, decisions_tsv=decisions_tsv, output=join(temp_dir, 'annotated.vcf'))
+        elapsed = time.perf_counter() - start
+        print(f'{"annotate_vcf":>16}: {elapsed:.3f}s, {records / elapsed:,.0f} variants/s')
+
+        try:
+            elapsed = hail_join(vcf_path, decisions_tsv, temp_dir)
+        except Exception as error:  # noqa: BLE001
+            print(f'{"Hail join":>16}: skipped, Hail could not run ({type(error).__name__})')
+        else:
+            print(f'{"Hail join":>16}: {elapsed:.3f}s, {records / elapsed:,.0f} variants/s')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark streaming VCF annotation against a Hail join')
+    parser.add_argument('--rows', help='number of decisions to generate', type=int, default=3_000_000)
+    parser.add_argument('--records', help='number of VCF records to annotate', type=int, default=1_000_000)
+    args = parser.parse_args()
+    main(rows=args.rows, records=args.records)
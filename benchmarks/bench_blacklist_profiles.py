@@ -0,0 +1,94 @@
+"""
+Benchmarks blacklist profiles generated from one parse of ClinVar against a full re-summary per blacklist
+
+Writes synthetic variant_summary & submission_summary files, with N variants each holding 1-5 submissions from S
+submitters, then P profiles each blacklisting B random submitters. Reports:
+- the time to re-summarise once per profile, each with its blacklist (as separate resummarise_clinvar -b runs do)
+- the time to generate every profile with blacklist_profiles, parsing the inputs once
+
+Output writing is the same for both approaches, and isn't timed.
+
+python benchmarks/bench_blacklist_profiles.py --variants 500000 --profiles 10
+"""
+
+import gzip
+import random
+import tempfile
+import time
+from argparse import ArgumentParser
+from os.path import join
+
+from clinvarbitration.scripts import resummarise_clinvar
+from clinvarbitration.scripts.blacklist_profiles import batch_decisions
+from clinvarbitration.scripts.resummarise_clinvar import GRCH38, generate_decisions
+
+CLASSIFICATIONS = ['Pathogenic', 'Likely pathogenic', 'Benign', 'Likely benign', 'Uncertain significance']
+REVIEWS = ['criteria provided, single submitter'] * 20 + ['no assertion criteria provided'] * 5 + ['practice guideline']
+DATES = ['Jan 01, 2012', 'Mar 15, 2018', 'Jun 30, 2021', '-']
+
+
+def write_inputs(folder: str, variants: int, submitters: int, seed: int = 42) -> tuple[str, str]:
+    """Synthetic submission_summary & variant_summary files, returns their paths."""
+    rng = random.Random(seed)  # noqa: S311
+    variant_path = join(folder, 'variant_summary.txt.gz')
+    with gzip.open(variant_path, 'wt') as handle:
+        handle.write(
+            '#AlleleID\tGeneSymbol\tRS# (dbSNP)\tAssembly\tChromosome\tVariationID\tPositionVCF\t'
+            'ReferenceAlleleVCF\tAlternateAlleleVCF\n',
+        )
+        for number in range(variants):
+            chromosome, position = rng.randint(1, 22), rng.randint(1, 200_000_000)
+            ref, alt = rng.sample('ACGT', 2)
+            handle.write(f'{number}\tGENE\t{number}\tGRCh38\t{chromosome}\t{number}\t{position}\t{ref}\t{alt}\n')
+
+    submission_path = join(folder, 'submission_summary.txt.gz')
+    with gzip.open(submission_path, 'wt') as handle:
+        handle.write('#VariationID\tClinicalSignificance\tDateLastEvaluated\tReviewStatus\tSubmitter\n')
+        for number in range(variants):
+            for _ in range(rng.randint(1, 5)):
+                handle.write(
+                    f'{number}\t{rng.choice(CLASSIFICATIONS)}\t{rng.choice(DATES)}\t{rng.choice(REVIEWS)}\t'
+                    f'Lab {int(rng.paretovariate(1.2)) % submitters}\n',
+                )
+    return submission_path, variant_path
+
+
+def main(variants: int, submitters: int, profiles: int, blacklisted: int):
+    rng = random.Random(7)  # noqa: S311
+    blacklists = {
+        f'profile{number}': {f'lab {rng.randrange(submitters)}' for _ in range(blacklisted)}
+        for number in range(profiles)
+    }
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        subs, variant_path = write_inputs(temp_dir, variants=variants, submitters=submitters)
+
+        start = time.perf_counter()
+        separate = {}
+        original = resummarise_clinvar.BLACKLIST
+        try:
+            for name, blacklist in blacklists.items():
+                resummarise_clinvar.BLACKLIST = blacklist
+                separate[name] = generate_decisions(subs=subs, variants=variant_path, assembly=GRCH38)
+        finally:
+            resummarise_clinvar.BLACKLIST = original
+        print(f'{"separate runs":>20}: {time.perf_counter() - start:.2f}s for {profiles} profiles')
+
+        start = time.perf_counter()
+        batched = batch_decisions(subs=subs, variants=variant_path, profiles=blacklists, assembly=GRCH38)
+        print(f'{"one parse":>20}: {time.perf_counter() - start:.2f}s for {profiles} profiles')
+
+        for name, (decisions, summary) in batched.items():
+            if decisions != separate[name]:
+                raise ValueError(f'Profile {name} differs from its separate run')
+            print(f'{name:>20}: re-evaluated {summary["variation_ids_re_evaluated"]} VariationIDs')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark blacklist profiles from one parse against separate runs')
+    parser.add_argument('--variants', help='number of variants to generate', type=int, default=500_000)
+    parser.add_argument('--submitters', help='number of distinct submitters', type=int, default=2_000)
+    parser.add_argument('--profiles', help='number of blacklist profiles', type=int, default=10)
+    parser.add_argument('--blacklisted', help='submitters blacklisted per profile', type=int, default=3)
+    args = parser.parse_args()
+    main(variants=args.variants, submitters=args.submitters, profiles=args.profiles, blacklisted=args.blacklisted)
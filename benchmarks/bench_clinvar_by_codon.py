@@ -0,0 +1,82 @@
+"""
+Benchmarks the PM5 aggregation in clinvar_by_codon on a synthetic annotated TSV
+
+Generates N rows in the bcftools +split-vep format (Transcript, Amino Acid Change, ClinVar allele ID, gold stars),
+then times the string-keyed dictionary approach this replaced, against the columnar CodonAggregator. Each method runs
+in a fresh process, so the peak memory (max RSS) of each can be reported.
+
+python benchmarks/bench_clinvar_by_codon.py --rows 5000000
+"""
+
+import random
+import resource
+import tempfile
+import time
+from argparse import ArgumentParser
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from os.path import join
+
+from clinvarbitration.scripts.clinvar_by_codon import NUMBER_RE, aggregate_tsv, write_results_as_tsv
+
+
+def write_synthetic_tsv(path: str, rows: int, transcripts: int, seed: int = 42):
+    """Rows cluster onto a limited set of transcripts and codons, with repeats, like real missense annotations."""
+    rng = random.Random(seed)  # noqa: S311
+    amino_acids = 'ACDEFGHIKLMNPQRSTVWY'
+    with open(path, 'w') as handle:
+        for _ in range(rows):
+            codon = rng.randint(1, 2000)
+            handle.write(
+                f'ENST{rng.randrange(transcripts):011d}\t{codon}{rng.choice(amino_acids)}>{codon}'
+                f'{rng.choice(amino_acids)}\t{rng.randint(1, 4_000_000)}\t{rng.randint(0, 4)}\n',
+            )
+
+
+def legacy_aggregation(input_tsv: str, output_tsv: str):
+    """The string-keyed implementation, sets of 'AlleleID::Stars' per 'Transcript::Codon'."""
+    clinvar_dict = defaultdict(set)
+    with open(input_tsv) as handle:
+        for row in handle:
+            tx, aa, aid, stars = row.rstrip().split('\t')
+            match = NUMBER_RE.match(aa)
+            clinvar_dict[f'{tx}::{match.group(1)}'].add(f'{aid}::{stars}')
+    with open(output_tsv, 'w') as handle:
+        for key, value in clinvar_dict.items():
+            transcript_id, codon_number = key.split('::')
+            handle.write(f'{transcript_id}\t{codon_number}\t{"+".join(sorted(value))}\n')
+
+
+def columnar_aggregation(input_tsv: str, output_tsv: str):
+    write_results_as_tsv(aggregate_tsv(input_tsv), output_tsv)
+
+
+METHODS = {'legacy': legacy_aggregation, 'columnar': columnar_aggregation}
+
+
+def timed_run(name: str, input_tsv: str, output_tsv: str) -> tuple[float, int]:
+    """Runs one method, returning the elapsed time and the peak memory of this process in MB."""
+    start = time.perf_counter()
+    METHODS[name](input_tsv, output_tsv)
+    elapsed = time.perf_counter() - start
+    return elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+
+
+def main(rows: int, transcripts: int):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_tsv = join(temp_dir, 'annotated.tsv')
+        write_synthetic_tsv(input_tsv, rows=rows, transcripts=transcripts)
+
+        for name in METHODS:
+            # a new process per method, so the peak memory of one doesn't hide the other
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                elapsed, peak_mb = executor.submit(timed_run, name, input_tsv, join(temp_dir, f'{name}.tsv')).result()
+            print(f'{name:>10}: {elapsed:.2f}s, {rows / elapsed:,.0f} rows/s, peak memory {peak_mb:,} MB')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark the clinvar_by_codon aggregation')
+    parser.add_argument('--rows', help='number of annotated rows to generate', type=int, default=5_000_000)
+    parser.add_argument('--transcripts', help='number of distinct transcripts', type=int, default=50_000)
+    args = parser.parse_args()
+    main(rows=args.rows, transcripts=args.transcripts)
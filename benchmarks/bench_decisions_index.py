@@ -0,0 +1,119 @@
+"""
+Benchmarks lookups from the memory-mapped decisions index against loading the decisions TSV into a dictionary
+
+Generates N synthetic decisions, writes the decisions TSV and index, then reports:
+- the time to build the index, to load the TSV into a {(contig, position, ref, alt): decision} dictionary, and to
+  memory-map the index
+- single lookups per second, for the dictionary and the index
+- queries per second for batch lookups of the index
+- 10kb region queries per second
+
+Half of the queries hit a decision, half miss.
+
+python benchmarks/bench_decisions_index.py --rows 3000000 --queries 1000000
+"""
+
+import gzip
+import random
+import tempfile
+import time
+from argparse import ArgumentParser
+from collections.abc import Callable
+from os.path import join
+
+from clinvarbitration.scripts.decisions_index import DecisionIndex
+from clinvarbitration.scripts.resummarise_clinvar import (
+    GRCH38,
+    ORDERED_CONTIGS,
+    Consequence,
+    write_decision_index,
+    write_decisions_tsv,
+)
+
+SINGLE_QUERIES = 100_000
+REGION_SIZE = 10_000
+
+
+def synthetic_decisions(rows: int, seed: int = 42) -> list[dict]:
+    """Decisions spread over the autosomes & X, sorted on contig & position, as resummarise_clinvar generates."""
+    rng = random.Random(seed)  # noqa: S311
+    contigs = ORDERED_CONTIGS[GRCH38][:23]
+    significance = [consequence.value for consequence in Consequence]
+    decisions = [
+        {
+            'contig': rng.choice(contigs),
+            'position': rng.randint(1, 200_000_000),
+            'alleles': [rng.choice('ACGT'), rng.choice(['A', 'C', 'G', 'T', 'AT', 'CTT'])],
+            'clinical_significance': rng.choice(significance),
+            'gold_stars': rng.randint(0, 4),
+            'allele_id': index,
+        }
+        for index in range(rows)
+    ]
+    return sorted(decisions, key=lambda x: (contigs.index(x['contig']), x['position']))
+
+
+def load_tsv(decisions_tsv: str) -> dict[tuple[str, int, str, str], tuple[str, ...]]:
+    """How consumers currently use the decisions TSV without Hail, reading the whole table up front."""
+    with gzip.open(decisions_tsv, 'rt') as handle:
+        next(handle)
+        table = {}
+        for line in handle:
+            contig, position, ref, alt, *rest = line.rstrip('\n').split('\t')
+            table[(contig, int(position), ref, alt)] = tuple(rest)
+        return table
+
+
+def make_queries(decisions: list[dict], count: int, seed: int = 42) -> list[tuple[str, int, str, str]]:
+    rng = random.Random(seed)  # noqa: S311
+    queries = []
+    for _ in range(count):
+        decision = rng.choice(decisions)
+        if rng.random() < 0.5:  # noqa: PLR2004
+            queries.append((decision['contig'], decision['position'], *decision['alleles']))
+        else:
+            queries.append((decision['contig'], decision['position'] + 1, 'A', 'G'))
+    return queries
+
+
+def timed(label: str, count: int, function: Callable, *args: object) -> object:
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    rate = f', {count / elapsed:,.0f} queries/s' if count else ''
+    print(f'{label:>24}: {elapsed:.3f}s{rate}')
+    return result
+
+
+def main(rows: int, queries: int):
+    decisions = synthetic_decisions(rows)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        decisions_tsv = join(temp_dir, 'clinvar_decisions.tsv.bgz')
+        index_path = join(temp_dir, 'clinvar_decisions.idx')
+
+        write_decisions_tsv(decisions, output_path=decisions_tsv)
+        timed('build index', 0, write_decision_index, decisions, index_path, GRCH38)
+
+        table = timed('load TSV', 0, load_tsv, decisions_tsv)
+        decision_index = timed('map index', 0, DecisionIndex.load, index_path)
+
+        single = make_queries(decisions, min(queries, SINGLE_QUERIES))
+        batch = make_queries(decisions, queries)
+        columns = [list(column) for column in zip(*batch, strict=True)]
+
+        timed('dict lookups', len(single), lambda: [table.get(query) for query in single])
+        timed('index lookups', len(single), lambda: [decision_index.lookup(*query) for query in single])
+        timed('index batch lookup', len(batch), decision_index.lookup_many, *columns)
+        timed(
+            'region queries',
+            len(single),
+            lambda: [decision_index.region_bounds(contig, pos, pos + REGION_SIZE) for contig, pos, _, _ in single],
+        )
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark decisions index lookups')
+    parser.add_argument('--rows', help='number of decisions to generate', type=int, default=3_000_000)
+    parser.add_argument('--queries', help='number of batch queries', type=int, default=1_000_000)
+    args = parser.parse_args()
+    main(rows=args.rows, queries=args.queries)
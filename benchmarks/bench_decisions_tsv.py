@@ -0,0 +1,97 @@
+"""
+Benchmarks writing the decisions as a BGZF-compressed, tabix-indexed TSV against the plain TSV
+
+Generates N synthetic decisions (as in bench_decisions_index.py), then reports:
+- the time & file size for the plain TSV, as the decisions were written before BGZF
+- the time & file size (TSV + index) for the BGZF TSV, compressing on 1 thread and on --threads threads
+- region queries per second from the tabix index, against scanning the plain TSV for a region
+
+python benchmarks/bench_decisions_tsv.py --rows 3000000 --threads 8
+"""
+
+import os
+import random
+import tempfile
+import time
+from argparse import ArgumentParser
+from os.path import join
+
+from bench_decisions_index import synthetic_decisions
+
+from clinvarbitration.scripts.resummarise_clinvar import TSV_KEYS, decision_columns
+from clinvarbitration.scripts.tabix import TabixIndex, fetch, write_indexed_tsv
+
+REGION_QUERIES = 1_000
+REGION_SIZE = 100_000
+
+
+def write_plain_tsv(decisions: list[dict], output_path: str):
+    """The plain TSV baseline, one row per decision."""
+    with open(output_path, 'w', encoding='utf-8') as handle:
+        handle.write('\t'.join(TSV_KEYS) + '\n')
+        for decision in decisions:
+            ref, alt = decision['alleles']
+            row = [
+                decision['contig'],
+                decision['position'],
+                ref,
+                alt,
+                decision['clinical_significance'],
+                decision['gold_stars'],
+                decision['allele_id'],
+            ]
+            handle.write('\t'.join(map(str, row)) + '\n')
+
+
+def scan_tsv(tsv_path: str, contig: str, beg: int, end: int) -> list[str]:
+    with open(tsv_path) as handle:
+        next(handle)
+        return [
+            line for line in handle if line.split('\t', 1)[0] == contig and beg < int(line.split('\t', 2)[1]) <= end
+        ]
+
+
+def main(rows: int, threads: int):
+    decisions = synthetic_decisions(rows)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        plain = join(temp_dir, 'clinvar_decisions.tsv')
+        start = time.perf_counter()
+        write_plain_tsv(decisions, output_path=plain)
+        elapsed = time.perf_counter() - start
+        print(f'{"plain TSV":>24}: {elapsed:.3f}s, {os.path.getsize(plain) / 1e6:.1f}MB')
+
+        compressed = join(temp_dir, 'clinvar_decisions.tsv.bgz')
+        for thread_count in sorted({1, threads}):
+            start = time.perf_counter()
+            write_indexed_tsv(compressed, decision_columns(decisions), threads=thread_count)
+            elapsed = time.perf_counter() - start
+            size = os.path.getsize(compressed) + os.path.getsize(f'{compressed}.tbi')
+            print(f'{f"BGZF + tabix, {thread_count} threads":>24}: {elapsed:.3f}s, {size / 1e6:.1f}MB')
+
+        rng = random.Random(42)  # noqa: S311
+        regions = []
+        for _ in range(REGION_QUERIES):
+            chosen = rng.choice(decisions)
+            regions.append((chosen['contig'], chosen['position'], chosen['position'] + REGION_SIZE))
+
+        index = TabixIndex.load(f'{compressed}.tbi')
+        start = time.perf_counter()
+        for contig, beg, end in regions:
+            list(fetch(compressed, contig, beg, end, index=index))
+        elapsed = time.perf_counter() - start
+        print(f'{"tabix region queries":>24}: {REGION_QUERIES / elapsed:,.0f} queries/s')
+
+        scans = regions[:5]
+        start = time.perf_counter()
+        for contig, beg, end in scans:
+            scan_tsv(plain, contig, beg, end)
+        elapsed = time.perf_counter() - start
+        print(f'{"plain TSV region scans":>24}: {len(scans) / elapsed:,.1f} queries/s')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark the BGZF & tabix decisions TSV against the plain TSV')
+    parser.add_argument('--rows', help='number of decisions to generate', type=int, default=3_000_000)
+    parser.add_argument('--threads', help='compression threads', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    main(rows=args.rows, threads=args.threads)
@@ -0,0 +1,129 @@
+"""
+Benchmarks the streaming diff of two decision outputs against an in-memory pandas join
+
+Generates N synthetic decisions (as in bench_decisions_index.py), then a second release with 1% reclassified, 1% with
+changed stars, 0.5% removed and 0.5% added. Writes the TSV & index of each, then reports:
+- the time & peak memory to diff the two TSVs, and the two indexes, streaming
+- the time & peak memory to load both TSVs into pandas and outer-join them, holding both releases in memory
+Each run is in a fresh process, so its peak memory (max RSS) is its own.
+
+python benchmarks/bench_diff_decisions.py --rows 3000000
+"""
+
+import random
+import resource
+import tempfile
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from os.path import join
+
+import pandas as pd
+from bench_decisions_index import synthetic_decisions
+
+from clinvarbitration.scripts.diff_decisions import main as diff_decisions
+from clinvarbitration.scripts.resummarise_clinvar import (
+    GRCH38,
+    ORDERED_CONTIGS,
+    Consequence,
+    write_decision_index,
+    write_decisions_tsv,
+)
+
+
+def next_release(decisions: list[dict], seed: int = 7) -> list[dict]:
+    """A copy of the decisions with some changed, removed, and added."""
+    rng = random.Random(seed)  # noqa: S311
+    significance = [consequence.value for consequence in Consequence]
+    contigs = ORDERED_CONTIGS[GRCH38][:23]
+    changed = []
+    for decision in decisions:
+        roll = rng.random()
+        if roll < 0.005:  # noqa: PLR2004
+            continue
+        if roll < 0.015:  # noqa: PLR2004
+            decision = {**decision, 'clinical_significance': rng.choice(significance)}  # noqa: PLW2901
+        elif roll < 0.025:  # noqa: PLR2004
+            decision = {**decision, 'gold_stars': (decision['gold_stars'] + 1) % 5}  # noqa: PLW2901
+        changed.append(decision)
+    for number in range(len(decisions) // 200):
+        changed.append(
+            {
+                'contig': rng.choice(contigs),
+                'position': rng.randint(1, 200_000_000),
+                'alleles': ['A', 'GCA'],  # never generated by synthetic_decisions
+                'clinical_significance': rng.choice(significance),
+                'gold_stars': 1,
+                'allele_id': len(decisions) + number,
+            },
+        )
+    return sorted(changed, key=lambda x: (contigs.index(x['contig']), x['position']))
+
+
+def streaming_diff(old_path: str, new_path: str, output_root: str) -> int:
+    return sum(diff_decisions(old_path, new_path, output_root)['changes'].values())
+
+
+def pandas_diff(old_path: str, new_path: str, _output_root: str) -> int:
+    """Both TSVs read into memory & outer-joined on the locus and alleles."""
+    joined = pd.read_csv(old_path, sep='\t', compression='gzip').merge(
+        pd.read_csv(new_path, sep='\t', compression='gzip'),
+        on=['contig', 'position', 'reference', 'alternate'],
+        how='outer',
+        suffixes=('_old', '_new'),
+        indicator=True,
+    )
+    differs = (
+        (joined['_merge'] != 'both')
+        | (joined['clinical_significance_old'] != joined['clinical_significance_new'])
+        | (joined['gold_stars_old'] != joined['gold_stars_new'])
+    )
+    return int(differs.sum())
+
+
+METHODS = {'streaming': streaming_diff, 'pandas': pandas_diff}
+
+
+def timed_run(name: str, old_path: str, new_path: str, output_root: str) -> tuple[float, int, int]:
+    """Runs one method, returning the elapsed time, the number of changes, and the peak memory of this process in MB."""
+    start = time.perf_counter()
+    changes = METHODS[name](old_path, new_path, output_root)
+    elapsed = time.perf_counter() - start
+    return elapsed, changes, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+
+
+def write_inputs(rows: int, temp_dir: str) -> dict[str, tuple[str, str]]:
+    """Writes the TSV & index of two synthetic releases, returning their paths."""
+    paths = {}
+    old = synthetic_decisions(rows)
+    for name, decisions in (('old', old), ('new', next_release(old))):
+        paths[name] = (join(temp_dir, f'{name}.tsv.bgz'), join(temp_dir, f'{name}.idx'))
+        write_decisions_tsv(decisions, output_path=paths[name][0])
+        write_decision_index(decisions, index_path=paths[name][1], assembly=GRCH38)
+    return paths
+
+
+def main(rows: int):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # every step runs in a new process, so the synthetic decisions don't count towards a diff's peak memory
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            paths = executor.submit(write_inputs, rows, temp_dir).result()
+
+        runs = [('streaming', 'TSVs', 0), ('streaming', 'indexes', 1), ('pandas', 'TSVs', 0)]
+        for name, label, column in runs:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                elapsed, changes, peak_mb = executor.submit(
+                    timed_run,
+                    name,
+                    paths['old'][column],
+                    paths['new'][column],
+                    join(temp_dir, f'{name}.{label}'),
+                ).result()
+            print(f'{name + ", " + label:>18}: {elapsed:.2f}s, {changes} changes, peak memory {peak_mb:,} MB')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark the streaming diff of decisions against a pandas join')
+    parser.add_argument('--rows', help='number of decisions to generate', type=int, default=3_000_000)
+    args = parser.parse_args()
+    main(rows=args.rows)
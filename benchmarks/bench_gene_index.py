@@ -0,0 +1,102 @@
+"""
+Benchmarks panel queries from the gene index against filtering the decisions by gene intervals
+
+Generates N synthetic decisions (as in bench_decisions_index.py) and G synthetic 50kb genes, assigns each decision to
+every gene overlapping it, then reports:
+- the time to build & write the gene index
+- the time per P-gene panel query from the gene index
+- the time per panel, filtering a pandas DataFrame of the decisions by each gene's interval
+
+python benchmarks/bench_gene_index.py --rows 3000000 --genes 20000 --panel 500
+"""
+
+import random
+import tempfile
+import time
+from argparse import ArgumentParser
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from os.path import join
+
+import pandas as pd
+from bench_decisions_index import synthetic_decisions
+
+from clinvarbitration.scripts.gene_index import GeneIndex
+from clinvarbitration.scripts.resummarise_clinvar import GRCH38, ORDERED_CONTIGS, write_gene_index
+
+GENE_LENGTH = 50_000
+PANELS = 20
+# the interval filter is much slower, so is timed on fewer panels
+INTERVAL_PANELS = 2
+
+
+def synthetic_genes(decisions: list[dict], genes: int, seed: int = 42) -> dict[str, tuple[str, int, int]]:
+    """Random gene intervals, each decision's 'genes' is set to every gene overlapping it."""
+    rng = random.Random(seed)  # noqa: S311
+    contigs = ORDERED_CONTIGS[GRCH38][:23]
+    intervals = {}
+    by_contig = defaultdict(list)
+    for number in range(genes):
+        contig, start = rng.choice(contigs), rng.randint(1, 200_000_000 - GENE_LENGTH)
+        intervals[f'GENE{number}'] = (contig, start, start + GENE_LENGTH)
+        by_contig[contig].append((start, f'GENE{number}'))
+    for gene_list in by_contig.values():
+        gene_list.sort()
+    starts = {contig: [start for start, _gene in gene_list] for contig, gene_list in by_contig.items()}
+
+    for decision in decisions:
+        gene_list = by_contig[decision['contig']]
+        contig_starts = starts[decision['contig']]
+        first = bisect_left(contig_starts, decision['position'] - GENE_LENGTH)
+        last = bisect_right(contig_starts, decision['position'])
+        decision['genes'] = [gene for _start, gene in gene_list[first:last]]
+    return intervals
+
+
+def main(rows: int, genes: int, panel: int):
+    decisions = synthetic_decisions(rows)
+    intervals = synthetic_genes(decisions, genes)
+    rng = random.Random(7)  # noqa: S311
+    panels = [rng.sample(sorted(intervals), panel) for _ in range(PANELS)]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        index_path = join(temp_dir, 'clinvar_decisions.genes.idx')
+        start = time.perf_counter()
+        write_gene_index(decisions, index_path=index_path, assembly=GRCH38)
+        print(f'{"build gene index":>24}: {time.perf_counter() - start:.3f}s')
+
+        gene_index = GeneIndex.load(index_path)
+        start = time.perf_counter()
+        index_counts = [len(gene_index.panel(panel_genes)) for panel_genes in panels]
+        elapsed = time.perf_counter() - start
+        print(f'{"gene index panels":>24}: {elapsed / PANELS * 1e3:.1f}ms per {panel}-gene panel')
+
+        frame = pd.DataFrame(
+            {
+                'contig': pd.Categorical([decision['contig'] for decision in decisions]),
+                'position': [decision['position'] for decision in decisions],
+                'allele_id': [decision['allele_id'] for decision in decisions],
+            },
+        )
+        start = time.perf_counter()
+        interval_counts = []
+        for panel_genes in panels[:INTERVAL_PANELS]:
+            masks = [
+                (frame['contig'] == contig) & frame['position'].between(begin, end)
+                for contig, begin, end in map(intervals.__getitem__, panel_genes)
+            ]
+            interval_counts.append(len(frame[pd.concat(masks, axis=1).any(axis=1)]))
+        elapsed = time.perf_counter() - start
+        print(f'{"interval filter panels":>24}: {elapsed / INTERVAL_PANELS * 1e3:.1f}ms per {panel}-gene panel')
+
+        if index_counts[:INTERVAL_PANELS] != interval_counts:
+            raise ValueError(f'Panel sizes differ, {index_counts[:INTERVAL_PANELS]} vs {interval_counts}')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark panel queries from the gene index against interval filtering')
+    parser.add_argument('--rows', help='number of decisions to generate', type=int, default=3_000_000)
+    parser.add_argument('--genes', help='number of genes to generate', type=int, default=20_000)
+    parser.add_argument('--panel', help='genes per panel', type=int, default=500)
+    args = parser.parse_args()
+    main(rows=args.rows, genes=args.genes, panel=args.panel)
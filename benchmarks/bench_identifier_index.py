@@ -0,0 +1,91 @@
+"""
+Benchmarks identifier lookups from the identifier index against scanning the decisions
+
+Generates N synthetic decisions (as in bench_decisions_index.py), each with a VariationID and, for most, an rsID, then
+reports:
+- the time to build & write the identifier index
+- single AlleleID, VariationID, and rsID lookups per second from the index
+- batch rsID lookups per second from the index
+- single rsID lookups per second, scanning a pandas DataFrame of the decisions
+
+Half of the queries hit a decision, half miss.
+
+python benchmarks/bench_identifier_index.py --rows 3000000 --queries 1000000
+"""
+
+import random
+import tempfile
+import time
+from argparse import ArgumentParser
+from os.path import join
+
+import pandas as pd
+from bench_decisions_index import synthetic_decisions
+
+from clinvarbitration.scripts.identifier_index import IdentifierIndex
+from clinvarbitration.scripts.resummarise_clinvar import GRCH38, write_identifier_index
+
+SINGLE_QUERIES = 100_000
+# the scan is much slower, so is timed on fewer queries
+SCAN_QUERIES = 20
+
+
+def add_identifiers(decisions: list[dict], seed: int = 42):
+    """VariationIDs & rsIDs in a different order to the AlleleIDs, with a tenth of the decisions lacking an rsID."""
+    rng = random.Random(seed)  # noqa: S311
+    variation_ids = rng.sample(range(len(decisions) * 2), len(decisions))
+    for decision, variation_id in zip(decisions, variation_ids, strict=True):
+        decision['variation_id'] = variation_id
+        decision['rsid'] = -1 if rng.random() < 0.1 else variation_id * 3  # noqa: PLR2004
+
+
+def main(rows: int, queries: int):
+    decisions = synthetic_decisions(rows)
+    add_identifiers(decisions)
+    rng = random.Random(7)  # noqa: S311
+    # hits are the identifiers of random decisions, misses are beyond any identifier generated
+    miss = rows * 10
+    hits = rng.sample([decision for decision in decisions if decision['rsid'] >= 0], min(queries, rows) // 2)
+    rsid_queries = [decision['rsid'] for decision in hits]
+    rsid_queries += [rsid + miss for rsid in rsid_queries]
+    rng.shuffle(rsid_queries)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        index_path = join(temp_dir, 'clinvar_decisions.ids.idx')
+        start = time.perf_counter()
+        write_identifier_index(decisions, index_path=index_path, assembly=GRCH38)
+        print(f'{"build identifier index":>24}: {time.perf_counter() - start:.3f}s')
+
+        index = IdentifierIndex.load(index_path)
+        for identifier in ('allele_id', 'variation_id', 'rsid'):
+            values = [decision[identifier] for decision in hits[: SINGLE_QUERIES // 2]]
+            values += [value + miss for value in values]
+            start = time.perf_counter()
+            found = sum(len(index.lookup(identifier, value)) for value in values)
+            elapsed = time.perf_counter() - start
+            print(f'{identifier + " single":>24}: {len(values) / elapsed:,.0f} lookups/s ({found} decisions)')
+
+        start = time.perf_counter()
+        starts, ends = index.lookup_many('rsid', rsid_queries)
+        elapsed = time.perf_counter() - start
+        print(f'{"rsid batch":>24}: {len(rsid_queries) / elapsed:,.0f} lookups/s ({int((ends - starts).sum())} hits)')
+
+        frame = pd.DataFrame({key: [decision[key] for decision in decisions] for key in ('allele_id', 'rsid')})
+        rsids = frame['rsid'].to_numpy()
+        start = time.perf_counter()
+        scanned = [frame[rsids == value] for value in rsid_queries[:SCAN_QUERIES]]
+        elapsed = time.perf_counter() - start
+        print(f'{"rsid scan":>24}: {SCAN_QUERIES / elapsed:,.0f} lookups/s')
+
+        expected = [sorted(match['allele_id']) for match in scanned]
+        indexed = [sorted(each[-1] for each in index.lookup('rsid', value)) for value in rsid_queries[:SCAN_QUERIES]]
+        if expected != indexed:
+            raise ValueError('Index lookups differ from the scan')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark identifier lookups from the identifier index against a scan')
+    parser.add_argument('--rows', help='number of decisions to generate', type=int, default=3_000_000)
+    parser.add_argument('--queries', help='number of batch queries', type=int, default=1_000_000)
+    args = parser.parse_args()
+    main(rows=args.rows, queries=args.queries)
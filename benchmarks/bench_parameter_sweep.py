@@ -0,0 +1,81 @@
+"""
+Benchmarks the vectorised parameter sweep against re-evaluating every variant in Python per setting
+
+Generates N variants with 1-8 synthetic submissions each, then reports:
+- the time to encode the submission aggregates
+- the time for one Python re-evaluation (resummarise_clinvar.decide) of every variant, the minimum cost of each
+  setting without the aggregates, and excluding the re-parse of ClinVar
+- the time to sweep a grid of settings from the aggregates, and the time per setting
+
+python benchmarks/bench_parameter_sweep.py --variants 2000000
+"""
+
+import random
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+
+from clinvarbitration.scripts.parameter_sweep import OUTCOMES, SubmissionAggregates, sweep
+from clinvarbitration.scripts.resummarise_clinvar import TIMEZONE, VERY_OLD, Consequence, Submission, decide
+
+REVIEWS = [
+    'criteria provided, single submitter',
+    'criteria provided, multiple submitters, no conflicts',
+    'no assertion criteria provided',
+    'reviewed by expert panel',
+    'practice guideline',
+]
+DATES = [VERY_OLD, *(datetime(year=year, month=6, day=1, tzinfo=TIMEZONE) for year in range(2010, 2025))]
+
+MAJORITIES = [0.5, 0.55, 0.6, 0.66, 0.75]
+MINORITIES = [0.1, 0.2, 0.3]
+THRESHOLDS = [datetime(year=year, month=1, day=1, tzinfo=TIMEZONE) for year in (2014, 2015, 2016, 2017)]
+STRONG_OPTIONS = [['practice guideline', 'reviewed by expert panel'], ['practice guideline'], []]
+
+
+def synthetic_submissions(variants: int, seed: int = 42) -> dict[int, list[Submission]]:
+    rng = random.Random(seed)  # noqa: S311
+    classes = [Consequence.PATHOGENIC, Consequence.BENIGN, Consequence.UNCERTAIN]
+    return {
+        var_id: [
+            Submission(
+                rng.choice(DATES),
+                'lab',
+                rng.choice(classes),
+                rng.choices(REVIEWS, weights=[50, 20, 25, 2, 1])[0],
+            )
+            for _ in range(rng.randint(1, 8))
+        ]
+        for var_id in range(variants)
+    }
+
+
+def main(variants: int):
+    submissions = synthetic_submissions(variants)
+
+    start = time.perf_counter()
+    aggregates = SubmissionAggregates.from_submissions(submissions, weights=dict.fromkeys(submissions, 1))
+    print(f'{"encode aggregates":>24}: {time.perf_counter() - start:.2f}s')
+
+    start = time.perf_counter()
+    expected = [decide(submissions[var_id])[0] for var_id in aggregates.variation_id.tolist()]
+    print(f'{"python, one setting":>24}: {time.perf_counter() - start:.2f}s')
+
+    settings = len(MAJORITIES) * len(MINORITIES) * len(THRESHOLDS) * len(STRONG_OPTIONS)
+    start = time.perf_counter()
+    rows = sweep(aggregates, MAJORITIES, MINORITIES, THRESHOLDS, STRONG_OPTIONS)
+    elapsed = time.perf_counter() - start
+    print(f'{"vectorised sweep":>24}: {elapsed:.2f}s for {settings} settings, {elapsed / settings * 1e3:.1f}ms each')
+
+    codes, _stars = aggregates.decisions()
+    if [OUTCOMES[code] for code in codes.tolist()] != expected:
+        raise ValueError('The vectorised decisions differ from decide()')
+    if len(rows) != settings:
+        raise ValueError(f'Expected {settings} settings, got {len(rows)}')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark the vectorised parameter sweep against per-setting re-evaluation')
+    parser.add_argument('--variants', help='number of variants to generate', type=int, default=2_000_000)
+    args = parser.parse_args()
+    main(variants=args.variants)
@@ -0,0 +1,93 @@
+"""
+Benchmarks reading the Parquet outputs against reading the equivalent TSVs
+
+Generates N synthetic decisions (as in bench_decisions_index.py) and M annotated PM5 rows (as in
+bench_clinvar_by_codon.py), writes each as TSV and Parquet, then reports for each:
+- the file sizes
+- reading the whole table with pandas, from TSV and from Parquet
+- a filtered read (one contig, or one transcript) of two columns: TSV read then filtered, vs. Parquet with pushdown
+- the same filtered read through DuckDB, if it's installed
+
+python benchmarks/bench_parquet.py --rows 3000000 --pm5-rows 5000000
+"""
+
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+from collections.abc import Callable
+from os.path import join
+
+import pandas as pd
+import pyarrow.parquet as pq
+from bench_clinvar_by_codon import write_synthetic_tsv
+from bench_decisions_index import synthetic_decisions
+
+from clinvarbitration.scripts.clinvar_by_codon import aggregate_tsv, write_results_as_tsv
+from clinvarbitration.scripts.parquet_output import write_codon_index_parquet, write_decisions_parquet
+from clinvarbitration.scripts.resummarise_clinvar import GRCH38, ORDERED_CONTIGS, write_decisions_tsv
+
+
+def timed(label: str, function: Callable, *args: object, **kwargs: object) -> object:
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    print(f'{label:>28}: {time.perf_counter() - start:.3f}s, {len(result):,} rows')
+    return result
+
+
+def duckdb_query(query: str) -> Callable | None:
+    try:
+        import duckdb  # noqa: PLC0415
+    except ImportError:
+        return None
+    return lambda: duckdb.sql(query).df()
+
+
+def compare(name: str, tsv: str, parquet: str, column: str, value: str, columns: list[str]):
+    print(f'{name}: TSV {os.path.getsize(tsv) / 1e6:.1f}MB, Parquet {os.path.getsize(parquet) / 1e6:.1f}MB')
+    # pandas doesn't infer gzip from the .bgz extension
+    compression = 'gzip' if tsv.endswith('.bgz') else 'infer'
+    timed('pandas TSV', pd.read_csv, tsv, sep='\t', compression=compression)
+    timed('pandas Parquet', pd.read_parquet, parquet)
+
+    def filter_tsv() -> pd.DataFrame:
+        table = pd.read_csv(tsv, sep='\t', usecols=[column, *columns], compression=compression)
+        return table.loc[table[column] == value, columns]
+
+    timed('pandas TSV, filtered', filter_tsv)
+    timed('pyarrow Parquet, filtered', pq.read_table, parquet, columns=columns, filters=[(column, '=', value)])
+
+    query = duckdb_query(f"SELECT {', '.join(columns)} FROM '{parquet}' WHERE {column} = '{value}'")  # noqa: S608
+    if query is None:
+        print(f'{"DuckDB Parquet, filtered":>28}: skipped, duckdb is not installed')
+    else:
+        timed('DuckDB Parquet, filtered', query)
+
+
+def main(rows: int, pm5_rows: int, transcripts: int):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        decisions = synthetic_decisions(rows)
+        decisions_tsv = join(temp_dir, 'clinvar_decisions.tsv.bgz')
+        decisions_parquet = join(temp_dir, 'clinvar_decisions.parquet')
+        write_decisions_tsv(decisions, output_path=decisions_tsv)
+        write_decisions_parquet(decisions, decisions_parquet, contigs=ORDERED_CONTIGS[GRCH38], assembly=GRCH38)
+        compare('decisions', decisions_tsv, decisions_parquet, 'contig', 'chrX', ['position', 'allele_id'])
+
+        input_tsv = join(temp_dir, 'annotated.tsv')
+        pm5_tsv = join(temp_dir, 'clinvar_decisions.pm5.tsv')
+        pm5_parquet = join(temp_dir, 'clinvar_decisions.pm5.parquet')
+        write_synthetic_tsv(input_tsv, rows=pm5_rows, transcripts=transcripts)
+        codon_index = aggregate_tsv(input_tsv)
+        write_results_as_tsv(codon_index, pm5_tsv)
+        write_codon_index_parquet(codon_index, pm5_parquet)
+        transcript = codon_index.transcripts[len(codon_index.transcripts) // 2]
+        compare('PM5', pm5_tsv, pm5_parquet, 'transcript', transcript, ['codon', 'clinvar_alleles'])
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark Parquet reads against TSV')
+    parser.add_argument('--rows', help='number of decisions to generate', type=int, default=3_000_000)
+    parser.add_argument('--pm5-rows', help='number of annotated PM5 rows to generate', type=int, default=5_000_000)
+    parser.add_argument('--transcripts', help='number of distinct transcripts', type=int, default=50_000)
+    args = parser.parse_args()
+    main(rows=args.rows, pm5_rows=args.pm5_rows, transcripts=args.transcripts)
@@ -0,0 +1,91 @@
+"""
+Benchmarks lookups from the memory-mapped PM5 index against loading the PM5 TSV into a dictionary
+
+Aggregates N synthetic annotated rows (as in bench_clinvar_by_codon.py), writes the PM5 TSV and index, then reports:
+- the time to load the TSV into a {'transcript::codon': alleles} dictionary, vs. memory-mapping the index
+- single lookups per second, for the dictionary and the index
+- queries per second for batch lookups of the index
+- single and batch +/- 10 codon window counts per second
+
+Half of the queries hit a PM5 codon, half miss.
+
+python benchmarks/bench_pm5_index.py --rows 5000000 --queries 1000000
+"""
+
+import random
+import tempfile
+import time
+from argparse import ArgumentParser
+from collections.abc import Callable
+from os.path import join
+
+from bench_clinvar_by_codon import write_synthetic_tsv
+
+from clinvarbitration.scripts.clinvar_by_codon import aggregate_tsv, write_results_as_tsv
+from clinvarbitration.scripts.pm5_index import Pm5Index
+
+SINGLE_QUERIES = 100_000
+
+
+def load_tsv(pm5_tsv: str) -> dict[str, str]:
+    """How consumers currently use the PM5 TSV, reading the whole table up front."""
+    with open(pm5_tsv) as handle:
+        next(handle)
+        return {f'{tx}::{codon}': alleles for tx, codon, alleles in (line.rstrip('\n').split('\t') for line in handle)}
+
+
+def make_queries(pm5_index: Pm5Index, count: int, seed: int = 42) -> list[tuple[str, int]]:
+    rng = random.Random(seed)  # noqa: S311
+    transcripts = [transcript.decode() for transcript in pm5_index.transcripts.tolist()]
+    group_keys = pm5_index.group_key.tolist()
+    queries = []
+    for _ in range(count):
+        if rng.random() < 0.5:  # noqa: PLR2004
+            key = rng.choice(group_keys)
+            queries.append((transcripts[key >> 24], key & 0xFFFFFF))
+        else:
+            queries.append((rng.choice(transcripts), rng.randint(3000, 5000)))
+    return queries
+
+
+def timed(label: str, count: int, function: Callable, *args: object) -> object:
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    rate = f', {count / elapsed:,.0f} queries/s' if count else ''
+    print(f'{label:>24}: {elapsed:.3f}s{rate}')
+    return result
+
+
+def main(rows: int, transcripts: int, queries: int):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_tsv = join(temp_dir, 'annotated.tsv')
+        pm5_tsv = join(temp_dir, 'clinvar_decisions.pm5.tsv')
+        index_path = join(temp_dir, 'clinvar_decisions.pm5.idx')
+
+        write_synthetic_tsv(input_tsv, rows=rows, transcripts=transcripts)
+        codon_index = aggregate_tsv(input_tsv)
+        write_results_as_tsv(codon_index, pm5_tsv)
+        Pm5Index.from_codon_index(codon_index).write(index_path)
+
+        table = timed('load TSV', 0, load_tsv, pm5_tsv)
+        pm5_index = timed('map index', 0, Pm5Index.load, index_path)
+
+        single = make_queries(pm5_index, min(queries, SINGLE_QUERIES))
+        batch = make_queries(pm5_index, queries)
+        batch_transcripts, batch_codons = [tx for tx, _ in batch], [codon for _, codon in batch]
+
+        timed('dict lookups', len(single), lambda: [table.get(f'{tx}::{codon}') for tx, codon in single])
+        timed('index lookups', len(single), lambda: [pm5_index.lookup(tx, codon) for tx, codon in single])
+        timed('index batch lookup', len(batch), pm5_index.lookup_many, batch_transcripts, batch_codons)
+        timed('window counts', len(single), lambda: [pm5_index.window_count(tx, codon, 10) for tx, codon in single])
+        timed('batch window counts', len(batch), pm5_index.window_many, batch_transcripts, batch_codons, 10)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark PM5 index lookups')
+    parser.add_argument('--rows', help='number of annotated rows to generate', type=int, default=5_000_000)
+    parser.add_argument('--transcripts', help='number of distinct transcripts', type=int, default=50_000)
+    parser.add_argument('--queries', help='number of batch queries', type=int, default=1_000_000)
+    args = parser.parse_args()
+    main(rows=args.rows, transcripts=args.transcripts, queries=args.queries)
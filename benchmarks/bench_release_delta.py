@@ -0,0 +1,68 @@
+"""
+Benchmarks the release delta on synthetic decisions
+
+Generates N synthetic decisions (as in bench_decisions_index.py), and a next release with 1% reclassified, 1% with
+changed stars, 0.5% removed and 0.5% added (as in bench_diff_decisions.py). Writes both as release folders (the
+decisions TSV, tabix index & decisions index), then reports:
+- the size of the files the delta replaces, compressed as in the release tarball, against the size of the delta
+- the time to write the delta, and to apply it to a copy of the previous release, verifying every file it updates
+
+python benchmarks/bench_release_delta.py --rows 3000000
+"""
+
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+from argparse import ArgumentParser
+from os.path import getsize, join
+
+from bench_decisions_index import synthetic_decisions
+from bench_diff_decisions import next_release
+
+from clinvarbitration.scripts.apply_delta import apply_delta
+from clinvarbitration.scripts.release_delta import main as release_delta
+from clinvarbitration.scripts.release_delta import write_checksums
+from clinvarbitration.scripts.resummarise_clinvar import GRCH38, write_decision_index, write_decisions_tsv
+
+
+def write_release(release_dir: str, decisions: list[dict]):
+    os.makedirs(release_dir)
+    write_decisions_tsv(decisions, output_path=join(release_dir, 'clinvar_decisions.tsv.bgz'))
+    write_decision_index(decisions, index_path=join(release_dir, 'clinvar_decisions.idx'), assembly=GRCH38)
+
+
+def main(rows: int):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        previous, new = join(temp_dir, 'previous'), join(temp_dir, 'new')
+        old = synthetic_decisions(rows)
+        write_release(previous, old)
+        write_checksums(previous)
+        write_release(new, next_release(old))
+        del old
+
+        tarball = join(temp_dir, 'release.tar.gz')
+        with tarfile.open(tarball, 'w:gz') as tar:
+            tar.add(new, arcname='clinvarbitration_data')
+
+        delta = join(temp_dir, 'delta.tar.gz')
+        start = time.perf_counter()
+        release_delta(new_dir=new, previous_dir=previous, delta_path=delta)
+        print(f'   write delta: {time.perf_counter() - start:.2f}s')
+
+        local = join(temp_dir, 'local')
+        shutil.copytree(previous, local)
+        start = time.perf_counter()
+        apply_delta(delta, local)
+        print(f'   apply delta: {time.perf_counter() - start:.2f}s, including verification')
+
+        print(f'release files: {getsize(tarball) / 1024 / 1024:.1f} MB as a tarball')
+        print(f'        delta: {getsize(delta) / 1024 / 1024:.1f} MB')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark the release delta')
+    parser.add_argument('--rows', help='number of decisions to generate', type=int, default=3_000_000)
+    args = parser.parse_args()
+    main(rows=args.rows)
@@ -0,0 +1,100 @@
+"""
+Benchmarks lookups against the cloud-optimised release layout, served over HTTP from a local stand-in server
+
+Generates N synthetic decisions (as in bench_decisions_index.py), writes the layout, then reports:
+- the time to write the layout, and its size against the decisions TSV
+- for Q random variant lookups from a fresh client: requests made, bytes fetched, and lookups per second
+- the same lookups repeated, answered from the block cache
+
+python benchmarks/bench_remote_release.py --rows 3000000 --queries 1000
+"""
+
+import os
+import tempfile
+import threading
+import time
+from argparse import ArgumentParser
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from os.path import join
+
+from bench_decisions_index import make_queries, synthetic_decisions
+
+from clinvarbitration.scripts.cloud_release import write_cloud_release
+from clinvarbitration.scripts.remote_release import RemoteRelease
+from clinvarbitration.scripts.resummarise_clinvar import write_decisions_tsv
+
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    """Answers single Range requests from a folder, as a bucket or web server would."""
+
+    def log_message(self, *args: object):
+        pass
+
+    def do_GET(self):
+        with open(self.translate_path(self.path), 'rb') as handle:
+            if byte_range := self.headers.get('Range'):
+                first, _, last = byte_range.removeprefix('bytes=').partition('-')
+                handle.seek(int(first))
+                data = handle.read(int(last) + 1 - int(first))
+                self.send_response(206)
+            else:
+                data = handle.read()
+                self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def run_queries(release: RemoteRelease, queries: list[tuple[str, int, str, str]], label: str):
+    requests, fetched = release.requests, release.bytes_fetched
+    start = time.perf_counter()
+    for query in queries:
+        release.lookup(*query)
+    elapsed = time.perf_counter() - start
+    print(
+        f'{label:>24}: {len(queries) / elapsed:,.0f} lookups/s, {release.requests - requests} requests, '
+        f'{(release.bytes_fetched - fetched) / 1e6:.2f}MB fetched',
+    )
+
+
+def main(rows: int, queries: int):
+    decisions = synthetic_decisions(rows)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        tsv = join(temp_dir, 'clinvar_decisions.tsv.bgz')
+        write_decisions_tsv(decisions, output_path=tsv)
+        pm5 = join(temp_dir, 'clinvar_decisions.pm5.tsv')
+        with open(pm5, 'w') as handle:
+            handle.write('transcript\tcodon\tclinvar_alleles\n')
+
+        cloud = join(temp_dir, 'clinvar_decisions.cloud')
+        start = time.perf_counter()
+        write_cloud_release({'decisions': tsv, 'pm5': pm5}, cloud)
+        elapsed = time.perf_counter() - start
+        size = sum(os.path.getsize(join(cloud, name)) for name in os.listdir(cloud))
+        print(f'{"write layout":>24}: {elapsed:.3f}s, {size / 1e6:.1f}MB, TSV {os.path.getsize(tsv) / 1e6:.1f}MB')
+
+        def make_handler(*args: object) -> RangeHandler:
+            return RangeHandler(*args, directory=cloud)
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            start = time.perf_counter()
+            release = RemoteRelease(f'http://127.0.0.1:{server.server_address[1]}')
+            elapsed = time.perf_counter() - start
+            print(f'{"open (fetch index)":>24}: {elapsed * 1e3:.1f}ms, {release.bytes_fetched / 1e3:.1f}kB')
+
+            chosen = make_queries(decisions, queries)
+            run_queries(release, chosen, 'cold lookups')
+            run_queries(release, chosen, 'cached lookups')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark lookups against the cloud-optimised release layout')
+    parser.add_argument('--rows', help='number of decisions to generate', type=int, default=3_000_000)
+    parser.add_argument('--queries', help='number of lookups', type=int, default=1_000)
+    args = parser.parse_args()
+    main(rows=args.rows, queries=args.queries)
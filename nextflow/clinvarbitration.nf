@@ -2,9 +2,9 @@
 
 nextflow.enable.dsl=2
 
-include { AnnotateCsqWithBcftools } from './modules/AnnotateCsqWithBcftools/main'
+include { AnnotateSnvsIntoPm5Table } from './modules/AnnotateSnvsIntoPm5Table/main'
+include { CompileGff3Index } from './modules/CompileGff3Index/main'
 include { DownloadClinVarFiles } from './modules/DownloadClinVarFiles/main'
-include { MakePm5TableFromAnnotations } from './modules/MakePm5TableFromAnnotations/main'
 include { PackageForRelease } from './modules/PackageForRelease/main'
 include { ResummariseRawSubmissions } from './modules/ResummariseRawSubmissions/main'
 
@@ -40,22 +40,45 @@ workflow {
         ch_clinvar_sub,
     )
 
-    // annotate the SNV VCF using BCFtools
-    AnnotateCsqWithBcftools(
+    // compile the GFF3 into a transcript index for the native annotator, cached in the data directory
+    // bcftools csq parses the GFF3 itself, so without the native annotator the index isn't built
+    if (params.native_annotation) {
+        CompileGff3Index(ch_gff3)
+        ch_gff3_index = CompileGff3Index.out
+    } else {
+        ch_gff3_index = channel.value([])
+    }
+
+    // missense results from previous runs, if the annotation cache is in use
+    def cache_file = file("${params.data}/annotation_cache.db")
+    ch_annotation_cache = (params.annotation_cache && cache_file.exists()) ? channel.value(cache_file) : channel.value([])
+
+    // annotate the SNV VCF using BCFtools, piping the missense rows straight into the PM5 table generation
+    AnnotateSnvsIntoPm5Table(
         ResummariseRawSubmissions.out.vcf,
+        ResummariseRawSubmissions.out.vcf_idx,
         ch_ref_fa,
         ch_gff3,
+        ch_gff3_index,
+        ch_annotation_cache,
     )
 
-    MakePm5TableFromAnnotations(
-        AnnotateCsqWithBcftools.out
-    )
+    // the previous release tarball, to write a delta against, or [] if there isn't one
+    ch_previous_release = params.previous_release ? channel.value(file(params.previous_release, checkIfExists: true)) : channel.value([])
 
     PackageForRelease(
         ResummariseRawSubmissions.out.ht,
         ResummariseRawSubmissions.out.tsv,
-        MakePm5TableFromAnnotations.out.ht,
-        MakePm5TableFromAnnotations.out.tsv,
+        ResummariseRawSubmissions.out.tsv_idx,
+        ResummariseRawSubmissions.out.idx,
+        ResummariseRawSubmissions.out.genes_idx,
+        ResummariseRawSubmissions.out.ids_idx,
+        AnnotateSnvsIntoPm5Table.out.ht,
+        AnnotateSnvsIntoPm5Table.out.tsv,
+        AnnotateSnvsIntoPm5Table.out.idx,
+        AnnotateSnvsIntoPm5Table.out.ps1_ht,
+        AnnotateSnvsIntoPm5Table.out.ps1_tsv,
+        ch_previous_release,
     )
 }
 
@@ -1,29 +0,0 @@
-process AnnotateCsqWithBcftools {
-    container params.container
-
-    publishDir params.output_dir
-
-    input:
-        path vcf
-        path ref_fa
-        path gff3
-
-    output:
-        path "clinvar_decisions.annotated.tsv"
-
-    """
-    bcftools csq \
-        -f "${ref_fa}" \
-        --force \
-        --local-csq \
-        --unify-chr-names 'chr,-,chr' \
-        -g "${gff3}" \
-        "${vcf}" |
-    bcftools +split-vep \
-        -d \
-        -s :missense \
-        -f "%transcript\t%amino_acid_change\t%allele_id\t%gold_stars\n" \
-        - \
-        > clinvar_decisions.annotated.tsv
-    """
-}
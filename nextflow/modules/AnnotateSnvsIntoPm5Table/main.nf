@@ -0,0 +1,63 @@
+process AnnotateSnvsIntoPm5Table {
+    container params.container
+
+    publishDir params.output_dir, mode: 'copy', pattern: "clinvar_decisions.{pm5,ps1}.*"
+
+    // the updated annotation cache replaces the previous one in the data directory
+    publishDir params.data, pattern: "annotation_cache.db", mode: 'copy', overwrite: true
+
+    cpus params.annotation_threads
+
+    input:
+        path vcf
+        path vcf_idx
+        path ref_fa
+        path gff3
+        // the compiled GFF3 index, or [] if the native annotator isn't used
+        path gff3_index
+        // the annotation cache from the previous run, or [] if there isn't one
+        path previous_cache, stageAs: 'previous_annotation_cache.db'
+
+    output:
+        path "clinvar_decisions.pm5.ht", emit: "ht"
+        path "clinvar_decisions.pm5.tsv", emit: "tsv"
+        path "clinvar_decisions.pm5.idx", emit: "idx"
+        path "clinvar_decisions.ps1.ht", emit: "ps1_ht"
+        path "clinvar_decisions.ps1.tsv", emit: "ps1_tsv"
+        path "annotation_cache.db", emit: "cache", optional: true
+
+    script:
+    // the missense rows are piped straight from the annotator into the PM5 aggregation, with no intermediate file
+    // the same pass writes the PS1 index, on (transcript, codon, alternate amino acid)
+    // bcftools annotation splits the VCF into region chunks, each annotated with bcftools csq | bcftools +split-vep in
+    // parallel, and merged in genomic order, so the output is identical to a single serial run
+    // if params.native_annotation is set, the in-process missense annotator is used instead of bcftools
+    // this reads transcripts from the compiled GFF3 index, instead of parsing the GFF3
+    def index_arg = params.native_annotation ? "--index ${gff3_index}" : ''
+
+    // with params.annotation_cache, only SNVs not annotated in a previous run are sent to the annotator
+    def annotator = params.native_annotation ? 'missense_annotator' : 'annotate_snvs'
+    def cache_args = ''
+    def copy_cache = ''
+    if (params.annotation_cache) {
+        annotator = 'annotation_cache'
+        cache_args = params.native_annotation ? '--cache annotation_cache.db --native' : '--cache annotation_cache.db'
+        copy_cache = 'if [ -f previous_annotation_cache.db ]; then cp previous_annotation_cache.db annotation_cache.db; fi'
+    }
+    // optionally add the structured allele columns to the PM5 outputs
+    def structured = params.structured_pm5 ? '--structured' : ''
+    """
+    set -o pipefail
+    ${copy_cache}
+    python3 -m clinvarbitration.scripts.${annotator} \
+        -i "${vcf}" \
+        -f "${ref_fa}" \
+        -g "${gff3}" \
+        -o - \
+        --threads ${task.cpus} ${index_arg} ${cache_args} | \
+    python3 -m clinvarbitration.scripts.clinvar_by_codon \
+        -i - \
+        -o clinvar_decisions.pm5 \
+        --ps1 clinvar_decisions.ps1 ${structured}
+    """
+}
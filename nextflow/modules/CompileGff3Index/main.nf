@@ -0,0 +1,17 @@
+process CompileGff3Index {
+    container params.container
+
+    // the compiled index is kept in the data directory, so it's only built once per GFF3
+    storeDir params.data
+
+    input:
+        path gff3
+
+    // the index file name contains the md5 checksum of the GFF3
+    output:
+        path "${gff3}.*.cdsidx"
+
+    """
+    python3 -m clinvarbitration.scripts.gff3_index -g "${gff3}"
+    """
+}
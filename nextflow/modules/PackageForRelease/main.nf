@@ -1,20 +1,51 @@
 process PackageForRelease {
+    container params.container
 
     publishDir params.output_dir, mode: 'copy'
 
     input:
         path decisions_ht
         path decisions_tsv
+        path decisions_tsv_idx
+        path decisions_idx
+        path genes_idx
+        path ids_idx
         path pm5_ht
         path pm5_tsv
+        path pm5_idx
+        path ps1_ht
+        path ps1_tsv
+        // the previous release tarball, or [] if there isn't one
+        path previous_release, stageAs: 'previous_release.tar.gz'
 
     output:
         path "clinvar_decisions.release.tar.gz"
+        path "clinvar_decisions.cloud"
+        path "clinvar_decisions.delta.tar.gz", optional: true
 
     // create a new folder, decompress the previous archives, and recompress everything together
+    // the checksums of every file are written into the folder first, so they're packaged in the tarball
+    // given the previous release, also write the delta from it, for updating a local copy in place
+    // then write the cloud-optimised layout, for remote lookups over HTTP Range requests
     """
     mkdir clinvarbitration_data
-    cp -r "${pm5_ht}" "${pm5_tsv}" "${decisions_ht}" "${decisions_tsv}" clinvarbitration_data/
+    cp -r "${pm5_ht}" "${pm5_tsv}" "${pm5_idx}" "${ps1_ht}" "${ps1_tsv}" "${decisions_ht}" "${decisions_tsv}" "${decisions_tsv_idx}" "${decisions_idx}" "${genes_idx}" "${ids_idx}" clinvarbitration_data/
+    if [ -f previous_release.tar.gz ]; then
+        mkdir previous
+        tar -xzf previous_release.tar.gz -C previous
+        python3 -m clinvarbitration.scripts.release_delta \
+            -n clinvarbitration_data \
+            -p previous/clinvarbitration_data \
+            -o clinvar_decisions.delta.tar.gz
+    else
+        python3 -m clinvarbitration.scripts.release_delta -n clinvarbitration_data
+    fi
     tar -czf clinvar_decisions.release.tar.gz clinvarbitration_data
+
+    python3 -m clinvarbitration.scripts.cloud_release \
+        --decisions "${decisions_tsv}" \
+        --pm5 "${pm5_tsv}" \
+        --ps1 "${ps1_tsv}" \
+        -o clinvar_decisions.cloud
     """
 }
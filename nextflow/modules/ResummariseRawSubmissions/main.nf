@@ -12,16 +12,27 @@ process ResummariseRawSubmissions {
         path "clinvar_decisions.vcf.bgz", emit: "vcf"
         path "clinvar_decisions.vcf.bgz.tbi", emit: "vcf_idx"
         path "clinvar_decisions.ht", emit: "ht"
-        path "clinvar_decisions.tsv", emit: "tsv"
+        path "clinvar_decisions.tsv.bgz", emit: "tsv"
+        path "clinvar_decisions.tsv.bgz.tbi", emit: "tsv_idx"
+        path "clinvar_decisions.idx", emit: "idx"
+        path "clinvar_decisions.genes.idx", emit: "genes_idx"
+        path "clinvar_decisions.ids.idx", emit: "ids_idx"
+        path "clinvar_decisions.shards", emit: "shards", optional: true
 
     // Generates
     // clinvar_decisions.vcf.bgz + index - VCF containing only pathogenic SNV entries, feeds into annotation
     // clinvar_decisions.ht - a Hail Table containing the summarised data entries
+    // clinvar_decisions.tsv.bgz + index - the summarised data entries as a tabix-indexed TSV
+    // clinvar_decisions.idx - a memory-mappable index of the decisions, for lookups without Hail
+    // clinvar_decisions.genes.idx - a memory-mappable index of the decisions in each gene, for panel queries
+    // clinvar_decisions.ids.idx - a memory-mappable index of the decisions by AlleleID, VariationID & rsID
+    // clinvar_decisions.shards - if params.shard_by_contig, per-contig TSV/HT/VCF shards and a manifest.json
+    def shard_flag = params.shard_by_contig ? '--shards' : ''
     """
     python3 -m clinvarbitration.scripts.resummarise_clinvar \
         -v "${variant_summary}" \
         -s "${submission_summary}" \
         -o "clinvar_decisions" \
-        --assembly "${params.assembly}"
+        --assembly "${params.assembly}" ${shard_flag}
     """
 }
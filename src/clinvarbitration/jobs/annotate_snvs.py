@@ -1,23 +1,29 @@
 from typing import TYPE_CHECKING
 
-from cpg_utils import config, hail_batch
-
-from clinvarbitration.cpg_internal.utils import make_me_a_job
+from cpg_utils import config, hail_batch, to_path
 
 if TYPE_CHECKING:
     from hailtop.batch.job import BashJob
 
 
-def annotate_clinvar_snvs(
-    snv_vcf: str,
-    output: str,
-) -> 'BashJob':
-    """Annotate the SNVs, reduce dataset to Missense only, write as a TSV."""
+def annotate_clinvar_snvs(job: 'BashJob', snv_vcf: str) -> str:
+    """
+    Localise the annotation inputs, and build a command to annotate the SNVs, reduced to missense only
+    The command writes Transcript, Amino Acid Change, ClinVar allele ID, ClinVar gold stars to stdout, to be piped
+    straight into the PM5 table generation. If the annotation cache is in use, it's copied in to the job here.
+
+    Args:
+        job (BashJob): the job the annotation will run in
+        snv_vcf (str): path to the tabix-indexed VCF of Pathogenic SNVs
+
+    Returns:
+        the annotation command
+    """
 
     batch_instance = hail_batch.get_batch('Run ClinvArbitration')
 
-    # localise the input file
-    snv_vcf_local = batch_instance.read_input(snv_vcf)
+    # localise the input file, and its index - required to split the VCF into regions
+    snv_vcf_local = batch_instance.read_input_group(vcf=snv_vcf, tbi=f'{snv_vcf}.tbi')
 
     # need a genome reference - mandatory argument
     ref_fa = batch_instance.read_input(config.config_retrieve(['workflow', 'ref_fa']))
@@ -25,37 +31,31 @@ def annotate_clinvar_snvs(
     # read in the gene model file
     gff3 = batch_instance.read_input(config.config_retrieve(['references', 'ensembl_113', 'gff3']))
 
-    job = make_me_a_job(name='AnnotateClinvarSnvsWithBcftools', attributes={'tool': 'bcftools'})
-
-    # -g is the GFF3 file, -f is the reference fasta
-    # --local-csq is required to apply non-phase aware annotation
-    # --force is required to use annotations without phase data
-    job.command(f"""
-        bcftools csq \\
-        --force \\
-        --local-csq \\
-        -f {ref_fa} \\
-        --unify-chr-names 'chr,-,chr' \\
-        -g {gff3} \\
-        {snv_vcf_local} \\
-        -o out.vcf
-    """)
-
-    # split the bcftools CSQ fields, filter to missense, and write out a tab-delimited file
-    # -d - duplicate, writes each transcript onto a new line
-    # -s :missense - only keep Consequence==missense variants
-    # -f - format string - tab delimited, Transcript, Amino Acid Change, ClinVar allele ID, ClinVar gold stars
-    job.command(
-        """
-        bcftools \\
-            +split-vep out.vcf \\
-            -d \\
-            -s :missense \\
-            -f "%transcript\t%amino_acid_change\t%allele_id\t%gold_stars\n" \\
-            > output_file
-        """,
-    )
-
-    job.command(f'gcloud storage cp output_file {output}')
-
-    return job
+    # number of region chunks to annotate in parallel
+    threads = config.config_retrieve(['workflow', 'annotation_threads'], 4)
+
+    # optionally swap bcftools for the in-process missense annotator, which produces identical rows
+    native = config.config_retrieve(['workflow', 'native_annotation'], False)
+    annotator = 'missense_annotator' if native else 'annotate_snvs'
+
+    # a pre-compiled transcript index saves the native annotator from parsing the GFF3
+    extra_args = ''
+    if native and (gff3_index := config.config_retrieve(['workflow', 'gff3_index'], None)):
+        extra_args = f'--index {batch_instance.read_input(gff3_index)}'
+
+    # optionally, a persistent cache of missense results - only SNVs not annotated in an earlier run are annotated
+    if cache := config.config_retrieve(['workflow', 'annotation_cache'], None):
+        if to_path(cache).exists():
+            job.command(f'cp {batch_instance.read_input(cache)} annotation_cache.db')
+        annotator = 'annotation_cache'
+        extra_args += ' --cache annotation_cache.db --native' if native else ' --cache annotation_cache.db'
+
+    # bcftools csq runs on each region chunk in parallel, piped straight into bcftools +split-vep
+    # this filters to missense, and writes Transcript, Amino Acid Change, ClinVar allele ID, ClinVar gold stars
+    return f"""
+        python3 -m clinvarbitration.scripts.{annotator} \\
+            -i {snv_vcf_local.vcf} \\
+            -f {ref_fa} \\
+            -g {gff3} \\
+            -o - \\
+            --threads {threads} {extra_args}"""
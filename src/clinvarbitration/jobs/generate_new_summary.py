@@ -24,6 +24,9 @@ def generate_new_summary(
     else:
         blacklist_string = ''
 
+    # optionally write per-contig shards of every output, alongside a manifest
+    shard_string = ' --shards' if config.config_retrieve(['workflow', 'shard_by_contig'], False) else ''
+
     var_file_local = batch_instance.read_input(var_file)
     sub_file_local = batch_instance.read_input(sub_file)
 
@@ -31,7 +34,7 @@ def generate_new_summary(
         python3 -m clinvarbitration.scripts.resummarise_clinvar \\
         -v {var_file_local} \\
         -s {sub_file_local} \\
-        {blacklist_string} -o ${{BATCH_TMPDIR}}/clinvar_decisions
+        {blacklist_string}{shard_string} -o ${{BATCH_TMPDIR}}/clinvar_decisions
     """)
 
     # don't tar from current location, we'll catch all the tmp pathing
@@ -41,8 +44,14 @@ def generate_new_summary(
         gcloud storage cp \\
             clinvar_decisions.ht.tar \\
             "${{BATCH_TMPDIR}}/clinvar_decisions.vcf.bgz*" \\
-            ${{BATCH_TMPDIR}}/clinvar_decisions.tsv \\
+            "${{BATCH_TMPDIR}}/clinvar_decisions.tsv.bgz*" \\
+            ${{BATCH_TMPDIR}}/clinvar_decisions.idx \\
+            ${{BATCH_TMPDIR}}/clinvar_decisions.genes.idx \\
+            ${{BATCH_TMPDIR}}/clinvar_decisions.ids.idx \\
             {output_root}
     """)
 
+    if shard_string:
+        job.command(f'gcloud storage cp -r ${{BATCH_TMPDIR}}/clinvar_decisions.shards {output_root}')
+
     return job
@@ -1,38 +1,59 @@
 from typing import TYPE_CHECKING
 
-from cpg_utils import hail_batch
+from cpg_utils import config
 
 from clinvarbitration.cpg_internal.utils import make_me_a_job
+from clinvarbitration.jobs.annotate_snvs import annotate_clinvar_snvs
 
 if TYPE_CHECKING:
     from hailtop.batch.job import BashJob
 
 
 def generate_pm5_data(
-    annotated_snvs: str,
+    snv_vcf: str,
     output_folder: str,
 ) -> 'BashJob':
-    """Generate PM5 data (index pathogenic missense variants by codon/transcript)."""
+    """
+    Annotate the Pathogenic SNVs, and generate PM5 data (index pathogenic missense variants by codon/transcript)
+    The annotated rows are piped straight into the PM5 generation, so no annotated TSV is written
+    """
 
-    batch_instance = hail_batch.get_batch('Run ClinvArbitration')
+    threads = config.config_retrieve(['workflow', 'annotation_threads'], 4)
+    job = make_me_a_job('Pm5TableGeneration', attributes={'tool': 'bcftools'}).cpu(threads).storage('10G')
 
-    annotated_snvs_local = batch_instance.read_input(annotated_snvs)
+    annotation_command = annotate_clinvar_snvs(job=job, snv_vcf=snv_vcf)
 
-    job = make_me_a_job('Pm5TableGeneration').storage('10G')
+    # optionally add the structured allele columns to the PM5 outputs
+    structured = '--structured' if config.config_retrieve(['workflow', 'structured_pm5'], False) else ''
 
     # write both HT and TSV outputs to the same root location
     job.command(f"""
+        set -o pipefail
+        {annotation_command} | \\
         python3 -m clinvarbitration.scripts.clinvar_by_codon \\
-            -i {annotated_snvs_local} \\
-            -o ${{BATCH_TMPDIR}}/clinvar_decisions.pm5
+            -i - \\
+            -o ${{BATCH_TMPDIR}}/clinvar_decisions.pm5 \\
+            --ps1 ${{BATCH_TMPDIR}}/clinvar_decisions.ps1 {structured}
     """)
 
-    # compress the HT, move the TSV, and copy everything out in a single command
+    # write the updated annotation cache back, if one is in use
+    if cache := config.config_retrieve(['workflow', 'annotation_cache'], None):
+        job.command(f'gcloud storage cp annotation_cache.db {cache}')
+
+    # compress the HTs, and copy them out with the TSVs and index in a single command
     job.command(
         f"""
         mv ${{BATCH_TMPDIR}}/clinvar_decisions.pm5.ht clinvar_decisions.pm5.ht
+        mv ${{BATCH_TMPDIR}}/clinvar_decisions.ps1.ht clinvar_decisions.ps1.ht
         tar -cf clinvar_decisions.pm5.ht.tar clinvar_decisions.pm5.ht
-        gcloud storage cp ${{BATCH_TMPDIR}}/clinvar_decisions.pm5.tsv clinvar_decisions.pm5.ht.tar {output_folder}
+        tar -cf clinvar_decisions.ps1.ht.tar clinvar_decisions.ps1.ht
+        gcloud storage cp \
+            ${{BATCH_TMPDIR}}/clinvar_decisions.pm5.tsv \
+            ${{BATCH_TMPDIR}}/clinvar_decisions.pm5.idx \
+            ${{BATCH_TMPDIR}}/clinvar_decisions.ps1.tsv \
+            clinvar_decisions.pm5.ht.tar \
+            clinvar_decisions.ps1.ht.tar \
+            {output_folder}
         """,
     )
 
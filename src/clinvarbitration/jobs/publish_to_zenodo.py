@@ -11,14 +11,24 @@ if TYPE_CHECKING:
 def create_new_release(
     tarball: Path,
     successfile: Path,
+    delta: Path | None = None,
 ) -> 'BashJob':
-    """Localise the Tarball, create and publish a new release, write success file."""
+    """
+    Localise the Tarball & any delta from the previous release, create and publish a new release, write success
+    The delta is copied in the job rather than localised, as it's not written if the previous release can't be compared
+    """
 
     batch_instance = hail_batch.get_batch('Run ClinvArbitration')
 
     job = make_me_a_job('PublishToZenodo').storage('10G')
 
     tarball_local = batch_instance.read_input(tarball)
+    delta_string = ''
+    if delta:
+        job.command(
+            f'gcloud storage cp {delta} clinvar_decisions.delta.tar.gz || echo "No delta from the previous release"',
+        )
+        delta_string = ' $([ -f clinvar_decisions.delta.tar.gz ] && echo "--delta clinvar_decisions.delta.tar.gz")'
 
     # a record ID to create a new version of, not necessarily the latest
     zenodo_record = config.config_retrieve(['workflow', 'zenodo_id'])
@@ -34,7 +44,7 @@ def create_new_release(
             --record {zenodo_record} \\
             --secret {zenodo_secret} \\
             --project {zenodo_project} \\
-            --tarball {tarball_local} \\
+            --tarball {tarball_local}{delta_string} \\
             --success {job.output}
     """,
     )
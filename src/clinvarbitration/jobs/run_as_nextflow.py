@@ -40,7 +40,14 @@ def clinvarbitration_nextflow(
             'vcf.bgz.tbi': '{root}/clinvar_decisions.vcf.bgz.tbi',
             'unfiltered.vcf.bgz': '{root}/clinvar_decisions.unfiltered.vcf.bgz',
             'unfiltered.vcf.bgz.tbi': '{root}/clinvar_decisions.unfiltered.vcf.bgz.tbi',
-            'annotated.tsv': '{root}/clinvar_decisions.annotated.tsv',
+            'tsv.bgz': '{root}/clinvar_decisions.tsv.bgz',
+            'tsv.bgz.tbi': '{root}/clinvar_decisions.tsv.bgz.tbi',
+            'idx': '{root}/clinvar_decisions.idx',
+            'genes.idx': '{root}/clinvar_decisions.genes.idx',
+            'ids.idx': '{root}/clinvar_decisions.ids.idx',
+            'pm5.tsv': '{root}/clinvar_decisions.pm5.tsv',
+            'pm5.idx': '{root}/clinvar_decisions.pm5.idx',
+            'ps1.tsv': '{root}/clinvar_decisions.ps1.tsv',
             'release.tar.gz': '{root}/clinvar_decisions.release.tar.gz',
         },
     )
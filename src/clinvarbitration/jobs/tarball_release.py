@@ -11,18 +11,35 @@ if TYPE_CHECKING:
 def package_data_for_release(
     pm5: dict[str, Path],
     clinvar_decisions: dict[str, Path],
-    output: Path,
+    output: dict[str, Path],
+    previous_release: Path | None = None,
+    delta: Path | None = None,
 ) -> 'BashJob':
-    """Localise all the previously generated data into a folder - tarball it, and write out as a single file."""
+    """
+    Localise all the previously generated data into a folder - tarball it, and write out as a single file
+    The checksums of every file are written into the folder first, so they're packaged in the tarball
+    Given the previous release tarball, also writes the delta from it to `delta`, for updating a local copy in place
+    No delta is written if the previous release can't be compared, e.g. it predates the checksums, so it's optional
+    Also writes the cloud-optimised layout alongside the tarball, for remote lookups over HTTP Range requests
+    """
 
     batch_instance = hail_batch.get_batch('Run ClinvArbitration')
 
     job = make_me_a_job('PackageForRelease').storage('10G')
 
     decisions_ht = batch_instance.read_input(clinvar_decisions['clinvar_decisions'])
-    decisions_tsv = batch_instance.read_input(clinvar_decisions['tsv'])
+    decisions_tsv = batch_instance.read_input_group(
+        tsv=clinvar_decisions['tsv'],
+        tbi=f'{clinvar_decisions["tsv"]}.tbi',
+    )
+    decisions_idx = batch_instance.read_input(clinvar_decisions['idx'])
+    genes_idx = batch_instance.read_input(clinvar_decisions['genes'])
+    ids_idx = batch_instance.read_input(clinvar_decisions['ids'])
     pm5_ht = batch_instance.read_input(pm5['ht'])
     pm5_tsv = batch_instance.read_input(pm5['tsv'])
+    pm5_idx = batch_instance.read_input(pm5['idx'])
+    ps1_ht = batch_instance.read_input(pm5['ps1_ht'])
+    ps1_tsv = batch_instance.read_input(pm5['ps1_tsv'])
 
     # create a new folder, move the files into it
     # unpack all the already compressed HTs into it
@@ -31,17 +48,57 @@ def package_data_for_release(
         f"""
         mkdir clinvarbitration_data
         tar -xf {pm5_ht} -C clinvarbitration_data
+        tar -xf {ps1_ht} -C clinvarbitration_data
         tar -xf {decisions_ht} -C clinvarbitration_data
         mv {pm5_tsv} clinvarbitration_data/clinvar_decisions.pm5.tsv
-        mv {decisions_tsv} clinvarbitration_data/clinvar_decisions.tsv
+        mv {pm5_idx} clinvarbitration_data/clinvar_decisions.pm5.idx
+        mv {ps1_tsv} clinvarbitration_data/clinvar_decisions.ps1.tsv
+        mv {decisions_tsv.tsv} clinvarbitration_data/clinvar_decisions.tsv.bgz
+        mv {decisions_tsv.tbi} clinvarbitration_data/clinvar_decisions.tsv.bgz.tbi
+        mv {decisions_idx} clinvarbitration_data/clinvar_decisions.idx
+        mv {genes_idx} clinvarbitration_data/clinvar_decisions.genes.idx
+        mv {ids_idx} clinvarbitration_data/clinvar_decisions.ids.idx
+        python3 -m clinvarbitration.scripts.release_delta -n clinvarbitration_data
         tar -czf output.tar.gz \
+            clinvarbitration_data/clinvar_decisions.checksums.json \
             clinvarbitration_data/clinvar_decisions.ht \
             clinvarbitration_data/clinvar_decisions.pm5.ht \
             clinvarbitration_data/clinvar_decisions.pm5.tsv \
-            clinvarbitration_data/clinvar_decisions.tsv
+            clinvarbitration_data/clinvar_decisions.pm5.idx \
+            clinvarbitration_data/clinvar_decisions.ps1.ht \
+            clinvarbitration_data/clinvar_decisions.ps1.tsv \
+            clinvarbitration_data/clinvar_decisions.tsv.bgz \
+            clinvarbitration_data/clinvar_decisions.tsv.bgz.tbi \
+            clinvarbitration_data/clinvar_decisions.idx \
+            clinvarbitration_data/clinvar_decisions.genes.idx \
+            clinvarbitration_data/clinvar_decisions.ids.idx
+
+        gcloud storage cp output.tar.gz {output['tarball']}
+        gcloud storage cp clinvarbitration_data/clinvar_decisions.checksums.json {output['checksums']}
 
-        gcloud storage cp output.tar.gz {output}
+        python3 -m clinvarbitration.scripts.cloud_release \
+            --decisions clinvarbitration_data/clinvar_decisions.tsv.bgz \
+            --pm5 clinvarbitration_data/clinvar_decisions.pm5.tsv \
+            --ps1 clinvarbitration_data/clinvar_decisions.ps1.tsv \
+            -o clinvar_decisions.cloud
+        gcloud storage cp -r clinvar_decisions.cloud {output['tarball'].parent}
     """,
     )
 
+    if previous_release is not None and delta is not None:
+        previous_tarball = batch_instance.read_input(previous_release)
+        job.command(
+            f"""
+            mkdir previous
+            tar -xzf {previous_tarball} -C previous
+            python3 -m clinvarbitration.scripts.release_delta \\
+                -n clinvarbitration_data \\
+                -p previous/clinvarbitration_data \\
+                -o clinvar_decisions.delta.tar.gz
+            if [ -f clinvar_decisions.delta.tar.gz ]; then
+                gcloud storage cp clinvar_decisions.delta.tar.gz {delta}
+            fi
+        """,
+        )
+
     return job
@@ -0,0 +1,393 @@
+"""
+Annotate the Pathogenic SNV VCF with bcftools csq, scattered over genomic regions and gathered in sorted order
+
+The tabix-indexed VCF generated by resummarise_clinvar.py is split into N chunks with a near-equal number of records.
+Each chunk is a list of contiguous regions, annotated by its own bcftools csq process and piped directly through
+bcftools +split-vep, so no intermediate VCF is written. The per-chunk missense rows are concatenated in chunk order,
+which is identical to the row order of a single serial run.
+
+bcftools csq parses the whole GFF3 in every process. To reduce that cost the GFF3 is read once here, and each chunk
+is given a GFF3 containing only the contigs it covers.
+
+Output rows are tab-delimited: Transcript, Amino Acid Change, ClinVar allele ID, ClinVar gold stars
+This is the input format expected by clinvar_by_codon.py
+"""
+
+import gzip
+import os
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser
+from collections.abc import Generator, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from itertools import pairwise
+from os.path import join
+from threading import Thread
+from typing import IO
+
+from loguru import logger
+
+BCFTOOLS = 'bcftools'
+
+# -d - duplicate, writes each transcript onto a new line
+# -s :missense - only keep Consequence==missense variants
+# -f - format string - tab delimited, Transcript, Amino Acid Change, ClinVar allele ID, ClinVar gold stars
+SPLIT_VEP_ARGS = ['-d', '-s', ':missense', '-f', '%transcript\t%amino_acid_change\t%allele_id\t%gold_stars\n']
+
+# as above, each row prefixed with the record's contig, position, ref & alt, to match rows back to their records
+LOCUS_SPLIT_VEP_ARGS = [*SPLIT_VEP_ARGS[:-1], f'%CHROM\t%POS\t%REF\t%ALT\t{SPLIT_VEP_ARGS[-1]}']
+
+
+def get_record_positions(vcf: str) -> list[tuple[str, int]]:
+    """Reads the contig and position of every record in the VCF, in file order."""
+
+    result = subprocess.run(  # noqa: S603
+        [BCFTOOLS, 'query', '-f', '%CHROM\t%POS\n', vcf],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    positions = []
+    for line in result.stdout.splitlines():
+        contig, pos = line.split('\t')
+        positions.append((contig, int(pos)))
+    return positions
+
+
+def plan_chunks(positions: list[tuple[str, int]], chunks: int) -> list[list[str]]:
+    """
+    Splits the sorted record positions into up to N chunks with a near-equal number of records.
+    Chunk boundaries never split a single position, and each chunk is a list of bcftools region strings.
+
+    Args:
+        positions (list[tuple[str, int]]): sorted (contig, position) of every record
+        chunks (int): the number of chunks to aim for
+
+    Returns:
+        a list of chunks, each a list of regions, e.g. [['chr1:1-5000'], ['chr1:5001-', 'chr2']]
+    """
+
+    if not positions:
+        return []
+
+    target = -(-len(positions) // max(chunks, 1))
+
+    # group record indexes into chunks, only ever breaking between two different positions
+    boundaries = [0]
+    for index in range(1, len(positions)):
+        if index - boundaries[-1] >= target and positions[index] != positions[index - 1]:
+            boundaries.append(index)
+    boundaries.append(len(positions))
+
+    planned = []
+    for start, end in pairwise(boundaries):
+        contigs = list(dict.fromkeys(contig for contig, _pos in positions[start:end]))
+        regions: list[list] = [[contig, 1, None] for contig in contigs]
+
+        # if the previous chunk finished on this contig, start at the first position in this chunk
+        if start > 0 and positions[start - 1][0] == contigs[0]:
+            regions[0][1] = positions[start][1]
+
+        # if the next chunk starts on this contig, stop before the first position in that chunk
+        if end < len(positions) and positions[end][0] == contigs[-1]:
+            regions[-1][2] = positions[end][1] - 1
+
+        planned.append([format_region(*region) for region in regions])
+
+    return planned
+
+
+def format_region(contig: str, start: int, end: int | None) -> str:
+    """Formats a bcftools region string, open-ended if there is no end position."""
+    if start == 1 and end is None:
+        return contig
+    return f'{contig}:{start}-{end if end is not None else ""}'
+
+
+def region_contig(region: str) -> str:
+    """The contig name of a region string."""
+    return region.split(':', 1)[0]
+
+
+def split_gff3_by_contig(gff3: str, contigs: Iterable[str], temp_dir: str) -> dict[str, str]:
+    """
+    Reads the GFF3 once, writing a separate GFF3 per contig of interest.
+    Contig names are matched without any 'chr' prefix, mirroring --unify-chr-names.
+
+    Args:
+        gff3 (str): path to the full GFF3, gzipped or not
+        contigs (Iterable[str]): the VCF contig names to extract
+        temp_dir (str): where to write the per-contig files
+
+    Returns:
+        dictionary of each VCF contig name to the path of its GFF3
+    """
+
+    wanted = {contig.removeprefix('chr'): contig for contig in contigs}
+    contig_gff3s = {contig: join(temp_dir, f'{contig}.gff3.gz') for contig in wanted.values()}
+    header: list[str] = []
+
+    with ExitStack() as stack:
+        # per-contig files are opened when the first feature is seen, by which point the header is complete
+        writers: dict[str, IO[str]] = {}
+
+        opener = gzip.open if gff3.endswith('gz') else open
+        handle = stack.enter_context(opener(gff3, 'rt'))
+        for line in handle:
+            if line.startswith('#'):
+                # keep directives from the header, skip the ### separators between features
+                if not writers and not line.startswith('###'):
+                    header.append(line)
+                continue
+
+            if (contig := wanted.get(line.split('\t', 1)[0].removeprefix('chr'))) is None:
+                continue
+
+            if contig not in writers:
+                writers[contig] = stack.enter_context(gzip.open(contig_gff3s[contig], 'wt', compresslevel=1))
+                writers[contig].writelines(header)
+            writers[contig].write(line)
+
+        # contigs without any gene models still need a valid (empty) GFF3
+        for contig in set(contig_gff3s) - set(writers):
+            with gzip.open(contig_gff3s[contig], 'wt', compresslevel=1) as empty_handle:
+                empty_handle.writelines(header)
+
+    logger.info(f'Split the GFF3 into {len(contig_gff3s)} per-contig files')
+    return contig_gff3s
+
+
+def merge_gff3s(gff3s: list[str], output: str) -> str:
+    """Concatenates gzipped GFF3 files into a single gzipped file, keeping only the first header."""
+
+    with gzip.open(output, 'wt', compresslevel=1) as out_handle:
+        for index, gff3 in enumerate(gff3s):
+            with gzip.open(gff3, 'rt') as handle:
+                out_handle.writelines(line for line in handle if index == 0 or not line.startswith('#'))
+    return output
+
+
+def subset_gff3_per_chunk(gff3: str, chunk_contigs: list[list[str]], temp_dir: str) -> list[str]:
+    """
+    Reads the GFF3 once, and creates a GFF3 for each chunk containing only the contigs that chunk covers
+
+    Args:
+        gff3 (str): path to the full GFF3, gzipped or not
+        chunk_contigs (list[list[str]]): the VCF contig names covered by each chunk
+        temp_dir (str): where to write the subset files
+
+    Returns:
+        the path of the GFF3 for each chunk, in chunk order
+    """
+
+    contig_gff3s = split_gff3_by_contig(
+        gff3,
+        contigs={contig for contigs in chunk_contigs for contig in contigs},
+        temp_dir=temp_dir,
+    )
+    chunk_gff3s = []
+    for index, contigs in enumerate(chunk_contigs):
+        unique = list(dict.fromkeys(contigs))
+        if len(unique) == 1:
+            chunk_gff3s.append(contig_gff3s[unique[0]])
+        else:
+            chunk_gff3s.append(
+                merge_gff3s([contig_gff3s[contig] for contig in unique], join(temp_dir, f'chunk_{index}.gff3.gz')),
+            )
+    return chunk_gff3s
+
+
+def csq_command(ref_fa: str, gff3: str, vcf: str, regions: list[str] | None = None) -> list[str]:
+    """
+    The bcftools csq command, writing uncompressed BCF to stdout for bcftools +split-vep
+
+    Args:
+        ref_fa (str): path to the reference genome
+        gff3 (str): path to the GFF3 gene models
+        vcf (str): path to the VCF, or '-' to read from stdin
+        regions (list[str] | None): regions to annotate, requires an indexed VCF
+    """
+
+    # -g is the GFF3 file, -f is the reference fasta
+    # --local-csq is required to apply non-phase aware annotation
+    # --force is required to use annotations without phase data
+    # -Ou passes uncompressed BCF down the pipe, rather than VCF text
+    command = [
+        BCFTOOLS,
+        'csq',
+        '--force',
+        '--local-csq',
+        '-f',
+        ref_fa,
+        '--unify-chr-names',
+        'chr,-,chr',
+        '-g',
+        gff3,
+        '-Ou',
+    ]
+    if regions:
+        command.extend(['-r', ','.join(regions)])
+    command.append(vcf)
+    return command
+
+
+def annotate_chunk(vcf: str, ref_fa: str, gff3: str, regions: list[str] | None = None) -> bytes:
+    """
+    Runs bcftools csq on one chunk of the VCF, piped directly through bcftools +split-vep
+
+    Args:
+        vcf (str): path to the tabix-indexed VCF
+        ref_fa (str): path to the reference genome
+        gff3 (str): path to the GFF3 gene models
+        regions (list[str] | None): regions to annotate, or None to annotate the whole VCF
+
+    Returns:
+        the missense rows generated for this chunk
+    """
+
+    with subprocess.Popen(csq_command(ref_fa, gff3, vcf, regions), stdout=subprocess.PIPE) as csq:  # noqa: S603
+        split = subprocess.run(  # noqa: S603
+            [BCFTOOLS, '+split-vep', *SPLIT_VEP_ARGS, '-'],
+            stdin=csq.stdout,
+            capture_output=True,
+            check=False,
+        )
+        csq.stdout.close()  # type: ignore[union-attr]
+
+    if csq.returncode or split.returncode:
+        raise RuntimeError(
+            f'Annotation of {regions or vcf} failed: csq exit {csq.returncode}, split-vep exit {split.returncode}\n'
+            f'{split.stderr.decode()}',
+        )
+
+    return split.stdout
+
+
+def stream_annotations(
+    vcf_lines: Iterable[str],
+    ref_fa: str,
+    gff3: str,
+    split_vep_args: list[str] = SPLIT_VEP_ARGS,
+) -> Generator[str, None, None]:
+    """
+    Streams VCF lines through bcftools csq | bcftools +split-vep, yielding each missense row as it is produced.
+    Nothing is written to disk, the VCF lines are fed to bcftools from a separate thread.
+
+    Args:
+        vcf_lines (Iterable[str]): newline-terminated VCF lines, header first
+        ref_fa (str): path to the reference genome
+        gff3 (str): path to the GFF3 gene models
+        split_vep_args (list[str]): the +split-vep arguments, LOCUS_SPLIT_VEP_ARGS to prefix each row with its locus
+
+    Returns:
+        generator of tab-delimited missense rows
+    """
+
+    # the feeding thread can't raise into this one, so any exception is stored and raised at the end
+    feed_errors: list[BaseException] = []
+
+    def feed(stdin: IO[bytes]) -> None:
+        try:
+            for line in vcf_lines:
+                stdin.write(line.encode())
+        except BaseException as error:  # noqa: BLE001
+            feed_errors.append(error)
+        finally:
+            stdin.close()
+
+    with (
+        subprocess.Popen(  # noqa: S603
+            csq_command(ref_fa, gff3, '-'),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        ) as csq,
+        subprocess.Popen(  # noqa: S603
+            [BCFTOOLS, '+split-vep', *split_vep_args, '-'],
+            stdin=csq.stdout,
+            stdout=subprocess.PIPE,
+            text=True,
+        ) as split,
+    ):
+        # the split process now owns the read end of this pipe
+        csq.stdout.close()  # type: ignore[union-attr]
+
+        feeder = Thread(target=feed, args=(csq.stdin,), daemon=True)
+        feeder.start()
+
+        yield from split.stdout  # type: ignore[misc]
+
+        feeder.join()
+
+    # a failed bcftools process also breaks the feeding pipe, so report the process failure first
+    if csq.returncode or split.returncode:
+        raise RuntimeError(f'Streamed annotation failed: csq exit {csq.returncode}, split-vep exit {split.returncode}')
+    if feed_errors:
+        raise feed_errors[0]
+
+
+def cli_main():
+    parser = ArgumentParser(description='Annotates Pathogenic SNVs with bcftools csq, in parallel over regions')
+    parser.add_argument('-i', help='tabix-indexed VCF of Pathogenic SNVs', required=True)
+    parser.add_argument('-f', help='reference genome FASTA', required=True)
+    parser.add_argument('-g', help='GFF3 gene models', required=True)
+    parser.add_argument('-o', help='output TSV of missense annotations, or "-" for stdout', required=True)
+    parser.add_argument(
+        '--threads',
+        help='number of chunks to annotate in parallel, defaults to the number of CPUs',
+        type=int,
+        default=os.cpu_count() or 1,
+    )
+    args = parser.parse_args()
+
+    main(vcf=args.i, ref_fa=args.f, gff3=args.g, output=args.o, threads=args.threads)
+
+
+def main(vcf: str, ref_fa: str, gff3: str, output: str, threads: int):
+    """
+    Scatter the VCF into region chunks, annotate each chunk in parallel, then gather the results in sorted order
+
+    Args:
+        vcf (str): tabix-indexed VCF of Pathogenic SNVs
+        ref_fa (str): reference genome FASTA
+        gff3 (str): GFF3 gene models
+        output (str): path to write the missense TSV to, or '-' for stdout
+        threads (int): number of chunks to annotate in parallel
+    """
+
+    chunks = plan_chunks(get_record_positions(vcf), threads)
+    logger.info(f'Annotating {vcf} in {len(chunks)} chunks')
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # with a single chunk there's nothing to gain from subsetting the GFF3
+        if len(chunks) > 1:
+            chunk_gff3s = subset_gff3_per_chunk(
+                gff3,
+                chunk_contigs=[[region_contig(region) for region in chunk] for chunk in chunks],
+                temp_dir=temp_dir,
+            )
+        else:
+            chunk_gff3s = [gff3] * len(chunks)
+
+        with ThreadPoolExecutor(max_workers=max(threads, 1)) as executor:
+            # map returns results in submission order, i.e. sorted genomic order
+            results = executor.map(
+                lambda job: annotate_chunk(vcf=vcf, ref_fa=ref_fa, gff3=job[1], regions=job[0]),
+                zip(chunks, chunk_gff3s, strict=True),
+            )
+
+            if output == '-':
+                for result in results:
+                    sys.stdout.buffer.write(result)
+                sys.stdout.buffer.flush()
+            else:
+                with open(output, 'wb') as handle:
+                    for result in results:
+                        handle.write(result)
+
+    logger.info(f'Missense annotations written to {output}')
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -0,0 +1,220 @@
+"""
+Annotates a sample or cohort VCF with the re-summarised decisions, without Hail
+
+The user VCF (plain, gzipped, or bgzipped) and the decisions TSV (clinvar_decisions.tsv.bgz) are both sorted on contig,
+using the ORDERED_CONTIGS ordering, then position. They're streamed side by side in a merge-join: the decisions are
+read forwards only as far as the current VCF record, so only the decisions overlapping the current record's REF are
+held in memory, however large either file is.
+
+Each ALT of a multi-allelic record is trimmed to its minimal representation (as ClinVar's VCF coordinates are), then
+matched on (contig, position, ref, alt). Matches are written as INFO fields with one value per ALT, '.' where an ALT
+has no decision. Records on contigs outside ORDERED_CONTIGS are written unchanged.
+
+python -m clinvarbitration.scripts.annotate_vcf -i in.vcf.bgz -d clinvar_decisions.tsv.bgz -o - | bgzip > out.vcf.bgz
+"""
+
+import gzip
+import sys
+from argparse import ArgumentParser
+from collections.abc import Generator, Iterable, Iterator
+from contextlib import nullcontext
+from typing import TextIO
+
+from loguru import logger
+
+from clinvarbitration.scripts.resummarise_clinvar import GRCH37, GRCH38, ORDERED_CONTIGS
+
+INFO_HEADER = [
+    '##INFO=<ID=clinvarbitration_significance,Number=A,Type=String,Description="ClinvArbitration decision">',
+    '##INFO=<ID=clinvarbitration_stars,Number=A,Type=Integer,Description="ClinvArbitration gold stars">',
+    '##INFO=<ID=clinvarbitration_allele_id,Number=A,Type=Integer,Description="ClinVar AlleleID">',
+]
+INFO_KEYS = ['clinvarbitration_significance', 'clinvarbitration_stars', 'clinvarbitration_allele_id']
+
+
+def open_text(path: str) -> TextIO:
+    """Opens a plain, gzipped, or bgzipped text file for reading, or stdin for '-'."""
+    if path == '-':
+        return nullcontext(sys.stdin)  # type: ignore[return-value]
+    if path.endswith(('gz', 'bgz')):
+        return gzip.open(path, 'rt')
+    return open(path, encoding='utf-8')
+
+
+def contig_ranks(assembly: str) -> dict[str, int]:
+    """The rank of each contig in ORDERED_CONTIGS, also accepting each name with the 'chr' prefix added or removed."""
+    ranks = {}
+    for rank, contig in enumerate(ORDERED_CONTIGS[assembly]):
+        ranks[contig] = rank
+        ranks.setdefault(contig.removeprefix('chr') if contig.startswith('chr') else f'chr{contig}', rank)
+    return ranks
+
+
+def minimal_representation(position: int, ref: str, alt: str) -> tuple[int, str, str]:
+    """Trims shared trailing, then leading, bases from the alleles, keeping at least one base of each."""
+    while len(ref) > 1 and len(alt) > 1 and ref[-1] == alt[-1]:
+        ref, alt = ref[:-1], alt[:-1]
+    while len(ref) > 1 and len(alt) > 1 and ref[0] == alt[0]:
+        ref, alt = ref[1:], alt[1:]
+        position += 1
+    return position, ref, alt
+
+
+class DecisionStream:
+    """
+    A forward-only cursor over the sorted decisions TSV
+    Decisions are buffered from the lowest position still needed, up to the end of the current VCF record's REF
+    """
+
+    def __init__(self, rows: Iterable[str], ranks: dict[str, int]):
+        self.rows = iter(rows)
+        self.ranks = ranks
+        self.rank = -1
+        # position: {(ref, alt): (clinical significance, gold stars, allele ID)}, on the current contig only
+        self.buffer: dict[int, dict[tuple[str, str], tuple[str, str, str]]] = {}
+        self.pending = self._next_row()
+
+    def _next_row(self) -> tuple | None:
+        for row in self.rows:
+            contig, position, ref, alt, significance, stars, allele_id = row.rstrip('\n').split('\t')[:7]
+            if (rank := self.ranks.get(contig)) is not None:
+                return rank, int(position), ref, alt, (significance, stars, allele_id)
+        return None
+
+    def advance(self, rank: int, start: int, end: int):
+        """Moves the cursor to cover positions start to end on this contig, dropping everything before start."""
+
+        if rank != self.rank:
+            self.buffer.clear()
+            self.rank = rank
+        elif self.buffer and min(self.buffer) < start:
+            for position in [position for position in self.buffer if position < start]:
+                del self.buffer[position]
+
+        while self.pending is not None and (self.pending[0], self.pending[1]) <= (rank, end):
+            row_rank, position, ref, alt, decision = self.pending
+            if row_rank == rank and position >= start:
+                self.buffer.setdefault(position, {})[(ref, alt)] = decision
+            self.pending = self._next_row()
+
+    def get(self, position: int, ref: str, alt: str) -> tuple[str, str, str] | None:
+        if at_position := self.buffer.get(position):
+            return at_position.get((ref, alt))
+        return None
+
+
+def annotate_info(info: str, decisions: list[tuple[str, str, str] | None]) -> str:
+    """Replaces any existing ClinvArbitration fields in an INFO column with these per-ALT decisions."""
+
+    fields = [field for field in info.split(';') if field.split('=', 1)[0] not in INFO_KEYS and field != '.']
+    if any(decisions):
+        for index, key in enumerate(INFO_KEYS):
+            values = ','.join(decision[index] if decision else '.' for decision in decisions)
+            fields.append(f'{key}={values}')
+    return ';'.join(fields) or '.'
+
+
+def annotate_lines(
+    vcf_lines: Iterable[str],
+    decision_rows: Iterable[str],
+    assembly: str,
+) -> Generator[str, None, None]:
+    """
+    Merge-joins VCF lines against the decisions, yielding the annotated VCF lines
+
+    Args:
+        vcf_lines (Iterable[str]): newline-terminated VCF lines, header first, sorted on contig & position
+        decision_rows (Iterable[str]): rows of the decisions TSV, without the header
+        assembly (str): genome build, selecting the contig ordering
+
+    Returns:
+        generator of the annotated VCF lines, header first
+    """
+
+    ranks = contig_ranks(assembly)
+    decisions = DecisionStream(decision_rows, ranks=ranks)
+    last = (-1, 0)
+    records = annotated = 0
+
+    lines: Iterator[str] = iter(vcf_lines)
+    for line in lines:
+        if line.startswith('##INFO=<ID=clinvarbitration_'):
+            continue
+        if line.startswith('#CHROM'):
+            yield from (f'{header}\n' for header in INFO_HEADER)
+            yield line
+            break
+        yield line
+
+    for line in lines:
+        fields = line.rstrip('\n').split('\t', 8)
+        rank = ranks.get(fields[0])
+        if rank is None:
+            yield line
+            continue
+
+        position, ref = int(fields[1]), fields[3]
+        if (rank, position) < last:
+            raise ValueError(f'VCF is not sorted in {assembly} contig order at {fields[0]}:{position}')
+        last = (rank, position)
+
+        decisions.advance(rank, start=position, end=position + len(ref) - 1)
+        records += 1
+
+        matches = []
+        if decisions.buffer:
+            for alt in fields[4].split(','):
+                # symbolic, spanning deletion, and missing alleles can't match a decision
+                if alt.startswith('<') or alt in ('*', '.'):
+                    matches.append(None)
+                    continue
+                matches.append(decisions.get(*minimal_representation(position, ref, alt)))
+
+        # most records have no decision, and are written out unchanged
+        if not any(matches) and 'clinvarbitration_' not in fields[7]:
+            yield line
+            continue
+
+        if any(matches):
+            annotated += 1
+        fields[7] = annotate_info(fields[7], matches or [None] * len(fields[4].split(',')))
+        yield '\t'.join(fields) + '\n'
+
+    logger.info(f'Annotated {annotated} of {records} VCF records with ClinvArbitration decisions')
+
+
+def cli_main():
+    parser = ArgumentParser(description='Annotates a VCF with re-summarised ClinVar decisions, without Hail')
+    parser.add_argument('-i', help='VCF to annotate, sorted, plain/gzipped/bgzipped, or "-" for stdin', required=True)
+    parser.add_argument('-d', help='decisions TSV, clinvar_decisions.tsv.bgz from resummarise_clinvar', required=True)
+    parser.add_argument('-o', help='output VCF, or "-" for stdout', required=True)
+    parser.add_argument('--assembly', help='genome build to use', default=GRCH38, choices=[GRCH37, GRCH38])
+    args = parser.parse_args()
+
+    main(vcf=args.i, decisions_tsv=args.d, output=args.o, assembly=args.assembly)
+
+
+def main(vcf: str, decisions_tsv: str, output: str, assembly: str = GRCH38):
+    """
+    Annotate the VCF with the decisions, streaming both files
+
+    Args:
+        vcf (str): sorted VCF to annotate, or '-' for stdin
+        decisions_tsv (str): the decisions TSV, sorted on contig & position
+        output (str): path to write the annotated VCF to, or '-' for stdout
+        assembly (str): genome build, selecting the contig ordering
+    """
+
+    with (
+        open_text(vcf) as vcf_handle,
+        open_text(decisions_tsv) as decisions_handle,
+        nullcontext(sys.stdout) if output == '-' else open(output, 'w', encoding='utf-8') as out_handle,
+    ):
+        next(decisions_handle)
+        out_handle.writelines(annotate_lines(vcf_handle, decisions_handle, assembly=assembly))
+
+    logger.info(f'Annotated VCF written to {output}')
+
+
+if __name__ == '__main__':
+    cli_main()
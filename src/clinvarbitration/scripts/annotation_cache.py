@@ -0,0 +1,315 @@
+"""
+A persistent cache of missense annotations, so each monthly run only annotates Pathogenic SNVs it hasn't seen before
+
+Most Pathogenic SNVs in each month's clinvar_decisions.vcf.bgz were also present the month before, and their
+consequences can't change unless the gene models or reference do. The cache is a SQLite database keyed on
+(contig, position, ref, alt, GFF3 md5, reference md5), holding each SNV's (transcript, amino acid change) results -
+including an empty result for SNVs with no missense consequence, so those aren't re-annotated either.
+
+ClinVar allele IDs and gold stars are not cached, they're taken from the current records, as ratings change between
+releases. Only the cache misses are sent to the annotator (bcftools csq, or the native missense annotator), and the
+cached & new results are written back out in VCF order, so the output is identical to annotating every record.
+The annotator's rows are matched back to the misses on their locus, not the allele ID, as the X & Y copies of a
+pseudoautosomal variant share an allele ID.
+"""
+
+import gzip
+import os
+import sqlite3
+import sys
+import tempfile
+from argparse import ArgumentParser
+from collections import defaultdict
+from collections.abc import Callable, Generator, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from itertools import chain
+
+from loguru import logger
+
+from clinvarbitration.scripts.annotate_snvs import LOCUS_SPLIT_VEP_ARGS, stream_annotations, subset_gff3_per_chunk
+from clinvarbitration.scripts.checksums import checksum_path
+from clinvarbitration.scripts.missense_annotator import MissenseAnnotator, annotate_in_parallel, read_vcf_records
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS annotations (
+    contig TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    ref TEXT NOT NULL,
+    alt TEXT NOT NULL,
+    gff3_md5 TEXT NOT NULL,
+    ref_md5 TEXT NOT NULL,
+    consequences TEXT NOT NULL,
+    PRIMARY KEY (gff3_md5, ref_md5, contig, position, ref, alt)
+) WITHOUT ROWID
+"""
+
+# consequences are stored as 'transcript,change;transcript,change', or '' if there are none
+CONSEQUENCE_DELIMITER = ';'
+FIELD_DELIMITER = ','
+
+
+def encode_consequences(consequences: list[tuple[str, str]]) -> str:
+    return CONSEQUENCE_DELIMITER.join(f'{transcript}{FIELD_DELIMITER}{change}' for transcript, change in consequences)
+
+
+def decode_consequences(encoded: str) -> list[tuple[str, str]]:
+    if not encoded:
+        return []
+    return [tuple(each.split(FIELD_DELIMITER, 1)) for each in encoded.split(CONSEQUENCE_DELIMITER)]  # type: ignore[misc]
+
+
+class AnnotationCache:
+    """Missense results per SNV, for a single combination of GFF3 and reference genome."""
+
+    def __init__(self, path: str, gff3_checksum: str, ref_checksum: str):
+        self.path = path
+        self.checksums = (gff3_checksum, ref_checksum)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(SCHEMA)
+
+    @classmethod
+    def from_files(cls, path: str, gff3: str, ref_fa: str) -> 'AnnotationCache':
+        """Opens (or creates) the cache, keyed on the checksums of these gene models and this reference."""
+        return cls(path, gff3_checksum=checksum_path(gff3), ref_checksum=checksum_path(ref_fa))
+
+    def load(self) -> dict[tuple[str, int, str, str], list[tuple[str, str]]]:
+        """All cached results for this GFF3 & reference, keyed on (contig, position, ref, alt)."""
+        cursor = self.connection.execute(
+            'SELECT contig, position, ref, alt, consequences FROM annotations WHERE gff3_md5 = ? AND ref_md5 = ?',
+            self.checksums,
+        )
+        return {(contig, pos, ref, alt): decode_consequences(encoded) for contig, pos, ref, alt, encoded in cursor}
+
+    def store(self, results: dict[tuple[str, int, str, str], list[tuple[str, str]]]):
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    (contig, pos, ref, alt, *self.checksums, encode_consequences(consequences))
+                    for (contig, pos, ref, alt), consequences in results.items()
+                ),
+            )
+
+    def close(self):
+        self.connection.close()
+
+
+def annotate_with_cache(
+    records: Iterable[tuple],
+    cache: AnnotationCache,
+    annotate_misses: Callable[[list[tuple]], Iterable[str]],
+) -> Generator[str, None, None]:
+    """
+    Annotates only the records missing from the cache, then writes out every record's missense rows in input order
+
+    Args:
+        records (Iterable[tuple]): (contig, position, ref, alt, allele ID, gold stars) per SNV, in VCF order
+        cache (AnnotationCache): the cache to read from, and to add new results to
+        annotate_misses (Callable): annotates a list of records, returning the tab-delimited missense rows, each
+            prefixed with the record's contig, position, ref & alt
+
+    Returns:
+        generator of the tab-delimited missense rows, identical to annotating all records
+    """
+
+    records = list(records)
+    cached = cache.load()
+    misses = [record for record in records if (record[0], int(record[1]), record[2], record[3]) not in cached]
+    logger.info(f'{len(records) - len(misses)} of {len(records)} SNVs found in the annotation cache')
+
+    if misses:
+        # results come back as rows, which are matched back to their records on the locus
+        by_locus: dict[tuple[str, int, str, str], list[tuple[str, str]]] = defaultdict(list)
+        for row in annotate_misses(misses):
+            contig, pos, ref, alt, transcript, change, _allele_id, _stars = row.rstrip('\n').split('\t')
+            by_locus[(contig, int(pos), ref, alt)].append((transcript, change))
+
+        new_results = {
+            (contig, int(pos), ref, alt): by_locus.get((contig, int(pos), ref, alt), [])
+            for contig, pos, ref, alt, _allele_id, _stars in misses
+        }
+        cache.store(new_results)
+        cached.update(new_results)
+        logger.info(f'Added {len(new_results)} SNVs to the annotation cache')
+
+    for contig, pos, ref, alt, allele_id, gold_stars in records:
+        for transcript, change in cached[(contig, int(pos), ref, alt)]:
+            yield f'{transcript}\t{change}\t{allele_id}\t{gold_stars}\n'
+
+
+def read_vcf_header(vcf: str) -> list[str]:
+    """The header lines of a VCF, plain or gzipped."""
+    opener = gzip.open if vcf.endswith(('gz', 'bgz')) else open
+    header = []
+    with opener(vcf, 'rt') as handle:
+        for line in handle:
+            if not line.startswith('#'):
+                break
+            header.append(line)
+    return header
+
+
+def vcf_line(record: tuple) -> str:
+    """A minimal VCF line for a record, with the INFO fields used by bcftools +split-vep."""
+    contig, pos, ref, alt, allele_id, gold_stars = record
+    return f'{contig}\t{pos}\t.\t{ref}\t{alt}\t.\t.\tallele_id={allele_id};gold_stars={gold_stars}\n'
+
+
+def annotate_misses_with_bcftools(
+    misses: list[tuple],
+    header: list[str],
+    ref_fa: str,
+    gff3: str,
+    threads: int,
+) -> list[str]:
+    """
+    Streams the uncached records through bcftools csq | bcftools +split-vep, in parallel chunks
+
+    Args:
+        misses (list[tuple]): the records to annotate, in VCF order
+        header (list[str]): VCF header lines, including contigs and the allele_id & gold_stars INFO definitions
+        ref_fa (str): reference genome FASTA
+        gff3 (str): GFF3 gene models
+        threads (int): number of chunks to annotate in parallel
+
+    Returns:
+        the missense rows, each prefixed with the record's locus, in record order
+    """
+
+    size = -(-len(misses) // max(threads, 1))
+    chunks = [misses[start : start + size] for start in range(0, len(misses), size)]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # as with annotate_snvs.py, each chunk only gets the gene models for the contigs it covers
+        if len(chunks) > 1:
+            chunk_gff3s = subset_gff3_per_chunk(
+                gff3,
+                chunk_contigs=[[record[0] for record in chunk] for chunk in chunks],
+                temp_dir=temp_dir,
+            )
+        else:
+            chunk_gff3s = [gff3] * len(chunks)
+
+        with ThreadPoolExecutor(max_workers=max(len(chunks), 1)) as executor:
+            results = executor.map(
+                lambda job: list(
+                    stream_annotations(
+                        chain(header, map(vcf_line, job[0])),
+                        ref_fa=ref_fa,
+                        gff3=job[1],
+                        split_vep_args=LOCUS_SPLIT_VEP_ARGS,
+                    ),
+                ),
+                zip(chunks, chunk_gff3s, strict=True),
+            )
+            return [row for rows in results for row in rows]
+
+
+def miss_annotator(
+    ref_fa: str,
+    gff3: str,
+    header: list[str],
+    threads: int,
+    native: bool = False,
+    index_path: str | None = None,
+) -> Callable[[list[tuple]], Iterable[str]]:
+    """
+    The annotator to send cache misses to, bcftools or the native missense annotator
+    The native annotator is only loaded if there are misses to annotate
+
+    Args:
+        ref_fa (str): reference genome FASTA
+        gff3 (str): GFF3 gene models
+        header (list[str]): VCF header lines, used when streaming misses through bcftools
+        threads (int): number of processes/chunks to annotate with
+        native (bool): if True, use the in-process missense annotator instead of bcftools
+        index_path (str | None): compiled transcript index for the native annotator
+    """
+
+    def annotate_misses(misses: list[tuple]) -> Iterable[str]:
+        if native:
+            annotator = MissenseAnnotator.from_files(gff3=gff3, ref_fa=ref_fa, index_path=index_path)
+            return annotate_in_parallel(misses, annotator=annotator, threads=threads, locus=True)
+        return annotate_misses_with_bcftools(misses, header=header, ref_fa=ref_fa, gff3=gff3, threads=threads)
+
+    return annotate_misses
+
+
+def cli_main():
+    parser = ArgumentParser(description='Annotates Pathogenic SNVs, re-using cached results from earlier runs')
+    parser.add_argument('-i', help='VCF of Pathogenic SNVs', required=True)
+    parser.add_argument('-f', help='reference genome FASTA', required=True)
+    parser.add_argument('-g', help='GFF3 gene models', required=True)
+    parser.add_argument('-o', help='output TSV of missense annotations, or "-" for stdout', required=True)
+    parser.add_argument('--cache', help='SQLite annotation cache, created if it does not exist', required=True)
+    parser.add_argument(
+        '--threads',
+        help='number of processes/chunks to annotate with, defaults to the number of CPUs',
+        type=int,
+        default=os.cpu_count() or 1,
+    )
+    parser.add_argument(
+        '--native',
+        help='annotate cache misses with the in-process missense annotator instead of bcftools csq',
+        action='store_true',
+    )
+    parser.add_argument('--index', help='compiled transcript index for the native annotator', default=None)
+    args = parser.parse_args()
+
+    main(
+        vcf=args.i,
+        ref_fa=args.f,
+        gff3=args.g,
+        output=args.o,
+        cache_path=args.cache,
+        threads=args.threads,
+        native=args.native,
+        index_path=args.index,
+    )
+
+
+def main(
+    vcf: str,
+    ref_fa: str,
+    gff3: str,
+    output: str,
+    cache_path: str,
+    threads: int,
+    native: bool = False,
+    index_path: str | None = None,
+):
+    """
+    Annotate the SNVs in the VCF, only sending those missing from the cache to the annotator
+
+    Args:
+        vcf (str): VCF of Pathogenic SNVs
+        ref_fa (str): reference genome FASTA
+        gff3 (str): GFF3 gene models
+        output (str): path to write the missense TSV to, or '-' for stdout
+        cache_path (str): the SQLite annotation cache, updated with any new results
+        threads (int): number of processes/chunks to annotate with
+        native (bool): if True, use the in-process missense annotator instead of bcftools
+        index_path (str | None): compiled transcript index for the native annotator
+    """
+
+    cache = AnnotationCache.from_files(cache_path, gff3=gff3, ref_fa=ref_fa)
+    annotate_misses = miss_annotator(
+        ref_fa=ref_fa,
+        gff3=gff3,
+        header=read_vcf_header(vcf),
+        threads=threads,
+        native=native,
+        index_path=index_path,
+    )
+
+    # '-' writes to stdout, for piping straight into clinvar_by_codon.py
+    with nullcontext(sys.stdout) if output == '-' else open(output, 'w', encoding='utf-8') as handle:
+        handle.writelines(annotate_with_cache(read_vcf_records(vcf), cache=cache, annotate_misses=annotate_misses))
+
+    cache.close()
+    logger.info(f'Missense annotations written to {output}')
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -0,0 +1,233 @@
+"""
+Brings a local copy of a release up to date in place, by applying the delta from that release to the next one (see
+release_delta.py), rather than downloading the whole release tarball
+
+The local copy is the unpacked release folder, e.g. clinvarbitration_data. Before anything is changed, each dataset
+the delta covers is checked against the delta's base checksums, so a delta is only applied to the release it was made
+from. Each dataset is then streamed through the delta, replacing every changed group of rows, and the tabix &
+memory-mappable indexes are rebuilt from the patched rows. Every file written is checked against the new release's
+checksums in the delta manifest, and only once all of them match are they moved into the local copy, so a failed
+update leaves the local copy as it was. The BGZF decisions TSV is checked on its decompressed rows, as its compressed
+bytes depend on the local zlib, and its tabix index is rebuilt from it without a checksum.
+
+The Hail Tables and the gene & identifier indexes aren't covered by the delta, so they remain at the previous release
+until the full release is downloaded, and a warning lists any present in the local copy.
+
+python -m clinvarbitration.scripts.apply_delta -d clinvar_decisions.delta.tar.gz -r clinvarbitration_data
+"""
+
+import io
+import json
+import os
+import tarfile
+import tempfile
+from argparse import ArgumentParser
+from collections.abc import Iterable, Iterator
+from itertools import groupby
+from os.path import exists, join
+
+from loguru import logger
+
+from clinvarbitration.scripts.checksums import checksum_path, checksum_rows
+from clinvarbitration.scripts.clinvar_by_codon import CodonIndex
+from clinvarbitration.scripts.cloud_release import read_tsv
+from clinvarbitration.scripts.decisions_index import DecisionIndex
+from clinvarbitration.scripts.pm5_index import Pm5Index
+from clinvarbitration.scripts.release_delta import (
+    DATASETS,
+    GROUP_KEYS,
+    MANIFEST_NAME,
+    REBUILT,
+    VERSION,
+    dataset_checksum,
+    line_groups,
+)
+from clinvarbitration.scripts.resummarise_clinvar import TSV_KEYS, write_decisions_tsv
+
+
+def delta_groups(delta_lines: Iterable[str], dataset: str) -> Iterator[tuple[tuple, list[str]]]:
+    """
+    The new rows of each group changed in the delta, empty where the group was removed
+
+    Args:
+        delta_lines (Iterable[str]): the rows of the dataset's delta TSV, without the header
+        dataset (str): the dataset name, one of DATASETS
+    """
+    key = GROUP_KEYS[dataset]
+    rows = (line.split('\t', 1) for line in delta_lines)
+    for group_key, group in groupby(rows, key=lambda row: key(row[1])):
+        yield group_key, [line for change, line in group if change == 'added']
+
+
+def patch_groups(
+    groups: Iterable[tuple[tuple, list[str]]],
+    changes: Iterable[tuple[tuple, list[str]]],
+) -> Iterator[str]:
+    """
+    Merges the changed groups into the local groups, both sorted, yielding the patched rows in order
+
+    Args:
+        groups (Iterable[tuple[tuple, list[str]]]): the local dataset's groups, from line_groups
+        changes (Iterable[tuple[tuple, list[str]]]): the changed groups, from delta_groups
+    """
+
+    changes = iter(changes)
+    change = next(changes, None)
+    for group_key, lines in groups:
+        while change is not None and change[0] < group_key:
+            yield from change[1]
+            change = next(changes, None)
+        if change is not None and change[0] == group_key:
+            yield from change[1]
+            change = next(changes, None)
+        else:
+            yield from lines
+    while change is not None:
+        yield from change[1]
+        change = next(changes, None)
+
+
+def write_decisions(rows: Iterable[str], release_dir: str, output_dir: str, targets: dict[str, str]):
+    """Writes the patched decisions TSV and its tabix index, and rebuilds the decisions index if it's covered."""
+    decisions = []
+    for row in rows:
+        contig, position, ref, alt, significance, stars, allele_id = row.rstrip('\n').split('\t')
+        decisions.append(
+            {
+                'contig': contig,
+                'position': int(position),
+                'alleles': [ref, alt],
+                'clinical_significance': significance,
+                'gold_stars': int(stars),
+                'allele_id': int(allele_id),
+            },
+        )
+    write_decisions_tsv(decisions, join(output_dir, DATASETS['decisions']))
+
+    if (index_name := REBUILT['decisions'][1]) in targets:
+        # the contig order & significance labels are carried over from the local index
+        local_index = DecisionIndex.load(join(release_dir, index_name))
+        DecisionIndex.from_decisions(
+            decisions,
+            contigs=local_index.contigs,
+            significance=local_index.significance_labels,
+        ).write(join(output_dir, index_name))
+
+
+def write_codon_tsv(
+    dataset: str,
+    columns: list[str],
+    rows: Iterable[str],
+    output_dir: str,
+    targets: dict[str, str],
+):
+    """Writes a patched PM5 or PS1 TSV, rebuilding the PM5 index if it's covered."""
+    lines = []
+    with open(join(output_dir, DATASETS[dataset]), 'w', encoding='utf-8') as handle:
+        handle.write('\t'.join(columns) + '\n')
+        for row in rows:
+            handle.write(row)
+            lines.append(row)
+
+    if dataset == 'pm5' and (index_name := REBUILT['pm5'][0]) in targets:
+        Pm5Index.from_codon_index(CodonIndex.from_tsv_rows(lines)).write(join(output_dir, index_name))
+
+
+def mismatched_targets(manifest: dict, folder: str) -> list[str]:
+    """The files the delta recreates which are missing from the folder, or don't match the new release."""
+    expected = [
+        *((name, md5, checksum_path) for name, md5 in manifest['target'].items()),
+        *((name, md5, checksum_rows) for name, md5 in manifest['rows'].items()),
+    ]
+    return [
+        name
+        for name, md5, checksum in expected
+        if not exists(join(folder, name)) or checksum(join(folder, name)) != md5
+    ]
+
+
+def check_base(manifest: dict, release_dir: str):
+    """Checks the local copy is the release the delta was made from, or has already been updated by it."""
+    mismatched = [
+        name
+        for name, md5 in manifest['base'].items()
+        if not exists(join(release_dir, name)) or dataset_checksum(join(release_dir, name)) != md5
+    ]
+    if not mismatched:
+        return
+
+    if not mismatched_targets(manifest, release_dir):
+        raise ValueError(f'{release_dir} is already up to date with this delta')
+    raise ValueError(
+        f'{", ".join(mismatched)} in {release_dir} are not the release this delta was made from, '
+        'download the full release instead',
+    )
+
+
+def apply_delta(delta_path: str, release_dir: str) -> dict:
+    """
+    Updates the release folder in place
+
+    Args:
+        delta_path (str): the delta, written by release_delta.py
+        release_dir (str): the local copy of the release the delta was made from
+
+    Returns:
+        the delta manifest
+    """
+
+    with tarfile.open(delta_path, 'r:gz') as tar:
+        manifest = json.load(tar.extractfile(MANIFEST_NAME))  # type: ignore[arg-type]
+        if manifest['version'] != VERSION:
+            raise ValueError(f'{delta_path} is delta version {manifest["version"]}, expected {VERSION}')
+
+        check_base(manifest, release_dir)
+        targets = manifest['target']
+
+        # written alongside the local copy, so each file is moved into place rather than copied
+        with tempfile.TemporaryDirectory(dir=release_dir) as temp_dir:
+            for dataset in manifest['changes']:
+                columns, rows = read_tsv(join(release_dir, DATASETS[dataset]))
+                with io.TextIOWrapper(tar.extractfile(f'{dataset}.tsv'), encoding='utf-8') as delta:  # type: ignore[arg-type]
+                    if next(delta).rstrip('\n').split('\t') != ['change', *columns]:
+                        raise ValueError(f'The {dataset} columns in {delta_path} do not match {release_dir}')
+                    patched = patch_groups(
+                        line_groups(rows, GROUP_KEYS[dataset], DATASETS[dataset]),
+                        delta_groups(delta, dataset),
+                    )
+                    if dataset == 'decisions':
+                        if columns != TSV_KEYS:
+                            raise ValueError(f'Expected the decisions columns {", ".join(TSV_KEYS)}, not {columns}')
+                        write_decisions(patched, release_dir, temp_dir, targets)
+                    else:
+                        write_codon_tsv(dataset, columns, patched, temp_dir, targets)
+
+            if mismatched := mismatched_targets(manifest, temp_dir):
+                raise ValueError(
+                    f'The updated {", ".join(mismatched)} do not match the new release checksums, '
+                    f'{release_dir} has not been changed',
+                )
+
+            updated = [*targets, *manifest['rows'], *manifest['derived']]
+            for name in updated:
+                os.replace(join(temp_dir, name), join(release_dir, name))
+
+    for dataset, counts in manifest['changes'].items():
+        logger.info(f'{dataset}: {counts["added"]} added, {counts["removed"]} removed, {counts["changed"]} changed')
+    logger.info(f'Updated and verified {", ".join(updated)} in {release_dir}')
+    if stale := [name for name in manifest['not_covered'] if exists(join(release_dir, name))]:
+        logger.warning(f'Not covered by the delta, so still from the previous release: {", ".join(stale)}')
+    return manifest
+
+
+def cli_main():
+    parser = ArgumentParser(description='Update a local copy of a release in place, from a release delta')
+    parser.add_argument('-d', help='the delta, e.g. clinvar_decisions.delta.tar.gz', required=True)
+    parser.add_argument('-r', help='the local copy of the previous release, e.g. clinvarbitration_data', required=True)
+    args = parser.parse_args()
+
+    apply_delta(delta_path=args.d, release_dir=args.r)
+
+
+if __name__ == '__main__':
+    cli_main()
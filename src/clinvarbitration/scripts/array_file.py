@@ -0,0 +1,103 @@
+"""
+A minimal file format for named numpy arrays, which can be memory-mapped straight from disk
+
+File layout, all integers little-endian:
+- 8 byte magic, identifying the type of file
+- 8 byte header length
+- JSON header: format version, any file-specific metadata, and the dtype/shape/offset of each array
+- the arrays, each aligned to 8 bytes
+"""
+
+import json
+import os
+
+import numpy as np
+
+ALIGNMENT = 8
+
+
+def write_arrays(path: str, magic: bytes, version: int, metadata: dict, arrays: dict[str, np.ndarray]):
+    """
+    Writes the arrays to disk, via a temporary file so a partially written file is never picked up
+
+    Args:
+        path (str): where to write the file
+        magic (bytes): 8 bytes identifying the type of file
+        version (int): format version, checked on load
+        metadata (dict): JSON-serialisable details stored in the header
+        arrays (dict[str, np.ndarray]): the arrays, by name
+    """
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    header = json.dumps({'version': version, **metadata, 'arrays': layout}).encode()
+    header += b' ' * (-len(header) % ALIGNMENT)
+
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as handle:
+        handle.write(magic)
+        handle.write(len(header).to_bytes(8, 'little'))
+        handle.write(header)
+        for array in arrays.values():
+            handle.write(np.ascontiguousarray(array).tobytes())
+            handle.write(b'\0' * (-array.nbytes % ALIGNMENT))
+    os.replace(temp_path, path)
+
+
+def load_arrays(path: str, magic: bytes, version: int) -> tuple[dict, dict[str, np.ndarray]]:
+    """
+    Memory-maps the arrays in a file, nothing is read into memory until it's used
+
+    Args:
+        path (str): the file to load
+        magic (bytes): the expected magic bytes
+        version (int): the expected format version
+
+    Returns:
+        the header metadata, and a read-only memory-mapped view of each array
+    """
+
+    # plain ndarray views of the mapping, which skip the per-slice overhead of the np.memmap subclass
+    return arrays_from_buffer(np.asarray(np.memmap(path, dtype=np.uint8, mode='r')), magic, version, source=path)
+
+
+def arrays_from_buffer(
+    buffer: bytes | np.ndarray,
+    magic: bytes,
+    version: int,
+    source: str = 'buffer',
+) -> tuple[dict, dict[str, np.ndarray]]:
+    """
+    Reads the arrays from the contents of a file, e.g. a memory-mapping, or a file fetched over HTTP
+
+    Args:
+        buffer (bytes | np.ndarray): the whole file
+        magic (bytes): the expected magic bytes
+        version (int): the expected format version
+        source (str): where the data came from, for error messages
+
+    Returns:
+        the header metadata, and a read-only view of each array in the buffer
+    """
+
+    raw = np.frombuffer(buffer, dtype=np.uint8)
+    if raw[: len(magic)].tobytes() != magic:
+        raise ValueError(f'{source} is not a {magic.decode()} file')
+    header_length = int.from_bytes(raw[len(magic) : len(magic) + 8].tobytes(), 'little')
+    data_start = len(magic) + 8 + header_length
+    header = json.loads(raw[len(magic) + 8 : data_start].tobytes())
+
+    if header['version'] != version:
+        raise ValueError(f'{source} is version {header["version"]}, expected {version}')
+
+    arrays = {}
+    for name, spec in header.pop('arrays').items():
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        start = data_start + spec['offset']
+        arrays[name] = raw[start : start + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+    return header, arrays
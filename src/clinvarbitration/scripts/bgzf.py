@@ -0,0 +1,220 @@
+"""
+Blocked gzip (BGZF), the compression used by bgzip, tabix, and htslib
+
+A BGZF file is a series of gzip members, each holding at most 64KiB of data, with the compressed size of the member
+recorded in a header field. Any gzip reader can decompress the whole file, and a reader that knows the compressed
+offset of a block can seek straight to it. Positions in the file are 'virtual offsets', the compressed offset of a
+block shifted left 16 bits, plus the offset of the data within the decompressed block.
+
+The writer cuts the data into blocks of exactly BLOCK_SIZE bytes, so the virtual offset of any position in the
+uncompressed data can be calculated from the compressed block offsets alone. Blocks are compressed in a thread pool,
+zlib releases the GIL while it works, then written in order.
+"""
+
+import os
+import struct
+import zlib
+from collections import deque
+from collections.abc import Generator, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+# the uncompressed size of each block, as used by htslib, leaving room in the 64KiB limit for incompressible data
+BLOCK_SIZE = 0xFF00
+MAX_BLOCK = 0x10000
+
+# ID1, ID2, CM, FLG, MTIME, XFL, OS, XLEN, then the 'BC' extra subfield, SLEN, and BSIZE (the block size - 1)
+HEADER = struct.Struct('<4BI2BH2BHH')
+TRAILER = struct.Struct('<II')
+
+# the empty block marking the end of a BGZF file
+EOF_BLOCK = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+# most of the compression of zlib's default (6), in around half the time
+COMPRESSION_LEVEL = 4
+THREADS = min(8, os.cpu_count() or 1)
+
+
+def compress_block(data: bytes, level: int = COMPRESSION_LEVEL) -> bytes:
+    """Compresses up to BLOCK_SIZE bytes into a single BGZF block."""
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    if len(compressed) + HEADER.size + TRAILER.size > MAX_BLOCK:
+        # incompressible data, stored instead
+        compressor = zlib.compressobj(0, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+
+    block_size = HEADER.size + len(compressed) + TRAILER.size
+    header = HEADER.pack(31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, block_size - 1)
+    return header + compressed + TRAILER.pack(zlib.crc32(data), len(data))
+
+
+def compress_blocks(
+    blocks: Iterable[bytes],
+    threads: int = THREADS,
+    level: int = COMPRESSION_LEVEL,
+) -> Generator[bytes, None, None]:
+    """
+    Compresses each chunk of up to BLOCK_SIZE bytes into a BGZF block, in a thread pool, yielding the blocks in order
+    For writers which choose their own block boundaries, e.g. to keep whole rows within a block
+    """
+
+    if threads <= 1:
+        for block in blocks:
+            yield compress_block(block, level)
+        return
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending: deque[Future] = deque()
+        for block in blocks:
+            pending.append(executor.submit(compress_block, block, level))
+            if len(pending) > threads * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class BgzfWriter:
+    """
+    Writes a BGZF file, compressing full blocks in a thread pool
+
+    After closing, virtual_offsets converts uncompressed offsets into virtual offsets, e.g. to build a tabix index
+    """
+
+    def __init__(self, path: str, threads: int = THREADS, level: int = COMPRESSION_LEVEL):
+        self.handle = open(path, 'wb')  # noqa: SIM115
+        self.level = level
+        self.executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+        self.max_pending = threads * 4
+        self.pending: deque[Future | bytes] = deque()
+        self.buffer = bytearray()
+        # the compressed offset of each block, with the offset of the end of the data appended on closing
+        self.block_offsets: list[int] = []
+        self.written = 0
+        self.closed = False
+
+    def __enter__(self) -> 'BgzfWriter':
+        return self
+
+    def __exit__(self, *args: object):
+        self.close()
+
+    def tell(self) -> int:
+        """The number of uncompressed bytes written so far."""
+        return len(self.block_offsets) * BLOCK_SIZE + len(self.pending) * BLOCK_SIZE + len(self.buffer)
+
+    def write(self, data: bytes):
+        self.buffer += data
+        if len(self.buffer) < BLOCK_SIZE:
+            return
+        full = len(self.buffer) - len(self.buffer) % BLOCK_SIZE
+        for start in range(0, full, BLOCK_SIZE):
+            self.submit(bytes(self.buffer[start : start + BLOCK_SIZE]))
+        del self.buffer[:full]
+
+    def submit(self, data: bytes):
+        if self.executor is None:
+            self.pending.append(compress_block(data, self.level))
+        else:
+            self.pending.append(self.executor.submit(compress_block, data, self.level))
+        while len(self.pending) > self.max_pending:
+            self.write_block()
+
+    def write_block(self):
+        """Writes the oldest pending block, waiting for it to be compressed."""
+        block = self.pending.popleft()
+        if isinstance(block, Future):
+            block = block.result()
+        self.block_offsets.append(self.written)
+        self.handle.write(block)
+        self.written += len(block)
+
+    def close(self):
+        if self.closed:
+            return
+        if self.buffer:
+            self.submit(bytes(self.buffer))
+            self.buffer.clear()
+        while self.pending:
+            self.write_block()
+        if self.executor is not None:
+            self.executor.shutdown()
+        self.block_offsets.append(self.written)
+        self.handle.write(EOF_BLOCK)
+        self.handle.close()
+        self.closed = True
+
+    def virtual_offsets(self, offsets: np.ndarray) -> np.ndarray:
+        """
+        Converts uncompressed offsets into virtual offsets, only valid once the writer is closed
+
+        Args:
+            offsets (np.ndarray): positions in the uncompressed data
+
+        Returns:
+            the virtual offset of each position, as uint64
+        """
+        offsets = np.asarray(offsets, dtype=np.uint64)
+        blocks = np.asarray(self.block_offsets, dtype=np.uint64)
+        return (blocks[offsets // np.uint64(BLOCK_SIZE)] << np.uint64(16)) | (offsets % np.uint64(BLOCK_SIZE))
+
+
+class BgzfReader:
+    """Reads a BGZF file from any virtual offset, one line at a time."""
+
+    def __init__(self, path: str):
+        self.handle = open(path, 'rb')  # noqa: SIM115
+        self.block_offset = 0
+        self.next_block = 0
+        self.data = b''
+        self.within = 0
+
+    def __enter__(self) -> 'BgzfReader':
+        return self
+
+    def __exit__(self, *args: object):
+        self.handle.close()
+
+    def load_block(self, offset: int) -> bool:
+        """Reads and decompresses the block at this compressed offset, returns False at the end of the file."""
+        self.handle.seek(offset)
+        header = self.handle.read(HEADER.size)
+        if len(header) < HEADER.size:
+            self.data = b''
+            return False
+        *_, block_size = HEADER.unpack(header)
+        compressed = self.handle.read(block_size + 1 - HEADER.size)
+        self.block_offset = offset
+        self.next_block = offset + block_size + 1
+        self.data = zlib.decompress(compressed[: -TRAILER.size], -15)
+        self.within = 0
+        return True
+
+    def seek(self, virtual_offset: int):
+        self.load_block(virtual_offset >> 16)
+        self.within = virtual_offset & 0xFFFF
+
+    def tell(self) -> int:
+        """The virtual offset of the next byte to be read."""
+        if self.within == len(self.data):
+            return self.next_block << 16
+        return (self.block_offset << 16) | self.within
+
+    def readline(self) -> bytes:
+        """The next line, including the newline, or an empty bytes object at the end of the file."""
+        parts = []
+        while True:
+            end = self.data.find(b'\n', self.within)
+            if end >= 0:
+                parts.append(self.data[self.within : end + 1])
+                self.within = end + 1
+                return b''.join(parts)
+            parts.append(self.data[self.within :])
+            # step on to the next block, skipping empty blocks
+            while True:
+                if not self.load_block(self.next_block):
+                    return b''.join(parts)
+                if self.data:
+                    break
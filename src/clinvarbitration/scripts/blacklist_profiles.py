@@ -0,0 +1,242 @@
+"""
+Re-summarises ClinVar for each of several named blacklist profiles, parsing the two ClinVar files only once
+
+Running resummarise_clinvar.py with a different -b blacklist per cohort re-parses both inputs in full each time,
+though a blacklist usually removes a handful of submitters. Here the inputs are parsed once, without any profile's
+blacklist applied, and every Submission keeps its submitter. An index of the VariationIDs each submitter submitted
+to is built from those, so each profile only re-evaluates the variants its blacklisted submitters touched. Every
+other decision is shared with the unfiltered decisions.
+
+The profiles are a JSON object of profile name to blacklisted submitter names, matched case-insensitively:
+
+    {"cohort_a": ["Submitter One"], "cohort_b": ["Submitter One", "Submitter Two"], "none": []}
+
+Each profile's outputs are written as resummarise_clinvar.py writes them, with the output root {output_root}.{name},
+e.g. clinvar_decisions.cohort_a.tsv.bgz, and the Hail Table records the profile's blacklist in its globals. A
+summary of each profile (the VariationIDs re-evaluated, and decisions changed & removed) is written to
+{output_root}.profiles.json. The module-level BLACKLIST still applies to every profile.
+
+python -m clinvarbitration.scripts.blacklist_profiles -s submission_summary.txt.gz -v variant_summary.txt.gz \\
+    -p profiles.json -o clinvar_decisions
+"""
+
+import json
+import re
+from argparse import ArgumentParser
+from collections import defaultdict
+
+from loguru import logger
+
+import hail as hl
+
+from clinvarbitration.scripts.resummarise_clinvar import (
+    BLACKLIST,
+    GRCH37,
+    GRCH38,
+    Submission,
+    decide,
+    get_all_decisions,
+    get_allele_locus_map,
+    match_decisions,
+    write_outputs,
+)
+
+# profile names become part of each output path
+PROFILE_NAME = re.compile(r'[\w.-]+')
+
+
+def read_profiles(profiles_path: str) -> dict[str, set[str]]:
+    """
+    Reads the named blacklist profiles
+
+    Args:
+        profiles_path (str): JSON object of profile name to a list of submitter names
+
+    Returns:
+        the lower-cased submitter names blacklisted in each profile, as Submission.submitter is lower-cased
+    """
+
+    with open(profiles_path, encoding='utf-8') as handle:
+        profiles = json.load(handle)
+
+    if not isinstance(profiles, dict) or not profiles:
+        raise ValueError(f'{profiles_path} should be a JSON object of profile name to a list of submitters')
+
+    parsed = {}
+    for name, submitters in profiles.items():
+        if not PROFILE_NAME.fullmatch(name):
+            raise ValueError(f'Profile names may only contain letters, numbers, ".", "-" and "_", not {name!r}')
+        if not isinstance(submitters, list) or not all(isinstance(submitter, str) for submitter in submitters):
+            raise ValueError(f'Profile {name} should be a list of submitter names')
+        parsed[name] = {submitter.lower() for submitter in submitters}
+    return parsed
+
+
+def submitter_variants(decision_dict: dict[int, list[Submission]]) -> dict[str, set[int]]:
+    """The VariationIDs each submitter has a retained submission for."""
+    index: dict[str, set[int]] = defaultdict(set)
+    for var_id, submissions in decision_dict.items():
+        for submission in submissions:
+            index[submission.submitter].add(var_id)
+    return index
+
+
+def profile_decisions(
+    decisions: list[dict],
+    decision_dict: dict[int, list[Submission]],
+    submitter_index: dict[str, set[int]],
+    blacklist: set[str],
+) -> tuple[list[dict], dict]:
+    """
+    The decisions with a blacklist applied, re-evaluating only the variants a blacklisted submitter submitted to
+
+    Args:
+        decisions (list[dict]): the sorted decisions without the blacklist, from match_decisions
+        decision_dict (dict[int, list[Submission]]): the submissions for each VariationID, without the blacklist
+        submitter_index (dict[str, set[int]]): the VariationIDs of each submitter, from submitter_variants
+        blacklist (set[str]): the lower-cased submitter names to exclude
+
+    Returns:
+        the sorted decisions for this profile, and a summary of the changes. Unchanged decisions are shared with the
+        input, not copied
+    """
+
+    touched: set[int] = set()
+    for submitter in blacklist:
+        touched.update(submitter_index.get(submitter, ()))
+
+    # None where every submission for the variant was blacklisted, so it has no decision
+    overrides = {}
+    for var_id in touched:
+        kept = [submission for submission in decision_dict[var_id] if submission.submitter not in blacklist]
+        overrides[var_id] = decide(kept) if kept else None
+
+    profiled = []
+    changed = removed = 0
+    for decision in decisions:
+        if (var_id := decision['variation_id']) not in overrides:
+            profiled.append(decision)
+            continue
+
+        if (override := overrides[var_id]) is None:
+            removed += 1
+            continue
+
+        rating, stars = override
+        if rating.value == decision['clinical_significance'] and stars == decision['gold_stars']:
+            profiled.append(decision)
+        else:
+            profiled.append({**decision, 'clinical_significance': rating.value, 'gold_stars': stars})
+            changed += 1
+
+    return profiled, {
+        'blacklist': sorted(blacklist),
+        'variation_ids_re_evaluated': len(touched),
+        'decisions_changed': changed,
+        'decisions_removed': removed,
+        'decisions': len(profiled),
+    }
+
+
+def batch_decisions(
+    subs: str,
+    variants: str,
+    profiles: dict[str, set[str]],
+    assembly: str,
+) -> dict[str, tuple[list[dict], dict]]:
+    """
+    Parses ClinVar once, then generates the decisions for every profile. Nothing is written to disk.
+
+    Args:
+        subs (str): submission_summary.txt.gz from NCBI
+        variants (str): variant_summary.txt.gz from NCBI
+        profiles (dict[str, set[str]]): the lower-cased blacklisted submitters of each profile
+        assembly (str): genome build to use
+
+    Returns:
+        the sorted decisions and a summary of the changes, for each profile
+    """
+
+    logger.info('Getting alleleID-VariantID-Loci from variant summary')
+    allele_map = get_allele_locus_map(variants, assembly)
+
+    logger.info('Getting all submissions, indexed on clinvar Var ID')
+    decision_dict = get_all_decisions(submission_file=subs, var_ids={x['var_id'] for x in allele_map.values()})
+    submitter_index = submitter_variants(decision_dict)
+
+    decisions = match_decisions(
+        allele_map,
+        {var_id: decide(submissions) for var_id, submissions in decision_dict.items()},
+        assembly=assembly,
+    )
+
+    results = {}
+    for name, blacklist in profiles.items():
+        results[name] = profile_decisions(decisions, decision_dict, submitter_index, blacklist)
+        summary = results[name][1]
+        logger.info(
+            f'Profile {name}: re-evaluated {summary["variation_ids_re_evaluated"]} VariationIDs, '
+            f'{summary["decisions_changed"]} decisions changed, {summary["decisions_removed"]} removed',
+        )
+    return results
+
+
+def cli_main():
+    parser = ArgumentParser(description='Re-summarise ClinVar for several blacklist profiles, parsing ClinVar once')
+    parser.add_argument('-s', help='submission_summary.txt.gz from NCBI', required=True)
+    parser.add_argument('-v', help='variant_summary.txt.gz from NCBI', required=True)
+    parser.add_argument('-p', help='JSON file of profile name to a list of blacklisted submitters', required=True)
+    parser.add_argument('-o', help='output root, each profile is written to {output root}.{profile}', required=True)
+    parser.add_argument('--assembly', help='genome build to use', default=GRCH38, choices=[GRCH37, GRCH38])
+    parser.add_argument(
+        '--parquet',
+        help='if set, also write the decisions as Parquet, with one row group per contig (requires pyarrow)',
+        action='store_true',
+    )
+    args = parser.parse_args()
+
+    main(
+        subs=args.s,
+        variants=args.v,
+        profiles_path=args.p,
+        output_root=args.o,
+        assembly=args.assembly,
+        parquet=args.parquet,
+    )
+
+
+def main(subs: str, variants: str, profiles_path: str, output_root: str, assembly: str, parquet: bool = False):
+    """
+    Parse all ClinVar submissions once, and write re-summarised decisions for each blacklist profile
+
+    Args:
+        subs (str): submission_summary.txt.gz from NCBI
+        variants (str): variant_summary.txt.gz from NCBI
+        profiles_path (str): JSON file of profile name to a list of blacklisted submitters
+        output_root (str): output root, each profile is written to {output_root}.{profile}
+        assembly (str): genome build to use
+        parquet (bool): if True, also write each profile's decisions as Parquet
+    """
+
+    profiles = read_profiles(profiles_path)
+    results = batch_decisions(subs=subs, variants=variants, profiles=profiles, assembly=assembly)
+
+    hl.context.init_spark(master='local[*]')
+    hl.default_reference(assembly)
+    for name, (decisions, _summary) in results.items():
+        write_outputs(
+            decisions,
+            output_root=f'{output_root}.{name}',
+            assembly=assembly,
+            parquet=parquet,
+            blacklist=BLACKLIST | profiles[name],
+        )
+
+    summary_path = f'{output_root}.profiles.json'
+    with open(summary_path, 'w', encoding='utf-8') as handle:
+        json.dump({name: summary for name, (_decisions, summary) in results.items()}, handle, indent=2)
+    logger.info(f'Wrote a summary of {len(results)} profiles to {summary_path}')
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -0,0 +1,48 @@
+"""
+md5 checksums of files & folders, shared by the release outputs (resummarise_clinvar.py, release_delta.py), the
+compiled GFF3 index (gff3_index.py), and the annotation cache (annotation_cache.py)
+"""
+
+import gzip
+import hashlib
+from os import walk
+from os.path import isdir, join, relpath
+
+# md5 checksums are calculated over file content in chunks of this size
+CHECKSUM_CHUNK = 1024 * 1024
+
+
+def checksum_path(path: str) -> str:
+    """
+    md5 checksum of a file, or of a directory (e.g. a Hail Table)
+    directory checksums digest every contained file's relative path and content, in sorted path order
+    """
+
+    digest = hashlib.md5()  # noqa: S324
+
+    if isdir(path):
+        file_paths = sorted(join(root, name) for root, _dirs, files in walk(path) for name in files)
+    else:
+        file_paths = [path]
+
+    for file_path in file_paths:
+        if file_path != path:
+            digest.update(relpath(file_path, path).encode())
+        with open(file_path, 'rb') as handle:
+            while chunk := handle.read(CHECKSUM_CHUNK):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def checksum_rows(path: str) -> str:
+    """
+    md5 checksum of the decompressed content of a gzip or BGZF file
+    unlike the compressed bytes, this doesn't depend on the zlib build or compression level that wrote it
+    """
+
+    digest = hashlib.md5()  # noqa: S324
+    with gzip.open(path, 'rb') as handle:
+        while chunk := handle.read(CHECKSUM_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -16,16 +16,28 @@ has been generated by summarise_clinvar_entries.py:
 - ClinVar decision/alleles/gold stars are in INFO
 """
 
+import gzip
+import io
 import re
+import sys
 import zoneinfo
 from argparse import ArgumentParser
-from collections import defaultdict
+from collections.abc import Generator, Iterable
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
 from datetime import datetime
+from itertools import chain, islice, pairwise
+from operator import itemgetter
+from typing import TextIO
 
+import numpy as np
 from loguru import logger
 
 import hail as hl
 
+from clinvarbitration.scripts.parquet_output import write_codon_index_parquet
+from clinvarbitration.scripts.pm5_index import CODON_BITS, Pm5Index
+
 # I really want the linter to just tolerate naive datetimes, but it won't
 TIMEZONE = zoneinfo.ZoneInfo('Australia/Brisbane')
 
@@ -35,6 +47,35 @@ NUMBER_RE = re.compile(r'(\d+)\D>(\d+)\D?')
 
 TSV_KEYS = ['transcript', 'codon', 'clinvar_alleles']
 
+# the residue (PS1) index has an additional column, the alternate amino acid
+RESIDUE_TSV_KEYS = ['transcript', 'codon', 'alt_aa', 'clinvar_alleles']
+
+# appended to the TSV columns in structured output
+STRUCTURED_KEYS = ['max_stars', 'n_alleles']
+
+# the Hail Table schema, and the additional fields in structured output
+HT_SCHEMA = {'newkey': hl.tstr, 'clinvar_alleles': hl.tstr}
+STRUCTURED_SCHEMA = {
+    'alleles': hl.tarray(hl.tstruct(allele_id=hl.tint32, gold_stars=hl.tint32)),
+    'max_stars': hl.tint32,
+    'n_alleles': hl.tint32,
+}
+
+# gzip and BGZF files both start with these bytes
+GZIP_MAGIC = b'\x1f\x8b'
+
+# the two codon numbers in newline-delimited amino acid changes, each matching the same values as NUMBER_RE
+FIRST_CODON_RE = re.compile(r'^(\d+)\D>\d', re.MULTILINE)
+SECOND_CODON_RE = re.compile(r'^\d+\D>(\d+)', re.MULTILINE)
+
+# number of rows parsed at a time
+BATCH_ROWS = 100_000
+
+# (transcript, codon) and (allele ID, gold stars) are each packed into one int64 for sorting and de-duplication
+# for the residue (PS1) index, the alternate amino acid is packed in below the codon
+STARS_BITS = 4
+ALT_BITS = 8
+
 
 def cli_main():
     """
@@ -43,11 +84,11 @@ def cli_main():
     parser = ArgumentParser()
     parser.add_argument(
         '-i',
-        help='Path to the TSV',
+        help='Path to the TSV, optionally gzip/BGZF compressed, or "-" to read from stdin',
     )
     parser.add_argument(
         '-o',
-        help='Root to export PM5 table and JSON to',
+        help='Root to export the PM5 TSV, index, and Hail Table to',
     )
     parser.add_argument(
         '--assembly',
@@ -55,82 +96,507 @@ def cli_main():
         default='GRCh38',
         choices=['GRCh37', 'GRCh38'],
     )
+    parser.add_argument(
+        '--no-ht',
+        help='only write the PM5 TSV, without starting Hail',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--structured',
+        help="also write each codon's alleles as an array of structs, with max_stars and n_alleles columns",
+        action='store_true',
+    )
+    parser.add_argument(
+        '--ps1',
+        help='if provided, also write a PS1 index on (transcript, codon, alternate amino acid) to this root',
+        default=None,
+    )
+    parser.add_argument(
+        '--parquet',
+        help='also write the PM5 (and PS1) data as Parquet, in row groups of whole transcripts (requires pyarrow)',
+        action='store_true',
+    )
     args = parser.parse_args()
 
-    main(input_tsv=args.i, output_root=args.o, assembly=args.assembly)
+    main(
+        input_tsv=args.i,
+        output_root=args.o,
+        assembly=args.assembly,
+        write_ht=not args.no_ht,
+        structured=args.structured,
+        ps1_root=args.ps1,
+        parquet=args.parquet,
+    )
 
 
-def parse_tsv_into_dict(input_tsv: str) -> dict[str, set[str]]:
+def parse_integers(values: list[str]) -> np.ndarray | None:
     """
-    parse the TSV, and create the intermediate dictionary
+    Converts a column of integer strings in one numpy call
+    Returns None if any value isn't a plain integer, so the caller can fall back to parsing row by row
+    """
+    try:
+        return np.array(values, dtype=np.int64)
+    except (ValueError, OverflowError):
+        return None
+
+
+def alt_amino_acids(changes: list[str]) -> np.ndarray:
+    """
+    The alternate amino acid of each change (e.g. T in 334N>334T) as its character code, 0 if there isn't one
+    """
+    codes = np.frombuffer(''.join(change[-1] for change in changes).encode('ascii', errors='replace'), dtype=np.uint8)
+    return np.where((codes >= ord('0')) & (codes <= ord('9')), 0, codes).astype(np.int64)
+
+
+def parse_rows_individually(
+    rows: Iterable[str],
+) -> tuple[list[str], list[int], list[int], list[int], list[str]]:
+    """
+    Parse rows one at a time, raising an error on any row which can't be used
+    Returns:
+        the transcript, codon, allele ID, gold stars, and amino acid change columns
+    """
+
+    tx_column, codon_column, aid_column, stars_column, change_column = [], [], [], [], []
+    for row in rows:
+        # transcript, amino acid change, clinvar allele id, clinvar gold stars
+        tx, aa, aid, stars = row.rstrip().split('\t')
+
+        # find the codon number
+        match = NUMBER_RE.match(aa)
+
+        if not match:
+            raise ValueError(f'No codon found in {aa}')
+
+        if match.group(1) != match.group(2):
+            raise ValueError(f'Codon numbers do not match in {aa}')
+
+        tx_column.append(tx)
+        codon_column.append(int(match.group(1)))
+        aid_column.append(int(aid))
+        stars_column.append(int(stars))
+        change_column.append(aa)
+
+    return tx_column, codon_column, aid_column, stars_column, change_column
+
+
+class CodonAggregator:
+    """
+    Collects annotated rows as typed columns: interned transcript IDs, and integer codons, allele IDs, gold stars, and
+    alternate amino acids. Rows are parsed in batches, so a file or stream is never held in memory as strings
+    """
+
+    def __init__(self):
+        self.transcript_ids: dict[str, int] = {}
+        self.columns: dict[str, list[np.ndarray]] = {'tx': [], 'codon': [], 'allele_id': [], 'stars': [], 'alt': []}
+
+    def add_rows(self, rows: Iterable[str]) -> 'CodonAggregator':
+        """
+        Parses tab-delimited rows: transcript, amino acid change, clinvar allele id, clinvar gold stars
+        """
+        iterator = iter(rows)
+        while batch := list(islice(iterator, BATCH_ROWS)):
+            self.add_batch(batch)
+        return self
+
+    def add_batch(self, batch: list[str]):
+        """
+        Parse a batch of rows at once: the fields are split out of the joined batch, the codon numbers on each side of
+        the amino acid change are pulled out with one regex call each, and integer columns are converted in C loops.
+        If any row doesn't fit the expected format, the batch is parsed row by row instead to report the problem.
+        """
+
+        rows = len(batch)
+        fields = ''.join(batch).split()
+        if len(fields) == rows * 4:
+            changes = '\n'.join(fields[1::4])
+            first_codons = FIRST_CODON_RE.findall(changes)
+            if len(first_codons) == rows and first_codons == SECOND_CODON_RE.findall(changes):
+                codon = parse_integers(first_codons)
+                allele_id = parse_integers(fields[2::4])
+                stars = parse_integers(fields[3::4])
+                if codon is not None and allele_id is not None and stars is not None:
+                    self.add_columns(
+                        tx=fields[0::4],
+                        codon=codon,
+                        allele_id=allele_id,
+                        stars=stars,
+                        alt=alt_amino_acids(fields[1::4]),
+                    )
+                    return
+
+        tx, codon, aid, stars, changes = parse_rows_individually(batch)
+        self.add_columns(
+            tx=tx,
+            codon=np.array(codon, dtype=np.int64),
+            allele_id=np.array(aid, dtype=np.int64),
+            stars=np.array(stars, dtype=np.int64),
+            alt=alt_amino_acids(changes),
+        )
+
+    def add_columns(
+        self,
+        tx: list[str],
+        codon: np.ndarray,
+        allele_id: np.ndarray,
+        stars: np.ndarray,
+        alt: np.ndarray,
+    ):
+        """Store one batch of columns, interning the transcript IDs."""
+
+        transcript_ids = self.transcript_ids
+        for name in set(tx).difference(transcript_ids):
+            transcript_ids[name] = len(transcript_ids)
+
+        self.columns['tx'].append(np.fromiter(map(transcript_ids.__getitem__, tx), dtype=np.int64, count=len(tx)))
+        self.columns['codon'].append(codon)
+        self.columns['allele_id'].append(allele_id)
+        self.columns['stars'].append(stars)
+        self.columns['alt'].append(alt)
+
+    def column(self, name: str) -> np.ndarray:
+        return np.concatenate(self.columns[name]) if self.columns[name] else np.empty(0, dtype=np.int64)
+
+    def aggregate(self, by_residue: bool = False) -> 'CodonIndex':
+        """
+        Groups the collected rows on (transcript, codon), removing duplicate (allele ID, gold stars) entries
+
+        Transcripts are re-numbered in sorted order, then (transcript, codon) and (allele ID, stars) are each packed
+        into a single integer, so one lexsort orders the rows, and duplicates and group boundaries are found by
+        comparing neighbouring values.
+
+        Args:
+            by_residue (bool): if True, group on (transcript, codon, alternate amino acid) instead, for PS1. Rows
+                without an alternate amino acid are left out
+        """
+
+        names = sorted(self.transcript_ids)
+        rank = np.empty(len(names), dtype=np.int64)
+        rank[[self.transcript_ids[name] for name in names]] = np.arange(len(names), dtype=np.int64)
+
+        tx = rank[self.column('tx')]
+        codon = self.column('codon')
+        allele_id = self.column('allele_id')
+        stars = self.column('stars')
+
+        group_keys = (tx << CODON_BITS) | codon
+        allele_keys = (allele_id << STARS_BITS) | stars
+
+        if by_residue:
+            alt = self.column('alt')
+            has_alt = alt > 0
+            group_keys = (group_keys[has_alt] << ALT_BITS) | alt[has_alt]
+            allele_keys = allele_keys[has_alt]
+
+        order = np.lexsort((allele_keys, group_keys))
+        group_keys, allele_keys = group_keys[order], allele_keys[order]
+
+        # drop repeated (group, allele, stars) entries
+        unique = np.ones(len(group_keys), dtype=bool)
+        unique[1:] = (group_keys[1:] != group_keys[:-1]) | (allele_keys[1:] != allele_keys[:-1])
+        group_keys, allele_keys = group_keys[unique], allele_keys[unique]
+
+        # each group is a contiguous run of the sorted keys
+        group_starts = np.ones(len(group_keys), dtype=bool)
+        group_starts[1:] = group_keys[1:] != group_keys[:-1]
+        starts = np.flatnonzero(group_starts)
+        offsets = np.append(starts, len(group_keys)).astype(np.int64)
+        first_keys = group_keys[starts]
+
+        group_alt = None
+        if by_residue:
+            group_alt = first_keys & ((1 << ALT_BITS) - 1)
+            first_keys = first_keys >> ALT_BITS
+
+        return CodonIndex(
+            transcripts=names,
+            group_tx=first_keys >> CODON_BITS,
+            group_codon=first_keys & ((1 << CODON_BITS) - 1),
+            offsets=offsets,
+            allele_id=allele_keys >> STARS_BITS,
+            stars=allele_keys & ((1 << STARS_BITS) - 1),
+            group_alt=group_alt,
+        )
+
+
+@dataclass
+class CodonIndex:
+    """
+    The aggregated PM5 data, sorted on (transcript, codon), then (allele ID, gold stars)
+    Group i holds the alleles from offsets[i] to offsets[i + 1]
+    For the residue (PS1) index, groups are (transcript, codon, alternate amino acid), with group_alt holding the
+    character code of each group's alternate amino acid
+    """
+
+    transcripts: list[str]
+    group_tx: np.ndarray
+    group_codon: np.ndarray
+    offsets: np.ndarray
+    allele_id: np.ndarray
+    stars: np.ndarray
+    group_alt: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return len(self.group_tx)
+
+    @classmethod
+    def from_tsv_rows(cls, rows: Iterable[str]) -> 'CodonIndex':
+        """
+        Reads a written PM5 TSV back, the inverse of tsv_lines. Any structured columns are ignored
+
+        Args:
+            rows (Iterable[str]): the TSV rows without the header, sorted on transcript then codon
+        """
+
+        transcript_ids: dict[str, int] = {}
+        group_tx, group_codon, offsets, allele_id, stars = [], [], [0], [], []
+        for row in rows:
+            transcript, codon, alleles = row.rstrip('\n').split('\t')[:3]
+            group_tx.append(transcript_ids.setdefault(transcript, len(transcript_ids)))
+            group_codon.append(int(codon))
+            for allele in alleles.split('+'):
+                aid, allele_stars = allele.split('::')
+                allele_id.append(int(aid))
+                stars.append(int(allele_stars))
+            offsets.append(len(allele_id))
+
+        return cls(
+            transcripts=list(transcript_ids),
+            group_tx=np.array(group_tx, dtype=np.int64),
+            group_codon=np.array(group_codon, dtype=np.int64),
+            offsets=np.array(offsets, dtype=np.int64),
+            allele_id=np.array(allele_id, dtype=np.int64),
+            stars=np.array(stars, dtype=np.int64),
+        )
+
+    def labels(self, separator: str, first: int = 0, last: int | None = None) -> list[str]:
+        """
+        The 'transcript{separator}codon' label of each group in [first, last), with the alternate amino acid
+        appended for a residue index
+        """
+        block = slice(first, last)
+        parts = [map(self.transcripts.__getitem__, self.group_tx[block].tolist()), self.group_codon[block].tolist()]
+        if self.group_alt is not None:
+            parts.append(map(chr, self.group_alt[block].tolist()))
+        return list(map(separator.join, zip(*(map(str, part) for part in parts), strict=True)))
+
+    def allele_strings(self) -> list[str]:
+        """The alleles of each group, formatted as 'AlleleID::GoldStars+...'."""
+        alleles = [f'{aid}::{stars}' for aid, stars in zip(self.allele_id.tolist(), self.stars.tolist(), strict=True)]
+        return ['+'.join(alleles[start:end]) for start, end in pairwise(self.offsets.tolist())]
+
+    def rows(self) -> Generator[tuple[str, int, str], None, None]:
+        """(transcript, codon, clinvar_alleles) per group, with alleles formatted as 'AlleleID::GoldStars+...'."""
+        transcripts = self.transcripts
+        yield from zip(
+            map(transcripts.__getitem__, self.group_tx.tolist()),
+            self.group_codon.tolist(),
+            self.allele_strings(),
+            strict=True,
+        )
+
+    def n_alleles(self) -> np.ndarray:
+        """The number of alleles at each codon."""
+        return np.diff(self.offsets)
+
+    def max_stars(self) -> np.ndarray:
+        """The highest gold star rating of any allele at each codon."""
+        if not len(self):
+            return np.empty(0, dtype=np.int64)
+        return np.maximum.reduceat(self.stars, self.offsets[:-1])
+
+    def tsv_lines(self, structured: bool = False) -> Generator[str, None, None]:
+        """
+        The TSV body, in blocks of up to BATCH_ROWS groups
+        Each allele is preceded by a separator, either '+' or the 'transcript\tcodon\t' prefix of a new group (with
+        the alternate amino acid for a residue index), so a block of lines is a single join over interleaved
+        separators and alleles
+
+        Args:
+            structured (bool): if True, each row ends with max_stars & n_alleles columns
+        """
+
+        if structured:
+            max_stars, n_alleles = self.max_stars(), self.n_alleles()
+
+        for first in range(0, len(self), BATCH_ROWS):
+            last = min(first + BATCH_ROWS, len(self))
+            start, end = int(self.offsets[first]), int(self.offsets[last])
+            alleles = map('{}::{}'.format, self.allele_id[start:end].tolist(), self.stars[start:end].tolist())
+
+            # any trailing columns of a group are written in the separator which starts the next group
+            if structured:
+                suffixes = list(
+                    map('\t{}\t{}'.format, max_stars[first:last].tolist(), n_alleles[first:last].tolist()),
+                )
+            else:
+                suffixes = [''] * (last - first)
+
+            separators = np.full(end - start, '+', dtype=object)
+            separators[self.offsets[first:last] - start] = list(
+                map('{}\n{}\t'.format, ['', *suffixes[:-1]], self.labels('\t', first, last)),
+            )
+            # the first line of the block doesn't need a preceding newline, but ends with one
+            separators[0] = separators[0][1:]
+            yield ''.join(chain.from_iterable(zip(separators.tolist(), alleles, strict=True))) + suffixes[-1] + '\n'
+
+    def keyed_rows(self, structured: bool = False) -> list[dict]:
+        """
+        The Hail Table rows, {'newkey': 'transcript::codon', 'clinvar_alleles': 'AlleleID::GoldStars+...'}
+        Sorted on newkey as a string, matching the Table key order, which isn't the same as (transcript, codon) order
+        For a residue index the key is 'transcript::codon::alt', e.g. 'ENST00000338591::561::E'
+
+        Args:
+            structured (bool): if True, each row also has an array of allele structs, max_stars, and n_alleles
+        """
+        keyed = [
+            {'newkey': label, 'clinvar_alleles': alleles}
+            for label, alleles in zip(self.labels('::'), self.allele_strings(), strict=True)
+        ]
+        if structured:
+            allele_ids, stars = self.allele_id.tolist(), self.stars.tolist()
+            for row, (start, end), max_stars, n_alleles in zip(
+                keyed,
+                pairwise(self.offsets.tolist()),
+                self.max_stars().tolist(),
+                self.n_alleles().tolist(),
+                strict=True,
+            ):
+                row['alleles'] = [
+                    {'allele_id': allele_id, 'gold_stars': gold_stars}
+                    for allele_id, gold_stars in zip(allele_ids[start:end], stars[start:end], strict=True)
+                ]
+                row['max_stars'] = max_stars
+                row['n_alleles'] = n_alleles
+        keyed.sort(key=itemgetter('newkey'))
+        return keyed
+
+    def to_dict(self) -> dict[str, set[str]]:
+        """The legacy representation, {'transcript::codon': {'AlleleID::GoldStars', ...}}."""
+        return {
+            label: set(alleles.split('+'))
+            for label, alleles in zip(self.labels('::'), self.allele_strings(), strict=True)
+        }
+
+
+def aggregate_rows(rows: Iterable[str]) -> CodonIndex:
+    """
+    aggregate annotated rows by transcript and codon, consuming them one at a time
     Args:
-        input_tsv (str): path to an input TSV
+        rows (Iterable[str]): tab-delimited rows, from a file or a stream
 
     Returns:
-        dictionary of results,
+        the aggregated CodonIndex
+    """
+    return CodonAggregator().add_rows(rows).aggregate()
+
+
+@contextmanager
+def open_rows(input_tsv: str) -> Generator[TextIO, None, None]:
+    """
+    Opens the annotated rows for reading, one line at a time
+    '-' reads from stdin, and gzip or BGZF input (from a file or stdin) is decompressed as it's read
     """
 
-    # create a dictionary to store the parsed entries
-    clinvar_dict = defaultdict(set)
+    with ExitStack() as stack:
+        binary = sys.stdin.buffer if input_tsv == '-' else stack.enter_context(open(input_tsv, 'rb'))
+        if binary.peek(len(GZIP_MAGIC)).startswith(GZIP_MAGIC):
+            binary = stack.enter_context(gzip.open(binary))
+
+        text = io.TextIOWrapper(binary, encoding='utf-8')
+        try:
+            yield text
+        finally:
+            # leave the underlying stream for the ExitStack, so stdin is never closed
+            text.detach()
+
+
+def collect_tsv(input_tsv: str) -> CodonAggregator:
+    """
+    parse the TSV into typed columns, which can be aggregated by codon (PM5) and by residue (PS1)
+    Args:
+        input_tsv (str): path to an input TSV, optionally compressed, or '-' for stdin
+
+    Returns:
+        the CodonAggregator holding all rows
+    """
 
     # crack open a cold TSV, and have a sip
-    with open(input_tsv) as tsv_reader:
-        for row in tsv_reader:
-            # transcript, amino acid change, clinvar allele id, clinvar gold stars
-            tx, aa, aid, stars = row.rstrip().split('\t')
+    with open_rows(input_tsv) as tsv_reader:
+        return CodonAggregator().add_rows(tsv_reader)
 
-            # find the codon number
-            match = NUMBER_RE.match(aa)
 
-            if not match:
-                raise ValueError(f'No codon found in {aa}')
+def aggregate_tsv(input_tsv: str) -> CodonIndex:
+    """
+    parse the TSV, and aggregate by transcript and codon
+    Args:
+        input_tsv (str): path to an input TSV, optionally compressed, or '-' for stdin
 
-            if match.group(1) != match.group(2):
-                raise ValueError(f'Codon numbers do not match in {aa}')
+    Returns:
+        the aggregated CodonIndex
+    """
+    return collect_tsv(input_tsv).aggregate()
 
-            aa_number = match.group(1)
 
-            # extract the clinvar data
-            clinvar_key = f'{aid}::{stars}'
+def parse_tsv_into_dict(input_tsv: str) -> dict[str, set[str]]:
+    """
+    parse the TSV, and create the intermediate dictionary
+    Args:
+        input_tsv (str): path to an input TSV
 
-            # identify the transcript and codon number
-            transcript_key = f'{tx}::{aa_number}'
+    Returns:
+        dictionary of results,
+    """
+    return aggregate_tsv(input_tsv).to_dict()
 
-            # record this clinvar entry as being associated with this transcript & codon
-            clinvar_dict[transcript_key].add(clinvar_key)
 
-    return clinvar_dict
+def parse_rows_into_dict(rows: Iterable[str]) -> dict[str, set[str]]:
+    """
+    create the intermediate dictionary from annotated rows, consumed one at a time
+    Args:
+        rows (Iterable[str]): tab-delimited rows, from a file or a stream
+
+    Returns:
+        dictionary of results,
+    """
+    return aggregate_rows(rows).to_dict()
 
 
-def write_results_as_tsv(clinvar_dict: dict[str, set[str]], tsv_path: str) -> None:
+def write_results_as_tsv(codon_index: CodonIndex, tsv_path: str, structured: bool = False) -> None:
     """
-    Write the dictionary to a TSV. Columns:
+    Write the aggregated data to a TSV, sorted on transcript then codon. Columns:
     - Transcript
     - Codon Number
-    - ClinVar Allele IDs (joined by a plus sign)
+    - for a residue (PS1) index, the alternate amino acid
+    - ClinVar Allele IDs (joined by a plus sign, sorted on allele ID)
+    - if structured, the highest gold stars of any allele, and the number of alleles
     """
 
+    keys = RESIDUE_TSV_KEYS if codon_index.group_alt is not None else TSV_KEYS
+    if structured:
+        keys = keys + STRUCTURED_KEYS
     with open(tsv_path, 'w') as tsv_writer:
         # write the header
-        tsv_writer.write('\t'.join(TSV_KEYS) + '\n')
-        for key, value in clinvar_dict.items():
-            transcript_id, codon_number = key.split('::')
-            # join the alleles with a plus sign
-            tsv_writer.write(f'{transcript_id}\t{codon_number}\t{"+".join(sorted(value))}\n')
+        tsv_writer.write('\t'.join(keys) + '\n')
+        tsv_writer.writelines(codon_index.tsv_lines(structured=structured))
 
     logger.info(f'TSV written to {tsv_path}')
 
 
-def parse_tsv_into_hail_table(data: str, table_path: str) -> None:
-    """Read the TSV into a HailTable."""
-
-    # all elements are Strings, so no need to specify types
-    ht = hl.import_table(paths=data)
+def write_hail_table(codon_index: CodonIndex, table_path: str, structured: bool = False) -> None:
+    """
+    Write the aggregated data as a Hail Table, directly from memory, without re-importing the TSV
+    If structured, the legacy clinvar_alleles string is accompanied by an array of allele structs, max_stars, and
+    n_alleles, so consumers can filter on gold stars without parsing strings
+    """
 
     # newkey is a legacy column name, and represents Transcript::Codon
-    ht = ht.transmute(newkey=ht.transcript + '::' + ht.codon)
-
-    ht = ht.key_by(ht.newkey)
+    schema = HT_SCHEMA | STRUCTURED_SCHEMA if structured else HT_SCHEMA
+    ht = hl.Table.parallelize(
+        codon_index.keyed_rows(structured=structured),
+        schema=hl.tstruct(**schema),
+    )
+    ht = ht.key_by('newkey')
 
     # implant the creation date
     ht = ht.annotate_globals(
@@ -142,29 +608,59 @@ def parse_tsv_into_hail_table(data: str, table_path: str) -> None:
     logger.info(f'Hail Table written to {table_path}')
 
 
-def main(input_tsv: str, output_root: str, assembly: str):
+def main(
+    input_tsv: str,
+    output_root: str,
+    assembly: str,
+    write_ht: bool = True,
+    structured: bool = False,
+    ps1_root: str | None = None,
+    parquet: bool = False,
+):
     """
     parse the TSV, and create a re-indexed table
+    Optionally, in the same pass, index the same alleles on (transcript, codon, alternate amino acid) for PS1
 
     Args:
-        input_tsv (str): path to an input vcf
-        output_root ():
+        input_tsv (str): path to the annotated TSV, optionally compressed, or '-' for stdin
+        output_root (str): root path for the PM5 TSV, index, and Hail Table
         assembly (str): genome build to use
+        write_ht (bool): if False, only the TSV is written, and Hail is never started
+        structured (bool): if True, also write the alleles as structs, with max_stars and n_alleles
+        ps1_root (str | None): if provided, root path for the PS1 (same amino acid change) TSV and Hail Table
+        parquet (bool): if True, also write the PM5 (and PS1) data as Parquet
     """
 
-    # start the local hail runtime
-    hl.context.init_spark(master='local[*]')
-    hl.default_reference(assembly)
-
-    # parse the TSV into a dictionary
-    clinvar_dict = parse_tsv_into_dict(input_tsv)
+    # parse the TSV into typed columns, and aggregate by transcript & codon
+    aggregator = collect_tsv(input_tsv)
+    codon_index = aggregator.aggregate()
 
     # write collected results as a TSV
     tsv_path = f'{output_root}.tsv'
-    write_results_as_tsv(clinvar_dict, tsv_path)
+    write_results_as_tsv(codon_index, tsv_path, structured=structured)
+
+    # and as a memory-mappable index, for fast lookups by transcript & codon
+    Pm5Index.from_codon_index(codon_index).write(f'{output_root}.idx')
 
-    # now read the same as a Hail Table
-    parse_tsv_into_hail_table(data=tsv_path, table_path=f'{output_root}.ht')
+    # the PS1 index groups the same parsed columns on (transcript, codon, alternate amino acid)
+    residue_index = aggregator.aggregate(by_residue=True) if ps1_root else None
+    if residue_index is not None:
+        write_results_as_tsv(residue_index, f'{ps1_root}.tsv', structured=structured)
+
+    if parquet:
+        write_codon_index_parquet(codon_index, f'{output_root}.parquet', structured=structured)
+        if residue_index is not None:
+            write_codon_index_parquet(residue_index, f'{ps1_root}.parquet', structured=structured)
+
+    if not write_ht:
+        return
+
+    # start the local hail runtime, and write the same data as a Hail Table
+    hl.context.init_spark(master='local[*]')
+    hl.default_reference(assembly)
+    write_hail_table(codon_index, table_path=f'{output_root}.ht', structured=structured)
+    if residue_index is not None:
+        write_hail_table(residue_index, table_path=f'{ps1_root}.ht', structured=structured)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,216 @@
+"""
+Writes the release in a cloud-optimised layout, so clients can look up a few variants or codons over HTTP Range
+requests, without downloading and unpacking the whole release tarball
+
+The layout is a folder of an index and one data file per dataset:
+- index.bin: an array file (see array_file.py), with an uncompressed JSON header describing each dataset (its columns,
+  and the contigs or transcripts it covers), and per-block arrays of compressed offset, compressed size, and the first
+  & last key of the rows in the block
+- decisions.tsv.bgz: the decisions TSV rows, without the header, as BGZF blocks which each hold whole rows
+- pm5.tsv.bgz: the PM5 TSV rows, in the same form
+- ps1.tsv.bgz: optionally, the PS1 TSV rows, in the same form
+
+Each row is keyed on its first two columns, the rank of the contig or transcript (in order of first appearance)
+shifted left 32 bits, plus the position or codon. A client fetches the index once, then finds the blocks covering a
+query with two binary searches over the first & last keys, and fetches and decompresses only those blocks. See
+remote_release.py for the client.
+
+python -m clinvarbitration.scripts.cloud_release \
+    --decisions clinvar_decisions.tsv.bgz \
+    --pm5 clinvar_decisions.pm5.tsv \
+    --ps1 clinvar_decisions.ps1.tsv \
+    -o clinvar_decisions.cloud
+"""
+
+import gzip
+import os
+from argparse import ArgumentParser
+from collections.abc import Generator, Iterable
+from os.path import join
+
+import numpy as np
+from loguru import logger
+
+from clinvarbitration.scripts.array_file import write_arrays
+from clinvarbitration.scripts.bgzf import BLOCK_SIZE, EOF_BLOCK, THREADS, compress_blocks
+
+MAGIC = b'CVBCLOUD'
+VERSION = 1
+
+INDEX_NAME = 'index.bin'
+DATA_NAMES = {'decisions': 'decisions.tsv.bgz', 'pm5': 'pm5.tsv.bgz', 'ps1': 'ps1.tsv.bgz'}
+
+NAME_SHIFT = 32
+NUMBER_MASK = (1 << NAME_SHIFT) - 1
+
+
+def row_blocks(
+    lines: Iterable[str],
+    names: dict[str, int],
+    keys: list[tuple[int, int]],
+    block_size: int = BLOCK_SIZE,
+) -> Generator[bytes, None, None]:
+    """
+    Groups TSV rows into chunks of whole rows, each up to block_size bytes, recording the first & last key of each
+
+    Args:
+        lines (Iterable[str]): TSV rows, sorted on the first column (grouped, in any order) then the second (numeric)
+        names (dict[str, int]): populated with the rank of each value in the first column, in order of appearance
+        keys (list[tuple[int, int]]): populated with the first & last key of each chunk yielded
+        block_size (int): the largest chunk, in bytes
+
+    Yields:
+        the encoded rows of each chunk
+    """
+
+    chunk: list[bytes] = []
+    chunk_size = 0
+    first = previous = -1
+    for line in lines:
+        name, _, remainder = line.partition('\t')
+        rank = names.setdefault(name, len(names))
+        key = (rank << NAME_SHIFT) | int(remainder.partition('\t')[0])
+        if key < previous:
+            raise ValueError(f'Rows must be grouped by their first column, and sorted on the second: {line.strip()}')
+
+        encoded = line.encode()
+        if len(encoded) > block_size:
+            raise ValueError(f'A single row is larger than a block: {line[:100]}...')
+        if chunk_size + len(encoded) > block_size:
+            keys.append((first, previous))
+            yield b''.join(chunk)
+            chunk, chunk_size = [], 0
+        if not chunk:
+            first = key
+        chunk.append(encoded)
+        chunk_size += len(encoded)
+        previous = key
+
+    if chunk:
+        keys.append((first, previous))
+        yield b''.join(chunk)
+
+
+def write_dataset(
+    lines: Iterable[str],
+    data_path: str,
+    block_size: int = BLOCK_SIZE,
+    threads: int = THREADS,
+) -> tuple[list[str], dict[str, np.ndarray]]:
+    """
+    Writes the rows as BGZF blocks of whole rows
+
+    Args:
+        lines (Iterable[str]): TSV rows, without the header
+        data_path (str): where to write the BGZF file
+        block_size (int): the largest block of uncompressed rows, in bytes
+        threads (int): compression threads
+
+    Returns:
+        the values of the first column in rank order, and the offset, size, first & last key arrays of the blocks
+    """
+
+    names: dict[str, int] = {}
+    keys: list[tuple[int, int]] = []
+    offsets, sizes = [], []
+    written = 0
+    with open(data_path, 'wb') as handle:
+        for block in compress_blocks(row_blocks(lines, names, keys, block_size=block_size), threads=threads):
+            offsets.append(written)
+            sizes.append(len(block))
+            handle.write(block)
+            written += len(block)
+        handle.write(EOF_BLOCK)
+
+    key_array = np.array(keys, dtype=np.uint64).reshape(-1, 2)
+    arrays = {
+        'offset': np.array(offsets, dtype=np.uint64),
+        'size': np.array(sizes, dtype=np.uint32),
+        'first': key_array[:, 0].copy(),
+        'last': key_array[:, 1].copy(),
+    }
+    return list(names), arrays
+
+
+def read_tsv(path: str) -> tuple[list[str], Generator[str, None, None]]:
+    """The header columns of a plain or block-gzipped TSV, and a generator over its rows."""
+    handle = gzip.open(path, 'rt') if path.endswith(('.gz', '.bgz')) else open(path)  # noqa: SIM115
+    columns = handle.readline().rstrip('\n').split('\t')
+
+    def rows() -> Generator[str, None, None]:
+        with handle:
+            yield from handle
+
+    return columns, rows()
+
+
+def write_cloud_release(
+    tsvs: dict[str, str],
+    output_dir: str,
+    block_size: int = BLOCK_SIZE,
+    threads: int = THREADS,
+):
+    """
+    Writes each TSV as a dataset in the cloud-optimised layout, then the index covering all of them
+
+    Args:
+        tsvs (dict[str, str]): the TSV for each dataset, keyed on the dataset name (e.g. decisions, pm5)
+        output_dir (str): the folder to write
+        block_size (int): the largest block of uncompressed rows, in bytes
+        threads (int): compression threads
+    """
+
+    os.makedirs(output_dir, exist_ok=True)
+    datasets = {}
+    arrays = {}
+    for dataset, tsv_path in tsvs.items():
+        columns, rows = read_tsv(tsv_path)
+        names, dataset_arrays = write_dataset(
+            rows,
+            join(output_dir, DATA_NAMES[dataset]),
+            block_size=block_size,
+            threads=threads,
+        )
+        datasets[dataset] = {
+            'file': DATA_NAMES[dataset],
+            'columns': columns,
+            'names': names,
+            'blocks': len(dataset_arrays['offset']),
+        }
+        arrays.update({f'{dataset}_{name}': array for name, array in dataset_arrays.items()})
+        logger.info(f'{dataset}: {len(names)} contigs/transcripts in {len(dataset_arrays["offset"])} blocks')
+
+    write_arrays(join(output_dir, INDEX_NAME), MAGIC, VERSION, {'datasets': datasets}, arrays)
+    logger.info(f'Cloud-optimised release written to {output_dir}')
+
+
+def cli_main():
+    parser = ArgumentParser(description='Write the release in a layout for remote lookups over HTTP Range requests')
+    parser.add_argument('--decisions', help='the decisions TSV, clinvar_decisions.tsv.bgz', required=True)
+    parser.add_argument('--pm5', help='the PM5 TSV, clinvar_decisions.pm5.tsv', required=True)
+    parser.add_argument('--ps1', help='optionally, the PS1 TSV, clinvar_decisions.ps1.tsv')
+    parser.add_argument('-o', help='output folder, e.g. clinvar_decisions.cloud', required=True)
+    parser.add_argument('--threads', help='compression threads', type=int, default=THREADS)
+    args = parser.parse_args()
+
+    main(decisions=args.decisions, pm5=args.pm5, output_dir=args.o, ps1=args.ps1, threads=args.threads)
+
+
+def main(decisions: str, pm5: str, output_dir: str, ps1: str | None = None, threads: int = THREADS):
+    """
+    Args:
+        decisions (str): the decisions TSV
+        pm5 (str): the PM5 TSV
+        output_dir (str): the folder to write
+        ps1 (str | None): the PS1 TSV, if it's to be included
+        threads (int): compression threads
+    """
+
+    tsvs = {'decisions': decisions, 'pm5': pm5}
+    if ps1:
+        tsvs['ps1'] = ps1
+    write_cloud_release(tsvs, output_dir, threads=threads)
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -0,0 +1,107 @@
+"""
+Self-contained decision records, shared by the indexes which answer with whole decisions (gene_index.py and
+identifier_index.py) rather than offsets into the decisions index
+
+Arrays, one entry per record:
+- row: the decision's row in the sorted decisions, i.e. the decisions TSV (excluding the header) and Parquet
+- key: (contig rank << 32) | position, as uint64
+- significance, stars & allele_id, as in the decisions index
+- allele_offsets & alleles: the 'ref\\talt\\n' of each record, as one UTF-8 buffer with offsets
+"""
+
+from collections.abc import Iterable
+
+import numpy as np
+
+POSITION_BITS = 32
+POSITION_MASK = (1 << POSITION_BITS) - 1
+
+
+def range_positions(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """The positions within every [start, end) range, concatenated, without a Python loop over the ranges."""
+    lengths = ends - starts
+    return np.arange(int(lengths.sum()), dtype=np.int64) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+
+
+def pack_records(
+    decisions: Iterable[tuple[int, dict]],
+    contigs: list[str],
+    significance: list[str],
+) -> dict[str, np.ndarray]:
+    """
+    Packs decisions into the record arrays
+
+    Args:
+        decisions (Iterable[tuple[int, dict]]): (row, decision) of each record, in record order
+        contigs (list[str]): the contigs in rank order, i.e. ORDERED_CONTIGS[assembly]
+        significance (list[str]): every possible clinical_significance value, their index is the stored code
+
+    Returns:
+        the record arrays, by name
+    """
+
+    ranks = {contig: rank for rank, contig in enumerate(contigs)}
+    codes = {label: code for code, label in enumerate(significance)}
+
+    rows, keys, sig_codes, stars, allele_ids, alleles = [], [], [], [], [], []
+    for row, decision in decisions:
+        ref, alt = decision['alleles']
+        rows.append(row)
+        keys.append((ranks[decision['contig']] << POSITION_BITS) | decision['position'])
+        sig_codes.append(codes[decision['clinical_significance']])
+        stars.append(decision['gold_stars'])
+        allele_ids.append(decision['allele_id'])
+        alleles.append(f'{ref}\t{alt}\n'.encode())
+
+    allele_offsets = np.zeros(len(alleles) + 1, dtype=np.int64)
+    np.cumsum([len(allele) for allele in alleles], out=allele_offsets[1:])
+    return {
+        'row': np.array(rows, dtype=np.uint32),
+        'key': np.array(keys, dtype=np.uint64),
+        'significance': np.array(sig_codes, dtype=np.uint8),
+        'stars': np.array(stars, dtype=np.uint8),
+        'allele_id': np.array(allele_ids, dtype=np.uint32),
+        'allele_offsets': allele_offsets,
+        'alleles': np.frombuffer(b''.join(alleles), dtype=np.uint8),
+    }
+
+
+class DecisionRecords:
+    """Decodes whole decisions from the record arrays."""
+
+    def __init__(self, arrays: dict[str, np.ndarray], contigs: list[str], significance: list[str]):
+        self.arrays = arrays
+        self.row = arrays['row']
+        self.key = arrays['key']
+        self.significance = arrays['significance']
+        self.stars = arrays['stars']
+        self.allele_id = arrays['allele_id']
+        self.allele_offsets = arrays['allele_offsets']
+        self.alleles = arrays['alleles']
+        self.contigs = contigs
+        self.significance_labels = significance
+
+    def __len__(self) -> int:
+        return len(self.row)
+
+    def records(self, records: np.ndarray) -> list[tuple[str, int, str, str, str, int, int]]:
+        """(contig, position, ref, alt, clinical significance, gold stars, ClinVar allele ID) of each record."""
+        keys = self.key[records]
+        contigs = map(self.contigs.__getitem__, (keys >> np.uint64(POSITION_BITS)).tolist())
+        positions = (keys & np.uint64(POSITION_MASK)).tolist()
+        labels = map(self.significance_labels.__getitem__, self.significance[records].tolist())
+        # the alleles of every record gathered in one step, then split into lines
+        buffer = self.alleles[range_positions(self.allele_offsets[records], self.allele_offsets[records + 1])]
+        alleles = (line.split('\t') for line in buffer.tobytes().decode().splitlines())
+        return [
+            (contig, position, ref, alt, label, stars, allele_id)
+            for contig, position, (ref, alt), label, stars, allele_id in zip(
+                contigs,
+                positions,
+                alleles,
+                labels,
+                self.stars[records].tolist(),
+                self.allele_id[records].tolist(),
+                strict=True,
+            )
+        ]
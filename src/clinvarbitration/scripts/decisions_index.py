@@ -0,0 +1,377 @@
+"""
+A compact, memory-mappable index of the re-summarised decisions, for looking up single variants or small batches
+without starting Hail to read clinvar_decisions.ht, or scanning the whole TSV
+
+The index is written by resummarise_clinvar.py alongside the decisions TSV, as an array file (array_file.py) with the
+magic b'CVBDECIX'. One fixed-width entry per decision, sorted on (contig rank, position, allele hash):
+- key: (contig rank << 56) | (position << 24) | allele hash, as uint64
+- significance: the decision, as an index into the significance labels in the header
+- stars & allele_id: gold stars and ClinVar allele ID
+- allele_offsets & alleles: the 'ref\talt\n' of each entry, as one UTF-8 buffer with offsets (as in decision_records.py)
+
+The contig order and significance labels are held in the header. The allele hash is the low 24 bits of a CRC32 of
+'ref:alt', so a point lookup is a single binary search on the full key, and a range query is two binary searches
+bounding the positions on a contig. Batch lookups search all queries at once, in sorted order.
+
+24 bits don't separate every allele pair: chr1:100 A>AATAGCGGGT and A>ACAAAAAACG share a hash, for one. So every entry
+found on the key has its alleles checked against the query, and entries sharing a key are ordered on their alleles,
+keeping the entries of each variant contiguous.
+
+python -m clinvarbitration.scripts.decisions_index -i clinvar_decisions.idx chr1:12345:A:G chr17:43044295-43125364
+"""
+
+import sys
+import zlib
+from argparse import ArgumentParser
+from collections.abc import Iterable, Sequence
+from functools import cached_property
+from itertools import repeat
+
+import numpy as np
+from loguru import logger
+
+from clinvarbitration.scripts.array_file import load_arrays, write_arrays
+from clinvarbitration.scripts.decision_records import range_positions
+
+MAGIC = b'CVBDECIX'
+VERSION = 2
+
+# (contig rank, position, allele hash) are packed into one uint64
+HASH_BITS = 24
+HASH_MASK = (1 << HASH_BITS) - 1
+POSITION_BITS = 32
+POSITION_MASK = (1 << POSITION_BITS) - 1
+CONTIG_SHIFT = HASH_BITS + POSITION_BITS
+
+
+def allele_hash(ref: str, alt: str) -> int:
+    """A stable hash of the alleles at a position, which unlike hash() is the same in every process."""
+    return zlib.crc32(f'{ref}:{alt}'.encode()) & HASH_MASK
+
+
+class DecisionIndex:
+    """Memory-mapped lookups of the re-summarised decision at a locus, or across a region."""
+
+    def __init__(self, arrays: dict[str, np.ndarray], contigs: list[str], significance: list[str]):
+        self.arrays = arrays
+        self.key = arrays['key']
+        self.significance = arrays['significance']
+        self.stars = arrays['stars']
+        self.allele_id = arrays['allele_id']
+        self.allele_offsets = arrays['allele_offsets']
+        self.alleles = arrays['alleles']
+        self.contigs = contigs
+        self.significance_labels = significance
+
+    def __len__(self) -> int:
+        return len(self.key)
+
+    @classmethod
+    def from_decisions(cls, decisions: Iterable[dict], contigs: list[str], significance: list[str]) -> 'DecisionIndex':
+        """
+        Packs the decisions into fixed-width arrays, sorted on the packed key
+
+        Args:
+            decisions (Iterable[dict]): decisions, as generated by resummarise_clinvar.generate_decisions
+            contigs (list[str]): the contigs in rank order, i.e. ORDERED_CONTIGS[assembly]
+            significance (list[str]): every possible clinical_significance value, their index is the stored code
+        """
+
+        ranks = {contig: rank for rank, contig in enumerate(contigs)}
+        codes = {label: code for code, label in enumerate(significance)}
+
+        keys, sig_codes, stars, allele_ids, alleles = [], [], [], [], []
+        for decision in decisions:
+            ref, alt = decision['alleles']
+            keys.append(
+                (ranks[decision['contig']] << CONTIG_SHIFT)
+                | (decision['position'] << HASH_BITS)
+                | allele_hash(ref, alt),
+            )
+            sig_codes.append(codes[decision['clinical_significance']])
+            stars.append(decision['gold_stars'])
+            allele_ids.append(decision['allele_id'])
+            alleles.append(f'{ref}\t{alt}\n'.encode())
+
+        # decisions are already sorted on contig & position, this only orders the alleles within each position
+        key = np.array(keys, dtype=np.uint64)
+        order = np.argsort(key, kind='stable')
+
+        # the few entries sharing a key are ordered on their alleles, so each variant's entries are contiguous
+        sorted_key = key[order]
+        for shared in np.unique(sorted_key[1:][sorted_key[1:] == sorted_key[:-1]]).tolist():
+            start = int(sorted_key.searchsorted(np.uint64(shared)))
+            end = int(sorted_key.searchsorted(np.uint64(shared), side='right'))
+            order[start:end] = sorted(order[start:end].tolist(), key=alleles.__getitem__)
+
+        sorted_alleles = [alleles[entry] for entry in order.tolist()]
+        allele_offsets = np.zeros(len(sorted_alleles) + 1, dtype=np.int64)
+        np.cumsum([len(allele) for allele in sorted_alleles], out=allele_offsets[1:])
+        return cls(
+            {
+                'key': key[order],
+                'significance': np.array(sig_codes, dtype=np.uint8)[order],
+                'stars': np.array(stars, dtype=np.uint8)[order],
+                'allele_id': np.array(allele_ids, dtype=np.uint32)[order],
+                'allele_offsets': allele_offsets,
+                'alleles': np.frombuffer(b''.join(sorted_alleles), dtype=np.uint8),
+            },
+            contigs=list(contigs),
+            significance=list(significance),
+        )
+
+    def write(self, path: str):
+        write_arrays(
+            path,
+            magic=MAGIC,
+            version=VERSION,
+            metadata={'contigs': self.contigs, 'significance': self.significance_labels},
+            arrays=self.arrays,
+        )
+        logger.info(f'Wrote decisions index of {len(self)} variants to {path}')
+
+    @classmethod
+    def load(cls, path: str) -> 'DecisionIndex':
+        """Memory-maps a decisions index, nothing is read into memory until it's used."""
+        header, arrays = load_arrays(path, magic=MAGIC, version=VERSION)
+        return cls(arrays, contigs=header['contigs'], significance=header['significance'])
+
+    @cached_property
+    def contig_ranks(self) -> dict[str, int]:
+        """The rank of each contig, also accepting each name with the 'chr' prefix added or removed."""
+        ranks = {}
+        for rank, contig in enumerate(self.contigs):
+            ranks[contig] = rank
+            alias = contig.removeprefix('chr') if contig.startswith('chr') else f'chr{contig}'
+            ranks.setdefault(alias, rank)
+        return ranks
+
+    def base_key(self, contig: str, position: int) -> int | None:
+        """The packed key of a position with an allele hash of 0, or None if the contig or position is invalid."""
+        rank = self.contig_ranks.get(contig)
+        if rank is None or not 0 <= position <= POSITION_MASK:
+            return None
+        return (rank << CONTIG_SHIFT) | (position << HASH_BITS)
+
+    def entry_alleles(self, entries: np.ndarray) -> list[str]:
+        """The 'ref\talt' of each entry, gathered from the allele buffer in one step."""
+        buffer = self.alleles[range_positions(self.allele_offsets[entries], self.allele_offsets[entries + 1])]
+        return buffer.tobytes().decode().splitlines()
+
+    def match_alleles(self, start: int, end: int, ref: str, alt: str) -> tuple[int, int]:
+        """Narrows a range of entries sharing a key to those with these alleles, empty if none have them."""
+        query = f'{ref}\t{alt}'
+        matches = [
+            entry
+            for entry, alleles in enumerate(self.entry_alleles(np.arange(start, end)), start=start)
+            if alleles == query
+        ]
+        return (matches[0], matches[-1] + 1) if matches else (start, start)
+
+    def find(self, contig: str, position: int, ref: str, alt: str) -> tuple[int, int]:
+        """The range of entries matching this variant, empty (start == end) if there's no decision."""
+        if (base := self.base_key(contig, position)) is None:
+            return 0, 0
+        # a plain int would be compared as float64 against the uint64 keys, converting the whole array each search
+        key = np.uint64(base | allele_hash(ref, alt))
+        start = end = int(self.key.searchsorted(key))
+        # there's rarely more than one entry per key, so step forwards rather than searching again
+        while end < len(self.key) and self.key.item(end) == key:
+            end += 1
+        if start == end:
+            return start, end
+        return self.match_alleles(start, end, ref, alt)
+
+    def lookup(self, contig: str, position: int, ref: str, alt: str) -> list[tuple[str, int, int]]:
+        """
+        The decision for a single variant
+
+        Args:
+            contig (str): the contig, with or without a 'chr' prefix
+            position (int): 1-based position
+            ref (str): the reference allele
+            alt (str): the alternate allele
+
+        Returns:
+            (clinical significance, gold stars, ClinVar allele ID) of each matching decision, or an empty list
+        """
+        return self.records(*self.find(contig, position, ref, alt))
+
+    def records(self, start: int, end: int) -> list[tuple[str, int, int]]:
+        """(clinical significance, gold stars, ClinVar allele ID) of the entries between two offsets."""
+        if start == end:
+            return []
+        labels = self.significance_labels
+        return [
+            (labels[code], stars, allele_id)
+            for code, stars, allele_id in zip(
+                self.significance[start:end].tolist(),
+                self.stars[start:end].tolist(),
+                self.allele_id[start:end].tolist(),
+                strict=True,
+            )
+        ]
+
+    def region_bounds(self, contig: str, start: int, end: int) -> tuple[int, int]:
+        """The first entry at or after start on this contig, and the entry after the last at or before end."""
+        rank = self.contig_ranks.get(contig)
+        if rank is None or end < start:
+            return 0, 0
+        lower = (rank << CONTIG_SHIFT) | (min(max(start, 0), POSITION_MASK) << HASH_BITS)
+        upper = (rank << CONTIG_SHIFT) | (min(max(end, 0), POSITION_MASK) << HASH_BITS) | HASH_MASK
+        return (
+            int(self.key.searchsorted(np.uint64(lower))),
+            int(self.key.searchsorted(np.uint64(upper), side='right')),
+        )
+
+    def region(self, contig: str, start: int, end: int) -> list[tuple[int, str, int, int]]:
+        """
+        All decisions in a region
+
+        Args:
+            contig (str): the contig, with or without a 'chr' prefix
+            start (int): first position, inclusive
+            end (int): last position, inclusive
+
+        Returns:
+            (position, clinical significance, gold stars, ClinVar allele ID) of each decision, in position order
+        """
+        first, last = self.region_bounds(contig, start, end)
+        positions = ((self.key[first:last] >> np.uint64(HASH_BITS)) & np.uint64(POSITION_MASK)).tolist()
+        return [(position, *record) for position, record in zip(positions, self.records(first, last), strict=True)]
+
+    def lookup_many(
+        self,
+        contigs: Sequence[str],
+        positions: Iterable[int],
+        refs: Iterable[str],
+        alts: Iterable[str],
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorised lookup of many variants
+
+        Args:
+            contigs (Sequence[str]): contig of each query
+            positions (Iterable[int]): position of each query
+            refs (Iterable[str]): reference allele of each query
+            alts (Iterable[str]): alternate allele of each query
+
+        Returns:
+            start and end offsets into significance, stars & allele_id for each query, equal where there's no decision
+        """
+
+        count = len(contigs)
+        refs, alts = list(refs), list(alts)
+        ranks = np.fromiter(map(self.contig_ranks.get, contigs, repeat(-1)), dtype=np.int64, count=count)
+        positions = np.fromiter(positions, dtype=np.int64, count=count)
+        hashes = np.fromiter(map(allele_hash, refs, alts), dtype=np.uint64, count=count)
+        starts = np.zeros(count, dtype=np.int64)
+        ends = np.zeros(count, dtype=np.int64)
+        if not len(self) or not count:
+            return starts, ends
+
+        found = (ranks >= 0) & (positions >= 0) & (positions <= POSITION_MASK)
+        keys = (
+            (np.where(found, ranks, 0).astype(np.uint64) << np.uint64(CONTIG_SHIFT))
+            | (np.where(found, positions, 0).astype(np.uint64) << np.uint64(HASH_BITS))
+            | hashes
+        )
+
+        # searching in sorted order keeps each search close to the last, so far fewer pages are touched
+        order = np.argsort(keys)
+        sorted_keys = keys[order]
+        starts[order] = np.searchsorted(self.key, sorted_keys)
+        ends[order] = np.searchsorted(self.key, sorted_keys, side='right')
+        starts[~found] = 0
+        ends[~found] = 0
+
+        # the key only narrows each query to its allele hash, so the alleles of every hit are checked
+        hits = np.flatnonzero(ends > starts)
+        single = hits[ends[hits] - starts[hits] == 1]
+        for query, alleles in zip(single.tolist(), self.entry_alleles(starts[single]), strict=True):
+            if alleles != f'{refs[query]}\t{alts[query]}':
+                ends[query] = starts[query]
+        for query in hits[ends[hits] - starts[hits] > 1].tolist():
+            starts[query], ends[query] = self.match_alleles(
+                int(starts[query]),
+                int(ends[query]),
+                refs[query],
+                alts[query],
+            )
+        return starts, ends
+
+
+def parse_query(query: str) -> tuple[str, int, int] | tuple[str, int, str, str]:
+    """Splits a 'contig:position:ref:alt' variant query, or a 'contig:start-end' region query."""
+    fields = query.split(':')
+    if len(fields) == 4 and fields[1].isdigit():  # noqa: PLR2004
+        contig, position, ref, alt = fields
+        return contig, check_position(int(position), query), ref, alt
+    if len(fields) == 2:  # noqa: PLR2004
+        start, _, end = fields[1].partition('-')
+        if start.isdigit() and end.isdigit():
+            return fields[0], check_position(int(start), query), check_position(int(end), query)
+    raise ValueError(f'Queries should be formatted as contig:position:ref:alt or contig:start-end, not {query}')
+
+
+def check_position(position: int, query: str) -> int:
+    """Rejects a position too large to pack into a key, which would otherwise overflow a batched lookup."""
+    if position > POSITION_MASK:
+        raise ValueError(f'Positions are at most {POSITION_MASK}, not {position} in {query}')
+    return position
+
+
+def cli_main():
+    parser = ArgumentParser(description='Look up re-summarised ClinVar decisions by variant or region')
+    parser.add_argument('-i', help='decisions index, written by resummarise_clinvar.py', required=True)
+    parser.add_argument(
+        'queries',
+        help='contig:position:ref:alt or contig:start-end queries, e.g. chr1:12345:A:G',
+        nargs='*',
+    )
+    parser.add_argument('--queries', help='file of queries, one per line', dest='query_file')
+    args = parser.parse_args()
+
+    main(index_path=args.i, queries=args.queries, query_file=args.query_file)
+
+
+def main(index_path: str, queries: list[str], query_file: str | None = None):
+    """
+    Answer variant and region queries, writing the query, then the position, clinical significance, gold stars, and
+    allele ID of each matching decision, one line per decision. Queries without a decision are not written.
+
+    Args:
+        index_path (str): the decisions index
+        queries (list[str]): contig:position:ref:alt or contig:start-end queries
+        query_file (str | None): a file of additional queries, one per line
+    """
+
+    if query_file:
+        with open(query_file, encoding='utf-8') as handle:
+            queries = [*queries, *(line.strip() for line in handle if line.strip())]
+
+    index = DecisionIndex.load(index_path)
+    parsed = [parse_query(query) for query in queries]
+
+    # all variant queries are looked up in one batch
+    variants = [each for each in parsed if len(each) == 4]  # noqa: PLR2004
+    starts, ends = index.lookup_many(
+        [each[0] for each in variants],
+        [each[1] for each in variants],
+        [each[2] for each in variants],
+        [each[3] for each in variants],
+    )
+    variant_hits = iter(zip(starts.tolist(), ends.tolist(), strict=True))
+
+    for query, each in zip(queries, parsed, strict=True):
+        if len(each) == 4:  # noqa: PLR2004
+            position = each[1]
+            hits = [(position, *record) for record in index.records(*next(variant_hits))]
+        else:
+            hits = index.region(*each)
+        for position, significance, stars, allele_id in hits:
+            sys.stdout.write(f'{query}\t{position}\t{significance}\t{stars}\t{allele_id}\n')
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -0,0 +1,280 @@
+"""
+Compares two sets of re-summarised decisions, e.g. consecutive monthly releases, in one streaming pass
+
+Each input is a decisions TSV (clinvar_decisions.tsv.bgz, or uncompressed) or a decisions index (clinvar_decisions.idx),
+detected from the file's magic bytes. Both are sorted on contig & position, so they're merge-joined a position at a
+time, holding only the decisions at the current position of each input in memory. Within a position, decisions are
+matched on their alleles, which both the TSV and the index hold.
+
+Every difference is one of:
+- added: a decision only in the new input
+- removed: a decision only in the old input
+- reclassified: the clinical significance differs, whether or not the stars do
+- stars: only the gold stars differ
+
+Writes:
+- {output_root}.changes.tsv.gz: one row per change, in genomic order
+- {output_root}.summary.json: the number of each change, and counts grouped by transition, e.g.
+  'Conflicting -> Pathogenic/Likely Pathogenic' or 'Benign: 1 -> 2 stars'
+
+python -m clinvarbitration.scripts.diff_decisions old/clinvar_decisions.tsv.bgz new/clinvar_decisions.tsv.bgz \\
+    -o clinvar_changes
+"""
+
+import gzip
+import json
+from argparse import ArgumentParser
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from itertools import groupby
+from typing import NamedTuple
+
+import numpy as np
+from loguru import logger
+
+from clinvarbitration.scripts.decisions_index import CONTIG_SHIFT, HASH_BITS, MAGIC, POSITION_MASK, DecisionIndex
+from clinvarbitration.scripts.resummarise_clinvar import ORDERED_CONTIGS, TSV_KEYS
+
+# the index is read this many entries at a time
+CHUNK_SIZE = 65536
+
+# GRCh37 & GRCh38 contigs share a rank order, with & without the 'chr' prefix
+CONTIG_RANKS = {contig: rank for contigs in ORDERED_CONTIGS.values() for rank, contig in enumerate(contigs)}
+
+CHANGE_KEYS = [
+    'contig',
+    'position',
+    'reference',
+    'alternate',
+    'allele_id',
+    'change',
+    'old_significance',
+    'new_significance',
+    'old_stars',
+    'new_stars',
+]
+CHANGE_TYPES = ['added', 'removed', 'reclassified', 'stars']
+
+
+class DecisionRecord(NamedTuple):
+    """One decision, from either input type."""
+
+    rank: int
+    position: int
+    contig: str
+    ref: str
+    alt: str
+    significance: str
+    stars: int
+    allele_id: int
+
+
+@dataclass
+class Change:
+    """
+    A difference between the two inputs
+    """
+
+    old: DecisionRecord | None
+    new: DecisionRecord | None
+    change: str
+
+    @property
+    def record(self) -> DecisionRecord:
+        """The new decision, or the old one if it was removed."""
+        return self.new or self.old  # type: ignore[return-value]
+
+    @property
+    def transition(self) -> str:
+        """The group this change is summarised in."""
+        if self.old is None:
+            return f'added: {self.record.significance}'
+        if self.new is None:
+            return f'removed: {self.record.significance}'
+        if self.change == 'reclassified':
+            return f'{self.old.significance} -> {self.new.significance}'
+        return f'{self.new.significance}: {self.old.stars} -> {self.new.stars} stars'
+
+    def row(self) -> list:
+        """The change as a row, in CHANGE_KEYS order."""
+        return [
+            self.record.contig,
+            self.record.position,
+            self.record.ref,
+            self.record.alt,
+            self.record.allele_id,
+            self.change,
+            self.old.significance if self.old else '.',
+            self.new.significance if self.new else '.',
+            self.old.stars if self.old else '.',
+            self.new.stars if self.new else '.',
+        ]
+
+
+def is_index(path: str) -> bool:
+    """Whether the file is a decisions index, rather than a TSV."""
+    with open(path, 'rb') as handle:
+        return handle.read(len(MAGIC)) == MAGIC
+
+
+def tsv_records(path: str) -> Iterator[DecisionRecord]:
+    """Streams the decisions from a TSV, BGZF/gzip-compressed or not."""
+    with open(path, 'rb') as handle:
+        compressed = handle.read(2) == b'\x1f\x8b'
+    with gzip.open(path, 'rt') if compressed else open(path, encoding='utf-8') as handle:
+        if next(handle).rstrip('\n').split('\t') != TSV_KEYS:
+            raise ValueError(f'{path} is not a decisions TSV, expected the columns {", ".join(TSV_KEYS)}')
+        for line in handle:
+            contig, position, ref, alt, significance, stars, allele_id = line.rstrip('\n').split('\t')
+            yield DecisionRecord(
+                CONTIG_RANKS[contig],
+                int(position),
+                contig,
+                ref,
+                alt,
+                significance,
+                int(stars),
+                int(allele_id),
+            )
+
+
+def index_records(path: str) -> Iterator[DecisionRecord]:
+    """Streams the decisions from a decisions index, decoding a chunk of the memory-mapped arrays at a time."""
+    index = DecisionIndex.load(path)
+    ranks = [CONTIG_RANKS[contig] for contig in index.contigs]
+    labels = index.significance_labels
+    for start in range(0, len(index), CHUNK_SIZE):
+        keys = index.key[start : start + CHUNK_SIZE]
+        alleles = index.entry_alleles(np.arange(start, start + len(keys)))
+        for contig_rank, position, (ref, alt), code, stars, allele_id in zip(
+            (keys >> CONTIG_SHIFT).tolist(),
+            ((keys >> HASH_BITS) & POSITION_MASK).tolist(),
+            (each.split('\t') for each in alleles),
+            index.significance[start : start + CHUNK_SIZE].tolist(),
+            index.stars[start : start + CHUNK_SIZE].tolist(),
+            index.allele_id[start : start + CHUNK_SIZE].tolist(),
+            strict=True,
+        ):
+            yield DecisionRecord(
+                ranks[contig_rank],
+                position,
+                index.contigs[contig_rank],
+                ref,
+                alt,
+                labels[code],
+                stars,
+                allele_id,
+            )
+
+
+def read_records(path: str) -> Iterator[DecisionRecord]:
+    """Streams the decisions from a TSV or index."""
+    return index_records(path) if is_index(path) else tsv_records(path)
+
+
+def position_groups(records: Iterable[DecisionRecord], source: str) -> Iterator[tuple[tuple[int, int], list]]:
+    """The decisions at each position, checking the input is sorted."""
+    previous = (-1, -1)
+    for locus, group in groupby(records, key=lambda record: (record.rank, record.position)):
+        if locus <= previous:
+            raise ValueError(f'{source} is not sorted on contig & position, at {locus}')
+        previous = locus
+        yield locus, list(group)
+
+
+def compare_position(old: list[DecisionRecord], new: list[DecisionRecord]) -> Iterator[Change]:
+    """The changes between the decisions at one position, matched on their alleles."""
+
+    new_by_alleles = {(record.ref, record.alt): record for record in new}
+    for record in old:
+        if (match := new_by_alleles.pop((record.ref, record.alt), None)) is None:
+            yield Change(record, None, 'removed')
+        elif match.significance != record.significance:
+            yield Change(record, match, 'reclassified')
+        elif match.stars != record.stars:
+            yield Change(record, match, 'stars')
+    for record in new_by_alleles.values():
+        yield Change(None, record, 'added')
+
+
+def diff_records(
+    old: Iterable[DecisionRecord],
+    new: Iterable[DecisionRecord],
+    sources: tuple[str, str] = ('old', 'new'),
+) -> Iterator[Change]:
+    """
+    Merge-joins two sorted streams of decisions, yielding each change in genomic order
+
+    Args:
+        old (Iterable[DecisionRecord]): the earlier decisions, sorted on contig & position
+        new (Iterable[DecisionRecord]): the later decisions, sorted on contig & position
+        sources (tuple[str, str]): names of the inputs, for errors
+    """
+
+    old_groups = position_groups(old, sources[0])
+    new_groups = position_groups(new, sources[1])
+    old_group = next(old_groups, None)
+    new_group = next(new_groups, None)
+    while old_group or new_group:
+        if new_group is None or (old_group and old_group[0] < new_group[0]):
+            yield from compare_position(old_group[1], [])  # type: ignore[index]
+            old_group = next(old_groups, None)
+        elif old_group is None or new_group[0] < old_group[0]:
+            yield from compare_position([], new_group[1])
+            new_group = next(new_groups, None)
+        else:
+            yield from compare_position(old_group[1], new_group[1])
+            old_group = next(old_groups, None)
+            new_group = next(new_groups, None)
+
+
+def main(old_path: str, new_path: str, output_root: str) -> dict:
+    """
+    Compares two decision outputs, writing the changes and a summary
+
+    Args:
+        old_path (str): the earlier decisions, a TSV or index
+        new_path (str): the later decisions, a TSV or index
+        output_root (str): writes {output_root}.changes.tsv.gz and {output_root}.summary.json
+
+    Returns:
+        the summary
+    """
+
+    changes: Counter = Counter()
+    transitions: Counter = Counter()
+    with gzip.open(f'{output_root}.changes.tsv.gz', 'wt') as handle:
+        handle.write('\t'.join(CHANGE_KEYS) + '\n')
+        for change in diff_records(read_records(old_path), read_records(new_path), (old_path, new_path)):
+            handle.write('\t'.join(map(str, change.row())) + '\n')
+            changes[change.change] += 1
+            transitions[change.transition] += 1
+
+    summary = {
+        'old': old_path,
+        'new': new_path,
+        'changes': {change: changes[change] for change in CHANGE_TYPES},
+        'transitions': dict(transitions.most_common()),
+    }
+    with open(f'{output_root}.summary.json', 'w', encoding='utf-8') as handle:
+        json.dump(summary, handle, indent=2)
+
+    logger.info(', '.join(f'{changes[change]} {change}' for change in CHANGE_TYPES))
+    for transition, count in transitions.most_common():
+        logger.info(f'{transition}: {count}')
+    return summary
+
+
+def cli_main():
+    parser = ArgumentParser(description='Report the changes between two sets of re-summarised ClinVar decisions')
+    parser.add_argument('old', help='the earlier decisions TSV or index')
+    parser.add_argument('new', help='the later decisions TSV or index')
+    parser.add_argument('-o', help='output root, for the changes TSV and summary JSON', required=True)
+    args = parser.parse_args()
+
+    main(old_path=args.old, new_path=args.new, output_root=args.o)
+
+
+if __name__ == '__main__':
+    cli_main()
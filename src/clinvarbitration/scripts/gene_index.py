@@ -0,0 +1,184 @@
+"""
+A memory-mappable index of the re-summarised decisions by gene, so every decision for a panel of genes can be found
+without a separate join against gene intervals
+
+The index is written by resummarise_clinvar.py alongside the decisions index, as an array file (array_file.py) with
+the magic b'CVBGENIX'. The genes are the GeneSymbol values of variant_summary.txt.gz, split on ';', so a variant
+spanning overlapping genes is listed under each. Arrays:
+- records: one entry per decision with any gene, in decision (contig & position) order, see decision_records.py
+- genes: sorted gene symbols are held in the header, with gene_offsets & gene_records giving the ascending record
+  numbers of each gene, i.e. the records of gene g are gene_records[gene_offsets[g] : gene_offsets[g + 1]]
+
+A panel query gathers the record numbers of each gene in one vectorised step, then de-duplicates them, so the results
+are in genomic order with each decision reported once, however many panel genes it falls in.
+
+python -m clinvarbitration.scripts.gene_index -i clinvar_decisions.genes.idx BRCA1 BRCA2 --genes panel.txt
+"""
+
+import sys
+from argparse import ArgumentParser
+from collections import defaultdict
+from collections.abc import Iterable
+from functools import cached_property
+from itertools import chain
+
+import numpy as np
+from loguru import logger
+
+from clinvarbitration.scripts.array_file import load_arrays, write_arrays
+from clinvarbitration.scripts.decision_records import DecisionRecords, pack_records, range_positions
+
+MAGIC = b'CVBGENIX'
+VERSION = 1
+
+
+class GeneIndex(DecisionRecords):
+    """Memory-mapped lookups of every decision within a gene, or a panel of genes."""
+
+    def __init__(self, arrays: dict[str, np.ndarray], genes: list[str], contigs: list[str], significance: list[str]):
+        super().__init__(arrays, contigs=contigs, significance=significance)
+        self.gene_offsets = arrays['gene_offsets']
+        self.gene_records = arrays['gene_records']
+        self.genes = genes
+
+    @classmethod
+    def from_decisions(cls, decisions: Iterable[dict], contigs: list[str], significance: list[str]) -> 'GeneIndex':
+        """
+        Groups the decisions by gene
+
+        Args:
+            decisions (Iterable[dict]): sorted decisions, as generated by resummarise_clinvar.generate_decisions, the
+                genes of each are read from its 'genes' list, decisions without any are skipped
+            contigs (list[str]): the contigs in rank order, i.e. ORDERED_CONTIGS[assembly]
+            significance (list[str]): every possible clinical_significance value, their index is the stored code
+        """
+
+        selected = [(row, decision) for row, decision in enumerate(decisions) if decision.get('genes')]
+        gene_records: dict[str, list[int]] = defaultdict(list)
+        for record, (_row, decision) in enumerate(selected):
+            for gene in decision['genes']:
+                gene_records[gene].append(record)
+
+        genes = sorted(gene_records)
+        gene_offsets = np.zeros(len(genes) + 1, dtype=np.int64)
+        np.cumsum([len(gene_records[gene]) for gene in genes], out=gene_offsets[1:])
+
+        return cls(
+            {
+                **pack_records(selected, contigs=contigs, significance=significance),
+                'gene_offsets': gene_offsets,
+                'gene_records': np.fromiter(
+                    chain.from_iterable(gene_records[gene] for gene in genes),
+                    dtype=np.uint32,
+                    count=int(gene_offsets[-1]),
+                ),
+            },
+            genes=genes,
+            contigs=list(contigs),
+            significance=list(significance),
+        )
+
+    def write(self, path: str):
+        write_arrays(
+            path,
+            magic=MAGIC,
+            version=VERSION,
+            metadata={'genes': self.genes, 'contigs': self.contigs, 'significance': self.significance_labels},
+            arrays=self.arrays,
+        )
+        logger.info(f'Wrote gene index of {len(self.genes)} genes, covering {len(self)} decisions, to {path}')
+
+    @classmethod
+    def load(cls, path: str) -> 'GeneIndex':
+        """Memory-maps a gene index, nothing is read into memory until it's used."""
+        header, arrays = load_arrays(path, magic=MAGIC, version=VERSION)
+        return cls(arrays, genes=header['genes'], contigs=header['contigs'], significance=header['significance'])
+
+    @cached_property
+    def gene_numbers(self) -> dict[str, int]:
+        """The number of each gene, also accepting the upper-cased symbol."""
+        numbers = {gene: number for number, gene in enumerate(self.genes)}
+        for number, gene in enumerate(self.genes):
+            numbers.setdefault(gene.upper(), number)
+        return numbers
+
+    def missing(self, genes: Iterable[str]) -> list[str]:
+        """The genes without any decisions in the index."""
+        return [gene for gene in genes if gene not in self.gene_numbers and gene.upper() not in self.gene_numbers]
+
+    def panel_records(self, genes: Iterable[str]) -> np.ndarray:
+        """
+        The records of all decisions in any of the genes
+
+        Args:
+            genes (Iterable[str]): gene symbols, genes absent from the index are ignored
+
+        Returns:
+            the record numbers, unique and ascending, i.e. in genomic order
+        """
+        numbers = [
+            number
+            for gene in genes
+            if (number := self.gene_numbers.get(gene, self.gene_numbers.get(gene.upper()))) is not None
+        ]
+        if not numbers:
+            return np.zeros(0, dtype=np.int64)
+
+        numbers = np.array(numbers, dtype=np.int64)
+        positions = range_positions(self.gene_offsets[numbers], self.gene_offsets[numbers + 1])
+        return np.unique(self.gene_records[positions])
+
+    def panel_rows(self, genes: Iterable[str]) -> np.ndarray:
+        """The rows of the sorted decisions (TSV or Parquet) for all decisions in any of the genes, ascending."""
+        return self.row[self.panel_records(genes)]
+
+    def gene(self, gene: str) -> list[tuple[str, int, str, str, str, int, int]]:
+        """All decisions in one gene, in genomic order."""
+        return self.panel([gene])
+
+    def panel(self, genes: Iterable[str]) -> list[tuple[str, int, str, str, str, int, int]]:
+        """
+        All decisions in any of the genes, each reported once, in genomic order
+
+        Args:
+            genes (Iterable[str]): gene symbols, genes absent from the index are ignored
+
+        Returns:
+            (contig, position, ref, alt, clinical significance, gold stars, ClinVar allele ID) of each decision
+        """
+        return self.records(self.panel_records(genes))
+
+
+def cli_main():
+    parser = ArgumentParser(description='Report every re-summarised ClinVar decision in a panel of genes')
+    parser.add_argument('-i', help='gene index, written by resummarise_clinvar.py', required=True)
+    parser.add_argument('genes', help='gene symbols, e.g. BRCA1', nargs='*')
+    parser.add_argument('--genes', help='file of gene symbols, one per line', dest='gene_file')
+    args = parser.parse_args()
+
+    main(index_path=args.i, genes=args.genes, gene_file=args.gene_file)
+
+
+def main(index_path: str, genes: list[str], gene_file: str | None = None):
+    """
+    Write every decision in the panel as a TSV row, in the decisions TSV column order
+
+    Args:
+        index_path (str): the gene index
+        genes (list[str]): gene symbols
+        gene_file (str | None): a file of additional gene symbols, one per line
+    """
+
+    if gene_file:
+        with open(gene_file, encoding='utf-8') as handle:
+            genes = [*genes, *(line.strip() for line in handle if line.strip())]
+
+    index = GeneIndex.load(index_path)
+    if missing := index.missing(genes):
+        logger.warning(f'{len(missing)} genes have no decisions: {", ".join(missing)}')
+
+    sys.stdout.writelines('\t'.join(map(str, record)) + '\n' for record in index.panel(genes))
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -0,0 +1,329 @@
+"""
+Compiles the coding transcripts of a GFF3 into a compact, memory-mappable CDS interval index
+
+Parsing the full Ensembl GFF3 takes far longer than annotating a month of ClinVar SNVs, and the gene model changes much
+less often than ClinVar does. The compiled index is written once per GFF3, named with the GFF3's md5 checksum, and
+cached alongside the GFF3 in the data directory. Later runs memory-map the index instead of re-parsing the GFF3.
+
+The index is an array file (array_file.py) with the magic b'CVBGFFIX', and the GFF3 checksum & contig names in its
+header.
+
+CDS segments are sorted per-contig on start, with a running maximum of segment ends, so the segments overlapping a
+position are found with a binary search, stepping back only while an earlier segment could still reach the position.
+"""
+
+import gzip
+import re
+from argparse import ArgumentParser
+from bisect import bisect_right
+from collections import defaultdict
+from dataclasses import dataclass, field
+from itertools import pairwise
+from os.path import basename, dirname, exists, join
+
+import numpy as np
+from loguru import logger
+
+from clinvarbitration.scripts.array_file import load_arrays, write_arrays
+from clinvarbitration.scripts.checksums import checksum_path
+
+MAGIC = b'CVBGFFIX'
+VERSION = 1
+
+# transcripts with CDS features are coding, unless they have one of these biotypes
+NON_CODING_BIOTYPES = {'antisense', 'lincRNA', 'lncRNA', 'macro_lncRNA', 'processed_transcript', 'retained_intron'}
+NON_CODING_SUFFIXES = ('RNA', '_pseudogene')
+
+# the attributes we need from the GFF3 column 9
+ID_RE = re.compile(r'(?:^|;)ID=([^;]+)')
+PARENT_RE = re.compile(r'(?:^|;)Parent=([^;]+)')
+BIOTYPE_RE = re.compile(r'(?:^|;)biotype=([^;]+)')
+
+
+def normalise_contig(contig: str) -> str:
+    """Contigs are matched without any 'chr' prefix, mirroring bcftools --unify-chr-names."""
+    return contig.removeprefix('chr')
+
+
+def is_coding_biotype(biotype: str) -> bool:
+    """bcftools csq treats polymorphic pseudogenes as coding, and anything it doesn't recognise."""
+    if biotype == 'polymorphic_pseudogene':
+        return True
+    return biotype not in NON_CODING_BIOTYPES and not biotype.endswith(NON_CODING_SUFFIXES) and biotype != 'pseudogene'
+
+
+@dataclass
+class Transcript:
+    """
+    The coding structure of a single transcript
+    cds is a list of (start, end) tuples, 1-based & inclusive, in transcript order (descending on the - strand)
+    offsets is the CDS offset of each segment's first base in transcript order
+    """
+
+    transcript_id: str
+    contig: str
+    strand: str
+    phase: int
+    cds: list[tuple[int, int]] = field(default_factory=list)
+    offsets: list[int] = field(default_factory=list)
+
+    @property
+    def length(self) -> int:
+        return self.offsets[-1] + self.cds[-1][1] - self.cds[-1][0] + 1
+
+    def cds_offset(self, pos: int, segment: int) -> int:
+        """The offset of a genomic position within the spliced CDS, in transcript orientation."""
+        start, end = self.cds[segment]
+        return self.offsets[segment] + (pos - start if self.strand == '+' else end - pos)
+
+    def genomic_position(self, offset: int) -> int:
+        """The genomic position of a CDS offset, the inverse of cds_offset."""
+        segment = bisect_right(self.offsets, offset) - 1
+        start, end = self.cds[segment]
+        within = offset - self.offsets[segment]
+        return start + within if self.strand == '+' else end - within
+
+
+def parse_gff3(gff3: str) -> list[Transcript]:
+    """
+    Reads the coding transcripts from a GFF3 file (gzipped or not)
+
+    Args:
+        gff3 (str): path to the GFF3, with Ensembl-style ID=transcript:X and Parent=transcript:X attributes
+
+    Returns:
+        a list of the coding transcripts, in the order they appear in the GFF3
+    """
+
+    biotypes: dict[str, str] = {}
+    cds: dict[str, list[tuple[int, int, int]]] = defaultdict(list)
+    details: dict[str, tuple[str, str]] = {}
+
+    opener = gzip.open if gff3.endswith('gz') else open
+    with opener(gff3, 'rt') as handle:
+        for line in handle:
+            if line.startswith('#'):
+                continue
+            seqid, _source, feature, start, end, _score, strand, phase, attributes = line.rstrip('\n').split('\t')
+
+            if feature == 'CDS':
+                if (parent := PARENT_RE.search(attributes)) and parent.group(1).startswith('transcript:'):
+                    transcript_id = parent.group(1).removeprefix('transcript:')
+                    cds[transcript_id].append((int(start), int(end), int(phase) if phase != '.' else 0))
+                    details[transcript_id] = (normalise_contig(seqid), strand)
+                continue
+
+            if (feature_id := ID_RE.search(attributes)) and feature_id.group(1).startswith('transcript:'):
+                biotype = BIOTYPE_RE.search(attributes)
+                biotypes[feature_id.group(1).removeprefix('transcript:')] = biotype.group(1) if biotype else ''
+
+    transcripts = []
+    for transcript_id, biotype in biotypes.items():
+        if transcript_id not in cds or not is_coding_biotype(biotype):
+            continue
+
+        contig, strand = details[transcript_id]
+        segments = sorted(cds[transcript_id], reverse=strand == '-')
+        transcript = Transcript(transcript_id, contig=contig, strand=strand, phase=segments[0][2])
+
+        offset = 0
+        for start, end, _phase in segments:
+            transcript.cds.append((start, end))
+            transcript.offsets.append(offset)
+            offset += end - start + 1
+        transcripts.append(transcript)
+
+    logger.info(f'Loaded {len(transcripts)} coding transcripts from {gff3}')
+    return transcripts
+
+
+class TranscriptIndex:
+    """
+    The coding transcripts of a GFF3, held as flat numpy arrays which can be memory-mapped straight from disk
+
+    Transcript arrays, one entry per transcript in GFF3 order:
+    - tx_ids, tx_contig (index into contigs), tx_strand (1 or -1), tx_phase
+    - tx_segments, the first segment index of each transcript, with a final entry for the total segment count
+    Segment arrays, in transcript order: seg_start, seg_end, seg_offset
+    Interval arrays, the same segments sorted on (contig, start), with iv_contig holding the bounds of each contig:
+    - iv_start, iv_end, iv_max_end (running max of iv_end within the contig), iv_tx, iv_seg
+    """
+
+    def __init__(self, checksum: str, contigs: list[str], arrays: dict[str, np.ndarray]):
+        self.checksum = checksum
+        self.contig_names = contigs
+        self.contigs = {contig: index for index, contig in enumerate(contigs)}
+        self.arrays = arrays
+        self._transcripts: dict[int, Transcript] = {}
+
+        # bind the most used arrays directly, these are hit for every variant
+        self.iv_contig = arrays['iv_contig']
+        self.iv_start = arrays['iv_start']
+        self.iv_end = arrays['iv_end']
+        self.iv_max_end = arrays['iv_max_end']
+        self.iv_tx = arrays['iv_tx']
+        self.iv_seg = arrays['iv_seg']
+
+    def __len__(self) -> int:
+        return len(self.arrays['tx_ids'])
+
+    @classmethod
+    def from_transcripts(cls, transcripts: list[Transcript], checksum: str) -> 'TranscriptIndex':
+        """Packs parsed transcripts into the flat array layout."""
+
+        contigs = sorted({transcript.contig for transcript in transcripts})
+        contig_index = {contig: index for index, contig in enumerate(contigs)}
+
+        tx_segments = [0]
+        seg_start, seg_end, seg_offset = [], [], []
+        by_contig: dict[int, list[tuple[int, int, int, int]]] = defaultdict(list)
+        for tx_index, transcript in enumerate(transcripts):
+            for seg_index, ((start, end), offset) in enumerate(zip(transcript.cds, transcript.offsets, strict=True)):
+                seg_start.append(start)
+                seg_end.append(end)
+                seg_offset.append(offset)
+                by_contig[contig_index[transcript.contig]].append((start, end, tx_index, seg_index))
+            tx_segments.append(len(seg_start))
+
+        intervals = []
+        iv_contig = [0]
+        for index in range(len(contigs)):
+            intervals.extend(sorted(by_contig[index]))
+            iv_contig.append(len(intervals))
+
+        iv_start = np.array([interval[0] for interval in intervals], dtype=np.int64)
+        iv_end = np.array([interval[1] for interval in intervals], dtype=np.int64)
+        iv_max_end = np.empty_like(iv_end)
+        for lower, upper in pairwise(iv_contig):
+            iv_max_end[lower:upper] = np.maximum.accumulate(iv_end[lower:upper])
+
+        arrays = {
+            'tx_ids': np.array([transcript.transcript_id.encode() for transcript in transcripts], dtype=np.bytes_),
+            'tx_contig': np.array([contig_index[transcript.contig] for transcript in transcripts], dtype=np.int32),
+            'tx_strand': np.array([1 if transcript.strand == '+' else -1 for transcript in transcripts], dtype=np.int8),
+            'tx_phase': np.array([transcript.phase for transcript in transcripts], dtype=np.int8),
+            'tx_segments': np.array(tx_segments, dtype=np.int64),
+            'seg_start': np.array(seg_start, dtype=np.int64),
+            'seg_end': np.array(seg_end, dtype=np.int64),
+            'seg_offset': np.array(seg_offset, dtype=np.int64),
+            'iv_contig': np.array(iv_contig, dtype=np.int64),
+            'iv_start': iv_start,
+            'iv_end': iv_end,
+            'iv_max_end': iv_max_end,
+            'iv_tx': np.array([interval[2] for interval in intervals], dtype=np.int32),
+            'iv_seg': np.array([interval[3] for interval in intervals], dtype=np.int32),
+        }
+        return cls(checksum=checksum, contigs=contigs, arrays=arrays)
+
+    def write(self, path: str):
+        """Writes the index to disk, via a temporary file so a partial index is never picked up."""
+        write_arrays(
+            path,
+            magic=MAGIC,
+            version=VERSION,
+            metadata={'checksum': self.checksum, 'contigs': self.contig_names},
+            arrays=self.arrays,
+        )
+        logger.info(f'Wrote transcript index for {len(self)} transcripts to {path}')
+
+    @classmethod
+    def load(cls, path: str) -> 'TranscriptIndex':
+        """Memory-maps a compiled index, nothing is read into memory until it's used."""
+        header, arrays = load_arrays(path, magic=MAGIC, version=VERSION)
+        return cls(checksum=header['checksum'], contigs=header['contigs'], arrays=arrays)
+
+    def overlapping(self, contig: str, pos: int) -> list[tuple[int, int]]:
+        """(transcript index, segment index) of every CDS segment containing this position, in transcript order."""
+        if (contig_index := self.contigs.get(contig)) is None:
+            return []
+
+        lower = int(self.iv_contig[contig_index])
+        upper = int(self.iv_contig[contig_index + 1])
+        # the last segment starting at or before pos, then step back while any earlier segment can still reach pos
+        index = lower + int(np.searchsorted(self.iv_start[lower:upper], pos, side='right')) - 1
+
+        hits = []
+        while index >= lower and self.iv_max_end[index] >= pos:
+            if self.iv_end[index] >= pos:
+                hits.append((int(self.iv_tx[index]), int(self.iv_seg[index])))
+            index -= 1
+        return sorted(hits)
+
+    def transcript(self, tx_index: int) -> Transcript:
+        """Rebuilds a single Transcript from the arrays, cached after first use."""
+        if (transcript := self._transcripts.get(tx_index)) is not None:
+            return transcript
+
+        arrays = self.arrays
+        first, last = int(arrays['tx_segments'][tx_index]), int(arrays['tx_segments'][tx_index + 1])
+        starts, ends = arrays['seg_start'][first:last].tolist(), arrays['seg_end'][first:last].tolist()
+        transcript = Transcript(
+            transcript_id=arrays['tx_ids'][tx_index].decode(),
+            contig=self.contig_names[int(arrays['tx_contig'][tx_index])],
+            strand='+' if arrays['tx_strand'][tx_index] == 1 else '-',
+            phase=int(arrays['tx_phase'][tx_index]),
+            cds=list(zip(starts, ends, strict=True)),
+            offsets=arrays['seg_offset'][first:last].tolist(),
+        )
+        self._transcripts[tx_index] = transcript
+        return transcript
+
+
+def default_index_path(gff3: str, checksum: str) -> str:
+    """The cached index sits alongside the GFF3, named with its checksum."""
+    return join(dirname(gff3), f'{basename(gff3)}.{checksum}.cdsidx')
+
+
+def load_or_compile(gff3: str, index_path: str | None = None) -> TranscriptIndex:
+    """
+    Loads the compiled index for a GFF3, compiling and caching it first if there isn't a current one
+
+    Args:
+        gff3 (str): path to the GFF3
+        index_path (str | None): the compiled index, defaults to {gff3}.{md5}.cdsidx alongside the GFF3
+
+    Returns:
+        the memory-mapped TranscriptIndex, or one built in memory if the index can't be written
+    """
+
+    checksum = checksum_path(gff3)
+    index_path = index_path or default_index_path(gff3, checksum)
+
+    if exists(index_path):
+        index = TranscriptIndex.load(index_path)
+        if index.checksum == checksum:
+            logger.info(f'Using compiled transcript index {index_path}')
+            return index
+        logger.warning(f'{index_path} was compiled from a different GFF3, recompiling')
+
+    index = TranscriptIndex.from_transcripts(parse_gff3(gff3), checksum=checksum)
+    try:
+        index.write(index_path)
+    except OSError as error:
+        logger.warning(f'Could not cache the transcript index at {index_path}: {error}')
+        return index
+    return TranscriptIndex.load(index_path)
+
+
+def cli_main():
+    parser = ArgumentParser(description='Compiles a GFF3 into a memory-mappable transcript index, if not cached')
+    parser.add_argument('-g', help='GFF3 gene models', required=True)
+    parser.add_argument('-o', help='path to write the index, defaults to {gff3}.{md5}.cdsidx', default=None)
+    args = parser.parse_args()
+
+    main(gff3=args.g, output=args.o)
+
+
+def main(gff3: str, output: str | None = None):
+    """
+    Compile the transcript index for a GFF3, unless a current one already exists
+
+    Args:
+        gff3 (str): GFF3 gene models
+        output (str | None): path to write the index, defaults to alongside the GFF3
+    """
+    load_or_compile(gff3, index_path=output)
+
+
+if __name__ == '__main__':
+    cli_main()
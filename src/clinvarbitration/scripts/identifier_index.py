@@ -0,0 +1,182 @@
+"""
+A memory-mappable index of the re-summarised decisions by identifier, so a ClinVar AlleleID or VariationID, or a dbSNP
+rsID, can be resolved to its decisions without scanning the decisions
+
+The index is written by resummarise_clinvar.py alongside the decisions index, as an array file (array_file.py) with
+the magic b'CVBIDSIX'. Arrays:
+- records: one entry per decision, in decision (contig & position) order, see decision_records.py
+- for each identifier (allele_id, variation_id, rsid), {identifier}_values holds the identifier of every decision
+  which has one, sorted, and {identifier}_records the matching record numbers
+
+An identifier lookup is one binary search, and batches are searched all at once. An rsID can be shared by several
+decisions (one per alternate allele), as can a VariationID mapped to both X & Y, so every match is returned.
+
+python -m clinvarbitration.scripts.identifier_index -i clinvar_decisions.ids.idx \\
+    AlleleID:15041 VariationID:17661 rs80357906
+"""
+
+import sys
+from argparse import ArgumentParser
+from collections.abc import Iterable
+
+import numpy as np
+from loguru import logger
+
+from clinvarbitration.scripts.array_file import load_arrays, write_arrays
+from clinvarbitration.scripts.decision_records import DecisionRecords, pack_records, range_positions
+
+MAGIC = b'CVBIDSIX'
+VERSION = 1
+
+# each identifier is read from the decision field of the same name
+IDENTIFIERS = ['allele_id', 'variation_id', 'rsid']
+
+# query prefixes for the command line, case-insensitive
+QUERY_PREFIXES = {'alleleid': 'allele_id', 'variationid': 'variation_id', 'rs': 'rsid'}
+
+# the largest identifier which can be looked up, values are searched as int64
+MAX_VALUE = (1 << 63) - 1
+
+
+class IdentifierIndex(DecisionRecords):
+    """Memory-mapped lookups of the decisions for ClinVar AlleleIDs & VariationIDs, and dbSNP rsIDs."""
+
+    @classmethod
+    def from_decisions(
+        cls,
+        decisions: Iterable[dict],
+        contigs: list[str],
+        significance: list[str],
+    ) -> 'IdentifierIndex':
+        """
+        Sorts the identifiers of every decision
+
+        Args:
+            decisions (Iterable[dict]): sorted decisions, as generated by resummarise_clinvar.generate_decisions, any
+                identifier missing from a decision (or negative, as variant_summary records a missing rsID) is skipped
+            contigs (list[str]): the contigs in rank order, i.e. ORDERED_CONTIGS[assembly]
+            significance (list[str]): every possible clinical_significance value, their index is the stored code
+        """
+
+        decisions = list(decisions)
+        arrays = pack_records(enumerate(decisions), contigs=contigs, significance=significance)
+        for name in IDENTIFIERS:
+            values = np.fromiter(
+                (decision.get(name, -1) for decision in decisions),
+                dtype=np.int64,
+                count=len(decisions),
+            )
+            records = np.flatnonzero(values >= 0)
+            order = np.argsort(values[records], kind='stable')
+            arrays[f'{name}_values'] = values[records][order].astype(np.uint64)
+            arrays[f'{name}_records'] = records[order].astype(np.uint32)
+
+        return cls(arrays, contigs=list(contigs), significance=list(significance))
+
+    def write(self, path: str):
+        write_arrays(
+            path,
+            magic=MAGIC,
+            version=VERSION,
+            metadata={'contigs': self.contigs, 'significance': self.significance_labels},
+            arrays=self.arrays,
+        )
+        logger.info(f'Wrote identifier index of {len(self)} decisions to {path}')
+
+    @classmethod
+    def load(cls, path: str) -> 'IdentifierIndex':
+        """Memory-maps an identifier index, nothing is read into memory until it's used."""
+        header, arrays = load_arrays(path, magic=MAGIC, version=VERSION)
+        return cls(arrays, contigs=header['contigs'], significance=header['significance'])
+
+    def lookup_many(self, identifier: str, values: Iterable[int]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorised lookup of many identifiers of one type
+
+        Args:
+            identifier (str): allele_id, variation_id, or rsid
+            values (Iterable[int]): the identifiers, rsIDs without the 'rs' prefix
+
+        Returns:
+            start and end offsets into {identifier}_records for each value, equal where there's no decision
+        """
+        if identifier not in IDENTIFIERS:
+            raise ValueError(f'Identifiers are one of {", ".join(IDENTIFIERS)}, not {identifier}')
+        sorted_values = self.arrays[f'{identifier}_values']
+        values = np.fromiter(values, dtype=np.int64)
+        # negative values can't match, and mustn't wrap around when cast to uint64
+        keys = np.where(values >= 0, values, 0).astype(np.uint64)
+        starts = np.searchsorted(sorted_values, keys)
+        ends = np.searchsorted(sorted_values, keys, side='right')
+        ends[values < 0] = starts[values < 0]
+        return starts, ends
+
+    def find(self, identifier: str, values: Iterable[int]) -> np.ndarray:
+        """The record numbers of the decisions matching any of the identifiers, ascending."""
+        starts, ends = self.lookup_many(identifier, values)
+        return np.unique(self.arrays[f'{identifier}_records'][range_positions(starts, ends)])
+
+    def lookup(self, identifier: str, value: int) -> list[tuple[str, int, str, str, str, int, int]]:
+        """
+        The decisions for one identifier
+
+        Args:
+            identifier (str): allele_id, variation_id, or rsid
+            value (int): the identifier, an rsID without the 'rs' prefix
+
+        Returns:
+            (contig, position, ref, alt, clinical significance, gold stars, ClinVar allele ID) of each decision
+        """
+        return self.records(self.find(identifier, [value]))
+
+    def rows(self, identifier: str, values: Iterable[int]) -> np.ndarray:
+        """The rows of the sorted decisions (TSV or Parquet) matching any of the identifiers, ascending."""
+        return self.row[self.find(identifier, values)]
+
+
+def parse_query(query: str) -> tuple[str, int]:
+    """Splits an 'AlleleID:15041', 'VariationID:17661', or 'rs80357906' query into (identifier, value)."""
+    prefix, _, value = query.partition(':')
+    if not value and query[:2].lower() == 'rs':
+        prefix, value = 'rs', query[2:]
+    identifier = QUERY_PREFIXES.get(prefix.lower())
+    if identifier is None or not value.isdigit():
+        raise ValueError(f'Queries are formatted as AlleleID:number, VariationID:number, or rsnumber, not {query}')
+    if int(value) > MAX_VALUE:
+        raise ValueError(f'Identifiers are at most {MAX_VALUE}, not {value} in {query}')
+    return identifier, int(value)
+
+
+def cli_main():
+    parser = ArgumentParser(description='Look up re-summarised ClinVar decisions by AlleleID, VariationID, or rsID')
+    parser.add_argument('-i', help='identifier index, written by resummarise_clinvar.py', required=True)
+    parser.add_argument('queries', help='e.g. AlleleID:15041, VariationID:17661, or rs80357906', nargs='*')
+    parser.add_argument('--queries', help='file of queries, one per line', dest='query_file')
+    args = parser.parse_args()
+
+    main(index_path=args.i, queries=args.queries, query_file=args.query_file)
+
+
+def main(index_path: str, queries: list[str], query_file: str | None = None):
+    """
+    Answer identifier queries, writing the query then each matching decision in the decisions TSV column order, one
+    line per decision. Queries without a decision are not written.
+
+    Args:
+        index_path (str): the identifier index
+        queries (list[str]): AlleleID:number, VariationID:number, or rsnumber queries
+        query_file (str | None): a file of additional queries, one per line
+    """
+
+    if query_file:
+        with open(query_file, encoding='utf-8') as handle:
+            queries = [*queries, *(line.strip() for line in handle if line.strip())]
+
+    index = IdentifierIndex.load(index_path)
+    for query in queries:
+        for record in index.lookup(*parse_query(query)):
+            sys.stdout.write('\t'.join([query, *map(str, record)]) + '\n')
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -0,0 +1,33 @@
+"""
+A fixed-size LRU cache, shared by the lookup service (serve.py) and the remote release client (remote_release.py)
+"""
+
+from collections import OrderedDict
+from collections.abc import Hashable
+
+
+class LruCache:
+    """A fixed-size mapping, evicting the least recently used entry."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, value: object):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
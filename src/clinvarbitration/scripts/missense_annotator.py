@@ -0,0 +1,305 @@
+"""
+In-process missense annotation of SNVs, a replacement for bcftools csq | bcftools +split-vep in the PM5 process
+
+For PM5 we only need the transcript, codon number, and amino acid change of each Pathogenic missense SNV. This uses
+the CDS structure of every coding transcript from the compiled GFF3 index (gff3_index.py), and reads codons from an
+indexed FASTA via mmap.
+
+The output rows match those generated by `bcftools csq --local-csq | bcftools +split-vep -d -s :missense`:
+Transcript, Amino Acid Change, ClinVar allele ID, ClinVar gold stars - e.g. "ENST00000338591	561A>561E	904889	0"
+
+Annotation rules mirror bcftools csq:
+- a transcript is coding if it has CDS features, and its biotype is not a non-coding type
+- the phase of the first CDS (in transcript order) is the number of bases before the first complete codon
+- missense means the amino acid changes, neither amino acid is a stop, and it's not a Met at codon 1 (start_lost)
+"""
+
+import gzip
+import mmap
+import os
+import sys
+from argparse import ArgumentParser
+from collections.abc import Generator, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import islice, repeat
+from multiprocessing import get_context
+from os.path import exists
+
+from loguru import logger
+
+from clinvarbitration.scripts.gff3_index import Transcript, TranscriptIndex, load_or_compile, normalise_contig
+
+BASES = 'TCAG'
+AMINO_ACIDS = 'FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG'
+CODON_TABLE = dict(zip((a + b + c for a in BASES for b in BASES for c in BASES), AMINO_ACIDS, strict=True))
+COMPLEMENT = str.maketrans('ACGTNacgtn', 'TGCANtgcan')
+
+# number of variants sent to each worker process at a time
+BATCH_SIZE = 10000
+
+# populated before worker processes are forked, so each worker shares the parent's loaded annotator
+_ANNOTATOR: 'MissenseAnnotator | None' = None
+
+
+def build_fai(ref_fa: str) -> str:
+    """Writes a samtools-compatible .fai index for an uncompressed FASTA, returning its path."""
+
+    fai_path = f'{ref_fa}.fai'
+    entries = []
+    with open(ref_fa, 'rb') as handle:
+        name, length, offset, line_bases, line_width = None, 0, 0, 0, 0
+        position = 0
+        for line in handle:
+            if line.startswith(b'>'):
+                if name is not None:
+                    entries.append((name, length, offset, line_bases, line_width))
+                name = line[1:].split()[0].decode()
+                length, line_bases, line_width = 0, 0, 0
+                offset = position + len(line)
+            elif name is not None:
+                if not line_bases:
+                    line_bases, line_width = len(line.rstrip(b'\r\n')), len(line)
+                length += len(line.rstrip(b'\r\n'))
+            position += len(line)
+        if name is not None:
+            entries.append((name, length, offset, line_bases, line_width))
+
+    with open(fai_path, 'w', encoding='utf-8') as handle:
+        for entry in entries:
+            handle.write('\t'.join(map(str, entry)) + '\n')
+    return fai_path
+
+
+class IndexedFasta:
+    """
+    Random access to an uncompressed, samtools-indexed FASTA, via mmap
+    The .fai index is created alongside the FASTA if it doesn't already exist
+    """
+
+    def __init__(self, ref_fa: str):
+        fai_path = f'{ref_fa}.fai' if exists(f'{ref_fa}.fai') else build_fai(ref_fa)
+
+        # contig: (offset, line_bases, line_width, length), keyed on the contig name without any 'chr' prefix
+        self.index: dict[str, tuple[int, int, int, int]] = {}
+        with open(fai_path, encoding='utf-8') as handle:
+            for line in handle:
+                name, length, offset, line_bases, line_width = line.split('\t')[:5]
+                self.index[normalise_contig(name)] = (int(offset), int(line_bases), int(line_width), int(length))
+
+        self._handle = open(ref_fa, 'rb')  # noqa: SIM115
+        self._mmap = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def base(self, contig: str, pos: int) -> str:
+        """The upper-case base at a 1-based position."""
+        offset, line_bases, line_width, _length = self.index[contig]
+        index = offset + ((pos - 1) // line_bases) * line_width + (pos - 1) % line_bases
+        return chr(self._mmap[index]).upper()
+
+    def close(self):
+        self._mmap.close()
+        self._handle.close()
+
+
+class MissenseAnnotator:
+    """
+    Annotates SNVs with the missense changes they cause, on every overlapping coding transcript
+    Transcripts & CDS segments come from a compiled TranscriptIndex, so overlapping segments are found by binary search
+    """
+
+    def __init__(self, index: TranscriptIndex, fasta: IndexedFasta):
+        self.index = index
+        self.fasta = fasta
+
+    @classmethod
+    def from_files(cls, gff3: str, ref_fa: str, index_path: str | None = None) -> 'MissenseAnnotator':
+        """Loads the cached transcript index for this GFF3 (compiling it if required), and the indexed FASTA."""
+        return cls(load_or_compile(gff3, index_path=index_path), IndexedFasta(ref_fa))
+
+    def codon(self, transcript: Transcript, codon_start: int) -> str:
+        """The codon sequence in transcript orientation, starting from a CDS offset."""
+        bases = ''.join(
+            self.fasta.base(transcript.contig, transcript.genomic_position(offset))
+            for offset in range(codon_start, codon_start + 3)
+        )
+        return bases.translate(COMPLEMENT) if transcript.strand == '-' else bases
+
+    def annotate(self, contig: str, pos: int, alt: str) -> list[tuple[str, str]]:
+        """
+        Finds all missense consequences of an SNV
+
+        Args:
+            contig (str): the contig, with or without a 'chr' prefix
+            pos (int): 1-based position
+            alt (str): the alternate base
+
+        Returns:
+            a list of (transcript ID, amino acid change), with changes formatted like bcftools, e.g. 334N>334T
+        """
+
+        contig = normalise_contig(contig)
+        results = []
+        for tx_index, seg_index in self.index.overlapping(contig, pos):
+            transcript = self.index.transcript(tx_index)
+
+            # bases before the first complete codon aren't annotated
+            offset = transcript.cds_offset(pos, seg_index) - transcript.phase
+            if offset < 0:
+                continue
+
+            codon_number, within = divmod(offset, 3)
+            codon_start = transcript.phase + codon_number * 3
+
+            # an incomplete final codon can't be translated
+            if codon_start + 3 > transcript.length:
+                continue
+
+            ref_codon = self.codon(transcript, codon_start)
+            alt_base = alt.upper().translate(COMPLEMENT) if transcript.strand == '-' else alt.upper()
+            alt_codon = ref_codon[:within] + alt_base + ref_codon[within + 1 :]
+
+            ref_aa = CODON_TABLE.get(ref_codon)
+            alt_aa = CODON_TABLE.get(alt_codon)
+
+            # skip ambiguous bases, synonymous changes, stop_gained/lost/retained, and start_lost
+            if ref_aa is None or alt_aa is None or ref_aa == alt_aa or '*' in (ref_aa, alt_aa):
+                continue
+            if codon_number == 0 and ref_aa == 'M':
+                continue
+
+            results.append(
+                (transcript.transcript_id, f'{codon_number + 1}{ref_aa}>{codon_number + 1}{alt_aa}'),
+            )
+        return results
+
+    def annotate_records(self, records: Iterable[tuple], locus: bool = False) -> list[str]:
+        """
+        Annotates a batch of SNV records
+
+        Args:
+            records (Iterable[tuple]): (contig, position, ref, alt, allele ID, gold stars) per SNV
+            locus (bool): if True, prefix each row with the record's contig, position, ref & alt
+
+        Returns:
+            the tab-delimited missense rows, one per transcript consequence, in input order
+        """
+
+        rows = []
+        for contig, pos, ref, alt, allele_id, gold_stars in records:
+            prefix = f'{contig}\t{pos}\t{ref}\t{alt}\t' if locus else ''
+            for transcript_id, aa_change in self.annotate(contig, pos, alt):
+                rows.append(f'{prefix}{transcript_id}\t{aa_change}\t{allele_id}\t{gold_stars}\n')
+        return rows
+
+
+def read_vcf_records(vcf: str) -> Generator[tuple, None, None]:
+    """
+    Reads SNV records from a VCF (plain, gzipped, or bgzipped), as generated by resummarise_clinvar.py
+
+    Returns:
+        generator of (contig, position, ref, alt, allele ID, gold stars) per SNV
+    """
+
+    opener = gzip.open if vcf.endswith(('gz', 'bgz')) else open
+    with opener(vcf, 'rt') as handle:
+        for line in handle:
+            if line.startswith('#'):
+                continue
+            contig, pos, _id, ref, alt, _qual, _filter, info = line.rstrip('\n').split('\t')[:8]
+            fields = dict(item.split('=', 1) for item in info.split(';') if '=' in item)
+            yield contig, int(pos), ref, alt, fields['allele_id'], fields['gold_stars']
+
+
+def _annotate_batch(records: list[tuple], locus: bool) -> list[str]:
+    """Worker process entry point, using the annotator inherited from the parent process."""
+    return _ANNOTATOR.annotate_records(records, locus=locus)  # type: ignore[union-attr]
+
+
+def batched(records: Iterable[tuple], size: int) -> Generator[list[tuple], None, None]:
+    """Splits an iterable into lists of a fixed size."""
+    iterator = iter(records)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def annotate_in_parallel(
+    records: Iterable[tuple],
+    annotator: 'MissenseAnnotator',
+    threads: int,
+    locus: bool = False,
+) -> Generator[str, None, None]:
+    """
+    Annotates records in batches across multiple processes, yielding rows in input order
+
+    Args:
+        records (Iterable[tuple]): (contig, position, ref, alt, allele ID, gold stars) per SNV
+        annotator (MissenseAnnotator): the loaded annotator, shared with forked workers
+        threads (int): number of worker processes, 1 annotates in this process
+        locus (bool): if True, prefix each row with the record's contig, position, ref & alt
+
+    Returns:
+        generator of the tab-delimited missense rows
+    """
+
+    if threads <= 1:
+        for batch in batched(records, BATCH_SIZE):
+            yield from annotator.annotate_records(batch, locus=locus)
+        return
+
+    global _ANNOTATOR  # noqa: PLW0603
+    _ANNOTATOR = annotator
+    try:
+        with ProcessPoolExecutor(max_workers=threads, mp_context=get_context('fork')) as executor:
+            for rows in executor.map(_annotate_batch, batched(records, BATCH_SIZE), repeat(locus)):
+                yield from rows
+    finally:
+        _ANNOTATOR = None
+
+
+def cli_main():
+    parser = ArgumentParser(description='Annotates Pathogenic SNVs with missense consequences, without bcftools')
+    parser.add_argument('-i', help='VCF of Pathogenic SNVs', required=True)
+    parser.add_argument('-f', help='reference genome FASTA, uncompressed', required=True)
+    parser.add_argument('-g', help='GFF3 gene models', required=True)
+    parser.add_argument('-o', help='output TSV of missense annotations, or "-" for stdout', required=True)
+    parser.add_argument(
+        '--threads',
+        help='number of processes to annotate with, defaults to the number of CPUs',
+        type=int,
+        default=os.cpu_count() or 1,
+    )
+    parser.add_argument(
+        '--index',
+        help='compiled transcript index for the GFF3 (gff3_index.py), defaults to a cached index alongside the GFF3',
+        default=None,
+    )
+    args = parser.parse_args()
+
+    main(vcf=args.i, ref_fa=args.f, gff3=args.g, output=args.o, threads=args.threads, index_path=args.index)
+
+
+def main(vcf: str, ref_fa: str, gff3: str, output: str, threads: int, index_path: str | None = None):
+    """
+    Annotate all SNVs in the VCF, writing the missense rows in the same format as bcftools +split-vep
+
+    Args:
+        vcf (str): VCF of Pathogenic SNVs
+        ref_fa (str): uncompressed reference genome FASTA
+        gff3 (str): GFF3 gene models
+        output (str): path to write the missense TSV to, or '-' for stdout
+        threads (int): number of processes to annotate with
+        index_path (str | None): compiled transcript index, created alongside the GFF3 if not provided
+    """
+
+    annotator = MissenseAnnotator.from_files(gff3=gff3, ref_fa=ref_fa, index_path=index_path)
+
+    # '-' writes to stdout, for piping straight into clinvar_by_codon.py
+    with nullcontext(sys.stdout) if output == '-' else open(output, 'w', encoding='utf-8') as handle:
+        handle.writelines(annotate_in_parallel(read_vcf_records(vcf), annotator=annotator, threads=threads))
+
+    annotator.fasta.close()
+    logger.info(f'Missense annotations written to {output}')
+
+
+if __name__ == '__main__':
+    cli_main()
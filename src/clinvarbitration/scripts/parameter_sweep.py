@@ -0,0 +1,427 @@
+"""
+Sweeps the re-summary parameters (MAJORITY_RATIO, MINORITY_RATIO, ACMG_THRESHOLD & STRONG_REVIEWS) over a grid of
+values, reporting how the distribution of decisions changes for each setting, without re-parsing ClinVar per setting
+
+ClinVar is parsed once (as resummarise_clinvar.py does, BLACKLIST included) into compact per-VariationID aggregates,
+an array file (array_file.py) with the magic b'CVBSWEEP'. Arrays:
+- variation_id: the VariationIDs with submissions, and weight: the number of decisions each becomes (a VariationID
+  mapped to both X & Y is two decisions)
+- submission_offsets: the submissions of variant v are submission_offsets[v] : submission_offsets[v + 1], in their
+  submission_summary order
+- days: each submission's DateLastEvaluated, as days since VERY_OLD (undated submissions are 0)
+- classification: each submission's class, an index into CLASSES
+- review: each submission's review status, an index into the review_statuses held in the header
+
+As ACMG_THRESHOLD is one of the swept parameters, the submission dates are kept rather than counts at one threshold.
+For each (threshold, strong reviews) pair the class counts after the threshold, the class counts overall, and the
+first strong-review class are computed for every variant at once, then each (majority, minority) pair is a single
+vectorised evaluation of consequence_decision's rules. check_stars is evaluated alongside.
+
+python -m clinvarbitration.scripts.parameter_sweep -s submission_summary.txt.gz -v variant_summary.txt.gz \\
+    -a clinvar.sweep --majority 0.5 0.6 0.7 --minority 0.1 0.2 --threshold 2015-01-01 2016-01-01 \\
+    --strong 'practice guideline;reviewed by expert panel' 'practice guideline' none
+"""
+
+import sys
+from argparse import ArgumentParser
+from collections import Counter
+from datetime import datetime
+from functools import cached_property
+from itertools import product
+
+import numpy as np
+from loguru import logger
+
+from clinvarbitration.scripts.array_file import load_arrays, write_arrays
+from clinvarbitration.scripts.resummarise_clinvar import (
+    ACMG_THRESHOLD,
+    GRCH37,
+    GRCH38,
+    MAJORITY_RATIO,
+    MINORITY_RATIO,
+    NO_STAR_RATINGS,
+    STRONG_REVIEWS,
+    TIMEZONE,
+    VERY_OLD,
+    Consequence,
+    Submission,
+    get_all_decisions,
+    get_allele_locus_map,
+)
+
+MAGIC = b'CVBSWEEP'
+VERSION = 1
+
+# submission classes, their index is the stored code
+CLASSES = [Consequence.PATHOGENIC, Consequence.BENIGN, Consequence.UNCERTAIN, Consequence.UNKNOWN]
+PATHOGENIC, BENIGN, UNCERTAIN, UNKNOWN = range(len(CLASSES))
+
+# decision outcomes, their index is the decision code
+OUTCOMES = list(Consequence)
+OUTCOME_CODES = np.array([OUTCOMES.index(consequence) for consequence in CLASSES])
+
+# gold stars run from 0 to 4
+STAR_LEVELS = 5
+
+REPORT_KEYS = [
+    'majority_ratio',
+    'minority_ratio',
+    'acmg_threshold',
+    'strong_reviews',
+    *(consequence.value for consequence in OUTCOMES),
+    *(f'stars_{stars}' for stars in range(STAR_LEVELS)),
+    'changed',
+]
+
+
+def days_since(date: datetime) -> int:
+    """Whole days from VERY_OLD, submission dates have no time component."""
+    return (date - VERY_OLD).days
+
+
+def review_stars(review_status: str) -> int:
+    """The stars a Pathogenic or Benign submission with this review status contributes in check_stars."""
+    if review_status == 'practice guideline':
+        return 4
+    if review_status == 'reviewed by expert panel':
+        return 3
+    return 0 if review_status in NO_STAR_RATINGS else 1
+
+
+class SubmissionAggregates:
+    """The compact submission details of every variant, for vectorised re-evaluation of the decisions."""
+
+    def __init__(self, arrays: dict[str, np.ndarray], review_statuses: list[str]):
+        self.arrays = arrays
+        self.variation_id = arrays['variation_id']
+        self.weight = arrays['weight']
+        self.submission_offsets = arrays['submission_offsets']
+        self.days = arrays['days']
+        self.classification = arrays['classification']
+        self.review = arrays['review']
+        self.review_statuses = review_statuses
+
+    def __len__(self) -> int:
+        return len(self.variation_id)
+
+    @classmethod
+    def from_submissions(
+        cls,
+        decision_dict: dict[int, list[Submission]],
+        weights: dict[int, int],
+    ) -> 'SubmissionAggregates':
+        """
+        Encodes the submissions of every variant
+
+        Args:
+            decision_dict (dict[int, list[Submission]]): the retained submissions per VariationID, from
+                resummarise_clinvar.get_all_decisions
+            weights (dict[int, int]): the number of decisions each VariationID becomes
+        """
+
+        var_ids = sorted(decision_dict)
+        class_codes = {consequence: code for code, consequence in enumerate(CLASSES)}
+        review_codes: dict[str, int] = {}
+        days, classification, review = [], [], []
+        for var_id in var_ids:
+            for submission in decision_dict[var_id]:
+                days.append(days_since(submission.date))
+                classification.append(class_codes[submission.classification])
+                review.append(review_codes.setdefault(submission.review_status, len(review_codes)))
+
+        submission_offsets = np.zeros(len(var_ids) + 1, dtype=np.int64)
+        np.cumsum([len(decision_dict[var_id]) for var_id in var_ids], out=submission_offsets[1:])
+        return cls(
+            {
+                'variation_id': np.array(var_ids, dtype=np.int64),
+                'weight': np.array([weights.get(var_id, 0) for var_id in var_ids], dtype=np.uint32),
+                'submission_offsets': submission_offsets,
+                'days': np.array(days, dtype=np.int32),
+                'classification': np.array(classification, dtype=np.uint8),
+                'review': np.array(review, dtype=np.uint16),
+            },
+            review_statuses=list(review_codes),
+        )
+
+    def write(self, path: str):
+        write_arrays(
+            path,
+            magic=MAGIC,
+            version=VERSION,
+            metadata={'review_statuses': self.review_statuses},
+            arrays=self.arrays,
+        )
+        logger.info(f'Wrote {len(self.days)} submissions of {len(self)} variants to {path}')
+
+    @classmethod
+    def load(cls, path: str) -> 'SubmissionAggregates':
+        """Memory-maps the aggregates, nothing is read into memory until it's used."""
+        header, arrays = load_arrays(path, magic=MAGIC, version=VERSION)
+        return cls(arrays, review_statuses=header['review_statuses'])
+
+    @cached_property
+    def variant(self) -> np.ndarray:
+        """The variant number of each submission."""
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.submission_offsets))
+
+    @cached_property
+    def class_counts(self) -> np.ndarray:
+        """The count of each class per variant, over all its submissions."""
+        return self.count_classes(np.ones(len(self.days), dtype=bool))
+
+    @cached_property
+    def submission_stars(self) -> np.ndarray:
+        """The stars each submission contributes in check_stars, the variant's stars are the maximum."""
+        by_review = np.array([review_stars(status) for status in self.review_statuses], dtype=np.uint8)
+        stars = by_review[self.review]
+        stars[np.isin(self.classification, [UNCERTAIN, UNKNOWN])] = 0
+        return stars
+
+    def count_classes(self, mask: np.ndarray) -> np.ndarray:
+        """The count of each class per variant, over the submissions in the mask."""
+        keys = self.variant[mask] * len(CLASSES) + self.classification[mask]
+        return np.bincount(keys, minlength=len(self) * len(CLASSES)).reshape(len(self), len(CLASSES))
+
+    def filtered_counts(self, threshold: datetime, strong_reviews: list[str]) -> tuple[np.ndarray, ...]:
+        """
+        The inputs to consequence_decision for every variant, after acmg_filter_submissions
+
+        Args:
+            threshold (datetime): the ACMG date threshold
+            strong_reviews (list[str]): the review statuses which are always retained, and decide the class
+
+        Returns:
+            the class counts of the retained submissions (variants x CLASSES), the class code of the first strong
+            review or -1 where there is none, and the gold stars
+        """
+
+        strong_codes = [code for code, status in enumerate(self.review_statuses) if status in strong_reviews]
+        is_strong = np.isin(self.review, strong_codes)
+        recent = (self.days >= days_since(threshold)) | is_strong
+        any_recent = np.bincount(self.variant[recent], minlength=len(self)) > 0
+        counts = np.where(any_recent[:, None], self.count_classes(recent), self.class_counts)
+
+        # strong reviews are always retained, so the first retained is the first overall
+        strong_submissions = np.flatnonzero(is_strong)
+        variants, first = np.unique(self.variant[strong_submissions], return_index=True)
+        strong_class = np.full(len(self), -1, dtype=np.int64)
+        strong_class[variants] = self.classification[strong_submissions[first]]
+
+        # every variant has a submission, so no reduceat segment is empty
+        retained = recent | ~any_recent[self.variant]
+        stars = np.maximum.reduceat(np.where(retained, self.submission_stars, 0), self.submission_offsets[:-1])
+        return counts, strong_class, stars
+
+    def decisions(
+        self,
+        majority: float = MAJORITY_RATIO,
+        minority: float = MINORITY_RATIO,
+        threshold: datetime = ACMG_THRESHOLD,
+        strong_reviews: list[str] = STRONG_REVIEWS,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """The decision code (an index into OUTCOMES) and gold stars of every variant, for one setting."""
+        counts, strong_class, stars = self.filtered_counts(threshold, strong_reviews)
+        return decide_codes(counts, strong_class, majority, minority), stars
+
+
+def decide_codes(counts: np.ndarray, strong_class: np.ndarray, majority: float, minority: float) -> np.ndarray:
+    """
+    consequence_decision, applied to every variant at once
+
+    Args:
+        counts (np.ndarray): the class counts of the retained submissions, variants x CLASSES
+        strong_class (np.ndarray): the class code of each variant's first strong review, or -1
+        majority (float): MAJORITY_RATIO
+        minority (float): MINORITY_RATIO
+
+    Returns:
+        the decision code of each variant, an index into OUTCOMES
+    """
+
+    pathogenic, benign, uncertain, unknown = counts.T
+    total = counts.sum(axis=1)
+    both = (pathogenic > 0) & (benign > 0)
+    clear_majority = (np.maximum(pathogenic, benign) >= total * majority) & (
+        np.minimum(pathogenic, benign) <= total * minority
+    )
+    code = OUTCOMES.index
+    return np.select(
+        [
+            strong_class >= 0,
+            both & clear_majority,
+            both,
+            unknown > total * majority,
+            uncertain > total * majority,
+            pathogenic > 0,
+            benign > 0,
+        ],
+        [
+            OUTCOME_CODES[np.maximum(strong_class, 0)],
+            np.where(benign > pathogenic, code(Consequence.BENIGN), code(Consequence.PATHOGENIC)),
+            code(Consequence.CONFLICTING),
+            code(Consequence.UNKNOWN),
+            code(Consequence.UNCERTAIN),
+            code(Consequence.PATHOGENIC),
+            code(Consequence.BENIGN),
+        ],
+        default=code(Consequence.UNCERTAIN),
+    )
+
+
+def sweep(
+    aggregates: SubmissionAggregates,
+    majorities: list[float],
+    minorities: list[float],
+    thresholds: list[datetime],
+    strong_options: list[list[str]],
+) -> list[dict]:
+    """
+    Evaluates every combination of the parameter values
+
+    Args:
+        aggregates (SubmissionAggregates): the parsed submissions
+        majorities (list[float]): MAJORITY_RATIO values
+        minorities (list[float]): MINORITY_RATIO values
+        thresholds (list[datetime]): ACMG_THRESHOLD values
+        strong_options (list[list[str]]): STRONG_REVIEWS values
+
+    Returns:
+        one row per setting, in REPORT_KEYS: the parameters, the count of decisions with each outcome and number of
+        stars, and the number of decisions which differ from the current module settings
+    """
+
+    weight = aggregates.weight.astype(np.int64)
+    base_codes, base_stars = aggregates.decisions()
+
+    rows = []
+    for threshold, strong_reviews in product(thresholds, strong_options):
+        counts, strong_class, stars = aggregates.filtered_counts(threshold, strong_reviews)
+        star_counts = np.bincount(stars, weights=weight, minlength=STAR_LEVELS)
+        for majority, minority in product(majorities, minorities):
+            codes = decide_codes(counts, strong_class, majority, minority)
+            outcome_counts = np.bincount(codes, weights=weight, minlength=len(OUTCOMES))
+            changed = weight[(codes != base_codes) | (stars != base_stars)].sum()
+            rows.append(
+                dict(
+                    zip(
+                        REPORT_KEYS,
+                        [
+                            majority,
+                            minority,
+                            threshold.strftime('%Y-%m-%d'),
+                            ';'.join(strong_reviews) or 'none',
+                            *map(int, outcome_counts),
+                            *map(int, star_counts),
+                            int(changed),
+                        ],
+                        strict=True,
+                    ),
+                ),
+            )
+    return rows
+
+
+def parse_aggregates(subs: str, variants: str, assembly: str) -> SubmissionAggregates:
+    """Parses ClinVar once, as resummarise_clinvar.generate_decisions does, into the submission aggregates."""
+    allele_map = get_allele_locus_map(variants, assembly)
+    weights = Counter(details['var_id'] for details in allele_map.values())
+    decision_dict = get_all_decisions(submission_file=subs, var_ids=set(weights))
+    return SubmissionAggregates.from_submissions(decision_dict, weights=weights)
+
+
+def parse_threshold(date: str) -> datetime:
+    """A YYYY-MM-DD ACMG threshold."""
+    return datetime.strptime(date, '%Y-%m-%d').replace(tzinfo=TIMEZONE)
+
+
+def parse_strong(option: str) -> list[str]:
+    """A ';'-delimited list of strong review statuses, or 'none'."""
+    return [] if option == 'none' else [status.strip().lower() for status in option.split(';') if status.strip()]
+
+
+def cli_main():
+    parser = ArgumentParser(description='Sweep the re-summary parameters, reporting the decisions for each setting')
+    parser.add_argument('-s', help='submission_summary.txt.gz from NCBI, parsed if provided')
+    parser.add_argument('-v', help='variant_summary.txt.gz from NCBI, parsed if provided')
+    parser.add_argument('-a', help='submission aggregates, written if ClinVar is parsed, otherwise read')
+    parser.add_argument('-o', help='write the report TSV here, instead of stdout')
+    parser.add_argument('--assembly', help='genome build to use', default=GRCH38, choices=[GRCH37, GRCH38])
+    parser.add_argument('--majority', help='MAJORITY_RATIO values', type=float, nargs='+', default=[MAJORITY_RATIO])
+    parser.add_argument('--minority', help='MINORITY_RATIO values', type=float, nargs='+', default=[MINORITY_RATIO])
+    parser.add_argument(
+        '--threshold',
+        help='ACMG_THRESHOLD values, YYYY-MM-DD',
+        nargs='+',
+        default=[ACMG_THRESHOLD.strftime('%Y-%m-%d')],
+    )
+    parser.add_argument(
+        '--strong',
+        help="STRONG_REVIEWS values, each a ';'-delimited list of review statuses, or 'none'",
+        nargs='+',
+        default=[';'.join(STRONG_REVIEWS)],
+    )
+    args = parser.parse_args()
+
+    if not args.a and not (args.s and args.v):
+        parser.error('Provide -s & -v to parse ClinVar, or -a to read previously written aggregates')
+
+    main(
+        subs=args.s,
+        variants=args.v,
+        aggregates_path=args.a,
+        output=args.o,
+        assembly=args.assembly,
+        majorities=args.majority,
+        minorities=args.minority,
+        thresholds=[parse_threshold(date) for date in args.threshold],
+        strong_options=[parse_strong(option) for option in args.strong],
+    )
+
+
+def main(
+    subs: str | None,
+    variants: str | None,
+    aggregates_path: str | None,
+    output: str | None,
+    assembly: str,
+    majorities: list[float],
+    minorities: list[float],
+    thresholds: list[datetime],
+    strong_options: list[list[str]],
+):
+    """
+    Parse ClinVar (or read the aggregates of a previous parse), then report the decisions for every setting
+
+    Args:
+        subs (str | None): submission_summary.txt.gz from NCBI
+        variants (str | None): variant_summary.txt.gz from NCBI
+        aggregates_path (str | None): where to write the aggregates of this parse, or read them from if not parsing
+        output (str | None): the report TSV, or None for stdout
+        assembly (str): genome build to use
+        majorities (list[float]): MAJORITY_RATIO values
+        minorities (list[float]): MINORITY_RATIO values
+        thresholds (list[datetime]): ACMG_THRESHOLD values
+        strong_options (list[list[str]]): STRONG_REVIEWS values
+    """
+
+    if subs and variants:
+        aggregates = parse_aggregates(subs=subs, variants=variants, assembly=assembly)
+        if aggregates_path:
+            aggregates.write(aggregates_path)
+    elif aggregates_path:
+        aggregates = SubmissionAggregates.load(aggregates_path)
+    else:
+        raise ValueError('Either the ClinVar files or previously written aggregates are required')
+
+    rows = sweep(aggregates, majorities, minorities, thresholds, strong_options)
+    lines = ['\t'.join(REPORT_KEYS) + '\n', *('\t'.join(str(row[key]) for key in REPORT_KEYS) + '\n' for row in rows)]
+    if output:
+        with open(output, 'w', encoding='utf-8') as handle:
+            handle.writelines(lines)
+        logger.info(f'Wrote {len(rows)} settings to {output}')
+    else:
+        sys.stdout.writelines(lines)
+
+
+if __name__ == '__main__':
+    cli_main()
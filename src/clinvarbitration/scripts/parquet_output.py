@@ -0,0 +1,175 @@
+"""
+Parquet copies of the decisions and PM5 tables, for analytics tools (DuckDB, pandas, Polars) which can then read only
+the contigs, transcripts, and columns they need, rather than parsing the whole TSV
+
+Both files are laid out for predicate pushdown:
+- decisions: one row group per contig, in ORDERED_CONTIGS order, sorted on position within each
+- PM5 & PS1: row groups of whole transcripts, in transcript order, of roughly PM5_ROW_GROUP rows each
+
+Every column chunk carries min/max statistics, so readers skip row groups which can't match a filter on contig,
+position, transcript, or codon. Contig, clinical_significance, and transcript columns are dictionary-encoded.
+
+pyarrow is an optional dependency, installed with `pip install clinvarbitration[parquet]`
+"""
+
+import zoneinfo
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+import numpy as np
+from loguru import logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+if TYPE_CHECKING:
+    from clinvarbitration.scripts.clinvar_by_codon import CodonIndex
+
+TIMEZONE = zoneinfo.ZoneInfo('Australia/Brisbane')
+
+# the target number of codons per PM5 row group, transcripts are never split across row groups
+PM5_ROW_GROUP = 100_000
+
+COMPRESSION = 'zstd'
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError('Parquet output requires pyarrow, install with `pip install clinvarbitration[parquet]`')
+
+
+def file_metadata(**metadata: str) -> dict[bytes, bytes]:
+    """Key-value metadata stored in the Parquet footer, alongside the schema."""
+    metadata['creation_date'] = datetime.now(tz=TIMEZONE).strftime('%Y-%m-%d')
+    return {key.encode(): value.encode() for key, value in metadata.items()}
+
+
+def write_decisions_parquet(decisions: list[dict], parquet_path: str, contigs: list[str], assembly: str):
+    """
+    Writes the decisions as Parquet, with one row group per contig
+
+    Args:
+        decisions (list[dict]): decisions sorted on contig & position, as from resummarise_clinvar.generate_decisions
+        parquet_path (str): where to write the file
+        contigs (list[str]): the contig order, i.e. ORDERED_CONTIGS[assembly]
+        assembly (str): genome build, stored in the file metadata
+    """
+
+    require_pyarrow()
+
+    schema = pa.schema(
+        [
+            ('contig', pa.dictionary(pa.int8(), pa.string())),
+            ('position', pa.int32()),
+            ('reference', pa.string()),
+            ('alternate', pa.string()),
+            ('clinical_significance', pa.dictionary(pa.int8(), pa.string())),
+            ('gold_stars', pa.int8()),
+            ('allele_id', pa.int32()),
+        ],
+        metadata=file_metadata(assembly=assembly),
+    )
+
+    columns = {
+        'contig': [decision['contig'] for decision in decisions],
+        'position': [decision['position'] for decision in decisions],
+        'reference': [decision['alleles'][0] for decision in decisions],
+        'alternate': [decision['alleles'][1] for decision in decisions],
+        'clinical_significance': [decision['clinical_significance'] for decision in decisions],
+        'gold_stars': [decision['gold_stars'] for decision in decisions],
+        'allele_id': [decision['allele_id'] for decision in decisions],
+    }
+    table = pa.Table.from_pydict(columns, schema=schema)
+
+    # decisions are sorted on contig, so each contig is one contiguous slice, written as one row group
+    contig_index = {contig: index for index, contig in enumerate(contigs)}
+    ranks = np.fromiter(map(contig_index.__getitem__, columns['contig']), dtype=np.int64, count=len(decisions))
+    boundaries = np.flatnonzero(np.diff(ranks)) + 1
+
+    with pq.ParquetWriter(
+        parquet_path,
+        schema,
+        compression=COMPRESSION,
+        use_dictionary=['contig', 'clinical_significance'],
+        write_statistics=True,
+    ) as writer:
+        for start, end in zip([0, *boundaries.tolist()], [*boundaries.tolist(), len(decisions)], strict=True):
+            if end > start:
+                writer.write_table(table.slice(start, end - start), row_group_size=end - start)
+
+    logger.info(f'Wrote {len(decisions)} decisions to Parquet at {parquet_path}, {len(boundaries) + 1} row groups')
+
+
+def transcript_row_groups(codon_index: 'CodonIndex', target: int = PM5_ROW_GROUP) -> list[tuple[int, int]]:
+    """Splits the codon groups into [start, end) ranges of roughly target rows, only between transcripts."""
+
+    # the first row of each transcript, groups are sorted on transcript
+    tx_starts = np.flatnonzero(np.diff(codon_index.group_tx, prepend=-1)).tolist()
+    ranges = []
+    start = 0
+    for tx_start in tx_starts[1:]:
+        if tx_start - start >= target:
+            ranges.append((start, tx_start))
+            start = tx_start
+    if len(codon_index) > start:
+        ranges.append((start, len(codon_index)))
+    return ranges
+
+
+def write_codon_index_parquet(
+    codon_index: 'CodonIndex',
+    parquet_path: str,
+    structured: bool = False,
+    target_rows: int = PM5_ROW_GROUP,
+):
+    """
+    Writes the PM5 (or PS1) data as Parquet, with row groups of whole transcripts
+
+    Columns match the TSV: transcript, codon, alt_aa (residue index only), clinvar_alleles. If structured, also
+    alleles (a list of {allele_id, gold_stars} structs), max_stars, and n_alleles
+
+    Args:
+        codon_index (CodonIndex): the aggregated data, sorted on transcript & codon
+        parquet_path (str): where to write the file
+        structured (bool): if True, also write the alleles as structs, with max_stars and n_alleles
+        target_rows (int): the approximate number of rows per row group
+    """
+
+    require_pyarrow()
+
+    transcripts = pa.DictionaryArray.from_arrays(
+        pa.array(codon_index.group_tx.astype(np.int32)),
+        pa.array(codon_index.transcripts, type=pa.string()),
+    )
+    columns = {'transcript': transcripts, 'codon': pa.array(codon_index.group_codon.astype(np.int32))}
+    if codon_index.group_alt is not None:
+        alt_aa = pa.array(list(map(chr, codon_index.group_alt.tolist())), type=pa.string())
+        columns['alt_aa'] = alt_aa.dictionary_encode()
+    columns['clinvar_alleles'] = pa.array(codon_index.allele_strings(), type=pa.string())
+
+    if structured:
+        alleles = pa.StructArray.from_arrays(
+            [pa.array(codon_index.allele_id.astype(np.int32)), pa.array(codon_index.stars.astype(np.int8))],
+            names=['allele_id', 'gold_stars'],
+        )
+        columns['alleles'] = pa.ListArray.from_arrays(pa.array(codon_index.offsets.astype(np.int32)), alleles)
+        columns['max_stars'] = pa.array(codon_index.max_stars().astype(np.int8))
+        columns['n_alleles'] = pa.array(codon_index.n_alleles().astype(np.int32))
+
+    table = pa.table(columns).replace_schema_metadata(file_metadata())
+    row_groups = transcript_row_groups(codon_index, target=target_rows)
+
+    with pq.ParquetWriter(
+        parquet_path,
+        table.schema,
+        compression=COMPRESSION,
+        use_dictionary=[name for name in ('transcript', 'alt_aa') if name in columns],
+        write_statistics=True,
+    ) as writer:
+        for start, end in row_groups:
+            writer.write_table(table.slice(start, end - start), row_group_size=end - start)
+
+    logger.info(f'Wrote {len(codon_index)} rows to Parquet at {parquet_path}, {len(row_groups)} row groups')
@@ -0,0 +1,291 @@
+"""
+A compact, memory-mappable index of the PM5 table, for answering "which Pathogenic missense alleles hit this codon"
+
+The index is written by clinvar_by_codon.py alongside the PM5 TSV, as an array file (array_file.py) with the magic
+b'CVBPM5IX'. Arrays:
+- transcripts: the sorted transcript IDs, as fixed-width bytes
+- group_key: one entry per (transcript, codon), (transcript index << 24) | codon, sorted
+- offsets: group i holds the alleles from offsets[i] to offsets[i + 1]
+- allele_id & stars: ClinVar allele IDs and gold stars, sorted within each group
+
+Only the transcript IDs are read into memory, on first use. A lookup is then a binary search of the memory-mapped
+group keys, and batch lookups search all queries at once, in sorted order.
+
+Since group keys are sorted on (transcript, codon), the groups within +/- N codons of a residue are a contiguous run,
+found with two binary searches. offsets is the running total of alleles over groups, so the number of Pathogenic
+missense alleles in any window is offsets[last] - offsets[first], with no scan. The window size is chosen per query.
+
+python -m clinvarbitration.scripts.pm5_index -i clinvar_decisions.pm5.idx ENST00000338591:561 ENST00000379370:76
+"""
+
+import sys
+from argparse import ArgumentParser
+from collections.abc import Iterable, Sequence
+from functools import cached_property
+from itertools import repeat
+from typing import TYPE_CHECKING
+
+import numpy as np
+from loguru import logger
+
+from clinvarbitration.scripts.array_file import load_arrays, write_arrays
+
+if TYPE_CHECKING:
+    from clinvarbitration.scripts.clinvar_by_codon import CodonIndex
+
+MAGIC = b'CVBPM5IX'
+VERSION = 1
+
+# (transcript, codon) are packed into one int64, here and in clinvar_by_codon.CodonAggregator
+CODON_BITS = 24
+CODON_MASK = (1 << CODON_BITS) - 1
+
+
+class Pm5Index:
+    """Memory-mapped lookups of the Pathogenic missense alleles at a transcript codon."""
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        self.arrays = arrays
+        self.transcripts = arrays['transcripts']
+        self.group_key = arrays['group_key']
+        self.offsets = arrays['offsets']
+        self.allele_id = arrays['allele_id']
+        self.stars = arrays['stars']
+
+    def __len__(self) -> int:
+        return len(self.group_key)
+
+    @classmethod
+    def from_codon_index(cls, codon_index: 'CodonIndex') -> 'Pm5Index':
+        """Packs the aggregated PM5 data, which is already sorted on (transcript, codon) then allele."""
+        transcripts = [transcript.encode() for transcript in codon_index.transcripts]
+        return cls(
+            {
+                'transcripts': np.array(transcripts, dtype=np.bytes_ if transcripts else 'S1'),
+                'group_key': (codon_index.group_tx << CODON_BITS) | codon_index.group_codon,
+                'offsets': codon_index.offsets.astype(np.int64),
+                'allele_id': codon_index.allele_id.astype(np.uint32),
+                'stars': codon_index.stars.astype(np.uint8),
+            },
+        )
+
+    def write(self, path: str):
+        write_arrays(path, magic=MAGIC, version=VERSION, metadata={}, arrays=self.arrays)
+        logger.info(f'Wrote PM5 index of {len(self)} codons to {path}')
+
+    @classmethod
+    def load(cls, path: str) -> 'Pm5Index':
+        """Memory-maps a PM5 index, nothing is read into memory until it's used."""
+        _header, arrays = load_arrays(path, magic=MAGIC, version=VERSION)
+        return cls(arrays)
+
+    @cached_property
+    def transcript_ids(self) -> dict[str, int]:
+        """The index of each transcript, built on first use. This is the only part of the index read into memory."""
+        return {transcript.decode(): index for index, transcript in enumerate(self.transcripts.tolist())}
+
+    def group(self, transcript: str, codon: int) -> int | None:
+        """The index of the (transcript, codon) group, or None if there are no alleles at this codon."""
+
+        tx_index = self.transcript_ids.get(transcript)
+        if tx_index is None or codon >> CODON_BITS:
+            return None
+
+        key = (tx_index << CODON_BITS) | codon
+        group = int(self.group_key.searchsorted(key))
+        if group == len(self.group_key) or self.group_key.item(group) != key:
+            return None
+        return group
+
+    def lookup(self, transcript: str, codon: int) -> list[tuple[int, int]]:
+        """
+        The Pathogenic missense alleles at a codon
+
+        Args:
+            transcript (str): Ensembl transcript ID, e.g. ENST00000338591
+            codon (int): codon number, 1-based
+
+        Returns:
+            (ClinVar allele ID, gold stars) of each allele, sorted on allele ID, or an empty list
+        """
+        if (group := self.group(transcript, codon)) is None:
+            return []
+        return self.alleles(self.offsets.item(group), self.offsets.item(group + 1))
+
+    def alleles(self, start: int, end: int) -> list[tuple[int, int]]:
+        """(ClinVar allele ID, gold stars) of the alleles between two offsets."""
+        return list(zip(self.allele_id[start:end].tolist(), self.stars[start:end].tolist(), strict=True))
+
+    def lookup_many(self, transcripts: Sequence[str], codons: Iterable[int]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorised lookup of many (transcript, codon) queries
+
+        Args:
+            transcripts (Sequence[str]): transcript ID of each query
+            codons (Iterable[int]): codon number of each query
+
+        Returns:
+            start and end offsets into allele_id & stars for each query, equal where there are no alleles
+        """
+
+        tx_index = np.fromiter(
+            map(self.transcript_ids.get, transcripts, repeat(-1)),
+            dtype=np.int64,
+            count=len(transcripts),
+        )
+        codons = np.fromiter(codons, dtype=np.int64, count=len(transcripts))
+        starts = np.zeros(len(transcripts), dtype=np.int64)
+        ends = np.zeros(len(transcripts), dtype=np.int64)
+        if not len(self) or not len(transcripts):
+            return starts, ends
+
+        found = (tx_index >= 0) & (codons >> CODON_BITS == 0)
+        keys = (tx_index << CODON_BITS) | (codons & ((1 << CODON_BITS) - 1))
+
+        # searching in sorted order keeps each search close to the last, so far fewer pages are touched
+        order = np.argsort(keys)
+        groups = np.empty_like(order)
+        groups[order] = np.searchsorted(self.group_key, keys[order])
+        np.minimum(groups, len(self.group_key) - 1, out=groups)
+        found &= self.group_key[groups] == keys
+
+        starts[found] = self.offsets[groups[found]]
+        ends[found] = self.offsets[groups[found] + 1]
+        return starts, ends
+
+    def window(self, transcript: str, codon: int, flank: int) -> tuple[int, int]:
+        """
+        The range of groups with codons from codon - flank to codon + flank on this transcript
+
+        Args:
+            transcript (str): Ensembl transcript ID
+            codon (int): the central codon, 1-based
+            flank (int): number of codons either side of the central codon
+
+        Returns:
+            the first group in the window, and the group after the last, equal if there are no Pathogenic codons
+        """
+        if (tx_index := self.transcript_ids.get(transcript)) is None:
+            return 0, 0
+        lower = (tx_index << CODON_BITS) | min(max(codon - flank, 0), CODON_MASK)
+        upper = (tx_index << CODON_BITS) | min(max(codon + flank, 0), CODON_MASK)
+        return int(self.group_key.searchsorted(lower)), int(self.group_key.searchsorted(upper, side='right'))
+
+    def window_count(self, transcript: str, codon: int, flank: int) -> int:
+        """The number of Pathogenic missense alleles within flank codons of this codon, inclusive."""
+        first, last = self.window(transcript, codon, flank)
+        return self.offsets.item(last) - self.offsets.item(first)
+
+    def window_alleles(self, transcript: str, codon: int, flank: int) -> list[tuple[int, int, int]]:
+        """(codon, ClinVar allele ID, gold stars) of each Pathogenic missense allele within flank codons."""
+        first, last = self.window(transcript, codon, flank)
+        codons = (self.group_key[first:last] & CODON_MASK).tolist()
+        counts = np.diff(self.offsets[first : last + 1]).tolist()
+        alleles = self.alleles(self.offsets.item(first), self.offsets.item(last))
+        per_allele = [group_codon for group_codon, count in zip(codons, counts, strict=True) for _ in range(count)]
+        return [(group_codon, *allele) for group_codon, allele in zip(per_allele, alleles, strict=True)]
+
+    def window_many(
+        self,
+        transcripts: Sequence[str],
+        codons: Iterable[int],
+        flank: int,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorised window queries
+
+        Args:
+            transcripts (Sequence[str]): transcript ID of each query
+            codons (Iterable[int]): central codon of each query
+            flank (int): number of codons either side of each central codon
+
+        Returns:
+            the number of Pathogenic codons, and the number of Pathogenic missense alleles, in each query's window
+        """
+
+        tx_index = np.fromiter(
+            map(self.transcript_ids.get, transcripts, repeat(-1)),
+            dtype=np.int64,
+            count=len(transcripts),
+        )
+        codons = np.fromiter(codons, dtype=np.int64, count=len(transcripts))
+        found = tx_index >= 0
+        base = np.where(found, tx_index, 0) << CODON_BITS
+        lower = base | np.clip(codons - flank, 0, CODON_MASK)
+        upper = base | np.clip(codons + flank, 0, CODON_MASK)
+
+        # as in lookup_many, search in sorted order - with one flank, upper bounds sort in the same order as lower
+        order = np.argsort(lower)
+        first = np.empty_like(order)
+        last = np.empty_like(order)
+        first[order] = np.searchsorted(self.group_key, lower[order])
+        last[order] = np.searchsorted(self.group_key, upper[order], side='right')
+        first[~found] = 0
+        last[~found] = 0
+        return last - first, self.offsets[last] - self.offsets[first]
+
+
+def parse_query(query: str) -> tuple[str, int]:
+    """Splits a 'transcript:codon' query."""
+    transcript, _, codon = query.rpartition(':')
+    if not transcript or not codon.isdigit():
+        raise ValueError(f'Queries should be formatted as transcript:codon, not {query}')
+    # a larger codon can't be packed into a key
+    if int(codon) > CODON_MASK:
+        raise ValueError(f'Codons are at most {CODON_MASK}, not {codon} in {query}')
+    return transcript, int(codon)
+
+
+def cli_main():
+    parser = ArgumentParser(description='Look up Pathogenic missense alleles by transcript and codon')
+    parser.add_argument('-i', help='PM5 index, written by clinvar_by_codon.py', required=True)
+    parser.add_argument('queries', help='transcript:codon queries, e.g. ENST00000338591:561', nargs='*')
+    parser.add_argument('--queries', help='file of transcript:codon queries, one per line', dest='query_file')
+    parser.add_argument(
+        '--window',
+        help='instead, report the Pathogenic missense alleles within this many codons either side of each query',
+        type=int,
+        default=None,
+    )
+    args = parser.parse_args()
+
+    main(index_path=args.i, queries=args.queries, query_file=args.query_file, window=args.window)
+
+
+def main(index_path: str, queries: list[str], query_file: str | None = None, window: int | None = None):
+    """
+    Answer transcript:codon queries, writing transcript, codon, and the alleles formatted as in the PM5 TSV
+    With a window, writes transcript, codon, the number of Pathogenic codons and alleles in the window, and the
+    alleles formatted as 'codon:AlleleID::GoldStars+...'
+
+    Args:
+        index_path (str): the PM5 index
+        queries (list[str]): transcript:codon queries
+        query_file (str | None): a file of additional queries, one per line
+        window (int | None): if provided, the number of codons either side of each query to report on
+    """
+
+    if query_file:
+        with open(query_file, encoding='utf-8') as handle:
+            queries = [*queries, *(line.strip() for line in handle if line.strip())]
+
+    index = Pm5Index.load(index_path)
+    parsed = [parse_query(query) for query in queries]
+
+    if window is not None:
+        for transcript, codon in parsed:
+            hits = index.window_alleles(transcript, codon, flank=window)
+            alleles = '+'.join(f'{hit_codon}:{allele_id}::{stars}' for hit_codon, allele_id, stars in hits)
+            n_codons = len({hit[0] for hit in hits})
+            sys.stdout.write(f'{transcript}\t{codon}\t{n_codons}\t{len(hits)}\t{alleles}\n')
+        return
+
+    starts, ends = index.lookup_many([tx for tx, _codon in parsed], [codon for _tx, codon in parsed])
+
+    for (transcript, codon), start, end in zip(parsed, starts.tolist(), ends.tolist(), strict=True):
+        alleles = '+'.join(f'{allele_id}::{stars}' for allele_id, stars in index.alleles(start, end))
+        sys.stdout.write(f'{transcript}\t{codon}\t{alleles}\n')
+
+
+if __name__ == '__main__':
+    cli_main()
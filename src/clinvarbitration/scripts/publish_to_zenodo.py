@@ -12,6 +12,7 @@ Arguments:
     secret    Name of the GCP Secret Manager secret holding the Zenodo token
     project   ID of the GCP project ID holding the Zenodo secret
     tarball   Path to the file to attach to the new record version
+    delta     Optional path to the delta from the previous release, also attached to the new record version
     success   Path to an output file, to contain the new record URL
 """
 
@@ -149,10 +150,20 @@ def publish(draft_id: int, token: str) -> dict:
     return _check(r, 'Publish')
 
 
-def main(record: int, token_secret: str, token_project: str, tarball_path: str, success_file: str) -> None:
-    tarball = Path(tarball_path)
-    if not tarball.exists():
-        raise FileNotFoundError(f'File not found: {tarball}')
+def main(
+    record: int,
+    token_secret: str,
+    token_project: str,
+    tarball_path: str,
+    success_file: str,
+    delta_path: str | None = None,
+) -> None:
+    files = [Path(tarball_path)]
+    if delta_path:
+        files.append(Path(delta_path))
+    for file_path in files:
+        if not file_path.exists():
+            raise FileNotFoundError(f'File not found: {file_path}')
 
     print(f'Retrieving Zenodo token from GCP secret "{token_secret}"...')
     token = get_secret(token_secret, secret_project=token_project)
@@ -166,7 +177,8 @@ def main(record: int, token_secret: str, token_project: str, tarball_path: str,
     draft = get_deposition(draft_id, token)
 
     clear_inherited_files(draft_id, token)
-    upload_file(draft, tarball, token)
+    for file_path in files:
+        upload_file(draft, file_path, token)
     update_metadata(draft_id, existing['metadata'], token)
     result = publish(draft_id, token)
 
@@ -189,6 +201,7 @@ if __name__ == '__main__':
     parser.add_argument('--project', help='GCP ID for the Zenodo token project', required=True)
     parser.add_argument('--tarball', type=str, help='path to the file to upload', required=True)
     parser.add_argument('--success', type=str, help='if successful, write new record URL', required=True)
+    parser.add_argument('--delta', type=str, help='optional, the delta from the previous release to upload')
     args = parser.parse_args()
 
     try:
@@ -198,6 +211,7 @@ if __name__ == '__main__':
             token_project=args.project,
             tarball_path=args.tarball,
             success_file=args.success,
+            delta_path=args.delta,
         )
     except Exception as exc:  # noqa: BLE001
         print(f'Error: {exc}', file=sys.stderr)
@@ -0,0 +1,284 @@
+"""
+Writes the checksums of a release, and a compact delta from the previous release, so a local copy can be brought up
+to date (see apply_delta.py) without downloading the whole release tarball
+
+The checksums ({release}/clinvar_decisions.checksums.json) are the md5 of every file & Hail Table in the release
+folder, see checksums.checksum_path, and are packaged in the release tarball.
+
+The delta covers the row data of the release, each dataset a sorted TSV:
+- decisions: clinvar_decisions.tsv.bgz, grouped on (contig, position)
+- pm5: clinvar_decisions.pm5.tsv, grouped on (transcript, codon)
+- ps1: clinvar_decisions.ps1.tsv, grouped on (transcript, codon), each group holding a row per alternate amino acid
+
+Both releases are merge-joined a group at a time, and any group whose rows differ is written to the delta in full:
+its previous rows marked 'removed', and its new rows marked 'added'. Applying the delta replaces each such group with
+its added rows, so the order of rows within a group is kept exactly. The delta is a gzipped tarball of:
+- manifest.json: the md5 of each dataset in the previous release (the base the delta applies to), the md5 of each
+  file the delta recreates in the new release (the datasets, plus the memory-mappable indexes rebuilt from them), the
+  number of groups added, removed & changed in each dataset, and the release files the delta can't update
+- {dataset}.tsv: a 'change' column, then the dataset's columns
+
+The compressed bytes of the BGZF decisions TSV depend on the zlib build and compression level that wrote them, so it
+is checked on an md5 of its decompressed rows (the base, and 'rows' in the manifest), and its tabix index, which
+holds offsets into the compressed file, is rebuilt on application without a checksum ('derived' in the manifest).
+
+The Hail Tables and the gene & identifier indexes hold more than the TSV rows, so aren't covered by the delta. A delta
+is only written from a previous release with a checksums file, as earlier releases weren't all sorted, and a dataset
+which can't be compared is left out with a warning, so packaging a release never fails for want of a delta.
+
+python -m clinvarbitration.scripts.release_delta -n clinvarbitration_data -p previous/clinvarbitration_data \\
+    -o clinvar_decisions.delta.tar.gz
+"""
+
+import json
+import os
+import tarfile
+import tempfile
+from argparse import ArgumentParser
+from collections.abc import Callable, Iterable, Iterator
+from itertools import groupby
+from os.path import basename, exists, join
+
+from loguru import logger
+
+from clinvarbitration.scripts.checksums import checksum_path, checksum_rows
+from clinvarbitration.scripts.cloud_release import read_tsv
+from clinvarbitration.scripts.diff_decisions import CONTIG_RANKS
+
+VERSION = 2
+
+CHECKSUMS_NAME = 'clinvar_decisions.checksums.json'
+MANIFEST_NAME = 'manifest.json'
+
+# the file holding each dataset in a release
+DATASETS = {
+    'decisions': 'clinvar_decisions.tsv.bgz',
+    'pm5': 'clinvar_decisions.pm5.tsv',
+    'ps1': 'clinvar_decisions.ps1.tsv',
+}
+
+# files rebuilt from each dataset when a delta is applied
+REBUILT = {
+    'decisions': ['clinvar_decisions.tsv.bgz.tbi', 'clinvar_decisions.idx'],
+    'pm5': ['clinvar_decisions.pm5.idx'],
+}
+
+# compressed datasets, checked on their decompressed rows rather than their bytes
+COMPRESSED = {'clinvar_decisions.tsv.bgz'}
+
+# files derived from a compressed dataset's bytes, rebuilt without a checksum
+DERIVED = {'clinvar_decisions.tsv.bgz.tbi'}
+
+
+def decision_key(line: str) -> tuple[int, int]:
+    """Decisions are sorted on contig, in reference order, then position."""
+    contig, position, _ = line.split('\t', 2)
+    return CONTIG_RANKS[contig], int(position)
+
+
+def codon_key(line: str) -> tuple[str, int]:
+    """PM5 & PS1 rows are sorted on transcript, then codon."""
+    transcript, codon, _ = line.split('\t', 2)
+    return transcript, int(codon)
+
+
+GROUP_KEYS: dict[str, Callable[[str], tuple]] = {'decisions': decision_key, 'pm5': codon_key, 'ps1': codon_key}
+
+
+def dataset_checksum(path: str) -> str:
+    """The md5 a dataset is compared on: of its decompressed rows if it's compressed, otherwise of its bytes."""
+    return checksum_rows(path) if basename(path) in COMPRESSED else checksum_path(path)
+
+
+def release_checksums(release_dir: str) -> dict[str, str]:
+    """The md5 of every file & Hail Table in the release folder, except the checksums file itself."""
+    return {
+        name: checksum_path(join(release_dir, name))
+        for name in sorted(os.listdir(release_dir))
+        if name != CHECKSUMS_NAME
+    }
+
+
+def write_checksums(release_dir: str) -> dict[str, str]:
+    """Writes the checksums of the release folder into it, returning them."""
+    checksums = release_checksums(release_dir)
+    with open(join(release_dir, CHECKSUMS_NAME), 'w', encoding='utf-8') as handle:
+        json.dump(checksums, handle, indent=2)
+    logger.info(f'Wrote checksums of {len(checksums)} release files to {join(release_dir, CHECKSUMS_NAME)}')
+    return checksums
+
+
+def line_groups(lines: Iterable[str], key: Callable[[str], tuple], source: str) -> Iterator[tuple[tuple, list[str]]]:
+    """The rows of each group, checking the groups are sorted."""
+    previous = None
+    for group_key, group in groupby(lines, key=key):
+        if previous is not None and group_key <= previous:
+            raise ValueError(f'{source} is not sorted, at {group_key}')
+        previous = group_key
+        yield group_key, list(group)
+
+
+def diff_groups(
+    old: Iterable[tuple[tuple, list[str]]],
+    new: Iterable[tuple[tuple, list[str]]],
+) -> Iterator[tuple[list[str], list[str]]]:
+    """
+    Merge-joins two sorted streams of groups, yielding the (old rows, new rows) of every group which differs
+
+    Args:
+        old (Iterable[tuple[tuple, list[str]]]): the previous release's groups, from line_groups
+        new (Iterable[tuple[tuple, list[str]]]): the new release's groups, from line_groups
+    """
+
+    old_groups, new_groups = iter(old), iter(new)
+    old_group = next(old_groups, None)
+    new_group = next(new_groups, None)
+    while old_group or new_group:
+        if new_group is None or (old_group and old_group[0] < new_group[0]):
+            yield old_group[1], []  # type: ignore[index]
+            old_group = next(old_groups, None)
+        elif old_group is None or new_group[0] < old_group[0]:
+            yield [], new_group[1]
+            new_group = next(new_groups, None)
+        else:
+            if old_group[1] != new_group[1]:
+                yield old_group[1], new_group[1]
+            old_group = next(old_groups, None)
+            new_group = next(new_groups, None)
+
+
+def write_dataset_delta(dataset: str, old_path: str, new_path: str, delta_path: str) -> dict[str, int]:
+    """
+    Writes the changed groups of one dataset
+
+    Args:
+        dataset (str): the dataset name, one of DATASETS
+        old_path (str): the dataset in the previous release
+        new_path (str): the dataset in the new release
+        delta_path (str): where to write the changed rows
+
+    Returns:
+        the number of groups added, removed & changed
+    """
+
+    old_columns, old_rows = read_tsv(old_path)
+    new_columns, new_rows = read_tsv(new_path)
+    if old_columns != new_columns:
+        raise ValueError(
+            f'The {dataset} columns changed from {old_columns} to {new_columns}, so a delta is not possible',
+        )
+
+    counts = {'added': 0, 'removed': 0, 'changed': 0}
+    key = GROUP_KEYS[dataset]
+    with open(delta_path, 'w', encoding='utf-8') as handle:
+        handle.write('\t'.join(['change', *new_columns]) + '\n')
+        for old_lines, new_lines in diff_groups(
+            line_groups(old_rows, key, old_path),
+            line_groups(new_rows, key, new_path),
+        ):
+            counts['changed' if old_lines and new_lines else 'removed' if old_lines else 'added'] += 1
+            handle.writelines(f'removed\t{line}' for line in old_lines)
+            handle.writelines(f'added\t{line}' for line in new_lines)
+
+    logger.info(f'{dataset}: {counts["added"]} added, {counts["removed"]} removed, {counts["changed"]} changed')
+    return counts
+
+
+def write_delta(
+    previous_dir: str,
+    new_dir: str,
+    delta_path: str,
+    checksums: dict[str, str] | None = None,
+) -> dict | None:
+    """
+    Writes the delta from the previous release to the new one
+
+    Only a previous release with a checksums file was written in this layout, with every dataset sorted. Earlier
+    releases (e.g. a PM5 TSV in insertion order) can't be merge-joined, so no delta is written from them. A dataset
+    which can't be compared, e.g. its columns changed, is left out of the delta with a warning, rather than failing.
+
+    Args:
+        previous_dir (str): the previous release folder
+        new_dir (str): the new release folder
+        delta_path (str): where to write the delta, conventionally clinvar_decisions.delta.tar.gz
+        checksums (dict[str, str] | None): the new release's checksums, if already calculated
+
+    Returns:
+        the delta manifest, or None if no delta was written
+    """
+
+    if not exists(join(previous_dir, CHECKSUMS_NAME)):
+        logger.warning(f'{previous_dir} has no {CHECKSUMS_NAME}, so predates the delta layout, no delta is written')
+        return None
+
+    checksums = checksums or release_checksums(new_dir)
+    datasets = [dataset for dataset, name in DATASETS.items() if exists(join(previous_dir, name)) and name in checksums]
+
+    changes = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for dataset in datasets:
+            try:
+                changes[dataset] = write_dataset_delta(
+                    dataset,
+                    join(previous_dir, DATASETS[dataset]),
+                    join(new_dir, DATASETS[dataset]),
+                    join(temp_dir, f'{dataset}.tsv'),
+                )
+            except ValueError as error:
+                logger.warning(f'{dataset} is left out of the delta: {error}')
+
+        if not changes:
+            logger.warning('None of the datasets could be compared, no delta is written')
+            return None
+
+        recreated = [
+            name for dataset in changes for name in [DATASETS[dataset], *REBUILT.get(dataset, [])] if name in checksums
+        ]
+        manifest = {
+            'version': VERSION,
+            'base': {DATASETS[dataset]: dataset_checksum(join(previous_dir, DATASETS[dataset])) for dataset in changes},
+            'target': {name: checksums[name] for name in recreated if name not in COMPRESSED | DERIVED},
+            'rows': {name: checksum_rows(join(new_dir, name)) for name in recreated if name in COMPRESSED},
+            'derived': [name for name in recreated if name in DERIVED],
+            'changes': changes,
+            'not_covered': sorted(set(checksums).difference(recreated)),
+        }
+        with open(join(temp_dir, MANIFEST_NAME), 'w', encoding='utf-8') as handle:
+            json.dump(manifest, handle, indent=2)
+
+        with tarfile.open(delta_path, 'w:gz') as tar:
+            for name in [MANIFEST_NAME, *(f'{dataset}.tsv' for dataset in changes)]:
+                tar.add(join(temp_dir, name), arcname=name)
+
+    logger.info(f'Wrote the delta of {", ".join(changes)} to {delta_path}')
+    return manifest
+
+
+def cli_main():
+    parser = ArgumentParser(description='Write the checksums of a release, and a delta from the previous release')
+    parser.add_argument('-n', help='the new release folder, the checksums are written into it', required=True)
+    parser.add_argument('-p', help='the previous release folder, if set a delta is written')
+    parser.add_argument('-o', help='where to write the delta, e.g. clinvar_decisions.delta.tar.gz')
+    args = parser.parse_args()
+
+    if args.p and not args.o:
+        parser.error('-o is required to write a delta')
+
+    main(new_dir=args.n, previous_dir=args.p, delta_path=args.o)
+
+
+def main(new_dir: str, previous_dir: str | None = None, delta_path: str | None = None):
+    """
+    Args:
+        new_dir (str): the new release folder, the checksums are written into it
+        previous_dir (str | None): the previous release folder, if set a delta is written where possible
+        delta_path (str | None): where to write the delta
+    """
+
+    checksums = write_checksums(new_dir)
+    if previous_dir and delta_path:
+        write_delta(previous_dir, new_dir, delta_path, checksums=checksums)
+
+
+if __name__ == '__main__':
+    cli_main()
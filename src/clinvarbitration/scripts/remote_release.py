@@ -0,0 +1,260 @@
+"""
+Looks up decisions and PM5 codons in a cloud-optimised release (see cloud_release.py), fetching only the index and the
+blocks covering each query, through HTTP Range requests
+
+The index is fetched once, when the release is opened. Each query finds its blocks with two binary searches over the
+first & last keys of the blocks, then any blocks not already cached are fetched, adjacent blocks in a single request.
+Decompressed blocks are held in an LRU cache, so nearby queries are answered without any further requests.
+
+The release can be an http(s) URL, e.g. the bucket or web server the release folder is published to, or a local
+folder, read with the same ranged reads.
+
+python -m clinvarbitration.scripts.remote_release \
+    -r https://example.org/clinvar_decisions.cloud \
+    chr1:12345:A:G chr17:43044295-43125364 \
+    --pm5 ENST00000338591:561
+"""
+
+import sys
+import zlib
+from argparse import ArgumentParser
+from bisect import bisect_left, bisect_right
+from os.path import join
+from urllib.request import Request, urlopen
+
+import numpy as np
+from loguru import logger
+
+from clinvarbitration.scripts.array_file import arrays_from_buffer
+from clinvarbitration.scripts.bgzf import HEADER, TRAILER
+from clinvarbitration.scripts.cloud_release import INDEX_NAME, MAGIC, NAME_SHIFT, NUMBER_MASK, VERSION
+from clinvarbitration.scripts.decisions_index import parse_query as parse_variant
+from clinvarbitration.scripts.lru_cache import LruCache
+from clinvarbitration.scripts.pm5_index import parse_query as parse_codon
+
+# decompressed blocks held in memory, each up to 64KiB
+CACHE_BLOCKS = 256
+TIMEOUT = 30
+
+# columns returned as ints, the rest are returned as strings
+INTEGER_COLUMNS = {'position', 'gold_stars', 'allele_id', 'codon', 'max_stars', 'n_alleles'}
+
+HTTP_PARTIAL = 206
+
+
+class RemoteRelease:
+    """A cloud-optimised release, read through ranged reads with an LRU cache of decompressed blocks."""
+
+    def __init__(self, location: str, cache_blocks: int = CACHE_BLOCKS, timeout: float = TIMEOUT):
+        """
+        Args:
+            location (str): an http(s) URL or local path of the release folder
+            cache_blocks (int): the number of decompressed blocks to keep
+            timeout (float): seconds to wait on each HTTP request
+        """
+        self.location = location.rstrip('/')
+        self.remote = self.location.startswith(('http://', 'https://'))
+        self.timeout = timeout
+        self.cache = LruCache(cache_blocks)
+        self.requests = 0
+        self.bytes_fetched = 0
+
+        header, self.arrays = arrays_from_buffer(self.read(INDEX_NAME), MAGIC, VERSION, source=self.location)
+        self.datasets: dict[str, dict] = header['datasets']
+        self.ranks = {dataset: name_ranks(details['names']) for dataset, details in self.datasets.items()}
+
+    def read(self, name: str, start: int | None = None, length: int | None = None) -> bytes:
+        """
+        Reads a whole file, or length bytes from start, from the release
+
+        Args:
+            name (str): the file within the release folder
+            start (int | None): the first byte to read, or None for the whole file
+            length (int | None): the number of bytes to read
+
+        Returns:
+            the bytes read
+        """
+        self.requests += 1
+        if not self.remote:
+            with open(join(self.location, name), 'rb') as handle:
+                if start is None:
+                    data = handle.read()
+                else:
+                    handle.seek(start)
+                    data = handle.read(length)
+        else:
+            request = Request(f'{self.location}/{name}')  # noqa: S310
+            if start is not None:
+                request.add_header('Range', f'bytes={start}-{start + length - 1}')
+            with urlopen(request, timeout=self.timeout) as response:  # noqa: S310
+                data = response.read()
+                if start is not None and response.status != HTTP_PARTIAL:
+                    logger.warning(f'{self.location} ignored a Range request, and returned the whole of {name}')
+                    data = data[start : start + length]
+
+        if length is not None and len(data) != length:
+            raise ValueError(f'Expected {length} bytes from {name} at {start}, read {len(data)}')
+        self.bytes_fetched += len(data)
+        return data
+
+    def block_range(self, dataset: str, first_key: int, last_key: int) -> range:
+        """The blocks of a dataset which hold any rows with keys between first_key and last_key, inclusive."""
+        first, last = self.arrays[f'{dataset}_first'], self.arrays[f'{dataset}_last']
+        return range(
+            int(last.searchsorted(np.uint64(first_key))),
+            int(first.searchsorted(np.uint64(last_key), side='right')),
+        )
+
+    def load_blocks(self, dataset: str, blocks: range) -> list[tuple[list[int], list[list[str]]]]:
+        """
+        The keys & rows of each block, fetching any runs of uncached blocks in a single request each
+
+        Args:
+            dataset (str): the dataset the blocks are in
+            blocks (range): consecutive block numbers
+
+        Returns:
+            for each block, the key of each row, and the fields of each row
+        """
+        loaded = {}
+        missing = []
+        for block in blocks:
+            cached = self.cache.get((dataset, block))
+            if cached is None:
+                missing.append(block)
+            else:
+                loaded[block] = cached
+
+        offsets, sizes = self.arrays[f'{dataset}_offset'], self.arrays[f'{dataset}_size']
+        while missing:
+            run = 1
+            while run < len(missing) and missing[run] == missing[0] + run:
+                run += 1
+            start = int(offsets[missing[0]])
+            end = int(offsets[missing[run - 1]]) + int(sizes[missing[run - 1]])
+            data = self.read(self.datasets[dataset]['file'], start, end - start)
+            for block in missing[:run]:
+                within = int(offsets[block]) - start
+                parsed = self.parse_block(dataset, data[within : within + int(sizes[block])])
+                self.cache.put((dataset, block), parsed)
+                loaded[block] = parsed
+            missing = missing[run:]
+
+        return [loaded[block] for block in blocks]
+
+    def parse_block(self, dataset: str, block: bytes) -> tuple[list[int], list[list[str]]]:
+        """Decompresses and checks a BGZF block, returning the key & fields of each row."""
+        data = zlib.decompress(block[HEADER.size : -TRAILER.size], -15)
+        crc, size = TRAILER.unpack(block[-TRAILER.size :])
+        if zlib.crc32(data) != crc or len(data) != size:
+            raise ValueError(f'A block of {self.datasets[dataset]["file"]} is corrupt')
+        text = data.decode()
+        ranks = self.ranks[dataset]
+        keys, rows = [], []
+        for line in text.splitlines():
+            fields = line.split('\t')
+            keys.append((ranks[fields[0]] << NAME_SHIFT) | int(fields[1]))
+            rows.append(fields)
+        return keys, rows
+
+    def rows(self, dataset: str, name: str, first_number: int, last_number: int) -> list[dict]:
+        """
+        All rows of a dataset for one contig or transcript, between two positions or codons
+
+        Args:
+            dataset (str): decisions, pm5, or ps1
+            name (str): the contig (with or without a 'chr' prefix) or transcript
+            first_number (int): the first position or codon, inclusive
+            last_number (int): the last position or codon, inclusive
+
+        Returns:
+            each row as a dict keyed on the dataset's columns, in key order
+        """
+        rank = self.ranks[dataset].get(name)
+        if rank is None or last_number < first_number:
+            return []
+        first_key = (rank << NAME_SHIFT) | min(max(first_number, 0), NUMBER_MASK)
+        last_key = (rank << NAME_SHIFT) | min(max(last_number, 0), NUMBER_MASK)
+
+        columns = self.datasets[dataset]['columns']
+        results = []
+        for keys, rows in self.load_blocks(dataset, self.block_range(dataset, first_key, last_key)):
+            first, last = bisect_left(keys, first_key), bisect_right(keys, last_key)
+            results.extend(row_dict(columns, row) for row in rows[first:last])
+        return results
+
+    def lookup(self, contig: str, position: int, ref: str, alt: str) -> list[dict]:
+        """The decisions for a single variant, as dicts keyed on the decisions TSV columns."""
+        return [
+            row
+            for row in self.rows('decisions', contig, position, position)
+            if row['reference'] == ref and row['alternate'] == alt
+        ]
+
+    def region(self, contig: str, start: int, end: int) -> list[dict]:
+        """All decisions between two positions, inclusive."""
+        return self.rows('decisions', contig, start, end)
+
+    def codon(self, transcript: str, codon: int, dataset: str = 'pm5') -> list[dict]:
+        """The PM5 (or PS1) rows for a codon, as dicts keyed on the TSV columns."""
+        return self.rows(dataset, transcript, codon, codon)
+
+
+def name_ranks(names: list[str]) -> dict[str, int]:
+    """The rank of each contig or transcript, also accepting contigs with the 'chr' prefix added or removed."""
+    ranks = {}
+    for rank, name in enumerate(names):
+        ranks[name] = rank
+        alias = name.removeprefix('chr') if name.startswith('chr') else f'chr{name}'
+        ranks.setdefault(alias, rank)
+    return ranks
+
+
+def row_dict(columns: list[str], fields: list[str]) -> dict:
+    return {
+        column: int(field) if column in INTEGER_COLUMNS else field
+        for column, field in zip(columns, fields, strict=True)
+    }
+
+
+def cli_main():
+    parser = ArgumentParser(description='Look up decisions and PM5 codons in a remote cloud-optimised release')
+    parser.add_argument('-r', help='URL or path of the release folder, written by cloud_release.py', required=True)
+    parser.add_argument(
+        'queries',
+        help='contig:position:ref:alt or contig:start-end queries, e.g. chr1:12345:A:G',
+        nargs='*',
+    )
+    parser.add_argument('--pm5', help='transcript:codon queries, e.g. ENST00000338591:561', nargs='*', default=[])
+    parser.add_argument('--cache', help='decompressed blocks to cache', type=int, default=CACHE_BLOCKS)
+    args = parser.parse_args()
+
+    main(location=args.r, queries=args.queries, codons=args.pm5, cache_blocks=args.cache)
+
+
+def main(location: str, queries: list[str], codons: list[str], cache_blocks: int = CACHE_BLOCKS):
+    """
+    Answer variant, region, and codon queries, writing each matching row as TSV
+
+    Args:
+        location (str): URL or path of the release folder
+        queries (list[str]): contig:position:ref:alt or contig:start-end queries
+        codons (list[str]): transcript:codon queries
+        cache_blocks (int): decompressed blocks to cache
+    """
+
+    release = RemoteRelease(location, cache_blocks=cache_blocks)
+    for query in queries:
+        parsed = parse_variant(query)
+        rows = release.lookup(*parsed) if len(parsed) == 4 else release.region(*parsed)  # noqa: PLR2004
+        sys.stdout.writelines('\t'.join(map(str, row.values())) + '\n' for row in rows)
+    for query in codons:
+        rows = release.codon(*parse_codon(query))
+        sys.stdout.writelines('\t'.join(map(str, row.values())) + '\n' for row in rows)
+
+    logger.info(f'{release.requests} requests, {release.bytes_fetched} bytes fetched')
+
+
+if __name__ == '__main__':
+    cli_main()
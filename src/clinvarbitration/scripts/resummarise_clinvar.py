@@ -13,12 +13,13 @@ relevant fields:
 10. Submitter
 
 variant_summary.txt
- - links clinvar AlleleID, Variant ID, position and alleles
+ - links clinvar AlleleID, Variant ID, dbSNP rsID, position, alleles, and genes
 
 These need to be localised prior to running this script.
 """
 
 import gzip
+import json
 import re
 import zoneinfo
 from argparse import ArgumentParser
@@ -27,12 +28,21 @@ from collections.abc import Generator
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
+from os import makedirs
+from os.path import basename, join
 
 import pandas as pd
 from loguru import logger
 
 import hail as hl
 
+from clinvarbitration.scripts.checksums import checksum_path
+from clinvarbitration.scripts.decisions_index import DecisionIndex
+from clinvarbitration.scripts.gene_index import GeneIndex
+from clinvarbitration.scripts.identifier_index import IdentifierIndex
+from clinvarbitration.scripts.parquet_output import write_decisions_parquet
+from clinvarbitration.scripts.tabix import write_indexed_tsv
+
 ASSEMBLY = 'Assembly'
 GRCH37 = 'GRCh37'
 GRCH38 = 'GRCh38'
@@ -110,6 +120,9 @@ def get_allele_locus_map(summary_file: str, assembly: str) -> dict:
      - links the allele ID, Locus/Alleles, and variant ID
     relevant fields:
     0 AlleleID
+    3 GeneID
+    4 GeneSymbol
+    9 RS# (dbSNP)
     20 Chromosome
     30 VariationID
     31 Start
@@ -166,11 +179,23 @@ def get_allele_locus_map(summary_file: str, assembly: str) -> dict:
                 'pos': pos,
                 'ref': ref,
                 'alt': alt,
+                'genes': gene_symbols(line['GeneSymbol']),
+                'rsid': rsid_number(line['RS# (dbSNP)']),
             }
 
     return allele_dict
 
 
+def gene_symbols(symbols: str) -> list[str]:
+    """The genes in a variant_summary GeneSymbol field, ';'-delimited where a variant spans overlapping genes."""
+    return [symbol for symbol in symbols.split(';') if symbol and symbol != '-']
+
+
+def rsid_number(rsid: str) -> int:
+    """The number of a variant_summary RS# (dbSNP) field, which is -1 where the variant has no rsID."""
+    return int(rsid) if rsid.isdigit() else -1
+
+
 def dicts_from_gzip(filename: str) -> Generator[dict[str, str], None, None]:
     """
     generator for gzip reading
@@ -408,8 +433,11 @@ def sort_decisions(all_subs: list[dict], assembly: str) -> list[dict]:
     return sorted(all_subs, key=lambda x: (ORDERED_CONTIGS[assembly].index(x['contig']), x['position']))
 
 
-def parse_into_table(tsv_path: str, out_path: str) -> hl.Table:
-    """Takes the file of one clinvar variant per line, processes that line into a table."""
+def parse_into_table(tsv_path: str, out_path: str, blacklist: set[str] | None = None) -> hl.Table:
+    """
+    Takes the file of one clinvar variant per line, processes that line into a table.
+    The blacklisted submitters (by default, BLACKLIST) are recorded in the table's globals.
+    """
 
     ht = hl.import_table(tsv_path, types={'position': hl.tint32, 'gold_stars': hl.tint32, 'allele_id': hl.tint32})
 
@@ -423,7 +451,7 @@ def parse_into_table(tsv_path: str, out_path: str) -> hl.Table:
 
     ht = ht.annotate_globals(
         creation_date=datetime.now(tz=TIMEZONE).strftime('%Y-%m-%d'),
-        blacklist=sorted(BLACKLIST) or ['no blacklisted sites'],
+        blacklist=sorted(BLACKLIST if blacklist is None else blacklist) or ['no blacklisted sites'],
     )
 
     # write out to the specified location
@@ -464,31 +492,154 @@ def write_vcf(clinvar_table: hl.Table, output_vcf: str, pm5_filter: bool = True)
     logger.info(f'Wrote VCF to {output_vcf}')
 
 
-def write_dicts_as_tsv(dicts: list[dict], output_path: str):
+def decision_columns(decisions: list[dict]) -> dict[str, list]:
+    """The decisions as typed columns, in TSV_KEYS order, collected in a single pass over the decisions."""
+    columns: dict[str, list] = {key: [] for key in TSV_KEYS}
+    contigs, positions, refs, alts, significance, stars, allele_ids = columns.values()
+    for decision in decisions:
+        contigs.append(decision['contig'])
+        positions.append(decision['position'])
+        ref, alt = decision['alleles']
+        refs.append(ref)
+        alts.append(alt)
+        significance.append(decision['clinical_significance'])
+        stars.append(decision['gold_stars'])
+        allele_ids.append(decision['allele_id'])
+    return columns
+
+
+def write_decisions_tsv(decisions: list[dict], output_path: str):
     """
-    Writes a list of dictionaries to a TSV file, with headers.
+    Writes the sorted decisions as a BGZF-compressed TSV with headers, and a tabix index at {output_path}.tbi
+
     Args:
-        dicts (list[dict]): List of dictionaries to write.
-        output_path (str): Path to write the TSV file.
+        decisions (list[dict]): decisions sorted on contig & position
+        output_path (str): path to write the TSV, conventionally ending .tsv.bgz
     """
 
-    if not dicts:
+    if not decisions:
         logger.warning('No data to write to TSV.')
         raise ValueError('No ClinVar decisions present.')
 
-    logger.info(f'Writing {len(dicts)} entries to TSV at {output_path}')
-    with open(output_path, 'w', encoding='utf-8') as tsv_file:
-        # Write header
-        tsv_file.write('\t'.join(TSV_KEYS) + '\n')
+    logger.info(f'Writing {len(decisions)} entries to TSV at {output_path}')
+    write_indexed_tsv(output_path, decision_columns(decisions))
+
+
+def write_decision_index(decisions: list[dict], index_path: str, assembly: str):
+    """Writes the memory-mappable decisions index, see decisions_index.py."""
+    DecisionIndex.from_decisions(
+        decisions,
+        contigs=ORDERED_CONTIGS[assembly],
+        significance=[consequence.value for consequence in Consequence],
+    ).write(index_path)
+
+
+def write_gene_index(decisions: list[dict], index_path: str, assembly: str):
+    """Writes the memory-mappable index of the decisions in each gene, see gene_index.py."""
+    GeneIndex.from_decisions(
+        decisions,
+        contigs=ORDERED_CONTIGS[assembly],
+        significance=[consequence.value for consequence in Consequence],
+    ).write(index_path)
+
+
+def write_identifier_index(decisions: list[dict], index_path: str, assembly: str):
+    """Writes the memory-mappable index of the decisions by AlleleID, VariationID & rsID, see identifier_index.py."""
+    IdentifierIndex.from_decisions(
+        decisions,
+        contigs=ORDERED_CONTIGS[assembly],
+        significance=[consequence.value for consequence in Consequence],
+    ).write(index_path)
+
+
+def is_pm5_candidate(decision: dict) -> bool:
+    """Mirrors the pm5_filter in write_vcf - Pathogenic SNVs, excluding chrM."""
+    ref, alt = decision['alleles']
+    return (
+        len(ref) == 1
+        and len(alt) == 1
+        and decision['clinical_significance'] == Consequence.PATHOGENIC.value
+        and decision['contig'] != 'chrM'
+    )
+
+
+def write_contig_shards(decisions: list[dict], ht: hl.Table, output_root: str, assembly: str) -> str:
+    """
+    Writes per-contig shards of each output, alongside a manifest describing them. For each contig with decisions:
+        - a tabix-indexed TSV of all decisions on the contig
+        - a Hail Table of all decisions on the contig
+        - a tabix-indexed VCF of the Pathogenic SNVs on the contig (if there are any)
+
+    The manifest records each shard path (relative to the manifest), row counts, and md5 checksums
+
+    Args:
+        decisions (list[dict]): all decisions, sorted by contig & position
+        ht (hl.Table): the Hail Table of all decisions
+        output_root (str): output root for the whole run, the shards are written to {output_root}.shards/
+        assembly (str): genome build, used to order the contigs
+
+    Returns:
+        the path to the manifest file
+    """
+
+    shard_dir = f'{output_root}.shards'
+    makedirs(shard_dir, exist_ok=True)
+    prefix = basename(output_root)
+
+    decisions_by_contig: dict[str, list[dict]] = defaultdict(list)
+    for decision in decisions:
+        decisions_by_contig[decision['contig']].append(decision)
+
+    shards = []
+    for contig in ORDERED_CONTIGS[assembly]:
+        if not (contig_decisions := decisions_by_contig.get(contig)):
+            continue
+
+        shard_root = join(shard_dir, f'{prefix}.{contig}')
+        write_decisions_tsv(contig_decisions, output_path=f'{shard_root}.tsv.bgz')
 
-        # Write each dictionary as a row
-        for each_dict in dicts:
-            ref, alt = each_dict['alleles']
-            each_dict['reference'] = ref
-            each_dict['alternate'] = alt
-            tsv_file.write('\t'.join(str(each_dict[key]) for key in TSV_KEYS) + '\n')
+        # the table is keyed on locus, so this is an index lookup rather than a full scan
+        contig_ht = hl.filter_intervals(ht, [hl.parse_locus_interval(contig, reference_genome=assembly)])
+        contig_ht.write(f'{shard_root}.ht', overwrite=True)
 
-    logger.info(f'Wrote TSV to {output_path}')
+        shard = {
+            'contig': contig,
+            'rows': len(contig_decisions),
+            'tsv': {
+                'path': f'{prefix}.{contig}.tsv.bgz',
+                'index': f'{prefix}.{contig}.tsv.bgz.tbi',
+                'md5': checksum_path(f'{shard_root}.tsv.bgz'),
+            },
+            'ht': {'path': f'{prefix}.{contig}.ht', 'md5': checksum_path(f'{shard_root}.ht')},
+        }
+
+        if pm5_rows := sum(is_pm5_candidate(decision) for decision in contig_decisions):
+            write_vcf(contig_ht, f'{shard_root}.vcf.bgz')
+            shard['vcf'] = {
+                'path': f'{prefix}.{contig}.vcf.bgz',
+                'index': f'{prefix}.{contig}.vcf.bgz.tbi',
+                'rows': pm5_rows,
+                'md5': checksum_path(f'{shard_root}.vcf.bgz'),
+            }
+
+        shards.append(shard)
+        logger.info(f'Wrote {len(contig_decisions)} decisions to {contig} shards')
+
+    manifest_path = join(shard_dir, 'manifest.json')
+    with open(manifest_path, 'w', encoding='utf-8') as handle:
+        json.dump(
+            {
+                'assembly': assembly,
+                'creation_date': datetime.now(tz=TIMEZONE).strftime('%Y-%m-%d'),
+                'rows': len(decisions),
+                'shards': shards,
+            },
+            handle,
+            indent=2,
+        )
+
+    logger.info(f'Wrote shard manifest to {manifest_path}')
+    return manifest_path
 
 
 def cli_main():
@@ -505,7 +656,7 @@ def cli_main():
     )
     parser.add_argument(
         '-o',
-        help='output root, for table, tsv, and pathogenic-only VCF',
+        help='output root, for table, tsv, index, and pathogenic-only VCF',
         default=True,
     )
     parser.add_argument(
@@ -525,6 +676,16 @@ def cli_main():
         help='if provided, write a VCF containing all entries',
         default=None,
     )
+    parser.add_argument(
+        '--shards',
+        help='if set, also write per-contig shards of each output, with a manifest',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--parquet',
+        help='if set, also write the decisions as Parquet, with one row group per contig (requires pyarrow)',
+        action='store_true',
+    )
 
     args = parser.parse_args()
 
@@ -533,38 +694,51 @@ def cli_main():
     if args.b:
         BLACKLIST.update(args.b)
 
-    main(subs=args.s, variants=args.v, output_root=args.o, assembly=args.assembly, all_vcf=args.all_vcf)
+    main(
+        subs=args.s,
+        variants=args.v,
+        output_root=args.o,
+        assembly=args.assembly,
+        all_vcf=args.all_vcf,
+        shards=args.shards,
+        parquet=args.parquet,
+    )
 
 
-def main(subs: str, variants: str, output_root: str, assembly: str, all_vcf: str | None = None):
-    """Parse all ClinVar submissions, and re-summarise with new algorithm."""
-    logger.info('Getting alleleID-VariantID-Loci from variant summary')
-    allele_map = get_allele_locus_map(variants, assembly)
+def decide(submissions: list[Submission]) -> tuple[Consequence, int]:
+    """
+    The aggregate rating & gold stars of one variant's submissions
 
-    logger.info('Getting all decisions, indexed on clinvar Var ID')
+    Args:
+        submissions (list[Submission]): every retained submission for the variant
 
-    # the raw IDs - some have ambiguous X/Y mappings
-    all_uniq_ids = {x['var_id'] for x in allele_map.values()}
-    decision_dict = get_all_decisions(submission_file=subs, var_ids=all_uniq_ids)
+    Returns:
+        the Consequence and number of gold stars
+    """
 
-    # placeholder to fill wth per-allele decisions
-    all_decisions = {}
+    # filter against ACMG date, if appropriate
+    filtered_submissions = acmg_filter_submissions(submissions)
 
-    # now filter each set of decisions per allele
-    for var_id, submissions in decision_dict.items():
-        # filter against ACMG date, if appropriate
-        filtered_submissions = acmg_filter_submissions(submissions)
+    # obtain an aggregate rating
+    rating = Consequence.UNCERTAIN if not filtered_submissions else consequence_decision(filtered_submissions)
 
-        # obtain an aggregate rating
-        rating = Consequence.UNCERTAIN if not filtered_submissions else consequence_decision(filtered_submissions)
+    # assess stars in remaining entries
+    return rating, check_stars(filtered_submissions)
 
-        # assess stars in remaining entries
-        stars = check_stars(filtered_submissions)
 
-        all_decisions[var_id] = (rating, stars)
+def match_decisions(allele_map: dict, all_decisions: dict[int, tuple[Consequence, int]], assembly: str) -> list[dict]:
+    """
+    Matches the per-VariationID decisions up with the variant coordinates
+
+    Args:
+        allele_map (dict): the variant details, from get_allele_locus_map
+        all_decisions (dict[int, tuple[Consequence, int]]): the rating & stars of each VariationID
+        assembly (str): genome build, used to order the contigs
+
+    Returns:
+        one dictionary per decision, sorted on contig & position
+    """
 
-    # now match those up with the variant coordinates
-    logger.info('Matching decisions to variant coordinates')
     complete_decisions = []
     for var_details in allele_map.values():
         var_id = var_details['var_id']
@@ -582,21 +756,88 @@ def main(subs: str, variants: str, output_root: str, assembly: str, all_vcf: str
                 'clinical_significance': all_decisions[var_id][0].value,
                 'gold_stars': all_decisions[var_details['var_id']][1],
                 'allele_id': var_details['allele'],
+                'genes': var_details['genes'],
+                'variation_id': var_id,
+                'rsid': var_details['rsid'],
             },
         )
 
     logger.info(f'{len(complete_decisions)} ClinVar entries remain')
 
     # sort all collected decisions, trying to reduce overhead in HT later
-    complete_decisions_sorted = sort_decisions(complete_decisions, assembly=assembly)
+    return sort_decisions(complete_decisions, assembly=assembly)
 
-    tsv_path = f'{output_root}.tsv'
-    write_dicts_as_tsv(complete_decisions_sorted, output_path=tsv_path)
 
-    hl.context.init_spark(master='local[*]')
-    hl.default_reference(assembly)
+def generate_decisions(subs: str, variants: str, assembly: str) -> list[dict]:
+    """
+    Parse all ClinVar submissions, and re-summarise with new algorithm. Nothing is written to disk.
+
+    Args:
+        subs (str): submission_summary.txt.gz from NCBI
+        variants (str): variant_summary.txt.gz from NCBI
+        assembly (str): genome build to use
+
+    Returns:
+        one dictionary per decision, sorted on contig & position
+    """
+    logger.info('Getting alleleID-VariantID-Loci from variant summary')
+    allele_map = get_allele_locus_map(variants, assembly)
+
+    logger.info('Getting all decisions, indexed on clinvar Var ID')
+
+    # the raw IDs - some have ambiguous X/Y mappings
+    all_uniq_ids = {x['var_id'] for x in allele_map.values()}
+    decision_dict = get_all_decisions(submission_file=subs, var_ids=all_uniq_ids)
+
+    # now filter each set of decisions per allele
+    all_decisions = {var_id: decide(submissions) for var_id, submissions in decision_dict.items()}
+
+    # now match those up with the variant coordinates
+    logger.info('Matching decisions to variant coordinates')
+    return match_decisions(allele_map, all_decisions, assembly=assembly)
+
+
+def write_outputs(
+    decisions: list[dict],
+    output_root: str,
+    assembly: str,
+    all_vcf: str | None = None,
+    shards: bool = False,
+    parquet: bool = False,
+    blacklist: set[str] | None = None,
+):
+    """
+    Writes every output for one set of decisions: the TSV, binary indexes, Hail Table, and Pathogenic SNV VCF.
+    Hail must already be initialised.
+
+    Args:
+        decisions (list[dict]): all decisions, sorted by contig & position
+        output_root (str): output root, each output path is this with a suffix
+        assembly (str): genome build to use
+        all_vcf (str | None): if provided, write a VCF containing all entries
+        shards (bool): if True, also write per-contig shards of each output, with a manifest
+        parquet (bool): if True, also write the decisions as Parquet
+        blacklist (set[str] | None): the submitters excluded from these decisions, if not BLACKLIST
+    """
+
+    tsv_path = f'{output_root}.tsv.bgz'
+    write_decisions_tsv(decisions, output_path=tsv_path)
+
+    # a compact binary index of the decisions, for point & range lookups without Hail
+    write_decision_index(decisions, index_path=f'{output_root}.idx', assembly=assembly)
+    write_gene_index(decisions, index_path=f'{output_root}.genes.idx', assembly=assembly)
+    write_identifier_index(decisions, index_path=f'{output_root}.ids.idx', assembly=assembly)
+
+    if parquet:
+        write_decisions_parquet(
+            decisions,
+            parquet_path=f'{output_root}.parquet',
+            contigs=ORDERED_CONTIGS[assembly],
+            assembly=assembly,
+        )
+
     ht_output = f'{output_root}.ht'
-    ht = parse_into_table(tsv_path=tsv_path, out_path=ht_output)
+    ht = parse_into_table(tsv_path=tsv_path, out_path=ht_output, blacklist=blacklist)
 
     # write a VCF containing all variants, not just pathogenic SNV (Echtvar use case)
     if all_vcf:
@@ -607,6 +848,34 @@ def main(subs: str, variants: str, output_root: str, assembly: str, all_vcf: str
     logger.info(f'Writing out Pathogenic SNV VCF to {vcf_output}')
     write_vcf(ht, vcf_output)
 
+    if shards:
+        write_contig_shards(decisions, ht=ht, output_root=output_root, assembly=assembly)
+
+
+def main(
+    subs: str,
+    variants: str,
+    output_root: str,
+    assembly: str,
+    all_vcf: str | None = None,
+    shards: bool = False,
+    parquet: bool = False,
+):
+    """Parse all ClinVar submissions, and re-summarise with new algorithm."""
+
+    complete_decisions_sorted = generate_decisions(subs=subs, variants=variants, assembly=assembly)
+
+    hl.context.init_spark(master='local[*]')
+    hl.default_reference(assembly)
+    write_outputs(
+        complete_decisions_sorted,
+        output_root=output_root,
+        assembly=assembly,
+        all_vcf=all_vcf,
+        shards=shards,
+        parquet=parquet,
+    )
+
 
 if __name__ == '__main__':
     cli_main()
@@ -0,0 +1,449 @@
+"""
+A small asyncio HTTP service answering decision and PM5 lookups from a loaded release, so tools querying one variant
+at a time don't each reload the data
+
+The release (clinvar_decisions.release.tar.gz, or a directory holding its contents) is loaded once, as the
+memory-mapped decisions index (clinvar_decisions.idx) and PM5 index (clinvar_decisions.pm5.idx), and the identifier
+index (clinvar_decisions.ids.idx) if the release has one. Endpoints:
+
+- POST /variants {"variants": ["chr1:12345:A:G", ...]}: the decisions for each variant
+- POST /pm5 {"queries": ["ENST00000338591:561", ...]}: the Pathogenic missense alleles at each codon
+- POST /identifiers {"queries": ["AlleleID:15041", "VariationID:17661", "rs80357906", ...]}: the decisions for each
+  ClinVar AlleleID, VariationID, or dbSNP rsID
+- GET /variants?q=chr1:12345:A:G, GET /pm5?q=ENST00000338591:561 & GET /identifiers?q=rs80357906: the same, for
+  single queries
+- GET /stats: request counts, cache hit rates, and latency percentiles per endpoint
+- GET /health: the loaded release
+
+Queries from all concurrent requests are coalesced: each query waits on the loop's next tick, and everything queued
+by then is answered in one vectorised lookup, with duplicate queries sharing a single result. If that lookup fails,
+each query is looked up on its own, so only the requests holding a failing query fail. Results are held in an LRU
+cache, which is cleared whenever the release is reloaded.
+
+If the release is a tarball, it's checked for changes every --poll seconds. A new tarball is loaded in a thread, then
+swapped in, so requests are never answered from a partially loaded release.
+
+python -m clinvarbitration.scripts.serve --release clinvar_decisions.release.tar.gz --port 8080
+"""
+
+import asyncio
+import json
+import os
+import tarfile
+import tempfile
+import time
+from argparse import ArgumentParser
+from collections import defaultdict, deque
+from collections.abc import Callable, Hashable
+from os.path import basename, isdir, isfile, join
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+from loguru import logger
+
+from clinvarbitration.scripts.decisions_index import DecisionIndex
+from clinvarbitration.scripts.decisions_index import parse_query as parse_variant
+from clinvarbitration.scripts.identifier_index import IdentifierIndex
+from clinvarbitration.scripts.identifier_index import parse_query as parse_identifier
+from clinvarbitration.scripts.lru_cache import LruCache
+from clinvarbitration.scripts.pm5_index import Pm5Index
+from clinvarbitration.scripts.pm5_index import parse_query as parse_codon
+
+DECISIONS_INDEX = 'clinvar_decisions.idx'
+PM5_INDEX = 'clinvar_decisions.pm5.idx'
+# optional, releases from before the identifier index was added don't have one
+IDENTIFIER_INDEX = 'clinvar_decisions.ids.idx'
+
+# the number of recent request latencies kept per endpoint, for percentiles
+LATENCY_WINDOW = 10000
+PERCENTILES = [50, 90, 99, 99.9]
+
+# requests with more queries than this are rejected
+MAX_QUERIES = 100000
+MAX_BODY = 64 * 1024 * 1024
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large'}
+
+
+class RequestError(Exception):
+    """An invalid request, reported to the client with this HTTP status."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Release:
+    """The decisions, PM5 & identifier indexes from one release, extracted from the tarball if required."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.signature = release_signature(path)
+        self._temp_dir: tempfile.TemporaryDirectory | None = None
+
+        if isdir(path):
+            folder = join(path, 'clinvarbitration_data') if isdir(join(path, 'clinvarbitration_data')) else path
+        else:
+            self._temp_dir = tempfile.TemporaryDirectory(prefix='clinvarbitration_')
+            folder = self._temp_dir.name
+            extract_indexes(path, folder)
+
+        self.decisions = DecisionIndex.load(join(folder, DECISIONS_INDEX))
+        self.pm5 = Pm5Index.load(join(folder, PM5_INDEX))
+        identifier_path = join(folder, IDENTIFIER_INDEX)
+        self.identifiers = IdentifierIndex.load(identifier_path) if isfile(identifier_path) else None
+        self.loaded = time.strftime('%Y-%m-%dT%H:%M:%S')
+        logger.info(f'Loaded release {path}: {len(self.decisions)} decisions, {len(self.pm5)} PM5 codons')
+
+    def close(self):
+        """Removes the extracted files, the memory-mapped arrays stay readable until they're released."""
+        if self._temp_dir:
+            self._temp_dir.cleanup()
+
+    def lookup_variants(self, queries: list[tuple[str, int, str, str]]) -> list[list[dict]]:
+        starts, ends = self.decisions.lookup_many(*(list(column) for column in zip(*queries, strict=True)))
+        return [
+            [
+                {'clinical_significance': significance, 'gold_stars': stars, 'allele_id': allele_id}
+                for significance, stars, allele_id in self.decisions.records(start, end)
+            ]
+            for start, end in zip(starts.tolist(), ends.tolist(), strict=True)
+        ]
+
+    def lookup_codons(self, queries: list[tuple[str, int]]) -> list[list[dict]]:
+        starts, ends = self.pm5.lookup_many([tx for tx, _codon in queries], [codon for _tx, codon in queries])
+        return [
+            [{'allele_id': allele_id, 'gold_stars': stars} for allele_id, stars in self.pm5.alleles(start, end)]
+            for start, end in zip(starts.tolist(), ends.tolist(), strict=True)
+        ]
+
+    def lookup_identifiers(self, queries: list[tuple[str, int]]) -> list[list[dict]]:
+        answers: list[list[dict]] = [[] for _query in queries]
+        if self.identifiers is None:
+            return answers
+        # one vectorised search per identifier type
+        positions = defaultdict(list)
+        for position, (identifier, _value) in enumerate(queries):
+            positions[identifier].append(position)
+        for identifier, indices in positions.items():
+            records = self.identifiers.arrays[f'{identifier}_records']
+            starts, ends = self.identifiers.lookup_many(identifier, (queries[index][1] for index in indices))
+            for index, start, end in zip(indices, starts.tolist(), ends.tolist(), strict=True):
+                answers[index] = [
+                    {
+                        'variant': f'{contig}:{position}:{ref}:{alt}',
+                        'clinical_significance': significance,
+                        'gold_stars': stars,
+                        'allele_id': allele_id,
+                    }
+                    # the records matching one identifier are stored ascending, i.e. in genomic order
+                    for contig, position, ref, alt, significance, stars, allele_id in self.identifiers.records(
+                        records[start:end],
+                    )
+                ]
+        return answers
+
+
+def release_signature(path: str) -> tuple[int, int] | None:
+    """Modification time & size of a release tarball, used to spot a new release. Directories aren't watched."""
+    if not isfile(path):
+        return None
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def extract_indexes(tarball: str, folder: str):
+    """Copies only the index files out of a release tarball, whatever their path within it."""
+    wanted = {DECISIONS_INDEX, PM5_INDEX}
+    optional = {IDENTIFIER_INDEX}
+    with tarfile.open(tarball) as archive:
+        for member in archive:
+            name = basename(member.name)
+            if not member.isfile() or name not in wanted | optional:
+                continue
+            # read through extractfile rather than extracting, so member paths can't write outside the folder
+            with archive.extractfile(member) as source, open(join(folder, name), 'wb') as dest:  # type: ignore[union-attr]
+                while chunk := source.read(1024 * 1024):
+                    dest.write(chunk)
+            wanted.discard(name)
+            optional.discard(name)
+    if wanted:
+        raise ValueError(f'{tarball} does not contain {", ".join(sorted(wanted))}')
+
+
+class Coalescer:
+    """
+    Collects queries from concurrent requests, and answers them in one batch on the loop's next tick
+    A query already cached, or already waiting on a batch, doesn't start a new lookup
+    """
+
+    def __init__(self, lookup: Callable[[list], list], cache: LruCache):
+        self.lookup = lookup
+        self.cache = cache
+        self.pending: dict[Hashable, asyncio.Future] = {}
+        self.batches = 0
+
+    async def get_many(self, queries: list[Hashable]) -> list:
+        loop = asyncio.get_running_loop()
+        results: list = [None] * len(queries)
+        waiting = []
+        for index, query in enumerate(queries):
+            if (cached := self.cache.get(query)) is not None:
+                results[index] = cached
+                continue
+            if query not in self.pending:
+                if not self.pending:
+                    loop.call_soon(self.flush)
+                self.pending[query] = loop.create_future()
+            waiting.append((index, self.pending[query]))
+
+        for index, future in waiting:
+            results[index] = await future
+        return results
+
+    def flush(self):
+        """Answers every pending query in one lookup."""
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        self.batches += 1
+        queries = list(pending)
+        try:
+            answers = self.lookup(queries)
+        except Exception:  # noqa: BLE001
+            # one bad query mustn't fail the other requests in the batch, so each query is answered on its own
+            self.answer_each(pending)
+            return
+        for query, answer in zip(queries, answers, strict=True):
+            self.cache.put(query, answer)
+            pending[query].set_result(answer)
+
+    def answer_each(self, pending: dict[Hashable, asyncio.Future]):
+        """Answers each query in a separate lookup, failing only the requests waiting on a query which fails."""
+        for query, future in pending.items():
+            try:
+                [answer] = self.lookup([query])
+            except Exception as error:  # noqa: BLE001
+                future.set_exception(error)
+                continue
+            self.cache.put(query, answer)
+            future.set_result(answer)
+
+
+class LatencyTracker:
+    """Request counts, and the latencies of the most recent requests, per endpoint."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.latencies: dict[str, deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self.counts: dict[str, int] = defaultdict(int)
+
+    def record(self, endpoint: str, seconds: float):
+        self.latencies[endpoint].append(seconds)
+        self.counts[endpoint] += 1
+
+    def summary(self) -> dict[str, dict]:
+        summary = {}
+        for endpoint, latencies in self.latencies.items():
+            values = np.percentile(np.fromiter(latencies, dtype=np.float64), PERCENTILES) * 1000
+            summary[endpoint] = {
+                'requests': self.counts[endpoint],
+                **{
+                    f'p{percentile:g}_ms': round(value, 3)
+                    for percentile, value in zip(PERCENTILES, values.tolist(), strict=True)
+                },
+            }
+        return summary
+
+
+class LookupService:
+    """The request handling, independent of HTTP: parses queries, answers them, and tracks the release."""
+
+    def __init__(self, release_path: str, cache_size: int = 100000):
+        self.release_path = release_path
+        self.release = Release(release_path)
+        self.latency = LatencyTracker()
+        self.variant_cache = LruCache(cache_size)
+        self.codon_cache = LruCache(cache_size)
+        self.identifier_cache = LruCache(cache_size)
+        self.variants = Coalescer(lambda queries: self.release.lookup_variants(queries), self.variant_cache)
+        self.codons = Coalescer(lambda queries: self.release.lookup_codons(queries), self.codon_cache)
+        self.identifiers = Coalescer(
+            lambda queries: self.release.lookup_identifiers(queries),
+            self.identifier_cache,
+        )
+        self.reloads = 0
+
+    def swap_release(self, release: Release):
+        """Serves from a new release. Batches already under way keep the release they started with."""
+        old, self.release = self.release, release
+        self.variant_cache.clear()
+        self.codon_cache.clear()
+        self.identifier_cache.clear()
+        self.reloads += 1
+        old.close()
+
+    async def reload_if_changed(self) -> bool:
+        """Loads the release tarball in a thread if it has changed since it was loaded, then swaps it in."""
+        signature = release_signature(self.release_path)
+        if signature is None or signature == self.release.signature:
+            return False
+        logger.info(f'Release {self.release_path} has changed, reloading')
+        self.swap_release(await asyncio.to_thread(Release, self.release_path))
+        return True
+
+    async def watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload_if_changed()
+            except Exception as error:  # noqa: BLE001
+                logger.error(f'Failed to reload {self.release_path}, still serving the previous release: {error}')
+
+    async def handle(self, method: str, target: str, body: bytes) -> dict:
+        """Answers a request, returning the JSON response, or raising a RequestError."""
+
+        url = urlsplit(target)
+        if url.path == '/health':
+            return {'release': self.release.path, 'loaded': self.release.loaded, 'reloads': self.reloads}
+        if url.path == '/stats':
+            return {
+                'latency': self.latency.summary(),
+                'cache': {
+                    name: {'entries': len(cache.entries), 'hits': cache.hits, 'misses': cache.misses}
+                    for name, cache in (
+                        ('variants', self.variant_cache),
+                        ('pm5', self.codon_cache),
+                        ('identifiers', self.identifier_cache),
+                    )
+                },
+                'batches': {
+                    'variants': self.variants.batches,
+                    'pm5': self.codons.batches,
+                    'identifiers': self.identifiers.batches,
+                },
+            }
+        if url.path not in ('/variants', '/pm5', '/identifiers'):
+            raise RequestError(404, f'No endpoint {url.path}')
+
+        field = 'variants' if url.path == '/variants' else 'queries'
+        queries = request_queries(method, url.query, body, field)
+        try:
+            if url.path == '/variants':
+                parsed = [parse_variant(query) for query in queries]
+                if any(len(each) != 4 for each in parsed):  # noqa: PLR2004
+                    raise ValueError('Variant queries should be formatted as contig:position:ref:alt')
+                answers = await self.variants.get_many(parsed)
+                return {'results': [{'query': q, 'decisions': a} for q, a in zip(queries, answers, strict=True)]}
+            if url.path == '/identifiers':
+                if self.release.identifiers is None:
+                    raise RequestError(404, f'The release {self.release.path} has no identifier index')
+                answers = await self.identifiers.get_many([parse_identifier(query) for query in queries])
+                return {'results': [{'query': q, 'decisions': a} for q, a in zip(queries, answers, strict=True)]}
+            answers = await self.codons.get_many([parse_codon(query) for query in queries])
+            return {'results': [{'query': q, 'alleles': a} for q, a in zip(queries, answers, strict=True)]}
+        except ValueError as error:
+            raise RequestError(400, str(error)) from error
+
+
+def request_queries(method: str, query_string: str, body: bytes, field: str) -> list[str]:
+    """Queries from ?q= parameters on a GET, or a JSON body on a POST."""
+    if method == 'GET':
+        queries = parse_qs(query_string).get('q', [])
+    elif method == 'POST':
+        try:
+            queries = json.loads(body or b'{}').get(field, [])
+        except (ValueError, AttributeError) as error:
+            raise RequestError(400, f'Expected a JSON object with a "{field}" list') from error
+        if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+            raise RequestError(400, f'"{field}" should be a list of strings')
+    else:
+        raise RequestError(405, f'{method} is not supported')
+    if len(queries) > MAX_QUERIES:
+        raise RequestError(413, f'At most {MAX_QUERIES} queries per request')
+    return queries
+
+
+async def handle_connection(service: LookupService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Serves HTTP/1.1 requests on one connection, until the client closes it or asks to."""
+
+    try:
+        while request_line := await reader.readline():
+            start = time.perf_counter()
+            method, target, _version = request_line.decode('latin-1').split(' ', 2)
+
+            headers = {}
+            while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get('content-length', 0))
+            if length > MAX_BODY:
+                status, response = 413, {'error': f'Request bodies are limited to {MAX_BODY} bytes'}
+                headers['connection'] = 'close'
+            else:
+                body = await reader.readexactly(length) if length else b''
+                try:
+                    status, response = 200, await service.handle(method, target, body)
+                except RequestError as error:
+                    status, response = error.status, {'error': str(error)}
+
+            payload = json.dumps(response).encode()
+            close = headers.get('connection', '').lower() == 'close'
+            writer.write(
+                f'HTTP/1.1 {status} {STATUS_TEXT[status]}\r\nContent-Type: application/json\r\n'
+                f'Content-Length: {len(payload)}\r\nConnection: {"close" if close else "keep-alive"}\r\n\r\n'.encode()
+                + payload,
+            )
+            await writer.drain()
+            service.latency.record(urlsplit(target).path, time.perf_counter() - start)
+            if close:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+def cli_main():
+    parser = ArgumentParser(description='Serve ClinvArbitration decision, PM5 & identifier lookups over HTTP')
+    parser.add_argument(
+        '--release',
+        help='release tarball, or a directory containing the extracted release',
+        required=True,
+    )
+    parser.add_argument('--host', help='address to listen on', default='127.0.0.1')
+    parser.add_argument('--port', help='port to listen on', type=int, default=8080)
+    parser.add_argument('--cache', help='number of results to hold in each LRU cache', type=int, default=100000)
+    parser.add_argument('--poll', help='seconds between checks for a new release tarball', type=float, default=60)
+    args = parser.parse_args()
+
+    asyncio.run(main(release=args.release, host=args.host, port=args.port, cache_size=args.cache, poll=args.poll))
+
+
+async def main(release: str, host: str, port: int, cache_size: int = 100000, poll: float = 60):
+    """
+    Load the release, then serve lookups until interrupted
+
+    Args:
+        release (str): release tarball, or a directory containing the extracted release
+        host (str): address to listen on
+        port (int): port to listen on, 0 to pick a free port
+        cache_size (int): number of results to hold in each LRU cache
+        poll (float): seconds between checks for a changed release tarball
+    """
+
+    service = LookupService(release, cache_size=cache_size)
+    server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), host, port)
+    watcher = asyncio.create_task(service.watch(poll))
+    logger.info(f'Serving {release} on {", ".join(str(sock.getsockname()) for sock in server.sockets)}')
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        watcher.cancel()
+        service.release.close()
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -0,0 +1,284 @@
+"""
+Streams the re-summarised decisions straight through to a PM5 table, without intermediate files
+
+The usual process passes data between steps as files: decisions TSV -> HT -> VCF -> annotated VCF -> annotated TSV
+-> PM5 TSV. Here the Pathogenic SNV records are generated from the in-memory decisions, streamed into
+bcftools csq | bcftools +split-vep over pipes, and each missense row is consumed by the PM5 aggregator as it arrives.
+
+With --native, the in-process missense annotator (missense_annotator.py) is used in place of bcftools.
+
+Nothing is written to disk except the requested outputs:
+- always: the PM5 TSV, index, and Hail Table, {output_root}.pm5.tsv, {output_root}.pm5.idx & {output_root}.pm5.ht
+- optionally: the decisions TSV, index, and Hail Table, {output_root}.tsv.bgz, {output_root}.idx & {output_root}.ht
+- optionally: the PS1 TSV and Hail Table, {output_root}.ps1.tsv & {output_root}.ps1.ht
+- optionally: Parquet copies of each table, {output_root}.parquet, {output_root}.pm5.parquet & {output_root}.ps1.parquet
+- optionally: the annotated missense TSV, as it streams past
+"""
+
+import os
+from argparse import ArgumentParser
+from collections.abc import Generator, Iterable
+
+from loguru import logger
+
+import hail as hl
+
+from clinvarbitration.scripts.annotate_snvs import stream_annotations
+from clinvarbitration.scripts.annotation_cache import AnnotationCache, annotate_with_cache, miss_annotator
+from clinvarbitration.scripts.clinvar_by_codon import (
+    CodonAggregator,
+    write_hail_table,
+    write_results_as_tsv,
+)
+from clinvarbitration.scripts.missense_annotator import MissenseAnnotator, annotate_in_parallel
+from clinvarbitration.scripts.parquet_output import write_codon_index_parquet, write_decisions_parquet
+from clinvarbitration.scripts.pm5_index import Pm5Index
+from clinvarbitration.scripts.resummarise_clinvar import (
+    BLACKLIST,
+    GRCH37,
+    GRCH38,
+    ORDERED_CONTIGS,
+    generate_decisions,
+    is_pm5_candidate,
+    parse_into_table,
+    write_decision_index,
+    write_decisions_tsv,
+    write_gene_index,
+    write_identifier_index,
+)
+
+VCF_HEADER = [
+    '##fileformat=VCFv4.2',
+    '##INFO=<ID=allele_id,Number=1,Type=Integer,Description="ClinVar AlleleID">',
+    '##INFO=<ID=gold_stars,Number=1,Type=Integer,Description="ClinvArbitration gold stars">',
+    '##INFO=<ID=clinical_significance,Number=1,Type=String,Description="ClinvArbitration decision">',
+]
+
+
+def pm5_vcf_lines(decisions: Iterable[dict], assembly: str) -> Generator[str, None, None]:
+    """
+    Generates VCF lines for all Pathogenic SNVs in the decisions, matching the content of the PM5 VCF from write_vcf
+
+    Args:
+        decisions (Iterable[dict]): decisions, sorted on contig & position
+        assembly (str): genome build, used to populate the contig header lines
+
+    Returns:
+        generator of newline-terminated VCF lines, header first
+    """
+
+    for line in VCF_HEADER:
+        yield f'{line}\n'
+    for contig in ORDERED_CONTIGS[assembly]:
+        yield f'##contig=<ID={contig}>\n'
+    yield '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n'
+
+    for decision in decisions:
+        if not is_pm5_candidate(decision):
+            continue
+        ref, alt = decision['alleles']
+        yield (
+            f'{decision["contig"]}\t{decision["position"]}\t.\t{ref}\t{alt}\t.\t.\t'
+            f'allele_id={decision["allele_id"]};gold_stars={decision["gold_stars"]};'
+            f'clinical_significance={decision["clinical_significance"]}\n'
+        )
+
+
+def pm5_records(decisions: Iterable[dict]) -> Generator[tuple, None, None]:
+    """The Pathogenic SNVs as (contig, position, ref, alt, allele ID, gold stars), for the native annotator."""
+    for decision in decisions:
+        if is_pm5_candidate(decision):
+            ref, alt = decision['alleles']
+            yield decision['contig'], decision['position'], ref, alt, decision['allele_id'], decision['gold_stars']
+
+
+def tee_rows(rows: Iterable[str], output_path: str) -> Generator[str, None, None]:
+    """Writes each row to a file as it passes through, without holding the stream up."""
+    with open(output_path, 'w', encoding='utf-8') as handle:
+        for row in rows:
+            handle.write(row)
+            yield row
+    logger.info(f'Wrote annotated rows to {output_path}')
+
+
+def cli_main():
+    parser = ArgumentParser(description='Re-summarises ClinVar, and streams the Pathogenic SNVs into a PM5 table')
+    parser.add_argument('-s', help='submission_summary.txt.gz from NCBI', required=True)
+    parser.add_argument('-v', help='variant_summary.txt.gz from NCBI', required=True)
+    parser.add_argument('-f', help='reference genome FASTA', required=True)
+    parser.add_argument('-g', help='GFF3 gene models', required=True)
+    parser.add_argument('-o', help='output root, for all outputs', required=True)
+    parser.add_argument('-b', help='sites to blacklist', nargs='+', default=[])
+    parser.add_argument('--assembly', help='genome build to use', default=GRCH38, choices=[GRCH37, GRCH38])
+    parser.add_argument(
+        '--decisions',
+        help='if set, also write the decisions TSV, index, and Hail Table',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--native',
+        help='annotate with the in-process missense annotator instead of bcftools csq',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--threads',
+        help='number of processes for the native annotator, defaults to the number of CPUs',
+        type=int,
+        default=os.cpu_count() or 1,
+    )
+    parser.add_argument(
+        '--index',
+        help='compiled transcript index for the native annotator, defaults to a cached index alongside the GFF3',
+        default=None,
+    )
+    parser.add_argument(
+        '--cache',
+        help='SQLite annotation cache (annotation_cache.py), if provided only uncached SNVs are annotated',
+        default=None,
+    )
+    parser.add_argument(
+        '--structured',
+        help="also write each codon's alleles as an array of structs, with max_stars and n_alleles columns",
+        action='store_true',
+    )
+    parser.add_argument(
+        '--ps1',
+        help='if set, also write a PS1 index on (transcript, codon, alternate amino acid)',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--parquet',
+        help='if set, also write each table as Parquet (requires pyarrow)',
+        action='store_true',
+    )
+    parser.add_argument(
+        '--annotated',
+        help='if provided, also write the annotated missense TSV to this path',
+        default=None,
+    )
+    args = parser.parse_args()
+
+    if args.b:
+        BLACKLIST.update(args.b)
+
+    main(
+        subs=args.s,
+        variants=args.v,
+        ref_fa=args.f,
+        gff3=args.g,
+        output_root=args.o,
+        assembly=args.assembly,
+        decisions=args.decisions,
+        annotated=args.annotated,
+        native=args.native,
+        threads=args.threads,
+        index_path=args.index,
+        cache_path=args.cache,
+        structured=args.structured,
+        ps1=args.ps1,
+        parquet=args.parquet,
+    )
+
+
+def main(
+    subs: str,
+    variants: str,
+    ref_fa: str,
+    gff3: str,
+    output_root: str,
+    assembly: str,
+    decisions: bool = False,
+    annotated: str | None = None,
+    native: bool = False,
+    threads: int = 1,
+    index_path: str | None = None,
+    cache_path: str | None = None,
+    structured: bool = False,
+    ps1: bool = False,
+    parquet: bool = False,
+):
+    """
+    Re-summarise ClinVar, then stream the Pathogenic SNVs through annotation and into the PM5 aggregation
+
+    Args:
+        subs (str): submission_summary.txt.gz from NCBI
+        variants (str): variant_summary.txt.gz from NCBI
+        ref_fa (str): reference genome FASTA
+        gff3 (str): GFF3 gene models
+        output_root (str): root path for all outputs
+        assembly (str): genome build to use
+        decisions (bool): if True, also write the decisions TSV, decision & gene indexes, and Hail Table
+        annotated (str | None): if provided, also write the annotated missense rows here
+        native (bool): if True, use the in-process missense annotator instead of bcftools
+        threads (int): number of processes for the native annotator
+        index_path (str | None): compiled transcript index for the native annotator
+        cache_path (str | None): if provided, an annotation cache to re-use results from, and add new results to
+        structured (bool): if True, also write the PM5 alleles as structs, with max_stars and n_alleles
+        ps1 (bool): if True, also write the PS1 TSV & Hail Table, indexed on (transcript, codon, alternate amino acid)
+        parquet (bool): if True, also write each table as Parquet
+    """
+
+    all_decisions = generate_decisions(subs=subs, variants=variants, assembly=assembly)
+
+    hl.context.init_spark(master='local[*]')
+    hl.default_reference(assembly)
+
+    if decisions:
+        write_decisions_tsv(all_decisions, output_path=f'{output_root}.tsv.bgz')
+        write_decision_index(all_decisions, index_path=f'{output_root}.idx', assembly=assembly)
+        write_gene_index(all_decisions, index_path=f'{output_root}.genes.idx', assembly=assembly)
+        write_identifier_index(all_decisions, index_path=f'{output_root}.ids.idx', assembly=assembly)
+        if parquet:
+            write_decisions_parquet(
+                all_decisions,
+                parquet_path=f'{output_root}.parquet',
+                contigs=ORDERED_CONTIGS[assembly],
+                assembly=assembly,
+            )
+        parse_into_table(tsv_path=f'{output_root}.tsv.bgz', out_path=f'{output_root}.ht')
+
+    cache = None
+    if cache_path:
+        logger.info(f'Annotating uncached Pathogenic SNVs, using cache {cache_path}')
+        cache = AnnotationCache.from_files(cache_path, gff3=gff3, ref_fa=ref_fa)
+        annotate_misses = miss_annotator(
+            ref_fa=ref_fa,
+            gff3=gff3,
+            header=list(pm5_vcf_lines([], assembly=assembly)),
+            threads=threads,
+            native=native,
+            index_path=index_path,
+        )
+        rows = annotate_with_cache(pm5_records(all_decisions), cache=cache, annotate_misses=annotate_misses)
+    elif native:
+        logger.info('Annotating Pathogenic SNVs in-process')
+        annotator = MissenseAnnotator.from_files(gff3=gff3, ref_fa=ref_fa, index_path=index_path)
+        rows = annotate_in_parallel(pm5_records(all_decisions), annotator=annotator, threads=threads)
+    else:
+        logger.info('Streaming Pathogenic SNVs through bcftools csq')
+        rows = stream_annotations(pm5_vcf_lines(all_decisions, assembly=assembly), ref_fa=ref_fa, gff3=gff3)
+    if annotated:
+        rows = tee_rows(rows, annotated)
+
+    aggregator = CodonAggregator().add_rows(rows)
+    codon_index = aggregator.aggregate()
+    if cache:
+        cache.close()
+
+    pm5_tsv = f'{output_root}.pm5.tsv'
+    write_results_as_tsv(codon_index, pm5_tsv, structured=structured)
+    Pm5Index.from_codon_index(codon_index).write(f'{output_root}.pm5.idx')
+    write_hail_table(codon_index, table_path=f'{output_root}.pm5.ht', structured=structured)
+    if parquet:
+        write_codon_index_parquet(codon_index, f'{output_root}.pm5.parquet', structured=structured)
+
+    if ps1:
+        residue_index = aggregator.aggregate(by_residue=True)
+        write_results_as_tsv(residue_index, f'{output_root}.ps1.tsv', structured=structured)
+        write_hail_table(residue_index, table_path=f'{output_root}.ps1.ht', structured=structured)
+        if parquet:
+            write_codon_index_parquet(residue_index, f'{output_root}.ps1.parquet', structured=structured)
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -0,0 +1,388 @@
+"""
+Writes BGZF-compressed, tabix-indexed TSVs, and answers region queries from them without htslib
+
+write_indexed_tsv takes the table as typed columns, formats the rows in batches, compresses them in a thread pool (see
+bgzf.py), and builds the tabix index (.tbi) from the offsets of each row as it goes. The result is read by standard
+`tabix`, e.g. `tabix clinvar_decisions.tsv.bgz chr17:43044295-43125483`, or by this module:
+
+python -m clinvarbitration.scripts.tabix clinvar_decisions.tsv.bgz chr17:43044295-43125483 chrX
+"""
+
+import gzip
+import struct
+from argparse import ArgumentParser
+from collections.abc import Generator, Sequence
+from itertools import pairwise
+
+import numpy as np
+from loguru import logger
+
+from clinvarbitration.scripts.bgzf import THREADS, BgzfReader, BgzfWriter
+
+TBI_MAGIC = b'TBI\x01'
+
+# the binning scheme shared by tabix, BAI, and CSI (with the default min_shift & depth)
+MIN_SHIFT = 14
+BIN_LEVELS = ((26, 1), (23, 9), (20, 73), (17, 585), (14, 4681))
+MAX_POSITION = 1 << 29
+PSEUDO_BIN = 37450
+
+# the first line of the TSV is the header
+SKIP_LINES = 1
+META_CHAR = '#'
+
+ROWS_PER_BATCH = 100_000
+
+
+def reg2bin(beg: int, end: int) -> int:
+    """The smallest bin containing the 0-based, half-open interval [beg, end)."""
+    end -= 1
+    for shift, offset in reversed(BIN_LEVELS):
+        if beg >> shift == end >> shift:
+            return offset + (beg >> shift)
+    return 0
+
+
+def reg2bins(beg: int, end: int) -> list[int]:
+    """Every bin which could hold a record overlapping [beg, end)."""
+    end = min(end, MAX_POSITION) - 1
+    bins = [0]
+    for shift, offset in BIN_LEVELS:
+        bins.extend(range(offset + (beg >> shift), offset + (end >> shift) + 1))
+    return bins
+
+
+class TabixIndex:
+    """
+    The contents of a .tbi file, for one generic (not SAM or VCF) tab-delimited file
+
+    For each contig the bins are held as arrays, one entry per chunk, sorted on bin: the bin of each chunk, and the
+    (start, end) virtual offsets of each chunk
+    """
+
+    def __init__(
+        self,
+        names: list[str],
+        bins: list[tuple[np.ndarray, np.ndarray]],
+        linear: list[np.ndarray],
+        columns: tuple[int, int, int] = (1, 2, 2),
+        skip: int = SKIP_LINES,
+    ):
+        """
+        Args:
+            names (list[str]): the contig names, in file order
+            bins (list[tuple[np.ndarray, np.ndarray]]): for each contig, the bin of each chunk, and its virtual offsets
+            linear (list[np.ndarray]): for each contig, the lowest virtual offset of a record in each 16kbp window
+            columns (tuple[int, int, int]): the 1-based contig, start, and end columns
+            skip (int): the number of header lines
+        """
+        self.names = names
+        self.ids = {name: ref_id for ref_id, name in enumerate(names)}
+        self.bins = bins
+        self.linear = linear
+        self.columns = columns
+        self.skip = skip
+
+    @classmethod
+    def build(
+        cls,
+        contigs: Sequence[str],
+        starts: np.ndarray,
+        ends: np.ndarray,
+        virtual_offsets: np.ndarray,
+        columns: tuple[int, int, int] = (1, 2, 2),
+        skip: int = SKIP_LINES,
+    ) -> 'TabixIndex':
+        """
+        Indexes records sorted on contig & start
+
+        Args:
+            contigs (Sequence[str]): the contig of each record
+            starts (np.ndarray): the 0-based start of each record
+            ends (np.ndarray): the 0-based, exclusive end of each record
+            virtual_offsets (np.ndarray): the virtual offset of each record, plus one for the end of the last record
+            columns (tuple[int, int, int]): the 1-based contig, start, and end columns
+            skip (int): the number of header lines
+        """
+
+        names = list(dict.fromkeys(contigs))
+        ref_ids = dict(zip(names, range(len(names)), strict=True))
+        ids = np.fromiter(map(ref_ids.__getitem__, contigs), dtype=np.int64, count=len(contigs))
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.maximum(np.asarray(ends, dtype=np.int64), starts + 1)
+        virtual_offsets = np.asarray(virtual_offsets, dtype=np.uint64)
+
+        if np.any(np.diff(ids) < 0):
+            raise ValueError('Records must be grouped by contig to build a tabix index')
+        boundaries = np.searchsorted(ids, np.arange(len(names) + 1))
+        if any(np.any(np.diff(starts[lo:hi]) < 0) for lo, hi in pairwise(boundaries.tolist())):
+            raise ValueError('Records must be sorted on position within each contig to build a tabix index')
+
+        all_bins, all_linear = [], []
+        for lo, hi in pairwise(boundaries.tolist()):
+            all_bins.append(contig_bins(starts[lo:hi], ends[lo:hi], virtual_offsets[lo : hi + 1]))
+            all_linear.append(linear_index(starts[lo:hi], ends[lo:hi], virtual_offsets[lo:hi]))
+
+        return cls(names, all_bins, all_linear, columns=columns, skip=skip)
+
+    def write(self, path: str, threads: int = THREADS):
+        seq_col, beg_col, end_col = self.columns
+        names = b''.join(name.encode() + b'\0' for name in self.names)
+        parts = [
+            TBI_MAGIC,
+            struct.pack('<8i', len(self.names), 0, seq_col, beg_col, end_col, ord(META_CHAR), self.skip, len(names)),
+            names,
+        ]
+        for (bin_ids, chunks), linear in zip(self.bins, self.linear, strict=True):
+            parts.append(bin_records(bin_ids, chunks))
+            parts.append(struct.pack('<i', len(linear)))
+            parts.append(linear.astype('<u8').tobytes())
+        parts.append(struct.pack('<Q', 0))
+
+        with BgzfWriter(path, threads=threads) as writer:
+            writer.write(b''.join(parts))
+
+    @classmethod
+    def load(cls, path: str) -> 'TabixIndex':
+        with gzip.open(path, 'rb') as handle:
+            data = handle.read()
+        if data[:4] != TBI_MAGIC:
+            raise ValueError(f'{path} is not a tabix index')
+
+        n_ref, _, seq_col, beg_col, end_col, _, skip, names_length = struct.unpack_from('<8i', data, 4)
+        offset = 36
+        names = data[offset : offset + names_length].split(b'\0')[:n_ref]
+        offset += names_length
+
+        all_bins, all_linear = [], []
+        for _ in range(n_ref):
+            (n_bin,) = struct.unpack_from('<i', data, offset)
+            offset += 4
+            bin_ids, chunks = [], []
+            for _ in range(n_bin):
+                bin_id, n_chunk = struct.unpack_from('<Ii', data, offset)
+                bin_ids.extend([bin_id] * n_chunk)
+                chunks.append(np.frombuffer(data, dtype='<u8', count=n_chunk * 2, offset=offset + 8))
+                offset += 8 + n_chunk * 16
+            all_bins.append(
+                (
+                    np.array(bin_ids, dtype=np.uint32),
+                    np.concatenate(chunks).reshape(-1, 2) if chunks else np.empty((0, 2), dtype=np.uint64),
+                ),
+            )
+            (n_intv,) = struct.unpack_from('<i', data, offset)
+            all_linear.append(np.frombuffer(data, dtype='<u8', count=n_intv, offset=offset + 4).astype(np.uint64))
+            offset += 4 + n_intv * 8
+
+        return cls([name.decode() for name in names], all_bins, all_linear, (seq_col, beg_col, end_col), skip)
+
+    def chunks(self, contig: str, beg: int, end: int) -> list[tuple[int, int]]:
+        """The merged ranges of virtual offsets which could hold records overlapping [beg, end) on this contig."""
+        if (ref_id := self.ids.get(contig)) is None:
+            return []
+
+        linear = self.linear[ref_id]
+        min_offset = linear[min(beg >> MIN_SHIFT, len(linear) - 1)] if len(linear) else np.uint64(0)
+
+        bin_ids, chunks = self.bins[ref_id]
+        chunks = chunks[np.isin(bin_ids, reg2bins(beg, end)) & (chunks[:, 1] > min_offset)]
+        merged: list[list[int]] = []
+        for chunk_beg, chunk_end in sorted(chunks.tolist()):
+            if merged and chunk_beg <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], chunk_end)
+            else:
+                merged.append([chunk_beg, chunk_end])
+        return [(chunk_beg, chunk_end) for chunk_beg, chunk_end in merged]
+
+
+def contig_bins(starts: np.ndarray, ends: np.ndarray, virtual_offsets: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The chunks of one contig, each chunk a run of consecutive records in the same bin, sorted on bin
+
+    Records spanning at most one 16kbp window (all the decisions) are all in the smallest bins, which are calculated
+    in one step. virtual_offsets has one more entry than starts, the end of the last record.
+    """
+
+    bins = 4681 + (starts >> MIN_SHIFT)
+    for index in np.flatnonzero((starts >> MIN_SHIFT) != ((ends - 1) >> MIN_SHIFT)).tolist():
+        bins[index] = reg2bin(int(starts[index]), int(ends[index]))
+
+    run_starts = np.flatnonzero(np.diff(bins, prepend=-1))
+    run_ends = np.append(run_starts[1:], len(bins))
+    order = np.argsort(bins[run_starts], kind='stable')
+
+    # the pseudo-bin htslib uses for per-contig metadata: the span of the contig's records, and the record count
+    pseudo = np.array([[virtual_offsets[0], virtual_offsets[-1]], [len(starts), 0]], dtype=np.uint64)
+    bin_ids = np.append(bins[run_starts][order], [PSEUDO_BIN, PSEUDO_BIN]).astype(np.uint32)
+    chunks = np.concatenate([np.stack([virtual_offsets[run_starts], virtual_offsets[run_ends]], axis=1)[order], pseudo])
+    return bin_ids, chunks
+
+
+def bin_records(bin_ids: np.ndarray, chunks: np.ndarray) -> bytes:
+    """
+    Serialises one contig's bins: n_bin, then for each bin its ID, n_chunk, and the chunks
+
+    Each bin is 2 x 32-bit words of header, each chunk is 4, so the position of every field is known up front and the
+    whole block is filled in without a loop over the bins.
+    """
+
+    ids, first, counts = np.unique(bin_ids, return_index=True, return_counts=True)
+    words = np.zeros(2 * len(ids) + 4 * len(bin_ids), dtype='<u4')
+    headers = 2 * np.arange(len(ids)) + 4 * first
+    words[headers] = ids
+    words[headers + 1] = counts
+
+    # every bin header before a chunk (including its own) adds 2 words, every earlier chunk 4
+    chunk_words = 2 * (np.repeat(np.arange(len(ids)), counts) + 1) + 4 * np.arange(len(bin_ids))
+    as_u8 = words.view('<u8')
+    as_u8[chunk_words // 2] = chunks[:, 0]
+    as_u8[chunk_words // 2 + 1] = chunks[:, 1]
+    return struct.pack('<i', len(ids)) + words.tobytes()
+
+
+def linear_index(starts: np.ndarray, ends: np.ndarray, virtual_offsets: np.ndarray) -> np.ndarray:
+    """The lowest virtual offset of any record overlapping each 16kbp window of one contig."""
+
+    first_windows = starts >> MIN_SHIFT
+    last_windows = (ends - 1) >> MIN_SHIFT
+    linear = np.zeros(int(last_windows.max()) + 1, dtype=np.uint64)
+
+    # records are sorted on start, so the first record starting in each window has the lowest offset
+    windows, first = np.unique(first_windows, return_index=True)
+    linear[windows] = virtual_offsets[first]
+    for index in np.flatnonzero(last_windows > first_windows).tolist():
+        span = slice(int(first_windows[index]) + 1, int(last_windows[index]) + 1)
+        covered = linear[span]
+        linear[span] = np.where((covered == 0) | (covered > virtual_offsets[index]), virtual_offsets[index], covered)
+
+    # windows without records point at the previous window's offset, as htslib does
+    filled = np.maximum.accumulate(np.where(linear > 0, np.arange(len(linear)), 0))
+    return linear[filled]
+
+
+def format_batch(columns: list[Sequence], start: int, end: int) -> tuple[bytes, np.ndarray]:
+    """Formats rows [start, end) of the columns as TSV lines, returning the bytes and the length of each line."""
+    values = [column[start:end].tolist() if isinstance(column, np.ndarray) else column[start:end] for column in columns]
+    lines = list(map('\t'.join(['%s'] * len(columns)).__mod__, zip(*values, strict=True)))
+    payload = ('\n'.join(lines) + '\n').encode()
+    lengths = np.fromiter(map(len, lines), dtype=np.uint64, count=len(lines)) + np.uint64(1)
+    if int(lengths.sum()) != len(payload):
+        # non-ASCII text, count the encoded bytes instead
+        lengths = np.fromiter((len(line.encode()) + 1 for line in lines), dtype=np.uint64, count=len(lines))
+    return payload, lengths
+
+
+def write_indexed_tsv(
+    path: str,
+    columns: dict[str, Sequence],
+    contig_column: str = 'contig',
+    position_column: str = 'position',
+    threads: int = THREADS,
+):
+    """
+    Writes the columns as a BGZF-compressed TSV with a header line, plus a tabix index at {path}.tbi
+
+    Rows must be sorted on contig and position. The index treats each row as covering the single base at its
+    (1-based) position, matching `tabix -s1 -b2 -e2 -S1` when those are the first two columns
+
+    Args:
+        path (str): where to write the TSV, conventionally ending .tsv.bgz
+        columns (dict[str, Sequence]): column name to values, in column order. Values are lists or numpy arrays
+        contig_column (str): the column holding the contig name
+        position_column (str): the column holding the 1-based position
+        threads (int): the number of threads compressing blocks
+    """
+
+    names = list(columns)
+    values = list(columns.values())
+    if not (rows := len(values[0])):
+        raise ValueError(f'No rows to write to {path}')
+    contig_index = names.index(contig_column) + 1
+    position_index = names.index(position_column) + 1
+
+    line_lengths = []
+    with BgzfWriter(path, threads=threads) as writer:
+        writer.write(('\t'.join(names) + '\n').encode())
+        header_length = writer.tell()
+        for start in range(0, rows, ROWS_PER_BATCH):
+            payload, lengths = format_batch(values, start, min(start + ROWS_PER_BATCH, rows))
+            writer.write(payload)
+            line_lengths.append(lengths)
+
+    offsets = np.concatenate([np.array([header_length], dtype=np.uint64), *line_lengths]).cumsum()
+    positions = np.asarray(columns[position_column], dtype=np.int64)
+    TabixIndex.build(
+        columns[contig_column],
+        starts=positions - 1,
+        ends=positions,
+        virtual_offsets=writer.virtual_offsets(offsets),
+        columns=(contig_index, position_index, position_index),
+    ).write(f'{path}.tbi', threads=threads)
+
+    logger.info(f'Wrote {rows} rows to {path}, with a tabix index')
+
+
+def fetch(
+    path: str,
+    contig: str,
+    beg: int = 0,
+    end: int = MAX_POSITION,
+    index: TabixIndex | None = None,
+) -> Generator[str, None, None]:
+    """
+    Yields the lines of a tabix-indexed file overlapping a region
+
+    Args:
+        path (str): the BGZF-compressed file, with its index at {path}.tbi
+        contig (str): the contig to query
+        beg (int): 0-based start of the region
+        end (int): 0-based, exclusive end of the region
+        index (TabixIndex | None): the loaded index, to avoid re-reading it for each query
+    """
+
+    index = index or TabixIndex.load(f'{path}.tbi')
+    seq_col, beg_col, end_col = (column - 1 for column in index.columns)
+    with BgzfReader(path) as reader:
+        for chunk_beg, chunk_end in index.chunks(contig, beg, end):
+            reader.seek(chunk_beg)
+            while reader.tell() < chunk_end and (line := reader.readline()):
+                fields = line.decode().rstrip('\n').split('\t')
+                if fields[seq_col] != contig:
+                    break
+                record_beg = int(fields[beg_col]) - 1
+                if record_beg >= end:
+                    break
+                record_end = int(fields[end_col]) if end_col >= 0 else record_beg + 1
+                if record_end > beg:
+                    yield line.decode()
+
+
+def parse_region(region: str) -> tuple[str, int, int]:
+    """Parses 'contig', 'contig:position', or 'contig:start-end' (1-based, inclusive) into 0-based, half-open."""
+    contig, _, span = region.partition(':')
+    if not span:
+        return contig, 0, MAX_POSITION
+    start, _, end = span.replace(',', '').partition('-')
+    try:
+        return contig, int(start) - 1, int(end) if end else int(start)
+    except ValueError:
+        raise ValueError(
+            f'Regions should be formatted as contig, contig:position, or contig:start-end: {region}',
+        ) from None
+
+
+def cli_main():
+    parser = ArgumentParser(description='Print the rows of a tabix-indexed TSV overlapping each region')
+    parser.add_argument('path', help='BGZF-compressed TSV, with an index at {path}.tbi')
+    parser.add_argument('regions', help='contig, contig:position, or contig:start-end', nargs='+')
+    args = parser.parse_args()
+
+    index = TabixIndex.load(f'{args.path}.tbi')
+    for region in args.regions:
+        contig, beg, end = parse_region(region)
+        for line in fetch(args.path, contig, beg, end, index=index):
+            print(line, end='')
+
+
+if __name__ == '__main__':
+    cli_main()
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from functools import cache
 from os.path import join
 
@@ -6,7 +6,6 @@ from cpg_flow import stage, targets
 from cpg_utils import Path, config, to_path
 
 from clinvarbitration import __version__ as clinvarbitration_version
-from clinvarbitration.jobs.annotate_snvs import annotate_clinvar_snvs
 from clinvarbitration.jobs.download_latest_files import copy_latest_files
 from clinvarbitration.jobs.generate_new_summary import generate_new_summary
 from clinvarbitration.jobs.pm5_generation import generate_pm5_data
@@ -30,6 +29,30 @@ def get_output_folder():
     )
 
 
+@cache
+def get_previous_release() -> Path | None:
+    """
+    The previous release tarball, to write a delta against
+    Either set in config as workflow.previous_release, or the tarball in last month's output folder, if there is one
+    Only releases with their checksums alongside were written in the delta layout, so earlier tarballs aren't used
+    """
+
+    if previous := config.config_retrieve(['workflow', 'previous_release'], None):
+        return to_path(previous)
+
+    last_month = datetime.now().replace(day=1) - timedelta(days=1)  # noqa: DTZ005
+    previous_folder = to_path(
+        join(
+            config.config_retrieve(['storage', 'default', 'default']),
+            'clinvarbitration',
+            last_month.strftime('%y-%m'),
+        ),
+    )
+    if (previous_folder / 'clinvar_decisions.checksums.json').exists():
+        return previous_folder / 'clinvar_decisions.release.tar.gz'
+    return None
+
+
 def populate_job_meta(output_file: str):
     """Populate analysis record metadata for the job."""
 
@@ -77,7 +100,10 @@ class GenerateNewClinvarSummary(stage.MultiCohortStage):
         return {
             'clinvar_decisions': get_output_folder() / 'clinvar_decisions.ht.tar',
             'snv_vcf': get_output_folder() / 'clinvar_decisions.vcf.bgz',
-            'tsv': get_output_folder() / 'clinvar_decisions.tsv',
+            'tsv': get_output_folder() / 'clinvar_decisions.tsv.bgz',
+            'idx': get_output_folder() / 'clinvar_decisions.idx',
+            'genes': get_output_folder() / 'clinvar_decisions.genes.idx',
+            'ids': get_output_folder() / 'clinvar_decisions.ids.idx',
         }
 
     def queue_jobs(self, mc: targets.MultiCohort, inputs: stage.StageInput) -> stage.StageOutput:
@@ -96,48 +122,32 @@ class GenerateNewClinvarSummary(stage.MultiCohortStage):
 
 
 @stage.stage(required_stages=[GenerateNewClinvarSummary])
-class AnnotateClinvarSnvsWithBcftools(stage.MultiCohortStage):
-    """
-    Take the vcf output from the clinvar stage, and apply consequence annotations
-    this uses BCFtools for speed and re-deployability, instead of VEP
-    """
-
-    def expected_outputs(self, mc: targets.MultiCohort) -> dict[str, Path]:
-        return {'annotated': get_output_folder() / 'clinvar_decisions.annotated.tsv'}
-
-    def queue_jobs(self, mc: targets.MultiCohort, inputs: stage.StageInput) -> stage.StageOutput:
-        output = self.expected_outputs(mc)
-
-        snv_vcf = inputs.as_str(mc, GenerateNewClinvarSummary, 'snv_vcf')
-
-        job = annotate_clinvar_snvs(
-            snv_vcf=snv_vcf,
-            output=str(output['annotated']),
-        )
-        return self.make_outputs(target=mc, jobs=job, data=output)
-
-
-@stage.stage(required_stages=[AnnotateClinvarSnvsWithBcftools])
 class Pm5TableGeneration(stage.MultiCohortStage):
     """
-    Reads in the annotated variant data (in TSV format), and generates a PM5 table
+    Take the SNV VCF output from the clinvar stage, and apply consequence annotations
+    this uses BCFtools for speed and re-deployability, instead of VEP
+    The annotated missense rows are piped straight into the PM5 table generation, without an intermediate TSV
     For each missense variant, we collect all other pathogenic missense variants affecting the same codon
-    This is output as an HT, and a JSON file of the raw representation
+    This is output as an HT, a TSV of the raw representation, and a memory-mappable lookup index
+    The same pass indexes alleles on (transcript, codon, alternate amino acid) for PS1, as an HT and TSV
     """
 
     def expected_outputs(self, mc: targets.MultiCohort) -> dict[str, Path]:
         return {
             'ht': get_output_folder() / 'clinvar_decisions.pm5.ht.tar',
             'tsv': get_output_folder() / 'clinvar_decisions.pm5.tsv',
+            'idx': get_output_folder() / 'clinvar_decisions.pm5.idx',
+            'ps1_ht': get_output_folder() / 'clinvar_decisions.ps1.ht.tar',
+            'ps1_tsv': get_output_folder() / 'clinvar_decisions.ps1.tsv',
         }
 
     def queue_jobs(self, mc: targets.MultiCohort, inputs: stage.StageInput) -> stage.StageOutput:
         outputs = self.expected_outputs(mc)
 
-        annotated_snvs = inputs.as_str(mc, AnnotateClinvarSnvsWithBcftools, 'annotated')
+        snv_vcf = inputs.as_str(mc, GenerateNewClinvarSummary, 'snv_vcf')
 
         job = generate_pm5_data(
-            annotated_snvs=annotated_snvs,
+            snv_vcf=snv_vcf,
             output_folder=str(get_output_folder()),
         )
 
@@ -157,10 +167,15 @@ class PackageForRelease(stage.MultiCohortStage):
     Takes the data created so far, and packages it up for release
     This includes the re-summarised decisions, and the PM5 table
     They are exported as a single tarball, which should be uploaded to the release page monthly
+    If there's a previous release, a delta from it is written alongside where possible, for updating a local copy in
+    place. The delta isn't an expected output, as it's skipped if the previous release can't be compared.
     """
 
-    def expected_outputs(self, multicohort: targets.MultiCohort) -> Path:
-        return get_output_folder() / 'clinvar_decisions.release.tar.gz'
+    def expected_outputs(self, multicohort: targets.MultiCohort) -> dict[str, Path]:
+        return {
+            'tarball': get_output_folder() / 'clinvar_decisions.release.tar.gz',
+            'checksums': get_output_folder() / 'clinvar_decisions.checksums.json',
+        }
 
     def queue_jobs(self, multicohort: targets.MultiCohort, inputs: stage.StageInput) -> stage.StageOutput:
         """
@@ -175,6 +190,8 @@ class PackageForRelease(stage.MultiCohortStage):
             pm5=pm5,
             clinvar_decisions=clinvar_decisions,
             output=output,
+            previous_release=get_previous_release(),
+            delta=get_output_folder() / 'clinvar_decisions.delta.tar.gz',
         )
 
         return self.make_outputs(multicohort, data=output, jobs=job)
@@ -184,7 +201,7 @@ class PackageForRelease(stage.MultiCohortStage):
 class GenerateNewZenodoRelease(stage.MultiCohortStage):
     """
     This Stage takes the tarball generated in the stage above, and automatically drafts, uploads files to, and publishes
-    a new zenodo version.
+    a new zenodo version. The delta from the previous release is uploaded alongside the tarball, if one was written.
     """
 
     def expected_outputs(self, multicohort: targets.MultiCohort) -> Path:
@@ -203,7 +220,8 @@ class GenerateNewZenodoRelease(stage.MultiCohortStage):
             return self.make_outputs(multicohort)
 
         output = self.expected_outputs(multicohort)
-        clinvar_decisions = inputs.as_path(multicohort, PackageForRelease)
+        release = inputs.as_dict(multicohort, PackageForRelease)
 
-        job = create_new_release(clinvar_decisions, output)
+        delta = get_output_folder() / 'clinvar_decisions.delta.tar.gz' if get_previous_release() is not None else None
+        job = create_new_release(release['tarball'], output, delta=delta)
         return self.make_outputs(multicohort, data=output, jobs=job)
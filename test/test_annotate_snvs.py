@@ -0,0 +1,45 @@
+import gzip
+from pathlib import Path
+
+import pytest
+
+from clinvarbitration.scripts.annotate_snvs import plan_chunks, split_gff3_by_contig
+
+POSITIONS = [('chr1', 10), ('chr1', 20), ('chr1', 20), ('chr1', 30), ('chr2', 5), ('chr2', 6), ('chr3', 1)]
+
+
+@pytest.mark.parametrize(
+    ('chunks', 'expected'),
+    [
+        (1, [['chr1', 'chr2', 'chr3']]),
+        (2, [['chr1'], ['chr2', 'chr3']]),
+        (4, [['chr1:1-29'], ['chr1:30-', 'chr2:1-5'], ['chr2:6-', 'chr3']]),
+        # a position is never split across chunks, so chr1:20 stays in a single chunk
+        (10, [['chr1:1-19'], ['chr1:20-29'], ['chr1:30-'], ['chr2:1-5'], ['chr2:6-'], ['chr3']]),
+    ],
+)
+def test_plan_chunks(chunks: int, expected: list[list[str]]):
+    assert plan_chunks(POSITIONS, chunks) == expected
+
+
+def test_plan_chunks_empty():
+    assert plan_chunks([], 4) == []
+
+
+def test_split_gff3_by_contig(tmp_path: Path):
+    gff3 = tmp_path / 'genes.gff3.gz'
+    with gzip.open(gff3, 'wt') as handle:
+        handle.write('##gff-version 3\n##sequence-region 1 1 1000\n')
+        handle.write('1\tensembl\tgene\t1\t100\t.\t+\t.\tID=gene:A\n###\n')
+        handle.write('2\tensembl\tgene\t1\t100\t.\t+\t.\tID=gene:B\n###\n')
+        handle.write('3\tensembl\tgene\t1\t100\t.\t+\t.\tID=gene:C\n')
+
+    split = split_gff3_by_contig(str(gff3), contigs=['chr1', 'chr3', 'chrX'], temp_dir=str(tmp_path))
+    assert set(split) == {'chr1', 'chr3', 'chrX'}
+
+    with gzip.open(split['chr1'], 'rt') as handle:
+        assert handle.read() == (
+            '##gff-version 3\n##sequence-region 1 1 1000\n1\tensembl\tgene\t1\t100\t.\t+\t.\tID=gene:A\n'
+        )
+    with gzip.open(split['chrX'], 'rt') as handle:
+        assert handle.read() == '##gff-version 3\n##sequence-region 1 1 1000\n'
@@ -0,0 +1,90 @@
+import gzip
+from pathlib import Path
+
+import pytest
+
+from clinvarbitration.scripts.annotate_vcf import INFO_HEADER, annotate_lines, main, minimal_representation
+from clinvarbitration.scripts.resummarise_clinvar import GRCH38, TSV_KEYS
+
+DECISION_ROWS = [
+    'chr1\t100\tA\tG\tBenign\t1\t11\n',
+    'chr1\t100\tA\tT\tPathogenic/Likely Pathogenic\t2\t12\n',
+    'chr1\t201\tCT\tC\tVUS\t0\t13\n',
+    'chr2\t50\tG\tA\tConflicting\t0\t21\n',
+    'chrX\t5\tG\tA\tPathogenic/Likely Pathogenic\t4\t31\n',
+]
+
+VCF_HEADER = [
+    '##fileformat=VCFv4.2\n',
+    '##INFO=<ID=DP,Number=1,Type=Integer,Description="Depth">\n',
+    '#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tS1\n',
+]
+
+
+def record(contig: str, position: int, ref: str, alt: str, info: str = 'DP=10') -> str:
+    return f'{contig}\t{position}\t.\t{ref}\t{alt}\t50\tPASS\t{info}\tGT\t0/1\n'
+
+
+def annotated_info(lines: list[str]) -> list[str]:
+    return [line.split('\t')[7] for line in lines if not line.startswith('#')]
+
+
+def test_minimal_representation():
+    assert minimal_representation(100, 'A', 'G') == (100, 'A', 'G')
+    assert minimal_representation(200, 'ACT', 'AT') == (200, 'AC', 'A')
+    assert minimal_representation(200, 'CCT', 'CT') == (200, 'CC', 'C')
+    assert minimal_representation(199, 'GCT', 'GCG') == (201, 'T', 'G')
+
+
+def test_annotate_lines():
+    vcf = [
+        *VCF_HEADER,
+        record('chr1', 100, 'A', 'C,T,G'),
+        record('chr1', 150, 'A', 'G', info='.'),
+        record('chr1', 200, 'ACTT', 'ACT,<DEL>'),
+        record('chrUn_random', 1, 'A', 'G'),
+        record('chr2', 50, 'G', 'A', info='DP=3;clinvarbitration_stars=9'),
+        record('chr2', 60, 'G', 'A'),
+        record('X', 5, 'G', 'A'),
+    ]
+    lines = list(annotate_lines(vcf, DECISION_ROWS, assembly=GRCH38))
+
+    header = [line for line in lines if line.startswith('#')]
+    assert header[-1].startswith('#CHROM')
+    assert header[-4:-1] == [f'{line}\n' for line in INFO_HEADER]
+
+    assert annotated_info(lines) == [
+        'DP=10;clinvarbitration_significance=.,Pathogenic/Likely Pathogenic,Benign;'
+        'clinvarbitration_stars=.,2,1;clinvarbitration_allele_id=.,12,11',
+        '.',
+        'DP=10;clinvarbitration_significance=VUS,.;clinvarbitration_stars=0,.;clinvarbitration_allele_id=13,.',
+        'DP=10',
+        'DP=3;clinvarbitration_significance=Conflicting;clinvarbitration_stars=0;clinvarbitration_allele_id=21',
+        'DP=10',
+        'DP=10;clinvarbitration_significance=Pathogenic/Likely Pathogenic;clinvarbitration_stars=4;'
+        'clinvarbitration_allele_id=31',
+    ]
+    # sample columns are untouched
+    assert all(line.endswith('\tGT\t0/1\n') for line in lines if not line.startswith('#'))
+
+
+def test_annotate_lines_unsorted():
+    vcf = [*VCF_HEADER, record('chr2', 50, 'G', 'A'), record('chr1', 100, 'A', 'G')]
+    with pytest.raises(ValueError, match='not sorted'):
+        list(annotate_lines(vcf, DECISION_ROWS, assembly=GRCH38))
+
+
+def test_main(tmp_path: Path):
+    decisions_tsv = tmp_path / 'clinvar_decisions.tsv'
+    decisions_tsv.write_text('\t'.join(TSV_KEYS) + '\n' + ''.join(DECISION_ROWS))
+    vcf = tmp_path / 'cohort.vcf.bgz'
+    with gzip.open(vcf, 'wt') as handle:
+        handle.writelines([*VCF_HEADER, record('chr1', 100, 'A', 'T'), record('chrX', 6, 'G', 'A')])
+
+    output = tmp_path / 'annotated.vcf'
+    main(vcf=str(vcf), decisions_tsv=str(decisions_tsv), output=str(output))
+    assert annotated_info(output.read_text().splitlines(keepends=True)) == [
+        'DP=10;clinvarbitration_significance=Pathogenic/Likely Pathogenic;clinvarbitration_stars=2;'
+        'clinvarbitration_allele_id=12',
+        'DP=10',
+    ]
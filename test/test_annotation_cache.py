@@ -0,0 +1,148 @@
+import stat
+import sys
+from functools import partial
+from pathlib import Path
+
+import pytest
+
+from clinvarbitration.scripts import annotate_snvs
+from clinvarbitration.scripts.annotation_cache import (
+    AnnotationCache,
+    annotate_misses_with_bcftools,
+    annotate_with_cache,
+    decode_consequences,
+    encode_consequences,
+    main,
+    read_vcf_header,
+)
+from clinvarbitration.scripts.missense_annotator import MissenseAnnotator, annotate_in_parallel, read_vcf_records
+
+input_path = Path(__file__).parent / 'input'
+MINI_FA = str(input_path / 'mini_region.fa')
+MINI_GFF3 = str(input_path / 'mini_region.gff3')
+MINI_VCF = str(input_path / 'mini_region.vcf')
+EXPECTED = input_path / 'mini_region.missense.tsv'
+
+# stands in for bcftools: csq passes the VCF through, +split-vep emits one row per record, prefixed with the locus
+FAKE_BCFTOOLS = f"""#!{sys.executable}
+import sys
+if sys.argv[1] == '+split-vep':
+    for line in sys.stdin:
+        if not line.startswith('#'):
+            chrom, pos, _id, ref, alt, _qual, _filter, info = line.rstrip().split('\\t')
+            fields = dict(field.split('=') for field in info.split(';'))
+            with_locus = '%CHROM' in sys.argv[sys.argv.index('-f') + 1]
+            locus = f'{{chrom}}\\t{{pos}}\\t{{ref}}\\t{{alt}}\\t' if with_locus else ''
+            sys.stdout.write(
+                f'{{locus}}TX\\t{{pos}}{{ref}}>{{pos}}{{alt}}\\t{{fields["allele_id"]}}\\t{{fields["gold_stars"]}}\\n'
+            )
+else:
+    sys.stdout.write(sys.stdin.read())
+"""
+
+
+@pytest.fixture(scope='module', name='annotator')
+def fixture_annotator(tmp_path_factory: pytest.TempPathFactory) -> MissenseAnnotator:
+    index_path = str(tmp_path_factory.mktemp('index') / 'mini_region.cdsidx')
+    return MissenseAnnotator.from_files(gff3=MINI_GFF3, ref_fa=MINI_FA, index_path=index_path)
+
+
+def test_consequence_encoding():
+    consequences = [('ENST1', '4N>4Y'), ('ENST2', '12A>12T')]
+    assert decode_consequences(encode_consequences(consequences)) == consequences
+    assert decode_consequences(encode_consequences([])) == []
+
+
+def test_only_misses_are_annotated(tmp_path: Path, annotator: MissenseAnnotator):
+    records = list(read_vcf_records(MINI_VCF))
+    expected = EXPECTED.read_text().splitlines(keepends=True)
+    annotated: list[list[tuple]] = []
+
+    def annotate_misses(misses: list[tuple]) -> list[str]:
+        annotated.append(misses)
+        return list(annotate_in_parallel(misses, annotator=annotator, threads=1, locus=True))
+
+    cache = AnnotationCache(str(tmp_path / 'cache.db'), gff3_checksum='gff3', ref_checksum='ref')
+
+    # a cold cache annotates half the records, a warm one annotates only the other half, then nothing
+    half = records[::2]
+    assert list(annotate_with_cache(half, cache, annotate_misses)) == list(
+        annotate_in_parallel(half, annotator=annotator, threads=1),
+    )
+    assert list(annotate_with_cache(records, cache, annotate_misses)) == expected
+    assert list(annotate_with_cache(records, cache, annotate_misses)) == expected
+    assert [len(misses) for misses in annotated] == [len(half), len(records) - len(half)]
+
+    # results are specific to the GFF3 & reference checksums
+    other = AnnotationCache(cache.path, gff3_checksum='new_gff3', ref_checksum='ref')
+    assert other.load() == {}
+
+
+def test_allele_details_come_from_current_records(tmp_path: Path, annotator: MissenseAnnotator):
+    cache = AnnotationCache(str(tmp_path / 'cache.db'), gff3_checksum='gff3', ref_checksum='ref')
+    annotate_misses = partial(annotator.annotate_records, locus=True)
+    list(annotate_with_cache([('chr21', 110, 'A', 'T', '1', '0')], cache, annotate_misses))
+
+    # gold stars have changed since the cached run
+    rows = list(annotate_with_cache([('chr21', 110, 'A', 'T', '1', '2')], cache, lambda _misses: []))
+    assert rows == ['ENST0000000A1\t4N>4Y\t1\t2\n', 'ENST0000000A2\t4N>4Y\t1\t2\n']
+
+
+def test_main_native(tmp_path: Path):
+    cache_path = str(tmp_path / 'cache.db')
+    for run in ('cold', 'warm'):
+        output = tmp_path / f'{run}.tsv'
+        main(
+            vcf=MINI_VCF,
+            ref_fa=MINI_FA,
+            gff3=MINI_GFF3,
+            output=str(output),
+            cache_path=cache_path,
+            threads=1,
+            native=True,
+            index_path=str(tmp_path / 'mini_region.cdsidx'),
+        )
+        assert output.read_text() == EXPECTED.read_text()
+
+
+def test_annotate_misses_with_bcftools(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """misses are streamed through bcftools in parallel chunks, and gathered in record order"""
+    fake = tmp_path / 'bcftools'
+    fake.write_text(FAKE_BCFTOOLS)
+    fake.chmod(fake.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(annotate_snvs, 'BCFTOOLS', str(fake))
+
+    misses = list(read_vcf_records(MINI_VCF))[:10]
+    rows = annotate_misses_with_bcftools(
+        misses,
+        header=read_vcf_header(MINI_VCF),
+        ref_fa=MINI_FA,
+        gff3=MINI_GFF3,
+        threads=3,
+    )
+    assert rows == [
+        f'{contig}\t{pos}\t{ref}\t{alt}\tTX\t{pos}{ref}>{pos}{alt}\t{aid}\t{stars}\n'
+        for contig, pos, ref, alt, aid, stars in misses
+    ]
+
+
+def test_pseudoautosomal_copies_are_kept_apart(tmp_path: Path):
+    """the X & Y copies of a PAR variant share an allele ID, but each keeps only its own consequences"""
+    records = [('chrX', 1000, 'A', 'T', '7', '1'), ('chrY', 2000, 'A', 'T', '7', '1')]
+    consequences = {'chrX': 'ENST_X\t5N>5Y', 'chrY': 'ENST_Y\t9K>9M'}
+
+    def annotate_misses(misses: list[tuple]) -> list[str]:
+        return [
+            f'{contig}\t{pos}\t{ref}\t{alt}\t{consequences[contig]}\t{aid}\t{stars}\n'
+            for contig, pos, ref, alt, aid, stars in misses
+        ]
+
+    cache = AnnotationCache(str(tmp_path / 'cache.db'), gff3_checksum='gff3', ref_checksum='ref')
+    expected = ['ENST_X\t5N>5Y\t7\t1\n', 'ENST_Y\t9K>9M\t7\t1\n']
+    assert list(annotate_with_cache(records, cache, annotate_misses)) == expected
+    assert cache.load() == {
+        ('chrX', 1000, 'A', 'T'): [('ENST_X', '5N>5Y')],
+        ('chrY', 2000, 'A', 'T'): [('ENST_Y', '9K>9M')],
+    }
+    # and from the cache
+    assert list(annotate_with_cache(records, cache, lambda _misses: [])) == expected
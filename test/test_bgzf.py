@@ -0,0 +1,51 @@
+import gzip
+import random
+from pathlib import Path
+
+from clinvarbitration.scripts.bgzf import BLOCK_SIZE, EOF_BLOCK, MAX_BLOCK, BgzfReader, BgzfWriter, compress_block
+
+
+def test_compress_block():
+    data = b'ACGT' * (BLOCK_SIZE // 4)
+    assert gzip.decompress(compress_block(data)) == data
+
+
+def test_compress_block_incompressible():
+    """random bytes still fit in one block"""
+    data = random.Random(42).randbytes(BLOCK_SIZE)  # noqa: S311
+    block = compress_block(data)
+    assert len(block) <= MAX_BLOCK
+    assert gzip.decompress(block) == data
+
+
+def test_writer_round_trip(tmp_path: Path):
+    """the blocks are written in order whatever the threading, and any gzip reader can decompress them"""
+    lines = [f'line {index}\t{"ACGT" * (index % 7)}\n'.encode() for index in range(20_000)]
+    for threads in (1, 4):
+        path = tmp_path / f'{threads}.bgz'
+        with BgzfWriter(str(path), threads=threads) as writer:
+            for line in lines:
+                writer.write(line)
+        assert path.read_bytes().endswith(EOF_BLOCK)
+        assert gzip.decompress(path.read_bytes()) == b''.join(lines)
+        assert len(writer.block_offsets) > 3  # noqa: PLR2004
+
+
+def test_virtual_offsets(tmp_path: Path):
+    """the reader finds each line at the virtual offset calculated by the writer"""
+    lines = [f'{index}\n'.encode() for index in range(50_000)]
+    path = str(tmp_path / 'lines.bgz')
+    offsets = [0]
+    with BgzfWriter(path, threads=2) as writer:
+        for line in lines:
+            writer.write(line)
+            offsets.append(offsets[-1] + len(line))
+    virtual_offsets = writer.virtual_offsets(offsets).tolist()
+
+    with BgzfReader(path) as reader:
+        for index in (0, 1, 12_345, 49_998):
+            reader.seek(virtual_offsets[index])
+            assert reader.readline() == lines[index]
+            assert reader.tell() == virtual_offsets[index + 1]
+        assert reader.readline() == lines[-1]
+        assert reader.readline() == b''
@@ -0,0 +1,106 @@
+import gzip
+import json
+from pathlib import Path
+
+import pytest
+
+from clinvarbitration.scripts import resummarise_clinvar
+from clinvarbitration.scripts.blacklist_profiles import batch_decisions, read_profiles
+from clinvarbitration.scripts.resummarise_clinvar import GRCH38, Consequence, generate_decisions
+
+VARIANT_COLUMNS = [
+    'AlleleID',
+    'GeneSymbol',
+    'RS# (dbSNP)',
+    'Assembly',
+    'Chromosome',
+    'VariationID',
+    'PositionVCF',
+    'ReferenceAlleleVCF',
+    'AlternateAlleleVCF',
+]
+SUBMISSION_COLUMNS = ['VariationID', 'ClinicalSignificance', 'DateLastEvaluated', 'ReviewStatus', 'Submitter']
+
+# variation 1 is only submitted by Lab A, variation 2 is conflicting until Lab B is removed, variation 3 has a
+# practice guideline from Lab C, and variation 4 is untouched by any profile
+VARIANTS = [
+    ['1', 'GENE1', '-1', 'GRCh38', '1', '1', '100', 'A', 'G'],
+    ['2', 'GENE1', '5', 'GRCh38', '1', '2', '200', 'C', 'T'],
+    ['3', 'GENE2', '-1', 'GRCh38', '2', '3', '300', 'G', 'A'],
+    ['4', 'GENE2', '-1', 'GRCh38', '2', '4', '400', 'T', 'C'],
+]
+SUBMISSIONS = [
+    ['1', 'Pathogenic', 'Jan 01, 2020', 'criteria provided, single submitter', 'Lab A'],
+    ['2', 'Pathogenic', 'Jan 01, 2020', 'criteria provided, single submitter', 'Lab A'],
+    ['2', 'Benign', 'Jan 01, 2020', 'criteria provided, single submitter', 'Lab B'],
+    ['3', 'Benign', 'Jan 01, 2020', 'practice guideline', 'Lab C'],
+    ['3', 'Pathogenic', 'Jan 01, 2020', 'criteria provided, single submitter', 'Lab A'],
+    ['4', 'Likely benign', '-', 'no assertion criteria provided', 'Lab D'],
+]
+PROFILES = {'none': [], 'no_b': ['Lab B'], 'no_a_c': ['LAB A', 'Lab C'], 'unknown': ['Lab Z']}
+
+
+def write_gzip(path: Path, columns: list[str], rows: list[list[str]]) -> str:
+    with gzip.open(path, 'wt') as handle:
+        handle.write('#' + '\t'.join(columns) + '\n')
+        handle.writelines('\t'.join(row) + '\n' for row in rows)
+    return str(path)
+
+
+@pytest.fixture(name='clinvar_files')
+def fixture_clinvar_files(tmp_path: Path) -> tuple[str, str]:
+    return (
+        write_gzip(tmp_path / 'submission_summary.txt.gz', SUBMISSION_COLUMNS, SUBMISSIONS),
+        write_gzip(tmp_path / 'variant_summary.txt.gz', VARIANT_COLUMNS, VARIANTS),
+    )
+
+
+def summarised(decisions: list[dict]) -> list[tuple[int, str, int]]:
+    return [(each['allele_id'], each['clinical_significance'], each['gold_stars']) for each in decisions]
+
+
+def test_profiles(clinvar_files: tuple[str, str], tmp_path: Path):
+    profiles_path = tmp_path / 'profiles.json'
+    profiles_path.write_text(json.dumps(PROFILES))
+    subs, variants = clinvar_files
+    results = batch_decisions(subs=subs, variants=variants, profiles=read_profiles(str(profiles_path)), assembly=GRCH38)
+
+    assert summarised(results['none'][0]) == [
+        (1, Consequence.PATHOGENIC.value, 1),
+        (2, Consequence.CONFLICTING.value, 1),
+        (3, Consequence.BENIGN.value, 4),
+        (4, Consequence.BENIGN.value, 0),
+    ]
+    assert summarised(results['no_b'][0])[1] == (2, Consequence.PATHOGENIC.value, 1)
+    assert summarised(results['no_a_c'][0]) == [
+        (2, Consequence.BENIGN.value, 1),
+        (4, Consequence.BENIGN.value, 0),
+    ]
+    assert results['no_a_c'][1] == {
+        'blacklist': ['lab a', 'lab c'],
+        'variation_ids_re_evaluated': 3,
+        'decisions_changed': 1,
+        'decisions_removed': 2,
+        'decisions': 2,
+    }
+    # only re-evaluated decisions are copied
+    assert results['unknown'][0][0] is results['none'][0][0]
+    assert results['no_b'][0][0] is results['none'][0][0]
+
+
+def test_profiles_match_blacklisted_runs(clinvar_files: tuple[str, str], monkeypatch: pytest.MonkeyPatch):
+    """each profile gives the same decisions as a full run with that blacklist"""
+    subs, variants = clinvar_files
+    profiles = {name: {submitter.lower() for submitter in submitters} for name, submitters in PROFILES.items()}
+    results = batch_decisions(subs=subs, variants=variants, profiles=profiles, assembly=GRCH38)
+    for name, blacklist in profiles.items():
+        monkeypatch.setattr(resummarise_clinvar, 'BLACKLIST', blacklist)
+        assert results[name][0] == generate_decisions(subs=subs, variants=variants, assembly=GRCH38)
+
+
+@pytest.mark.parametrize('profiles', [[], {}, {'a/b': []}, {'a': 'Lab A'}, {'a': [1]}])
+def test_read_profiles_invalid(profiles: object, tmp_path: Path):
+    profiles_path = tmp_path / 'profiles.json'
+    profiles_path.write_text(json.dumps(profiles))
+    with pytest.raises(ValueError):
+        read_profiles(str(profiles_path))
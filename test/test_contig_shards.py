@@ -0,0 +1,99 @@
+import gzip
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+import hail as hl
+
+from clinvarbitration.scripts import resummarise_clinvar
+from clinvarbitration.scripts.checksums import checksum_path
+from clinvarbitration.scripts.resummarise_clinvar import GRCH38, Consequence, is_pm5_candidate
+
+from .test_blacklist_profiles import SUBMISSION_COLUMNS, SUBMISSIONS, VARIANT_COLUMNS, VARIANTS, write_gzip
+
+PATH_SNV = {
+    'contig': 'chr1',
+    'position': 12345,
+    'alleles': ['A', 'G'],
+    'clinical_significance': Consequence.PATHOGENIC.value,
+    'gold_stars': 1,
+    'allele_id': 789,
+}
+
+
+def test_is_pm5_candidate():
+    assert is_pm5_candidate(PATH_SNV)
+    assert not is_pm5_candidate(PATH_SNV | {'alleles': ['A', 'GT']})
+    assert not is_pm5_candidate(PATH_SNV | {'clinical_significance': Consequence.BENIGN.value})
+    assert not is_pm5_candidate(PATH_SNV | {'contig': 'chrM'})
+
+
+def test_checksum_path_directory(tmp_path: Path):
+    """a directory checksum changes if any contained file changes"""
+    table = tmp_path / 'shard.ht'
+    (table / 'rows').mkdir(parents=True)
+    (table / 'metadata.json.gz').write_bytes(b'metadata')
+    (table / 'rows' / 'part-0').write_bytes(b'rows')
+
+    first = checksum_path(str(table))
+    assert first == checksum_path(str(table))
+
+    (table / 'rows' / 'part-0').write_bytes(b'different rows')
+    assert checksum_path(str(table)) != first
+
+
+def test_checksum_path_file(tmp_path: Path):
+    single = tmp_path / 'shard.tsv'
+    single.write_text('content')
+    assert checksum_path(str(single)) == '9a0364b9e99bb480dd25e1f0284c8555'
+
+
+@pytest.mark.skipif(shutil.which('java') is None, reason='Hail requires Java')
+def test_write_contig_shards(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """the ClinVar fixture has decisions on chr1 & chr2, with the only Pathogenic SNV on chr1"""
+    # Hail writes its log to the working directory
+    monkeypatch.chdir(tmp_path)
+    resummarise_clinvar.main(
+        subs=write_gzip(tmp_path / 'submission_summary.txt.gz', SUBMISSION_COLUMNS, SUBMISSIONS),
+        variants=write_gzip(tmp_path / 'variant_summary.txt.gz', VARIANT_COLUMNS, VARIANTS),
+        output_root=str(tmp_path / 'clinvar_decisions'),
+        assembly=GRCH38,
+        shards=True,
+    )
+
+    shard_dir = tmp_path / 'clinvar_decisions.shards'
+    manifest = json.loads((shard_dir / 'manifest.json').read_text())
+    assert manifest['assembly'] == GRCH38
+    assert manifest['rows'] == len(VARIANTS)
+
+    # contigs without decisions get no shard, and only chr1 has a Pathogenic SNV to write a VCF of
+    chr1, chr2 = manifest['shards']
+    assert (chr1['contig'], chr1['rows'], chr1['vcf']['rows']) == ('chr1', 2, 1)
+    assert (chr2['contig'], chr2['rows']) == ('chr2', 2)
+    assert 'vcf' not in chr2
+    assert chr2['tsv'] == {
+        'path': 'clinvar_decisions.chr2.tsv.bgz',
+        'index': 'clinvar_decisions.chr2.tsv.bgz.tbi',
+        'md5': checksum_path(str(shard_dir / 'clinvar_decisions.chr2.tsv.bgz')),
+    }
+
+    # every path is relative to the manifest, and every checksum matches
+    for shard in manifest['shards']:
+        for output in ('tsv', 'ht', 'vcf'):
+            if output in shard:
+                assert checksum_path(str(shard_dir / shard[output]['path'])) == shard[output]['md5']
+                assert 'index' not in shard[output] or (shard_dir / shard[output]['index']).exists()
+
+    with gzip.open(shard_dir / chr2['tsv']['path'], 'rt') as handle:
+        rows = [line.split('\t') for line in handle.read().splitlines()[1:]]
+    assert [(row[0], int(row[1])) for row in rows] == [('chr2', 300), ('chr2', 400)]
+
+    table = hl.read_table(str(shard_dir / chr2['ht']['path']))
+    assert table.aggregate(hl.agg.collect(table.locus.position)) == [300, 400]
+    assert table.aggregate(hl.agg.collect_as_set(table.locus.contig)) == {'chr2'}
+
+    with gzip.open(shard_dir / chr1['vcf']['path'], 'rt') as handle:
+        records = [line.split('\t')[:5] for line in handle if not line.startswith('#')]
+    assert records == [['chr1', '100', '.', 'A', 'G']]
@@ -0,0 +1,169 @@
+from pathlib import Path
+
+import pytest
+
+from clinvarbitration.scripts.decisions_index import DecisionIndex, allele_hash, main, parse_query
+from clinvarbitration.scripts.resummarise_clinvar import GRCH38, ORDERED_CONTIGS, Consequence
+
+SIGNIFICANCE = [consequence.value for consequence in Consequence]
+
+DECISIONS = [
+    {
+        'contig': 'chr1',
+        'position': 100,
+        'alleles': ['A', 'G'],
+        'clinical_significance': 'Benign',
+        'gold_stars': 1,
+        'allele_id': 11,
+    },
+    {
+        'contig': 'chr1',
+        'position': 100,
+        'alleles': ['A', 'T'],
+        'clinical_significance': 'Pathogenic/Likely Pathogenic',
+        'gold_stars': 2,
+        'allele_id': 12,
+    },
+    {
+        'contig': 'chr1',
+        'position': 250,
+        'alleles': ['CT', 'C'],
+        'clinical_significance': 'VUS',
+        'gold_stars': 0,
+        'allele_id': 13,
+    },
+    {
+        'contig': 'chr2',
+        'position': 100,
+        'alleles': ['A', 'G'],
+        'clinical_significance': 'Conflicting',
+        'gold_stars': 0,
+        'allele_id': 21,
+    },
+    {
+        'contig': 'chrX',
+        'position': 5,
+        'alleles': ['G', 'A'],
+        'clinical_significance': 'Pathogenic/Likely Pathogenic',
+        'gold_stars': 4,
+        'allele_id': 31,
+    },
+]
+
+
+@pytest.fixture(name='decision_index')
+def fixture_decision_index(tmp_path: Path) -> DecisionIndex:
+    index_path = str(tmp_path / 'clinvar_decisions.idx')
+    DecisionIndex.from_decisions(DECISIONS, contigs=ORDERED_CONTIGS[GRCH38], significance=SIGNIFICANCE).write(
+        index_path,
+    )
+    return DecisionIndex.load(index_path)
+
+
+def test_lookup_every_decision(decision_index: DecisionIndex):
+    assert not decision_index.key.flags.writeable
+    for decision in DECISIONS:
+        assert decision_index.lookup(decision['contig'], decision['position'], *decision['alleles']) == [
+            (decision['clinical_significance'], decision['gold_stars'], decision['allele_id']),
+        ]
+
+
+def test_lookup_misses(decision_index: DecisionIndex):
+    assert decision_index.lookup('chr1', 100, 'A', 'C') == []
+    assert decision_index.lookup('chr1', 101, 'A', 'G') == []
+    assert decision_index.lookup('chr3', 100, 'A', 'G') == []
+    assert decision_index.lookup('chrUn', 100, 'A', 'G') == []
+    assert decision_index.lookup('chr1', -1, 'A', 'G') == []
+
+
+def test_lookup_contig_alias(decision_index: DecisionIndex):
+    """contigs are accepted with or without the chr prefix"""
+    assert decision_index.lookup('X', 5, 'G', 'A') == decision_index.lookup('chrX', 5, 'G', 'A')
+
+
+def test_region(decision_index: DecisionIndex):
+    """decisions in a region are in position order, then allele hash order within each position"""
+    at_100 = sorted([(allele_hash('A', 'G'), 11), (allele_hash('A', 'T'), 12)])
+    assert [each[3] for each in decision_index.region('chr1', 1, 1000)] == [*(aid for _, aid in at_100), 13]
+    assert decision_index.region('chr1', 101, 250) == [(250, 'VUS', 0, 13)]
+    assert [each[0] for each in decision_index.region('chr1', 100, 100)] == [100, 100]
+    assert decision_index.region('chr1', 251, 1000) == []
+    assert decision_index.region('chr1', 300, 200) == []
+    assert decision_index.region('chr3', 1, 1000) == []
+
+
+def test_lookup_many_matches_single_lookups(decision_index: DecisionIndex):
+    queries = [
+        ('chrX', 5, 'G', 'A'),
+        ('chr1', 100, 'A', 'T'),
+        ('chr1', 100, 'A', 'C'),
+        ('chrUn', 1, 'A', 'C'),
+        ('chr2', 100, 'A', 'G'),
+        ('chr1', 100, 'A', 'G'),
+    ]
+    starts, ends = decision_index.lookup_many(*(list(column) for column in zip(*queries, strict=True)))
+    for query, start, end in zip(queries, starts.tolist(), ends.tolist(), strict=True):
+        assert decision_index.records(start, end) == decision_index.lookup(*query)
+
+
+def test_empty_index(tmp_path: Path):
+    index_path = str(tmp_path / 'empty.idx')
+    DecisionIndex.from_decisions([], contigs=ORDERED_CONTIGS[GRCH38], significance=SIGNIFICANCE).write(index_path)
+    decision_index = DecisionIndex.load(index_path)
+    assert decision_index.lookup('chr1', 100, 'A', 'G') == []
+    assert decision_index.region('chr1', 1, 1000) == []
+    starts, ends = decision_index.lookup_many(['chr1'], [100], ['A'], ['G'])
+    assert starts.tolist() == ends.tolist() == [0]
+
+
+def test_parse_query():
+    assert parse_query('chr1:100:A:G') == ('chr1', 100, 'A', 'G')
+    assert parse_query('chr1:100-200') == ('chr1', 100, 200)
+    for bad_query in ['chr1', 'chr1:100', 'chr1:a:A:G', 'chr1:100-']:
+        with pytest.raises(ValueError, match='contig:position:ref:alt'):
+            parse_query(bad_query)
+    for too_large in ['chr1:99999999999999999999:A:G', 'chr1:1-99999999999999999999']:
+        with pytest.raises(ValueError, match='Positions are at most'):
+            parse_query(too_large)
+
+
+def test_main(decision_index: DecisionIndex, tmp_path: Path, capsys: pytest.CaptureFixture):
+    assert len(decision_index) == len(DECISIONS)
+    query_file = tmp_path / 'queries.txt'
+    query_file.write_text('chr2:1-200\n\n')
+    main(str(tmp_path / 'clinvar_decisions.idx'), queries=['chrX:5:G:A', 'chr1:100:A:C'], query_file=str(query_file))
+    assert capsys.readouterr().out.splitlines() == [
+        'chrX:5:G:A\t5\tPathogenic/Likely Pathogenic\t4\t31',
+        'chr2:1-200\t100\tConflicting\t0\t21',
+    ]
+
+
+def test_allele_hash_collision(tmp_path: Path):
+    """alleles sharing a 24-bit hash at a position are told apart on the stored alleles"""
+    assert allele_hash('A', 'AATAGCGGGT') == allele_hash('A', 'ACAAAAAACG')
+    decision = DECISIONS[1] | {'alleles': ['A', 'AATAGCGGGT']}
+    index_path = str(tmp_path / 'collision.idx')
+    DecisionIndex.from_decisions([decision], contigs=ORDERED_CONTIGS[GRCH38], significance=SIGNIFICANCE).write(
+        index_path,
+    )
+    decision_index = DecisionIndex.load(index_path)
+
+    assert decision_index.lookup('chr1', 100, 'A', 'ACAAAAAACG') == []
+    assert decision_index.lookup('chr1', 100, 'A', 'AATAGCGGGT') == [('Pathogenic/Likely Pathogenic', 2, 12)]
+    starts, ends = decision_index.lookup_many(['chr1', 'chr1'], [100, 100], ['A', 'A'], ['ACAAAAAACG', 'AATAGCGGGT'])
+    assert (ends - starts).tolist() == [0, 1]
+
+
+def test_colliding_decisions_at_one_position():
+    """both of two colliding decisions at a position are kept, and each is found on its own alleles"""
+    decisions = [
+        DECISIONS[1] | {'alleles': ['A', 'ACAAAAAACG'], 'allele_id': 41},
+        DECISIONS[0] | {'alleles': ['A', 'AATAGCGGGT'], 'allele_id': 42},
+        DECISIONS[1] | {'alleles': ['A', 'ACAAAAAACG'], 'allele_id': 43},
+    ]
+    decision_index = DecisionIndex.from_decisions(decisions, contigs=ORDERED_CONTIGS[GRCH38], significance=SIGNIFICANCE)
+    assert [each[2] for each in decision_index.lookup('chr1', 100, 'A', 'ACAAAAAACG')] == [41, 43]
+    assert [each[2] for each in decision_index.lookup('chr1', 100, 'A', 'AATAGCGGGT')] == [42]
+    starts, ends = decision_index.lookup_many(['chr1', 'chr1'], [100, 100], ['A', 'A'], ['ACAAAAAACG', 'AATAGCGGGT'])
+    assert decision_index.records(int(starts[0]), int(ends[0])) == decision_index.lookup('chr1', 100, 'A', 'ACAAAAAACG')
+    assert (ends - starts).tolist() == [2, 1]
@@ -0,0 +1,133 @@
+import gzip
+import json
+from pathlib import Path
+
+import pytest
+
+from clinvarbitration.scripts.diff_decisions import CHANGE_KEYS, diff_records, main, tsv_records
+from clinvarbitration.scripts.resummarise_clinvar import (
+    GRCH38,
+    Consequence,
+    write_decision_index,
+    write_decisions_tsv,
+)
+
+PATHOGENIC = Consequence.PATHOGENIC.value
+CONFLICTING = Consequence.CONFLICTING.value
+BENIGN = Consequence.BENIGN.value
+
+
+def decision(contig: str, position: int, alt: str, significance: str, stars: int, allele_id: int) -> dict:
+    return {
+        'contig': contig,
+        'position': position,
+        'alleles': ['A', alt],
+        'clinical_significance': significance,
+        'gold_stars': stars,
+        'allele_id': allele_id,
+    }
+
+
+OLD = [
+    decision('chr1', 100, 'G', CONFLICTING, 1, 1),
+    decision('chr1', 100, 'T', BENIGN, 1, 2),
+    decision('chr1', 200, 'G', PATHOGENIC, 1, 3),
+    decision('chr2', 50, 'G', BENIGN, 1, 4),
+    decision('chrX', 10, 'C', PATHOGENIC, 2, 5),
+]
+NEW = [
+    decision('chr1', 50, 'G', PATHOGENIC, 1, 6),
+    decision('chr1', 100, 'T', BENIGN, 2, 2),
+    decision('chr1', 100, 'G', PATHOGENIC, 1, 1),
+    decision('chr1', 200, 'C', PATHOGENIC, 1, 7),
+    decision('chr2', 50, 'G', BENIGN, 1, 4),
+    decision('chrX', 10, 'C', PATHOGENIC, 2, 5),
+    decision('chrY', 10, 'C', BENIGN, 0, 8),
+]
+
+EXPECTED_ROWS = [
+    ['chr1', '50', 'A', 'G', '6', 'added', '.', PATHOGENIC, '.', '1'],
+    ['chr1', '100', 'A', 'G', '1', 'reclassified', CONFLICTING, PATHOGENIC, '1', '1'],
+    ['chr1', '100', 'A', 'T', '2', 'stars', BENIGN, BENIGN, '1', '2'],
+    ['chr1', '200', 'A', 'G', '3', 'removed', PATHOGENIC, '.', '1', '.'],
+    ['chr1', '200', 'A', 'C', '7', 'added', '.', PATHOGENIC, '.', '1'],
+    ['chrY', '10', 'A', 'C', '8', 'added', '.', BENIGN, '.', '0'],
+]
+
+
+def write_release(folder: Path, decisions: list[dict]) -> tuple[str, str]:
+    folder.mkdir()
+    tsv, index = str(folder / 'clinvar_decisions.tsv.bgz'), str(folder / 'clinvar_decisions.idx')
+    write_decisions_tsv(decisions, output_path=tsv)
+    write_decision_index(decisions, index_path=index, assembly=GRCH38)
+    return tsv, index
+
+
+def read_changes(output_root: Path) -> list[list[str]]:
+    with gzip.open(f'{output_root}.changes.tsv.gz', 'rt') as handle:
+        assert next(handle).rstrip('\n').split('\t') == CHANGE_KEYS
+        return [line.rstrip('\n').split('\t') for line in handle]
+
+
+def test_diff_tsvs(tmp_path: Path):
+    old_tsv, _old_index = write_release(tmp_path / 'old', OLD)
+    new_tsv, _new_index = write_release(tmp_path / 'new', NEW)
+    summary = main(old_tsv, new_tsv, output_root=str(tmp_path / 'changes'))
+
+    assert read_changes(tmp_path / 'changes') == EXPECTED_ROWS
+    assert summary['changes'] == {'added': 3, 'removed': 1, 'reclassified': 1, 'stars': 1}
+    assert summary['transitions'] == {
+        f'added: {PATHOGENIC}': 2,
+        f'added: {BENIGN}': 1,
+        f'{CONFLICTING} -> {PATHOGENIC}': 1,
+        f'{BENIGN}: 1 -> 2 stars': 1,
+        f'removed: {PATHOGENIC}': 1,
+    }
+    with open(tmp_path / 'changes.summary.json', encoding='utf-8') as handle:
+        assert json.load(handle) == summary
+
+
+def test_diff_indexes(tmp_path: Path):
+    """indexes hold the alleles, so give the same changes as the TSVs, whichever mix of inputs is used"""
+    old_tsv, old_index = write_release(tmp_path / 'old', OLD)
+    new_tsv, new_index = write_release(tmp_path / 'new', NEW)
+
+    # within a position the index is ordered on the allele hash, so compare ignoring that order
+    for old, new in [(old_index, new_index), (old_tsv, new_index), (old_index, new_tsv)]:
+        main(old, new, output_root=str(tmp_path / 'changes'))
+        assert sorted(read_changes(tmp_path / 'changes')) == sorted(EXPECTED_ROWS)
+
+
+def test_colliding_alleles(tmp_path: Path):
+    """alleles sharing an allele hash at a position are matched on the alleles themselves"""
+    old_tsv, old_index = write_release(
+        tmp_path / 'old',
+        [decision('chr1', 100, 'AATAGCGGGT', PATHOGENIC, 1, 1), decision('chr1', 100, 'ACAAAAAACG', BENIGN, 1, 2)],
+    )
+    new_tsv, new_index = write_release(tmp_path / 'new', [decision('chr1', 100, 'ACAAAAAACG', BENIGN, 2, 2)])
+
+    expected = [
+        ['chr1', '100', 'A', 'AATAGCGGGT', '1', 'removed', PATHOGENIC, '.', '1', '.'],
+        ['chr1', '100', 'A', 'ACAAAAAACG', '2', 'stars', BENIGN, BENIGN, '1', '2'],
+    ]
+    for old, new in [(old_tsv, new_tsv), (old_index, new_index)]:
+        summary = main(old, new, output_root=str(tmp_path / 'changes'))
+        assert sorted(read_changes(tmp_path / 'changes')) == expected
+        assert summary['changes'] == {'added': 0, 'removed': 1, 'reclassified': 0, 'stars': 1}
+
+
+def test_identical(tmp_path: Path):
+    old_tsv, old_index = write_release(tmp_path / 'old', OLD)
+    assert list(diff_records(tsv_records(old_tsv), tsv_records(old_tsv))) == []
+    summary = main(old_tsv, old_index, output_root=str(tmp_path / 'same'))
+    assert summary['changes'] == {'added': 0, 'removed': 0, 'reclassified': 0, 'stars': 0}
+
+
+def test_unsorted(tmp_path: Path):
+    old_tsv, _old_index = write_release(tmp_path / 'old', OLD)
+    unsorted = tmp_path / 'unsorted.tsv'
+    with gzip.open(old_tsv, 'rt') as handle:
+        header, *lines = handle.readlines()
+    unsorted.write_text(header + ''.join(reversed(lines)))
+    with pytest.raises(ValueError, match='is not sorted'):
+        main(old_tsv, str(unsorted), output_root=str(tmp_path / 'changes'))
@@ -0,0 +1,123 @@
+import gzip
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from clinvarbitration.scripts.gene_index import GeneIndex, main, range_positions
+from clinvarbitration.scripts.resummarise_clinvar import (
+    GRCH38,
+    ORDERED_CONTIGS,
+    Consequence,
+    gene_symbols,
+    get_allele_locus_map,
+)
+
+SIGNIFICANCE = [consequence.value for consequence in Consequence]
+
+
+def decision(contig: str, position: int, allele_id: int, genes: list[str], alt: str = 'G') -> dict:
+    return {
+        'contig': contig,
+        'position': position,
+        'alleles': ['A', alt],
+        'clinical_significance': Consequence.PATHOGENIC.value,
+        'gold_stars': 1,
+        'allele_id': allele_id,
+        'genes': genes,
+    }
+
+
+# sorted on contig & position, GENE2 overlaps the end of GENE1, and one decision is intergenic
+DECISIONS = [
+    decision('chr1', 100, 1, ['GENE1']),
+    decision('chr1', 200, 2, ['GENE1', 'GENE2']),
+    decision('chr1', 300, 3, ['GENE2'], alt='T'),
+    decision('chr1', 400, 4, []),
+    decision('chr2', 50, 5, ['Gene3']),
+    decision('chrX', 10, 6, ['GENE1']),
+]
+
+
+@pytest.fixture(name='gene_index')
+def fixture_gene_index(tmp_path: Path) -> GeneIndex:
+    index_path = str(tmp_path / 'clinvar_decisions.genes.idx')
+    GeneIndex.from_decisions(DECISIONS, contigs=ORDERED_CONTIGS[GRCH38], significance=SIGNIFICANCE).write(index_path)
+    return GeneIndex.load(index_path)
+
+
+def test_gene_index(gene_index: GeneIndex):
+    assert gene_index.genes == ['GENE1', 'GENE2', 'Gene3']
+    assert len(gene_index) == len(DECISIONS) - 1
+    assert gene_index.gene('GENE2') == [
+        ('chr1', 200, 'A', 'G', 'Pathogenic/Likely Pathogenic', 1, 2),
+        ('chr1', 300, 'A', 'T', 'Pathogenic/Likely Pathogenic', 1, 3),
+    ]
+    assert [each[-1] for each in gene_index.gene('GENE1')] == [1, 2, 6]
+    # symbols are also matched upper-cased
+    assert [each[-1] for each in gene_index.gene('GENE3')] == [5]
+    assert gene_index.gene('GENE4') == []
+
+
+def test_panel(gene_index: GeneIndex):
+    """each decision once, in genomic order, however many panel genes it's in"""
+    assert [each[-1] for each in gene_index.panel(['Gene3', 'GENE2', 'GENE1', 'GENE1', 'GENE4'])] == [1, 2, 3, 5, 6]
+    assert gene_index.panel_rows(['GENE2', 'Gene3']).tolist() == [1, 2, 4]
+    assert gene_index.panel([]) == []
+    assert gene_index.missing(['GENE1', 'gene3', 'GENE4']) == ['GENE4']
+
+
+def test_range_positions():
+    starts, ends = np.array([5, 0, 2]), np.array([7, 0, 3])
+    assert range_positions(starts, ends).tolist() == [5, 6, 2]
+
+
+def test_main(gene_index: GeneIndex, tmp_path: Path, capsys: pytest.CaptureFixture):
+    assert len(gene_index) == len(DECISIONS) - 1
+    gene_file = tmp_path / 'panel.txt'
+    gene_file.write_text('Gene3\n\n')
+    main(str(tmp_path / 'clinvar_decisions.genes.idx'), genes=['GENE2'], gene_file=str(gene_file))
+    assert capsys.readouterr().out.splitlines() == [
+        'chr1\t200\tA\tG\tPathogenic/Likely Pathogenic\t1\t2',
+        'chr1\t300\tA\tT\tPathogenic/Likely Pathogenic\t1\t3',
+        'chr2\t50\tA\tG\tPathogenic/Likely Pathogenic\t1\t5',
+    ]
+
+
+def test_gene_symbols():
+    assert gene_symbols('BRCA1') == ['BRCA1']
+    assert gene_symbols('LOC1;BRCA1') == ['LOC1', 'BRCA1']
+    assert gene_symbols('-') == []
+
+
+def test_allele_locus_map_genes(tmp_path: Path):
+    """the genes are kept from the same scan of variant_summary"""
+    columns = [
+        'AlleleID',
+        'GeneID',
+        'GeneSymbol',
+        'RS# (dbSNP)',
+        'Assembly',
+        'Chromosome',
+        'VariationID',
+        'PositionVCF',
+        'ReferenceAlleleVCF',
+        'AlternateAlleleVCF',
+    ]
+    rows = [
+        ['1', '672', 'BRCA1', '-1', 'GRCh38', '17', '11', '100', 'A', 'G'],
+        ['2', '-1', 'LOC1;BRCA2', '-1', 'GRCh38', '13', '12', '200', 'C', 'T'],
+        ['3', '-1', '-', '-1', 'GRCh38', '1', '13', '300', 'G', 'A'],
+        ['4', '672', 'BRCA1', '-1', 'GRCh37', '17', '11', '90', 'A', 'G'],
+    ]
+    summary = tmp_path / 'variant_summary.txt.gz'
+    with gzip.open(summary, 'wt') as handle:
+        handle.write('#' + '\t'.join(columns) + '\n')
+        handle.writelines('\t'.join(row) + '\n' for row in rows)
+
+    allele_map = get_allele_locus_map(str(summary), GRCH38)
+    assert {key: value['genes'] for key, value in allele_map.items()} == {
+        'chr17_11': ['BRCA1'],
+        'chr13_12': ['LOC1', 'BRCA2'],
+        'chr1_13': [],
+    }
@@ -1,6 +1,19 @@
+import gzip
+import io
 from pathlib import Path
+from typing import NoReturn
 
-from clinvarbitration.scripts.clinvar_by_codon import parse_tsv_into_dict
+import pytest
+
+from clinvarbitration.scripts.clinvar_by_codon import (
+    CodonAggregator,
+    aggregate_rows,
+    aggregate_tsv,
+    main,
+    parse_integers,
+    parse_tsv_into_dict,
+    write_results_as_tsv,
+)
 
 input_path = Path(__file__).parent / 'input'
 test_tsv_file = input_path / 'post_annotation.tsv'
@@ -24,3 +37,182 @@ def test_pm5_table():
         'ENST00000620552::310': {'822393::0'},
         'ENST00000651234::343': {'822393::0'},
     }
+
+
+def test_aggregate_rows_sorted_and_deduplicated():
+    rows = [
+        'ENST2\t3A>3C\t10\t1\n',
+        'ENST1\t5A>5C\t100\t0\n',
+        'ENST1\t5A>5T\t99\t0\n',
+        # the same allele, annotated twice
+        'ENST1\t5A>5T\t99\t0\n',
+        'ENST1\t12A>12T\t7\t4\n',
+    ]
+    codon_index = aggregate_rows(rows)
+    assert list(codon_index.rows()) == [
+        ('ENST1', 5, '99::0+100::0'),
+        ('ENST1', 12, '7::4'),
+        ('ENST2', 3, '10::1'),
+    ]
+    assert codon_index.to_dict() == {
+        'ENST1::5': {'99::0', '100::0'},
+        'ENST1::12': {'7::4'},
+        'ENST2::3': {'10::1'},
+    }
+
+
+def test_aggregate_rows_empty():
+    assert list(aggregate_rows([]).rows()) == []
+
+
+def test_aggregate_rows_mismatched_codon():
+    with pytest.raises(ValueError, match='Codon numbers do not match'):
+        aggregate_rows(['ENST1\t5A>6C\t100\t0\n'])
+
+
+def test_write_results_as_tsv(tmp_path: Path):
+    output = tmp_path / 'pm5.tsv'
+    write_results_as_tsv(aggregate_tsv(str(test_tsv_file)), str(output))
+    lines = output.read_text().splitlines()
+    assert lines[0] == 'transcript\tcodon\tclinvar_alleles'
+    assert lines[1:4] == [
+        'ENST00000338591\t561\t904889::0',
+        'ENST00000341290\t663\t1310278::0',
+        'ENST00000379370\t76\t244110::1',
+    ]
+    # one row per (transcript, codon), plus the header
+    assert len(lines) == len(parse_tsv_into_dict(str(test_tsv_file))) + 1
+
+
+def test_aggregate_compressed(tmp_path: Path):
+    """gzip, and multi-member gzip as written by bgzip, are both read as a stream"""
+    content = test_tsv_file.read_bytes()
+    expected = list(aggregate_tsv(str(test_tsv_file)).rows())
+
+    gzipped = tmp_path / 'annotated.tsv.gz'
+    gzipped.write_bytes(gzip.compress(content))
+    assert list(aggregate_tsv(str(gzipped)).rows()) == expected
+
+    # BGZF is a series of gzip members, and the extension doesn't matter
+    halfway = content.index(b'\n', len(content) // 2) + 1
+    blocked = tmp_path / 'annotated.tsv'
+    blocked.write_bytes(gzip.compress(content[:halfway]) + gzip.compress(content[halfway:]))
+    assert list(aggregate_tsv(str(blocked)).rows()) == expected
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_aggregate_stdin(monkeypatch: pytest.MonkeyPatch, compress: bool):
+    content = test_tsv_file.read_bytes()
+    stdin = io.TextIOWrapper(io.BufferedReader(io.BytesIO(gzip.compress(content) if compress else content)))
+    monkeypatch.setattr('sys.stdin', stdin)
+    assert list(aggregate_tsv('-').rows()) == list(aggregate_tsv(str(test_tsv_file)).rows())
+    # stdin is left open
+    assert not stdin.buffer.closed
+
+
+def test_keyed_rows_in_string_order():
+    """the Hail Table key is the string 'transcript::codon', which doesn't sort the same as (transcript, codon)"""
+    rows = ['ENST1\t9A>9C\t1\t0\n', 'ENST1\t10A>10C\t2\t0\n', 'ENST10\t5A>5C\t3\t1\n']
+    assert aggregate_rows(rows).keyed_rows() == [
+        {'newkey': 'ENST10::5', 'clinvar_alleles': '3::1'},
+        {'newkey': 'ENST1::10', 'clinvar_alleles': '2::0'},
+        {'newkey': 'ENST1::9', 'clinvar_alleles': '1::0'},
+    ]
+
+
+def test_main_without_hail_table(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """with write_ht=False only the TSV is written, and Hail is never started"""
+
+    def fail(*_args: object, **_kwargs: object) -> NoReturn:
+        raise AssertionError('Hail should not be started')
+
+    monkeypatch.setattr('hail.context.init_spark', fail)
+    output_root = tmp_path / 'clinvar_decisions.pm5'
+    main(input_tsv=str(test_tsv_file), output_root=str(output_root), assembly='GRCh38', write_ht=False)
+
+    assert (tmp_path / 'clinvar_decisions.pm5.tsv').exists()
+    assert not (tmp_path / 'clinvar_decisions.pm5.ht').exists()
+
+
+def test_structured_tsv(tmp_path: Path):
+    """structured output adds max_stars and n_alleles columns to each row"""
+    rows = ['ENST1\t9A>9C\t7\t2\n', 'ENST10\t5A>5C\t3\t1\n', 'ENST1\t9A>9D\t1\t0\n']
+    output = tmp_path / 'pm5.tsv'
+    write_results_as_tsv(aggregate_rows(rows), str(output), structured=True)
+    assert output.read_text() == (
+        'transcript\tcodon\tclinvar_alleles\tmax_stars\tn_alleles\nENST1\t9\t1::0+7::2\t2\t2\nENST10\t5\t3::1\t1\t1\n'
+    )
+
+
+def test_structured_tsv_across_blocks(monkeypatch: pytest.MonkeyPatch):
+    """the trailing columns are placed correctly where a block of lines ends"""
+    rows = [f'ENST1\t{codon}A>{codon}C\t{codon}\t{codon % 3}\n' for codon in range(1, 8)]
+    codon_index = aggregate_rows(rows)
+    expected = ''.join(codon_index.tsv_lines(structured=True))
+    monkeypatch.setattr('clinvarbitration.scripts.clinvar_by_codon.BATCH_ROWS', 3)
+    assert ''.join(codon_index.tsv_lines(structured=True)) == expected
+    assert expected.splitlines()[0] == 'ENST1\t1\t1::1\t1\t1'
+
+
+def test_structured_keyed_rows():
+    rows = ['ENST1\t9A>9C\t7\t2\n', 'ENST1\t9A>9D\t1\t0\n']
+    assert aggregate_rows(rows).keyed_rows(structured=True) == [
+        {
+            'newkey': 'ENST1::9',
+            'clinvar_alleles': '1::0+7::2',
+            'alleles': [{'allele_id': 1, 'gold_stars': 0}, {'allele_id': 7, 'gold_stars': 2}],
+            'max_stars': 2,
+            'n_alleles': 2,
+        },
+    ]
+
+
+def test_residue_index():
+    """the PS1 index separates alleles at the same codon by their alternate amino acid"""
+    rows = [
+        'ENST1\t9A>9C\t7\t2\n',
+        'ENST1\t9A>9D\t1\t0\n',
+        'ENST1\t9A>9C\t5\t1\n',
+        'ENST1\t9A>9C\t5\t1\n',
+        'ENST2\t4R>4\t8\t0\n',
+    ]
+    aggregator = CodonAggregator().add_rows(rows)
+    assert aggregator.aggregate().to_dict() == {'ENST1::9': {'1::0', '5::1', '7::2'}, 'ENST2::4': {'8::0'}}
+
+    # the row without an alternate amino acid is left out of the residue index
+    residue_index = aggregator.aggregate(by_residue=True)
+    assert residue_index.to_dict() == {'ENST1::9::C': {'5::1', '7::2'}, 'ENST1::9::D': {'1::0'}}
+    assert ''.join(residue_index.tsv_lines()) == 'ENST1\t9\tC\t5::1+7::2\nENST1\t9\tD\t1::0\n'
+    assert [row['newkey'] for row in residue_index.keyed_rows()] == ['ENST1::9::C', 'ENST1::9::D']
+
+
+def test_parse_integers():
+    assert parse_integers(['561', '0', '904889']).tolist() == [561, 0, 904889]
+    for bad_values in [['561', 'N'], ['1.5'], [''], ['99999999999999999999']]:
+        assert parse_integers(bad_values) is None
+
+
+def test_residue_index_matches_row_parser(monkeypatch: pytest.MonkeyPatch):
+    """the batch parser and the row-by-row fallback find the same alternate amino acids"""
+    with open(test_tsv_file) as handle:
+        rows = handle.readlines()
+    fast = CodonAggregator().add_rows(rows).aggregate(by_residue=True).to_dict()
+
+    # force every batch down the row-by-row path
+    monkeypatch.setattr('clinvarbitration.scripts.clinvar_by_codon.parse_integers', lambda _values: None)
+    assert CodonAggregator().add_rows(rows).aggregate(by_residue=True).to_dict() == fast
+    assert fast['ENST00000338591::561::E'] == {'904889::0'}
+
+
+def test_main_writes_ps1(tmp_path: Path):
+    main(
+        input_tsv=str(test_tsv_file),
+        output_root=str(tmp_path / 'clinvar_decisions.pm5'),
+        assembly='GRCh38',
+        write_ht=False,
+        ps1_root=str(tmp_path / 'clinvar_decisions.ps1'),
+    )
+    lines = (tmp_path / 'clinvar_decisions.ps1.tsv').read_text().splitlines()
+    assert lines[0] == 'transcript\tcodon\talt_aa\tclinvar_alleles'
+    assert 'ENST00000338591\t561\tE\t904889::0' in lines
+    assert len(lines) == len((tmp_path / 'clinvar_decisions.pm5.tsv').read_text().splitlines())
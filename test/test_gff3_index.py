@@ -0,0 +1,70 @@
+from pathlib import Path
+from typing import NoReturn
+
+import pytest
+
+from clinvarbitration.scripts import gff3_index
+from clinvarbitration.scripts.checksums import checksum_path
+from clinvarbitration.scripts.gff3_index import (
+    TranscriptIndex,
+    default_index_path,
+    load_or_compile,
+    parse_gff3,
+)
+
+MINI_GFF3 = str(Path(__file__).parent / 'input' / 'mini_region.gff3')
+
+
+def test_index_round_trip(tmp_path: Path):
+    transcripts = parse_gff3(MINI_GFF3)
+    index_path = str(tmp_path / 'mini.cdsidx')
+    TranscriptIndex.from_transcripts(transcripts, checksum='abc').write(index_path)
+
+    index = TranscriptIndex.load(index_path)
+    assert index.checksum == 'abc'
+    assert len(index) == len(transcripts)
+    assert [index.transcript(tx_index) for tx_index in range(len(index))] == transcripts
+
+
+def test_overlapping_matches_linear_scan(tmp_path: Path):
+    transcripts = parse_gff3(MINI_GFF3)
+    index_path = str(tmp_path / 'mini.cdsidx')
+    TranscriptIndex.from_transcripts(transcripts, checksum='abc').write(index_path)
+    index = TranscriptIndex.load(index_path)
+
+    for pos in range(1, 3700):
+        expected = [
+            (tx_index, seg_index)
+            for tx_index, transcript in enumerate(transcripts)
+            for seg_index, (start, end) in enumerate(transcript.cds)
+            if start <= pos <= end
+        ]
+        assert index.overlapping('21', pos) == expected
+    assert index.overlapping('22', 100) == []
+
+
+def test_load_or_compile_caches(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    gff3 = tmp_path / 'mini.gff3'
+    gff3.write_text(Path(MINI_GFF3).read_text())
+
+    index = load_or_compile(str(gff3))
+    assert Path(default_index_path(str(gff3), checksum_path(str(gff3)))).exists()
+
+    # a second load uses the cached index, without parsing the GFF3
+    def fail(_gff3: str) -> NoReturn:
+        raise AssertionError('GFF3 was re-parsed')
+
+    monkeypatch.setattr(gff3_index, 'parse_gff3', fail)
+    cached = load_or_compile(str(gff3))
+    assert cached.checksum == index.checksum
+    assert cached.overlapping('21', 110) == index.overlapping('21', 110)
+
+
+def test_load_or_compile_stale_index(tmp_path: Path):
+    index_path = str(tmp_path / 'mini.cdsidx')
+    TranscriptIndex.from_transcripts([], checksum='stale').write(index_path)
+
+    index = load_or_compile(MINI_GFF3, index_path=index_path)
+    assert index.checksum == checksum_path(MINI_GFF3)
+    assert TranscriptIndex.load(index_path).checksum == index.checksum
+    assert len(index) == len(parse_gff3(MINI_GFF3))
@@ -0,0 +1,121 @@
+import gzip
+from pathlib import Path
+
+import pytest
+
+from clinvarbitration.scripts.identifier_index import IdentifierIndex, main, parse_query
+from clinvarbitration.scripts.resummarise_clinvar import (
+    GRCH38,
+    ORDERED_CONTIGS,
+    Consequence,
+    get_allele_locus_map,
+    rsid_number,
+)
+
+SIGNIFICANCE = [consequence.value for consequence in Consequence]
+
+
+def decision(contig: str, position: int, allele_id: int, variation_id: int, rsid: int, alt: str = 'G') -> dict:
+    return {
+        'contig': contig,
+        'position': position,
+        'alleles': ['A', alt],
+        'clinical_significance': Consequence.PATHOGENIC.value,
+        'gold_stars': 1,
+        'allele_id': allele_id,
+        'variation_id': variation_id,
+        'rsid': rsid,
+    }
+
+
+# sorted on contig & position, rs100 is shared by two alternate alleles, and one decision has no rsID
+DECISIONS = [
+    decision('chr1', 100, 30, 300, 100),
+    decision('chr1', 100, 31, 301, 100, alt='T'),
+    decision('chr2', 50, 10, 100, -1),
+    decision('chrX', 10, 20, 200, 5),
+]
+
+
+@pytest.fixture(name='index_path')
+def fixture_index_path(tmp_path: Path) -> str:
+    index_path = str(tmp_path / 'clinvar_decisions.ids.idx')
+    IdentifierIndex.from_decisions(DECISIONS, contigs=ORDERED_CONTIGS[GRCH38], significance=SIGNIFICANCE).write(
+        index_path,
+    )
+    return index_path
+
+
+def test_identifier_index(index_path: str):
+    index = IdentifierIndex.load(index_path)
+    assert len(index) == len(DECISIONS)
+    assert index.lookup('allele_id', 10) == [('chr2', 50, 'A', 'G', 'Pathogenic/Likely Pathogenic', 1, 10)]
+    assert [each[-1] for each in index.lookup('variation_id', 200)] == [20]
+    assert [each[-1] for each in index.lookup('rsid', 100)] == [30, 31]
+    assert index.lookup('rsid', 101) == []
+    # the missing rsID isn't indexed, and negative queries match nothing
+    assert index.lookup('rsid', -1) == []
+    assert index.rows('allele_id', [20, 30, 99]).tolist() == [0, 3]
+
+
+def test_lookup_many(index_path: str):
+    index = IdentifierIndex.load(index_path)
+    starts, ends = index.lookup_many('rsid', [5, 100, 7, -3])
+    assert (ends - starts).tolist() == [1, 2, 0, 0]
+    with pytest.raises(ValueError, match='Identifiers are one of'):
+        index.lookup_many('gene', [1])
+
+
+def test_parse_query():
+    assert parse_query('AlleleID:15041') == ('allele_id', 15041)
+    assert parse_query('variationid:17661') == ('variation_id', 17661)
+    assert parse_query('rs80357906') == ('rsid', 80357906)
+    for query in ['15041', 'AlleleID:x', 'rs', 'Gene:BRCA1']:
+        with pytest.raises(ValueError, match='Queries are formatted as'):
+            parse_query(query)
+    for query in ['rs99999999999999999999', 'AlleleID:99999999999999999999']:
+        with pytest.raises(ValueError, match='Identifiers are at most'):
+            parse_query(query)
+
+
+def test_main(index_path: str, tmp_path: Path, capsys: pytest.CaptureFixture):
+    query_file = tmp_path / 'queries.txt'
+    query_file.write_text('VariationID:100\n\n')
+    main(index_path, queries=['rs100', 'AlleleID:99'], query_file=str(query_file))
+    assert capsys.readouterr().out.splitlines() == [
+        'rs100\tchr1\t100\tA\tG\tPathogenic/Likely Pathogenic\t1\t30',
+        'rs100\tchr1\t100\tA\tT\tPathogenic/Likely Pathogenic\t1\t31',
+        'VariationID:100\tchr2\t50\tA\tG\tPathogenic/Likely Pathogenic\t1\t10',
+    ]
+
+
+def test_rsid_number():
+    assert rsid_number('80357906') == 80357906  # noqa: PLR2004
+    assert rsid_number('-1') == -1
+    assert rsid_number('') == -1
+
+
+def test_allele_locus_map_rsids(tmp_path: Path):
+    """the rsIDs are kept from the same scan of variant_summary"""
+    columns = [
+        'AlleleID',
+        'GeneSymbol',
+        'RS# (dbSNP)',
+        'Assembly',
+        'Chromosome',
+        'VariationID',
+        'PositionVCF',
+        'ReferenceAlleleVCF',
+        'AlternateAlleleVCF',
+    ]
+    rows = [
+        ['1', 'BRCA1', '80357906', 'GRCh38', '17', '11', '100', 'A', 'G'],
+        ['2', 'BRCA2', '-1', 'GRCh38', '13', '12', '200', 'C', 'T'],
+    ]
+    summary = tmp_path / 'variant_summary.txt.gz'
+    with gzip.open(summary, 'wt') as handle:
+        handle.write('#' + '\t'.join(columns) + '\n')
+        handle.writelines('\t'.join(row) + '\n' for row in rows)
+
+    allele_map = get_allele_locus_map(str(summary), GRCH38)
+    assert {key: value['rsid'] for key, value in allele_map.items()} == {'chr17_11': 80357906, 'chr13_12': -1}
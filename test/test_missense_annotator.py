@@ -0,0 +1,71 @@
+"""
+The mini_region files are a synthetic 3.6kb contig with Ensembl-style gene models, covering both strands, multi-exon
+and alternatively spliced transcripts, incomplete 5' CDS (phase 1 & 2), an NMD transcript, a polymorphic pseudogene,
+overlapping genes, and a non-coding gene. The VCF contains an SNV at every CDS position, and a few outside CDS.
+
+mini_region.missense.tsv was generated with bcftools 1.24:
+bcftools csq --force --local-csq -f mini_region.fa --unify-chr-names 'chr,-,chr' -g mini_region.gff3 mini_region.vcf |
+bcftools +split-vep -d -s :missense -f "%transcript\t%amino_acid_change\t%allele_id\t%gold_stars\n" -
+"""
+
+import shutil
+from pathlib import Path
+
+import pytest
+
+from clinvarbitration.scripts.annotate_snvs import annotate_chunk
+from clinvarbitration.scripts.missense_annotator import (
+    MissenseAnnotator,
+    annotate_in_parallel,
+    build_fai,
+    read_vcf_records,
+)
+
+input_path = Path(__file__).parent / 'input'
+MINI_FA = str(input_path / 'mini_region.fa')
+MINI_GFF3 = str(input_path / 'mini_region.gff3')
+MINI_VCF = str(input_path / 'mini_region.vcf')
+EXPECTED = input_path / 'mini_region.missense.tsv'
+
+
+@pytest.fixture(scope='module', name='annotator')
+def fixture_annotator(tmp_path_factory: pytest.TempPathFactory) -> MissenseAnnotator:
+    index_path = str(tmp_path_factory.mktemp('index') / 'mini_region.cdsidx')
+    return MissenseAnnotator.from_files(gff3=MINI_GFF3, ref_fa=MINI_FA, index_path=index_path)
+
+
+def test_annotate_single(annotator: MissenseAnnotator):
+    # + strand, shared by both alternative transcripts of gene A
+    assert annotator.annotate('chr21', 110, 'T') == [
+        ('ENST0000000A1', '4N>4Y'),
+        ('ENST0000000A2', '4N>4Y'),
+    ]
+    # contig names are matched with or without a 'chr' prefix
+    assert annotator.annotate('21', 110, 'T') == annotator.annotate('chr21', 110, 'T')
+    # intronic
+    assert annotator.annotate('chr21', 200, 'A') == []
+
+
+def test_concordance_with_bcftools(annotator: MissenseAnnotator):
+    """the native annotator produces exactly the rows bcftools csq | +split-vep does, in the same order"""
+    rows = list(annotate_in_parallel(read_vcf_records(MINI_VCF), annotator=annotator, threads=1))
+    assert rows == EXPECTED.read_text().splitlines(keepends=True)
+
+
+def test_parallel_matches_serial(annotator: MissenseAnnotator):
+    serial = list(annotate_in_parallel(read_vcf_records(MINI_VCF), annotator=annotator, threads=1))
+    parallel = list(annotate_in_parallel(read_vcf_records(MINI_VCF), annotator=annotator, threads=3))
+    assert parallel == serial
+
+
+@pytest.mark.skipif(shutil.which('bcftools') is None, reason='bcftools is not installed')
+def test_live_concordance_with_bcftools(annotator: MissenseAnnotator):
+    bcftools_rows = annotate_chunk(vcf=MINI_VCF, ref_fa=MINI_FA, gff3=MINI_GFF3).decode()
+    rows = list(annotate_in_parallel(read_vcf_records(MINI_VCF), annotator=annotator, threads=1))
+    assert rows == bcftools_rows.splitlines(keepends=True)
+
+
+def test_build_fai(tmp_path: Path):
+    fasta = tmp_path / 'ref.fa'
+    shutil.copy(MINI_FA, fasta)
+    assert Path(build_fai(str(fasta))).read_text() == Path(f'{MINI_FA}.fai').read_text()
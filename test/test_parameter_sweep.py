@@ -0,0 +1,109 @@
+import random
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from clinvarbitration.scripts import resummarise_clinvar
+from clinvarbitration.scripts.parameter_sweep import (
+    OUTCOMES,
+    REPORT_KEYS,
+    SubmissionAggregates,
+    parse_strong,
+    sweep,
+)
+from clinvarbitration.scripts.resummarise_clinvar import (
+    ACMG_THRESHOLD,
+    MAJORITY_RATIO,
+    MINORITY_RATIO,
+    STRONG_REVIEWS,
+    TIMEZONE,
+    VERY_OLD,
+    Consequence,
+    Submission,
+    decide,
+)
+
+REVIEWS = [
+    'criteria provided, single submitter',
+    'no assertion criteria provided',
+    'reviewed by expert panel',
+    'practice guideline',
+]
+DATES = [VERY_OLD, *(datetime(year=year, month=6, day=1, tzinfo=TIMEZONE) for year in (2012, 2015, 2016, 2019))]
+THRESHOLDS = [
+    datetime(year=2015, month=6, day=1, tzinfo=TIMEZONE),
+    datetime(year=2017, month=1, day=1, tzinfo=TIMEZONE),
+]
+STRONG_OPTIONS = [['practice guideline', 'reviewed by expert panel'], ['practice guideline'], []]
+
+
+def random_submissions(variants: int, seed: int = 1) -> dict[int, list[Submission]]:
+    """submissions as get_all_decisions retains them, with no Unknown classes, mostly weak reviews"""
+    rng = random.Random(seed)  # noqa: S311
+    classes = [Consequence.PATHOGENIC, Consequence.BENIGN, Consequence.UNCERTAIN]
+    return {
+        var_id: [
+            Submission(
+                rng.choice(DATES),
+                f'lab {rng.randint(1, 5)}',
+                rng.choice(classes),
+                rng.choices(REVIEWS, weights=[20, 10, 1, 1])[0],
+            )
+            for _ in range(rng.randint(1, 8))
+        ]
+        for var_id in range(1, variants + 1)
+    }
+
+
+@pytest.fixture(name='submissions')
+def fixture_submissions() -> dict[int, list[Submission]]:
+    return random_submissions(400)
+
+
+def test_matches_decide(submissions: dict[int, list[Submission]], monkeypatch: pytest.MonkeyPatch, tmp_path: Path):
+    """every setting gives the same decisions & stars as decide() with the module constants set to it"""
+    path = str(tmp_path / 'clinvar.sweep')
+    SubmissionAggregates.from_submissions(submissions, weights=dict.fromkeys(submissions, 1)).write(path)
+    aggregates = SubmissionAggregates.load(path)
+
+    for majority, minority, threshold, strong in [
+        (0.6, 0.2, THRESHOLDS[0], STRONG_OPTIONS[0]),
+        (0.5, 0.3, THRESHOLDS[1], STRONG_OPTIONS[1]),
+        (0.8, 0.1, THRESHOLDS[1], STRONG_OPTIONS[2]),
+    ]:
+        monkeypatch.setattr(resummarise_clinvar, 'MAJORITY_RATIO', majority)
+        monkeypatch.setattr(resummarise_clinvar, 'MINORITY_RATIO', minority)
+        monkeypatch.setattr(resummarise_clinvar, 'ACMG_THRESHOLD', threshold)
+        monkeypatch.setattr(resummarise_clinvar, 'STRONG_REVIEWS', strong)
+        codes, stars = aggregates.decisions(majority, minority, threshold, strong)
+        expected = [decide(submissions[var_id]) for var_id in aggregates.variation_id.tolist()]
+        assert [OUTCOMES[code] for code in codes.tolist()] == [rating for rating, _stars in expected]
+        assert stars.tolist() == [each_stars for _rating, each_stars in expected]
+
+
+def test_sweep(submissions: dict[int, list[Submission]]):
+    # VariationID 1 becomes two decisions, e.g. on X & Y
+    weights = dict.fromkeys(submissions, 1) | {1: 2}
+    aggregates = SubmissionAggregates.from_submissions(submissions, weights=weights)
+    rows = sweep(aggregates, [0.5, 0.6, 0.7], [0.2], THRESHOLDS, STRONG_OPTIONS)
+    assert len(rows) == 3 * 2 * 3
+    assert all(list(row) == REPORT_KEYS for row in rows)
+    for row in rows:
+        assert sum(row[consequence.value] for consequence in OUTCOMES) == len(submissions) + 1
+        assert sum(row[f'stars_{stars}'] for stars in range(5)) == len(submissions) + 1
+
+    # other settings differ somewhere, and the current settings change nothing
+    assert any(row['changed'] for row in rows)
+    (current,) = sweep(aggregates, [MAJORITY_RATIO], [MINORITY_RATIO], [ACMG_THRESHOLD], [STRONG_REVIEWS])
+    assert current['changed'] == 0
+    assert current['strong_reviews'] == 'practice guideline;reviewed by expert panel'
+    assert current['acmg_threshold'] == '2016-01-01'
+
+
+def test_parse_strong():
+    assert parse_strong('Practice guideline; reviewed by expert panel') == [
+        'practice guideline',
+        'reviewed by expert panel',
+    ]
+    assert parse_strong('none') == []
@@ -0,0 +1,88 @@
+from pathlib import Path
+
+import pytest
+
+from clinvarbitration.scripts.clinvar_by_codon import CodonAggregator
+from clinvarbitration.scripts.parquet_output import write_codon_index_parquet, write_decisions_parquet
+from clinvarbitration.scripts.resummarise_clinvar import GRCH38, ORDERED_CONTIGS, Consequence
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+PM5_ROWS = [
+    'ENST2\t5A>5C\t3\t1\n',
+    'ENST1\t9A>9C\t7\t2\n',
+    'ENST1\t9A>9D\t1\t0\n',
+    'ENST1\t4A>4C\t5\t1\n',
+    'ENST3\t1A>1C\t8\t1\n',
+]
+
+
+def decision(contig: str, position: int, significance: Consequence, allele_id: int) -> dict:
+    return {
+        'contig': contig,
+        'position': position,
+        'alleles': ['A', 'G'],
+        'clinical_significance': significance.value,
+        'gold_stars': 1,
+        'allele_id': allele_id,
+    }
+
+
+DECISIONS = [
+    decision('chr1', 100, Consequence.BENIGN, 1),
+    decision('chr1', 200, Consequence.PATHOGENIC, 2),
+    decision('chr2', 50, Consequence.UNCERTAIN, 3),
+    decision('chrX', 5, Consequence.PATHOGENIC, 4),
+    decision('chrX', 15, Consequence.BENIGN, 5),
+]
+
+
+def test_decisions_row_groups(tmp_path: Path):
+    path = str(tmp_path / 'clinvar_decisions.parquet')
+    write_decisions_parquet(DECISIONS, path, contigs=ORDERED_CONTIGS[GRCH38], assembly=GRCH38)
+
+    parquet = pq.ParquetFile(path)
+    assert parquet.metadata.num_row_groups == 3  # noqa: PLR2004
+    assert parquet.schema_arrow.metadata[b'assembly'] == GRCH38.encode()
+    assert pa.types.is_dictionary(parquet.schema_arrow.field('clinical_significance').type)
+
+    position = parquet.schema_arrow.get_field_index('position')
+    bounds = []
+    for index in range(parquet.metadata.num_row_groups):
+        statistics = parquet.metadata.row_group(index).column(position).statistics
+        bounds.append((statistics.min, statistics.max))
+    assert bounds == [(100, 200), (50, 50), (5, 15)]
+
+    table = pq.read_table(path, columns=['position', 'allele_id'], filters=[('contig', '=', 'chrX')])
+    assert table.to_pydict() == {'position': [5, 15], 'allele_id': [4, 5]}
+
+
+def test_codon_index_row_groups(tmp_path: Path):
+    """transcripts are never split across row groups, and stay sorted for pushdown on transcript"""
+    codon_index = CodonAggregator().add_rows(PM5_ROWS).aggregate()
+    path = str(tmp_path / 'clinvar_decisions.pm5.parquet')
+    write_codon_index_parquet(codon_index, path, structured=True, target_rows=2)
+
+    parquet = pq.ParquetFile(path)
+    assert [parquet.metadata.row_group(index).num_rows for index in range(parquet.metadata.num_row_groups)] == [2, 2]
+    assert pa.types.is_dictionary(parquet.schema_arrow.field('transcript').type)
+
+    table = pq.read_table(path, filters=[('transcript', '=', 'ENST1')])
+    assert table.column('codon').to_pylist() == [4, 9]
+    assert table.column('clinvar_alleles').to_pylist() == ['5::1', '1::0+7::2']
+    assert table.column('alleles').to_pylist()[1] == [
+        {'allele_id': 1, 'gold_stars': 0},
+        {'allele_id': 7, 'gold_stars': 2},
+    ]
+    assert table.column('max_stars').to_pylist() == [1, 2]
+
+
+def test_residue_index_parquet(tmp_path: Path):
+    residue_index = CodonAggregator().add_rows(PM5_ROWS).aggregate(by_residue=True)
+    path = str(tmp_path / 'clinvar_decisions.ps1.parquet')
+    write_codon_index_parquet(residue_index, path)
+
+    table = pq.read_table(path, filters=[('transcript', '=', 'ENST1'), ('codon', '=', 9)])
+    assert table.column('alt_aa').to_pylist() == ['C', 'D']
+    assert table.column('clinvar_alleles').to_pylist() == ['7::2', '1::0']
@@ -0,0 +1,119 @@
+from pathlib import Path
+
+import pytest
+
+from clinvarbitration.scripts.clinvar_by_codon import aggregate_rows, aggregate_tsv
+from clinvarbitration.scripts.pm5_index import Pm5Index, main, parse_query
+
+input_path = Path(__file__).parent / 'input'
+test_tsv_file = input_path / 'post_annotation.tsv'
+
+
+@pytest.fixture(name='pm5_index')
+def fixture_pm5_index(tmp_path: Path) -> Pm5Index:
+    index_path = tmp_path / 'clinvar_decisions.pm5.idx'
+    Pm5Index.from_codon_index(aggregate_tsv(str(test_tsv_file))).write(str(index_path))
+    return Pm5Index.load(str(index_path))
+
+
+def test_lookup_matches_aggregation(pm5_index: Pm5Index):
+    """every (transcript, codon) in the PM5 data is found in the memory-mapped index"""
+    assert not pm5_index.group_key.flags.owndata
+    assert not pm5_index.group_key.flags.writeable
+    for key, alleles in aggregate_tsv(str(test_tsv_file)).to_dict().items():
+        transcript, codon = key.split('::')
+        found = pm5_index.lookup(transcript, int(codon))
+        assert {f'{allele_id}::{stars}' for allele_id, stars in found} == alleles
+
+
+def test_lookup_misses(pm5_index: Pm5Index):
+    assert pm5_index.lookup('ENST00000338591', 560) == []
+    assert pm5_index.lookup('ENST00000338590', 561) == []
+    assert pm5_index.lookup('ENST99999999999999999999', 1) == []
+    assert pm5_index.lookup('', 1) == []
+
+
+def test_lookup_many_matches_single_lookups(pm5_index: Pm5Index):
+    queries = [
+        ('ENST00000338591', 561),
+        ('ENST00000338591', 562),
+        ('ENST00000649529', 28),
+        ('missing', 1),
+        ('ENST00000379370', 76),
+    ]
+    starts, ends = pm5_index.lookup_many([tx for tx, _ in queries], [codon for _, codon in queries])
+    for (transcript, codon), start, end in zip(queries, starts.tolist(), ends.tolist(), strict=True):
+        assert pm5_index.alleles(start, end) == pm5_index.lookup(transcript, codon)
+
+
+def test_lookup_sorted_alleles():
+    rows = ['ENST1\t9A>9C\t7\t2\n', 'ENST10\t5A>5C\t3\t1\n', 'ENST1\t9A>9D\t1\t0\n']
+    pm5_index = Pm5Index.from_codon_index(aggregate_rows(rows))
+    assert pm5_index.lookup('ENST1', 9) == [(1, 0), (7, 2)]
+    assert pm5_index.lookup('ENST10', 5) == [(3, 1)]
+
+
+def test_empty_index(tmp_path: Path):
+    index_path = str(tmp_path / 'empty.idx')
+    Pm5Index.from_codon_index(aggregate_rows([])).write(index_path)
+    pm5_index = Pm5Index.load(index_path)
+    assert pm5_index.lookup('ENST1', 1) == []
+    starts, ends = pm5_index.lookup_many(['ENST1'], [1])
+    assert starts.tolist() == ends.tolist() == [0]
+
+
+def test_parse_query():
+    assert parse_query('ENST00000338591:561') == ('ENST00000338591', 561)
+    with pytest.raises(ValueError, match='transcript:codon'):
+        parse_query('ENST00000338591')
+    with pytest.raises(ValueError, match='Codons are at most'):
+        parse_query('ENST1:99999999999999999999')
+
+
+def test_cli_output(tmp_path: Path, capsys: pytest.CaptureFixture):
+    index_path = str(tmp_path / 'clinvar_decisions.pm5.idx')
+    Pm5Index.from_codon_index(aggregate_tsv(str(test_tsv_file))).write(index_path)
+    main(index_path=index_path, queries=['ENST00000338591:561', 'ENST00000338591:1'])
+    assert capsys.readouterr().out == 'ENST00000338591\t561\t904889::0\nENST00000338591\t1\t\n'
+
+
+def test_window_queries():
+    """window counts and listings match a scan of every codon on the transcript"""
+    rows = [
+        'ENST1\t5A>5C\t1\t0\n',
+        'ENST1\t8A>8C\t2\t1\n',
+        'ENST1\t8A>8D\t3\t2\n',
+        'ENST1\t20A>20C\t4\t0\n',
+        'ENST2\t7A>7C\t5\t1\n',
+    ]
+    pm5_index = Pm5Index.from_codon_index(aggregate_rows(rows))
+    per_codon = {('ENST1', 5): 1, ('ENST1', 8): 2, ('ENST1', 20): 1, ('ENST2', 7): 1}
+
+    queries = [(transcript, codon) for transcript in ('ENST1', 'ENST2', 'ENST3') for codon in range(1, 25)]
+    for flank in (0, 2, 3, 15):
+        expected = [
+            sum(
+                count
+                for (tx, hit_codon), count in per_codon.items()
+                if tx == transcript and abs(hit_codon - codon) <= flank
+            )
+            for transcript, codon in queries
+        ]
+        assert [pm5_index.window_count(transcript, codon, flank) for transcript, codon in queries] == expected
+
+        n_codons, n_alleles = pm5_index.window_many([tx for tx, _ in queries], [codon for _, codon in queries], flank)
+        assert n_alleles.tolist() == expected
+        assert n_codons.tolist() == [
+            len({hit[0] for hit in pm5_index.window_alleles(transcript, codon, flank)}) for transcript, codon in queries
+        ]
+
+    assert pm5_index.window_alleles('ENST1', 6, 2) == [(5, 1, 0), (8, 2, 1), (8, 3, 2)]
+    assert pm5_index.window_alleles('ENST2', 6, 2) == [(7, 5, 1)]
+    assert pm5_index.window_alleles('ENST3', 6, 2) == []
+
+
+def test_cli_window(tmp_path: Path, capsys: pytest.CaptureFixture):
+    index_path = str(tmp_path / 'clinvar_decisions.pm5.idx')
+    Pm5Index.from_codon_index(aggregate_tsv(str(test_tsv_file))).write(index_path)
+    main(index_path=index_path, queries=['ENST00000338591:560', 'ENST00000338591:1'], window=1)
+    assert capsys.readouterr().out == 'ENST00000338591\t560\t1\t1\t561:904889::0\nENST00000338591\t1\t0\t0\t\n'
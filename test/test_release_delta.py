@@ -0,0 +1,204 @@
+import json
+import shutil
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from clinvarbitration.scripts import bgzf
+from clinvarbitration.scripts.apply_delta import apply_delta
+from clinvarbitration.scripts.checksums import checksum_rows
+from clinvarbitration.scripts.clinvar_by_codon import CodonIndex, aggregate_rows, write_results_as_tsv
+from clinvarbitration.scripts.pm5_index import Pm5Index
+from clinvarbitration.scripts.release_delta import (
+    CHECKSUMS_NAME,
+    MANIFEST_NAME,
+    main,
+    release_checksums,
+    write_checksums,
+)
+from clinvarbitration.scripts.resummarise_clinvar import (
+    GRCH38,
+    Consequence,
+    write_decision_index,
+    write_decisions_tsv,
+)
+
+PATHOGENIC = Consequence.PATHOGENIC.value
+BENIGN = Consequence.BENIGN.value
+
+
+def decision(contig: str, position: int, alt: str, significance: str, stars: int, allele_id: int) -> dict:
+    return {
+        'contig': contig,
+        'position': position,
+        'alleles': ['A', alt],
+        'clinical_significance': significance,
+        'gold_stars': stars,
+        'allele_id': allele_id,
+    }
+
+
+OLD_DECISIONS = [
+    decision('chr1', 100, 'G', PATHOGENIC, 1, 1),
+    decision('chr1', 100, 'T', BENIGN, 1, 2),
+    decision('chr1', 200, 'G', PATHOGENIC, 1, 3),
+    *[decision('chr2', 1_000 + position, 'C', BENIGN, 1, 100 + position) for position in range(500)],
+    decision('chrX', 10, 'C', PATHOGENIC, 2, 5),
+]
+NEW_DECISIONS = [
+    decision('chr1', 50, 'G', PATHOGENIC, 1, 6),
+    decision('chr1', 100, 'T', BENIGN, 2, 2),
+    decision('chr1', 100, 'G', PATHOGENIC, 1, 1),
+    *[decision('chr2', 1_000 + position, 'C', BENIGN, 1, 100 + position) for position in range(500)],
+    decision('chrX', 10, 'C', PATHOGENIC, 2, 5),
+    decision('chrY', 20, 'C', PATHOGENIC, 1, 7),
+]
+
+OLD_PM5 = ['ENST1\t9A>9C\t7\t2\n', 'ENST1\t9A>9D\t1\t0\n', 'ENST2\t5A>5C\t3\t1\n', 'ENST3\t1A>1C\t4\t1\n']
+NEW_PM5 = ['ENST1\t9A>9C\t7\t2\n', 'ENST1\t9A>9E\t8\t1\n', 'ENST2\t5A>5C\t3\t1\n', 'ENST4\t2A>2C\t9\t1\n']
+
+
+def write_release(path: Path, decisions: list[dict], pm5_rows: list[str]) -> Path:
+    path.mkdir()
+    write_decisions_tsv(decisions, str(path / 'clinvar_decisions.tsv.bgz'))
+    write_decision_index(decisions, str(path / 'clinvar_decisions.idx'), assembly=GRCH38)
+    codon_index = aggregate_rows(pm5_rows)
+    write_results_as_tsv(codon_index, str(path / 'clinvar_decisions.pm5.tsv'))
+    Pm5Index.from_codon_index(codon_index).write(str(path / 'clinvar_decisions.pm5.idx'))
+    # a Hail Table stand-in, which the delta doesn't cover
+    (path / 'clinvar_decisions.ht').mkdir()
+    (path / 'clinvar_decisions.ht' / 'metadata.json').write_text(json.dumps({'rows': len(decisions)}))
+    return path
+
+
+@pytest.fixture
+def releases(tmp_path: Path) -> tuple[Path, Path, Path]:
+    """The previous & new release folders, and the delta between them."""
+    previous = write_release(tmp_path / 'previous', OLD_DECISIONS, OLD_PM5)
+    write_checksums(str(previous))
+    new = write_release(tmp_path / 'new', NEW_DECISIONS, NEW_PM5)
+    delta = tmp_path / 'clinvar_decisions.delta.tar.gz'
+    main(new_dir=str(new), previous_dir=str(previous), delta_path=str(delta))
+    return previous, new, delta
+
+
+def test_codon_index_from_tsv_rows():
+    codon_index = aggregate_rows(NEW_PM5 + OLD_PM5)
+    rows = list(codon_index.tsv_lines())
+    restored = CodonIndex.from_tsv_rows(''.join(rows).splitlines(keepends=True))
+    assert restored.transcripts == codon_index.transcripts
+    assert list(restored.rows()) == list(codon_index.rows())
+
+
+def test_delta_manifest(releases: tuple[Path, Path, Path]):
+    _previous, new, delta = releases
+    checksums = json.loads((new / CHECKSUMS_NAME).read_text())
+    assert checksums == release_checksums(str(new))
+    assert CHECKSUMS_NAME not in checksums
+
+    with tarfile.open(delta, 'r:gz') as tar:
+        manifest = json.load(tar.extractfile(MANIFEST_NAME))
+        decision_rows = tar.extractfile('decisions.tsv').read().decode().splitlines()
+
+    assert manifest['changes'] == {
+        'decisions': {'added': 2, 'removed': 1, 'changed': 1},
+        'pm5': {'added': 1, 'removed': 1, 'changed': 1},
+    }
+    assert set(manifest['target']) == {
+        'clinvar_decisions.idx',
+        'clinvar_decisions.pm5.tsv',
+        'clinvar_decisions.pm5.idx',
+    }
+    # the compressed decisions are checked on their rows, and their tabix index isn't checked
+    assert manifest['rows'] == {'clinvar_decisions.tsv.bgz': checksum_rows(str(new / 'clinvar_decisions.tsv.bgz'))}
+    assert manifest['derived'] == ['clinvar_decisions.tsv.bgz.tbi']
+    assert manifest['not_covered'] == ['clinvar_decisions.ht']
+
+    # a header, chr1:50 added, both alleles at chr1:100 removed & re-added, chr1:200 removed, and chrY:20 added
+    # the unchanged positions on chr2 & chrX aren't in the delta
+    assert decision_rows[0].split('\t')[0] == 'change'
+    assert len(decision_rows) == 1 + 1 + 4 + 1 + 1
+
+
+def test_apply_delta(releases: tuple[Path, Path, Path], tmp_path: Path):
+    previous, new, delta = releases
+    local = tmp_path / 'local'
+    shutil.copytree(previous, local)
+
+    apply_delta(str(delta), str(local))
+
+    updated = release_checksums(str(local))
+    expected = release_checksums(str(new))
+    for name in json.loads((new / CHECKSUMS_NAME).read_text()):
+        if name != 'clinvar_decisions.ht':
+            assert updated[name] == expected[name], name
+    assert updated['clinvar_decisions.ht'] == release_checksums(str(previous))['clinvar_decisions.ht']
+
+    # the temporary folder is cleaned up, and a second application is refused
+    assert sorted(path.name for path in local.iterdir()) == sorted(path.name for path in previous.iterdir())
+    with pytest.raises(ValueError, match='already up to date'):
+        apply_delta(str(delta), str(local))
+
+
+def test_apply_delta_other_compression(
+    releases: tuple[Path, Path, Path],
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """The patched decisions are verified on their rows, however the local zlib compresses them."""
+    previous, new, delta = releases
+    local = tmp_path / 'local'
+    shutil.copytree(previous, local)
+
+    monkeypatch.setattr(bgzf.BgzfWriter.__init__, '__defaults__', (bgzf.THREADS, 1))
+    apply_delta(str(delta), str(local))
+
+    decisions = 'clinvar_decisions.tsv.bgz'
+    assert checksum_rows(str(local / decisions)) == checksum_rows(str(new / decisions))
+    assert release_checksums(str(local))[decisions] != release_checksums(str(new))[decisions]
+    with pytest.raises(ValueError, match='already up to date'):
+        apply_delta(str(delta), str(local))
+
+
+def test_apply_delta_wrong_base(releases: tuple[Path, Path, Path], tmp_path: Path):
+    previous, _new, delta = releases
+    local = tmp_path / 'local'
+    shutil.copytree(previous, local)
+    with (local / 'clinvar_decisions.pm5.tsv').open('a') as handle:
+        handle.write('ENST9\t1\t1::1\n')
+    before = release_checksums(str(local))
+
+    with pytest.raises(ValueError, match=r'clinvar_decisions\.pm5\.tsv'):
+        apply_delta(str(delta), str(local))
+    assert release_checksums(str(local)) == before
+
+
+def test_no_delta_from_baseline_layout(tmp_path: Path):
+    """A previous release from before the checksums, with its PM5 rows in insertion order, gets no delta."""
+    previous = write_release(tmp_path / 'previous', OLD_DECISIONS, OLD_PM5)
+    with (previous / 'clinvar_decisions.pm5.tsv').open('a') as handle:
+        handle.write('ENST0\t1\t1::1\n')
+    new = write_release(tmp_path / 'new', NEW_DECISIONS, NEW_PM5)
+    delta = tmp_path / 'clinvar_decisions.delta.tar.gz'
+
+    main(new_dir=str(new), previous_dir=str(previous), delta_path=str(delta))
+    assert (new / CHECKSUMS_NAME).exists()
+    assert not delta.exists()
+
+
+def test_delta_skips_unsorted_dataset(tmp_path: Path):
+    """A dataset which can't be merge-joined is left out of the delta, and its files aren't covered."""
+    previous = write_release(tmp_path / 'previous', OLD_DECISIONS, OLD_PM5)
+    with (previous / 'clinvar_decisions.pm5.tsv').open('a') as handle:
+        handle.write('ENST0\t1\t1::1\n')
+    write_checksums(str(previous))
+    new = write_release(tmp_path / 'new', NEW_DECISIONS, NEW_PM5)
+    delta = tmp_path / 'clinvar_decisions.delta.tar.gz'
+
+    main(new_dir=str(new), previous_dir=str(previous), delta_path=str(delta))
+    with tarfile.open(delta, 'r:gz') as tar:
+        manifest = json.load(tar.extractfile(MANIFEST_NAME))
+    assert list(manifest['changes']) == ['decisions']
+    assert 'clinvar_decisions.pm5.tsv' not in manifest['base']
+    assert {'clinvar_decisions.pm5.tsv', 'clinvar_decisions.pm5.idx'}.issubset(manifest['not_covered'])
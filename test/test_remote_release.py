@@ -0,0 +1,164 @@
+import gzip
+import threading
+from collections.abc import Generator
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from clinvarbitration.scripts.clinvar_by_codon import aggregate_rows, write_results_as_tsv
+from clinvarbitration.scripts.cloud_release import INDEX_NAME, write_cloud_release
+from clinvarbitration.scripts.remote_release import RemoteRelease
+from clinvarbitration.scripts.resummarise_clinvar import Consequence, write_decisions_tsv
+
+
+def decision(contig: str, position: int, allele_id: int, alt: str = 'G') -> dict:
+    return {
+        'contig': contig,
+        'position': position,
+        'alleles': ['A', alt],
+        'clinical_significance': Consequence.PATHOGENIC.value,
+        'gold_stars': 1,
+        'allele_id': allele_id,
+    }
+
+
+DECISIONS = [
+    decision('chr1', 100, 1),
+    decision('chr1', 100, 2, alt='T'),
+    *[decision('chr1', 1_000 + index, 100 + index) for index in range(2_000)],
+    decision('chr2', 5, 3),
+    decision('chrX', 70_000, 4),
+]
+
+PM5_ROWS = ['ENST1\t9A>9C\t7\t2\n', 'ENST1\t9A>9D\t1\t0\n', 'ENST2\t5A>5C\t3\t1\n']
+
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    """Serves files from a folder, answering single Range requests with a 206, and recording each request."""
+
+    requests: list[str | None]
+
+    def log_message(self, *args: object):
+        pass
+
+    def do_GET(self):
+        path = Path(self.translate_path(self.path))
+        if not path.is_file():
+            self.send_error(404)
+            return
+        data = path.read_bytes()
+        self.requests.append(self.headers.get('Range'))
+        if byte_range := self.headers.get('Range'):
+            first, _, last = byte_range.removeprefix('bytes=').partition('-')
+            data = data[int(first) : int(last) + 1]
+            self.send_response(206)
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture(name='release_dir')
+def fixture_release_dir(tmp_path: Path) -> Path:
+    decisions_tsv = str(tmp_path / 'clinvar_decisions.tsv.bgz')
+    write_decisions_tsv(DECISIONS, output_path=decisions_tsv)
+    pm5_tsv = str(tmp_path / 'clinvar_decisions.pm5.tsv')
+    write_results_as_tsv(aggregate_rows(PM5_ROWS), pm5_tsv)
+
+    release_dir = tmp_path / 'clinvar_decisions.cloud'
+    # small blocks, so the decisions span many blocks
+    write_cloud_release({'decisions': decisions_tsv, 'pm5': pm5_tsv}, str(release_dir), block_size=4_096, threads=2)
+    return release_dir
+
+
+@pytest.fixture(name='server')
+def fixture_server(release_dir: Path) -> Generator[tuple[str, list], None, None]:
+    requests: list[str | None] = []
+    handler = type('Handler', (RangeHandler,), {'requests': requests})
+
+    def make_handler(*args: object) -> RangeHandler:
+        return handler(*args, directory=str(release_dir))
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}', requests
+    server.shutdown()
+    server.server_close()
+
+
+def test_layout(release_dir: Path):
+    """each data file is a valid BGZF file holding the TSV rows, without the header"""
+    with gzip.open(release_dir / 'decisions.tsv.bgz', 'rt') as handle:
+        lines = handle.readlines()
+    assert len(lines) == len(DECISIONS)
+    assert lines[0] == 'chr1\t100\tA\tG\tPathogenic/Likely Pathogenic\t1\t1\n'
+    assert (release_dir / INDEX_NAME).exists()
+
+
+def test_remote_lookups(server: tuple[str, list]):
+    url, requests = server
+    release = RemoteRelease(url)
+    assert requests == [None]
+    assert release.datasets['decisions']['names'] == ['chr1', 'chr2', 'chrX']
+    assert release.datasets['decisions']['blocks'] > 10  # noqa: PLR2004
+
+    assert release.lookup('chr1', 100, 'A', 'T') == [
+        {
+            'contig': 'chr1',
+            'position': 100,
+            'reference': 'A',
+            'alternate': 'T',
+            'clinical_significance': 'Pathogenic/Likely Pathogenic',
+            'gold_stars': 1,
+            'allele_id': 2,
+        },
+    ]
+    # the index, then a single block
+    assert len(requests) == 2  # noqa: PLR2004
+    assert requests[1].startswith('bytes=0-')
+
+    # the same block again, answered from the cache
+    assert [row['allele_id'] for row in release.lookup('1', 100, 'A', 'G')] == [1]
+    assert len(requests) == 2  # noqa: PLR2004
+    assert release.cache.hits == 1
+
+    # a region spanning many blocks, fetched in a single request
+    region = release.region('chr1', 1_500, 2_900)
+    assert [row['allele_id'] for row in region] == list(range(600, 2_001))
+    assert len(requests) == 3  # noqa: PLR2004
+
+    assert [row['allele_id'] for row in release.region('chrX', 1, 100_000)] == [4]
+    assert release.lookup('chr1', 101, 'A', 'G') == []
+    assert release.lookup('chr3', 100, 'A', 'G') == []
+    assert release.region('chr2', 10, 1) == []
+
+    assert release.codon('ENST1', 9) == [{'transcript': 'ENST1', 'codon': 9, 'clinvar_alleles': '1::0+7::2'}]
+    assert release.codon('ENST2', 6) == []
+    assert release.codon('ENST3', 5) == []
+
+
+def test_local_lookups(release_dir: Path):
+    """a local folder is read with the same ranged reads"""
+    release = RemoteRelease(str(release_dir))
+    assert [row['allele_id'] for row in release.region('chr2', 1, 10)] == [3]
+    assert release.requests == 2  # noqa: PLR2004
+    assert release.bytes_fetched < (release_dir / 'decisions.tsv.bgz').stat().st_size
+
+
+def test_corrupt_block(release_dir: Path):
+    """the CRC of the only PM5 block, just ahead of its length and the 28 byte EOF block, no longer matches"""
+    data = bytearray((release_dir / 'pm5.tsv.bgz').read_bytes())
+    data[-36] ^= 0xFF
+    (release_dir / 'pm5.tsv.bgz').write_bytes(bytes(data))
+    with pytest.raises(ValueError, match='corrupt'):
+        RemoteRelease(str(release_dir)).codon('ENST1', 9)
+
+
+def test_unsorted(tmp_path: Path):
+    tsv = tmp_path / 'unsorted.tsv'
+    tsv.write_text('contig\tposition\nchr1\t200\nchr1\t100\n')
+    with pytest.raises(ValueError, match='sorted on the second'):
+        write_cloud_release({'decisions': str(tsv)}, str(tmp_path / 'cloud'))
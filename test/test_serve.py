@@ -0,0 +1,231 @@
+import asyncio
+import json
+import os
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from clinvarbitration.scripts.clinvar_by_codon import aggregate_rows
+from clinvarbitration.scripts.decisions_index import DecisionIndex
+from clinvarbitration.scripts.identifier_index import IdentifierIndex
+from clinvarbitration.scripts.lru_cache import LruCache
+from clinvarbitration.scripts.pm5_index import Pm5Index
+from clinvarbitration.scripts.resummarise_clinvar import GRCH38, ORDERED_CONTIGS, Consequence
+from clinvarbitration.scripts.serve import (
+    DECISIONS_INDEX,
+    IDENTIFIER_INDEX,
+    PM5_INDEX,
+    LookupService,
+    RequestError,
+    handle_connection,
+)
+
+PM5_ROWS = ['ENST1\t9A>9C\t7\t2\n', 'ENST1\t9A>9D\t1\t0\n', 'ENST2\t5A>5C\t3\t1\n']
+
+
+def write_release(folder: Path, allele_id: int, identifiers: bool = False) -> Path:
+    """A release tarball holding the indexes, the decision at chr1:100:A:G has this allele ID, and rsID rs5."""
+    data = folder / 'clinvarbitration_data'
+    data.mkdir(parents=True, exist_ok=True)
+    decision = {
+        'contig': 'chr1',
+        'position': 100,
+        'alleles': ['A', 'G'],
+        'clinical_significance': Consequence.PATHOGENIC.value,
+        'gold_stars': 2,
+        'allele_id': allele_id,
+        'variation_id': 1,
+        'rsid': 5,
+    }
+    DecisionIndex.from_decisions(
+        [decision],
+        contigs=ORDERED_CONTIGS[GRCH38],
+        significance=[consequence.value for consequence in Consequence],
+    ).write(str(data / DECISIONS_INDEX))
+    Pm5Index.from_codon_index(aggregate_rows(PM5_ROWS)).write(str(data / PM5_INDEX))
+    if identifiers:
+        IdentifierIndex.from_decisions(
+            [decision],
+            contigs=ORDERED_CONTIGS[GRCH38],
+            significance=[consequence.value for consequence in Consequence],
+        ).write(str(data / IDENTIFIER_INDEX))
+
+    tarball = folder / 'clinvar_decisions.release.tar.gz'
+    with tarfile.open(tarball, 'w:gz') as archive:
+        archive.add(data, arcname='clinvarbitration_data')
+    return tarball
+
+
+async def http(port: int, method: str, target: str, body: dict | None = None) -> tuple[int, dict]:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    payload = json.dumps(body).encode() if body is not None else b''
+    writer.write(
+        f'{method} {target} HTTP/1.1\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n'.encode() + payload,
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(content)
+
+
+def test_lru_cache():
+    cache = LruCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3  # noqa: PLR2004
+
+
+def test_endpoints(tmp_path: Path):
+    service = LookupService(str(write_release(tmp_path, allele_id=11)))
+
+    async def run() -> list[tuple[int, dict]]:
+        server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return [
+                await http(port, 'POST', '/variants', {'variants': ['chr1:100:A:G', 'chr1:100:A:T']}),
+                await http(port, 'GET', '/variants?q=1:100:A:G'),
+                await http(port, 'POST', '/pm5', {'queries': ['ENST1:9', 'ENST3:1']}),
+                await http(port, 'POST', '/pm5', {'queries': ['ENST1']}),
+                await http(port, 'GET', '/missing'),
+                await http(port, 'GET', '/stats'),
+            ]
+
+    variants, single, pm5, bad, missing, stats = asyncio.run(run())
+    decision = {'clinical_significance': Consequence.PATHOGENIC.value, 'gold_stars': 2, 'allele_id': 11}
+    assert variants == (
+        200,
+        {
+            'results': [
+                {'query': 'chr1:100:A:G', 'decisions': [decision]},
+                {'query': 'chr1:100:A:T', 'decisions': []},
+            ],
+        },
+    )
+    assert single == (200, {'results': [{'query': '1:100:A:G', 'decisions': [decision]}]})
+    assert pm5 == (
+        200,
+        {
+            'results': [
+                {'query': 'ENST1:9', 'alleles': [{'allele_id': 1, 'gold_stars': 0}, {'allele_id': 7, 'gold_stars': 2}]},
+                {'query': 'ENST3:1', 'alleles': []},
+            ],
+        },
+    )
+    assert bad[0] == 400  # noqa: PLR2004
+    assert missing[0] == 404  # noqa: PLR2004
+    assert stats[0] == 200  # noqa: PLR2004
+    assert stats[1]['latency']['/variants']['requests'] == 2  # noqa: PLR2004
+    assert set(stats[1]['latency']['/pm5']) == {'requests', 'p50_ms', 'p90_ms', 'p99_ms', 'p99.9_ms'}
+
+
+def test_coalescing(tmp_path: Path):
+    """concurrent requests for overlapping queries are answered in one lookup, then from the cache"""
+    service = LookupService(str(write_release(tmp_path, allele_id=11)))
+
+    async def run() -> list[dict]:
+        requests = [
+            service.handle('POST', '/pm5', json.dumps({'queries': ['ENST1:9', 'ENST2:5']}).encode()),
+            service.handle('POST', '/pm5', json.dumps({'queries': ['ENST2:5', 'ENST1:9', 'ENST1:9']}).encode()),
+        ]
+        return await asyncio.gather(*requests)
+
+    first, second = asyncio.run(run())
+    assert service.codons.batches == 1
+    assert first['results'][0] == second['results'][1] == second['results'][2]
+    assert service.codon_cache.misses == 5  # noqa: PLR2004
+
+    asyncio.run(service.handle('GET', '/pm5?q=ENST1:9', b''))
+    assert service.codons.batches == 1
+    assert service.codon_cache.hits == 1
+
+
+def test_hot_reload(tmp_path: Path):
+    tarball = write_release(tmp_path, allele_id=11)
+    service = LookupService(str(tarball))
+
+    def lookup() -> int:
+        response = asyncio.run(service.handle('GET', '/variants?q=chr1:100:A:G', b''))
+        return response['results'][0]['decisions'][0]['allele_id']
+
+    assert lookup() == 11  # noqa: PLR2004
+    assert not asyncio.run(service.reload_if_changed())
+
+    write_release(tmp_path, allele_id=22)
+    stat = tarball.stat()
+    os.utime(tarball, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert asyncio.run(service.reload_if_changed())
+    assert lookup() == 22  # noqa: PLR2004
+    assert service.reloads == 1
+
+
+def test_handle_errors(tmp_path: Path):
+    service = LookupService(str(write_release(tmp_path, allele_id=11)))
+    for method, target, body in [
+        ('POST', '/variants', b'not json'),
+        ('POST', '/variants', b'{"variants": "chr1:100:A:G"}'),
+        ('POST', '/variants', b'{"variants": ["chr1:1-100"]}'),
+        ('DELETE', '/variants', b''),
+    ]:
+        with pytest.raises(RequestError):
+            asyncio.run(service.handle(method, target, body))
+
+
+def test_identifiers(tmp_path: Path):
+    service = LookupService(str(write_release(tmp_path, allele_id=11, identifiers=True)))
+    body = json.dumps({'queries': ['rs5', 'AlleleID:11', 'VariationID:2']}).encode()
+    response = asyncio.run(service.handle('POST', '/identifiers', body))
+    decision = {
+        'variant': 'chr1:100:A:G',
+        'clinical_significance': Consequence.PATHOGENIC.value,
+        'gold_stars': 2,
+        'allele_id': 11,
+    }
+    assert response == {
+        'results': [
+            {'query': 'rs5', 'decisions': [decision]},
+            {'query': 'AlleleID:11', 'decisions': [decision]},
+            {'query': 'VariationID:2', 'decisions': []},
+        ],
+    }
+    assert service.identifiers.batches == 1
+    with pytest.raises(RequestError):
+        asyncio.run(service.handle('GET', '/identifiers?q=rs', b''))
+
+    # releases written before the identifier index still serve variants & PM5
+    without = LookupService(str(write_release(tmp_path / 'old', allele_id=11)))
+    with pytest.raises(RequestError) as error:
+        asyncio.run(without.handle('GET', '/identifiers?q=rs5', b''))
+    assert error.value.status == 404  # noqa: PLR2004
+
+
+def test_bad_query_in_batch(tmp_path: Path):
+    """a query which can't be looked up fails only its own request, not the others in the same batch"""
+    service = LookupService(str(write_release(tmp_path, allele_id=11)))
+    too_large = 99999999999999999999
+
+    async def run() -> list:
+        requests = [
+            service.handle('GET', '/variants?q=chr1:100:A:G', b''),
+            service.handle('GET', f'/variants?q=chr1:{too_large}:A:G', b''),
+            service.handle('GET', f'/pm5?q=ENST1:{too_large}', b''),
+            # skipping the query parsing, the bad query reaches the lookup alongside a good one
+            service.variants.get_many([('chr1', 100, 'A', 'G')]),
+            service.variants.get_many([('chr1', too_large, 'A', 'G')]),
+        ]
+        return await asyncio.gather(*requests, return_exceptions=True)
+
+    good, bad_variant, bad_codon, good_batched, bad_batched = asyncio.run(run())
+    assert good['results'][0]['decisions'][0]['allele_id'] == 11  # noqa: PLR2004
+    assert isinstance(bad_variant, RequestError)
+    assert bad_variant.status == 400  # noqa: PLR2004
+    assert isinstance(bad_codon, RequestError)
+    assert bad_codon.status == 400  # noqa: PLR2004
+    assert good_batched[0][0]['allele_id'] == 11  # noqa: PLR2004
+    assert isinstance(bad_batched, OverflowError)
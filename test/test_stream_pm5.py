@@ -0,0 +1,81 @@
+import stat
+import sys
+from pathlib import Path
+
+import pytest
+
+from clinvarbitration.scripts import annotate_snvs
+from clinvarbitration.scripts.clinvar_by_codon import parse_rows_into_dict
+from clinvarbitration.scripts.resummarise_clinvar import Consequence
+from clinvarbitration.scripts.stream_pm5 import pm5_vcf_lines
+
+DECISIONS = [
+    {
+        'contig': 'chr1',
+        'position': 100,
+        'alleles': ['A', 'G'],
+        'clinical_significance': Consequence.PATHOGENIC.value,
+        'gold_stars': 1,
+        'allele_id': 11,
+    },
+    {
+        'contig': 'chr1',
+        'position': 200,
+        'alleles': ['A', 'GT'],
+        'clinical_significance': Consequence.PATHOGENIC.value,
+        'gold_stars': 1,
+        'allele_id': 22,
+    },
+    {
+        'contig': 'chr2',
+        'position': 300,
+        'alleles': ['C', 'T'],
+        'clinical_significance': Consequence.PATHOGENIC.value,
+        'gold_stars': 2,
+        'allele_id': 33,
+    },
+    {
+        'contig': 'chr2',
+        'position': 400,
+        'alleles': ['C', 'T'],
+        'clinical_significance': Consequence.BENIGN.value,
+        'gold_stars': 2,
+        'allele_id': 44,
+    },
+]
+
+# stands in for bcftools: csq passes the VCF through, +split-vep emits one missense row per record
+FAKE_BCFTOOLS = f"""#!{sys.executable}
+import sys
+if sys.argv[1] == '+split-vep':
+    for line in sys.stdin:
+        if line.startswith('#'):
+            continue
+        chrom, pos, _id, ref, alt, _qual, _filter, info = line.rstrip().split('\\t')
+        fields = dict(field.split('=') for field in info.split(';'))
+        sys.stdout.write(f'TX_{{chrom}}\\t{{pos}}A>{{pos}}G\\t{{fields["allele_id"]}}\\t{{fields["gold_stars"]}}\\n')
+else:
+    sys.stdout.write(sys.stdin.read())
+"""
+
+
+def test_pm5_vcf_lines():
+    lines = list(pm5_vcf_lines(DECISIONS, assembly='GRCh38'))
+    assert lines[0] == '##fileformat=VCFv4.2\n'
+    assert '##contig=<ID=chrX>\n' in lines
+    records = [line for line in lines if not line.startswith('#')]
+    assert records == [
+        'chr1\t100\t.\tA\tG\t.\t.\tallele_id=11;gold_stars=1;clinical_significance=Pathogenic/Likely Pathogenic\n',
+        'chr2\t300\t.\tC\tT\t.\t.\tallele_id=33;gold_stars=2;clinical_significance=Pathogenic/Likely Pathogenic\n',
+    ]
+
+
+def test_stream_annotations(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """the decisions are streamed through the annotation pipes, and aggregated row by row"""
+    fake = tmp_path / 'bcftools'
+    fake.write_text(FAKE_BCFTOOLS)
+    fake.chmod(fake.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setattr(annotate_snvs, 'BCFTOOLS', str(fake))
+
+    rows = annotate_snvs.stream_annotations(pm5_vcf_lines(DECISIONS, 'GRCh38'), ref_fa='ref.fa', gff3='genes.gff3')
+    assert parse_rows_into_dict(rows) == {'TX_chr1::100': {'11::1'}, 'TX_chr2::300': {'33::2'}}
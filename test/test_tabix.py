@@ -0,0 +1,101 @@
+import gzip
+from pathlib import Path
+
+import pytest
+
+from clinvarbitration.scripts.resummarise_clinvar import TSV_KEYS, Consequence, decision_columns, write_decisions_tsv
+from clinvarbitration.scripts.tabix import TabixIndex, fetch, parse_region, reg2bin, reg2bins, write_indexed_tsv
+
+
+def decision(contig: str, position: int, allele_id: int) -> dict:
+    return {
+        'contig': contig,
+        'position': position,
+        'alleles': ['A', 'G'],
+        'clinical_significance': Consequence.PATHOGENIC.value,
+        'gold_stars': 1,
+        'allele_id': allele_id,
+    }
+
+
+# spread over several 16kbp windows & bins, with a run of rows long enough to span BGZF blocks
+DECISIONS = [
+    decision('chr1', 100, 1),
+    decision('chr1', 100, 2),
+    decision('chr1', 20_000, 3),
+    *[decision('chr1', 1_000_000 + index, 100 + index) for index in range(5_000)],
+    decision('chr1', 200_000_000, 4),
+    decision('chr2', 5, 5),
+    decision('chrX', 70_000, 6),
+]
+
+
+def allele_ids(lines: list[str]) -> list[int]:
+    return [int(line.split('\t')[6]) for line in lines]
+
+
+def test_bins():
+    assert reg2bin(0, 1) == 4681  # noqa: PLR2004
+    assert reg2bin(16_383, 16_385) == 585  # noqa: PLR2004
+    assert reg2bin(0, 1 << 29) == 0
+    assert reg2bins(0, 1) == [0, 1, 9, 73, 585, 4681]
+
+
+def test_parse_region():
+    assert parse_region('chr1') == ('chr1', 0, 1 << 29)
+    assert parse_region('chr1:100') == ('chr1', 99, 100)
+    assert parse_region('chr1:1,000-2,000') == ('chr1', 999, 2000)
+    with pytest.raises(ValueError, match='Regions should be formatted'):
+        parse_region('chr1:a-b')
+
+
+def test_write_decisions_tsv(tmp_path: Path):
+    path = str(tmp_path / 'clinvar_decisions.tsv.bgz')
+    write_decisions_tsv(DECISIONS, output_path=path)
+
+    with gzip.open(path, 'rt') as handle:
+        lines = handle.readlines()
+    assert lines[0] == '\t'.join(TSV_KEYS) + '\n'
+    assert lines[1] == 'chr1\t100\tA\tG\tPathogenic/Likely Pathogenic\t1\t1\n'
+    assert len(lines) == len(DECISIONS) + 1
+
+    index = TabixIndex.load(f'{path}.tbi')
+    assert index.names == ['chr1', 'chr2', 'chrX']
+    assert index.columns == (1, 2, 2)
+    assert index.skip == 1
+
+
+def test_fetch(tmp_path: Path):
+    path = str(tmp_path / 'clinvar_decisions.tsv.bgz')
+    write_decisions_tsv(DECISIONS, output_path=path)
+    index = TabixIndex.load(f'{path}.tbi')
+
+    assert allele_ids(fetch(path, 'chr1', 99, 100, index=index)) == [1, 2]
+    assert allele_ids(fetch(path, 'chr1', 100, 20_000, index=index)) == [3]
+    assert allele_ids(fetch(path, 'chr1', 1_004_990, 1_200_000, index=index)) == list(range(5_091, 5_100))
+    assert allele_ids(fetch(path, 'chr1', 150_000_000, 1 << 29, index=index)) == [4]
+    assert allele_ids(fetch(path, 'chrX', 0, 1 << 29, index=index)) == [6]
+    assert list(fetch(path, 'chr2', 5, 100, index=index)) == []
+    assert list(fetch(path, 'chr3', 0, 100, index=index)) == []
+    assert len(list(fetch(path, 'chr1'))) == len(DECISIONS) - 2
+
+
+def test_write_unsorted(tmp_path: Path):
+    columns = decision_columns([decision('chr1', 200, 1), decision('chr1', 100, 2)])
+    with pytest.raises(ValueError, match='sorted on position'):
+        write_indexed_tsv(str(tmp_path / 'unsorted.tsv.bgz'), columns)
+
+    columns = decision_columns([decision('chr1', 100, 1), decision('chr2', 100, 2), decision('chr1', 200, 3)])
+    with pytest.raises(ValueError, match='grouped by contig'):
+        write_indexed_tsv(str(tmp_path / 'unsorted.tsv.bgz'), columns)
+
+
+def test_htslib_compatible(tmp_path: Path):
+    """htslib reads the file and index, and returns the same rows for each region"""
+    pysam = pytest.importorskip('pysam')
+    path = str(tmp_path / 'clinvar_decisions.tsv.bgz')
+    write_decisions_tsv(DECISIONS, output_path=path)
+
+    tabix_file = pysam.TabixFile(path)
+    for contig, beg, end in [('chr1', 99, 100), ('chr1', 1_004_990, 1_200_000), ('chr1', 0, 1 << 29), ('chrX', 0, 10)]:
+        assert list(tabix_file.fetch(contig, beg, end)) == [line.rstrip('\n') for line in fetch(path, contig, beg, end)]